@@ -0,0 +1,31 @@
+"""add stats counters table
+
+Revision ID: add_stats_counters
+Revises: add_mother_health_tracking
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "add_stats_counters"
+down_revision = "add_mother_health_tracking"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stats_counters",
+        sa.Column("key", sa.String(length=64), nullable=False),
+        sa.Column("dim", sa.String(length=128), nullable=False, server_default=""),
+        sa.Column("shard", sa.SmallInteger(), nullable=False, server_default="0"),
+        sa.Column("value", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("key", "dim", "shard"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("stats_counters")
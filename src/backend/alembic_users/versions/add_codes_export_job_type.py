@@ -0,0 +1,26 @@
+"""add codes_export batch job type
+
+Revision ID: add_codes_export_job_type
+Revises: add_keyset_pagination_indexes
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "add_codes_export_job_type"
+down_revision = "add_keyset_pagination_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 仅 PostgreSQL 的原生枚举需要扩展；其他方言以 VARCHAR 存储
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.execute("ALTER TYPE batch_job_type ADD VALUE IF NOT EXISTS 'codes_export'")
+
+
+def downgrade() -> None:
+    # PostgreSQL 不支持删除枚举值；保留即可
+    pass
@@ -0,0 +1,38 @@
+"""add (created_at, id) indexes for keyset pagination
+
+Revision ID: add_keyset_pagination_indexes
+Revises: add_stats_hourly_rollups
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "add_keyset_pagination_indexes"
+down_revision = "add_stats_hourly_rollups"
+branch_labels = None
+depends_on = None
+
+# (表, 新索引, 被取代的单列 created_at 索引)
+_INDEXES = [
+    ("invite_requests", "ix_invite_created_id", "ix_invite_created_at"),
+    ("redeem_codes", "ix_redeem_created_id", None),
+    ("audit_logs", "ix_audit_created_id", None),
+    ("bulk_operation_logs", "ix_bulk_operation_created_id", "ix_bulk_operation_created_at"),
+    ("batch_jobs", "ix_batch_job_created_id", "ix_batch_job_created_at"),
+]
+
+
+def upgrade() -> None:
+    # 列表接口按 (created_at, id) 倒序游标分页；复合索引同样覆盖按 created_at 的范围查询
+    for table, name, replaced in _INDEXES:
+        op.create_index(name, table, ["created_at", "id"])
+        if replaced:
+            op.drop_index(replaced, table_name=table)
+
+
+def downgrade() -> None:
+    for table, name, replaced in reversed(_INDEXES):
+        if replaced:
+            op.create_index(replaced, table, ["created_at"])
+        op.drop_index(name, table_name=table)
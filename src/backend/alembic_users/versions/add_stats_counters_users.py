@@ -0,0 +1,31 @@
+"""add stats counters table
+
+Revision ID: add_stats_counters_users
+Revises: add_code_sku_refresh
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "add_stats_counters_users"
+down_revision = "add_code_sku_refresh"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stats_counters",
+        sa.Column("key", sa.String(length=64), nullable=False),
+        sa.Column("dim", sa.String(length=128), nullable=False, server_default=""),
+        sa.Column("shard", sa.SmallInteger(), nullable=False, server_default="0"),
+        sa.Column("value", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("key", "dim", "shard"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("stats_counters")
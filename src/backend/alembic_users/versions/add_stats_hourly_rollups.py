@@ -0,0 +1,45 @@
+"""add hourly stats rollups
+
+Revision ID: add_stats_hourly_rollups
+Revises: add_stats_counters_users
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "add_stats_hourly_rollups"
+down_revision = "add_stats_counters_users"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stats_hourly_rollups",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("metric", sa.String(length=32), nullable=False),
+        sa.Column("hour_start", sa.DateTime(), nullable=False),
+        sa.Column("status", sa.String(length=32), nullable=False, server_default=""),
+        sa.Column("mother_group_id", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("sku_id", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.UniqueConstraint("metric", "hour_start", "status", "mother_group_id", "sku_id", name="uq_rollup_dims"),
+    )
+    op.create_index("ix_rollup_metric_hour", "stats_hourly_rollups", ["metric", "hour_start"])
+    # 汇总任务与当前小时的原始查询按时间列取范围
+    op.create_index("ix_invite_created_at", "invite_requests", ["created_at"])
+    op.create_index("ix_redeem_used_at", "redeem_codes", ["used_at"])
+    op.create_index("ix_switch_requests_created_at", "switch_requests", ["created_at"])
+    op.create_index("ix_code_refresh_history_created_at", "code_refresh_history", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_code_refresh_history_created_at", table_name="code_refresh_history")
+    op.drop_index("ix_switch_requests_created_at", table_name="switch_requests")
+    op.drop_index("ix_redeem_used_at", table_name="redeem_codes")
+    op.drop_index("ix_invite_created_at", table_name="invite_requests")
+    op.drop_index("ix_rollup_metric_hour", table_name="stats_hourly_rollups")
+    op.drop_table("stats_hourly_rollups")
@@ -0,0 +1,101 @@
+"""add trigram / FTS5 search indexes for codes and invites
+
+Revision ID: add_text_search_indexes
+Revises: add_codes_export_job_type
+"""
+
+import sqlite3
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "add_text_search_indexes"
+down_revision = "add_codes_export_job_type"
+branch_labels = None
+depends_on = None
+
+# 表 -> (子串搜索列, 精确/前缀快路径列)
+_TARGETS = {
+    "redeem_codes": (
+        ("code_hash", "batch_id", "used_by_email", "used_by_team_id"),
+        ("code_hash", "batch_id", "used_by_email", "used_by_team_id"),
+    ),
+    "invite_requests": (("email", "team_id", "error_msg"), ("email", "team_id")),
+}
+
+
+def _sqlite_trigram_supported() -> bool:
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        return False
+    try:
+        conn = sqlite3.connect(":memory:")
+        try:
+            conn.execute("CREATE VIRTUAL TABLE t USING fts5(a, tokenize='trigram')")
+        finally:
+            conn.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def _upgrade_postgres() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        for table, (columns, key_columns) in _TARGETS.items():
+            trgm = ", ".join(f"lower({c}) gin_trgm_ops" for c in columns)
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_search_{table}_trgm ON {table} USING gin ({trgm})")
+            for c in key_columns:
+                op.execute(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_search_{table}_{c} "
+                    f"ON {table} (lower({c}) text_pattern_ops)"
+                )
+
+
+def _upgrade_sqlite() -> None:
+    for table, (columns, key_columns) in _TARGETS.items():
+        for c in key_columns:
+            op.execute(f"CREATE INDEX IF NOT EXISTS ix_search_{table}_{c} ON {table} (lower({c}))")
+    if not _sqlite_trigram_supported():
+        return
+    for table, (columns, _) in _TARGETS.items():
+        fts = f"{table}_fts"
+        cols = ", ".join(columns)
+        new_vals = ", ".join(f"new.{c}" for c in columns)
+        old_vals = ", ".join(f"old.{c}" for c in columns)
+        delete_old = f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals});"
+        insert_new = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals});"
+        op.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"{cols}, content='{table}', content_rowid='id', tokenize='trigram')"
+        )
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN {insert_new} END")
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN {delete_old} END")
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} "
+            f"BEGIN {delete_old} {insert_new} END"
+        )
+        # 回填已有数据
+        op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        _upgrade_postgres()
+    elif dialect == "sqlite":
+        _upgrade_sqlite()
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for table, (columns, key_columns) in _TARGETS.items():
+        if dialect == "sqlite":
+            fts = f"{table}_fts"
+            for suffix in ("ai", "ad", "au"):
+                op.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+            op.execute(f"DROP TABLE IF EXISTS {fts}")
+        elif dialect == "postgresql":
+            op.execute(f"DROP INDEX IF EXISTS ix_search_{table}_trgm")
+        for c in key_columns:
+            op.execute(f"DROP INDEX IF EXISTS ix_search_{table}_{c}")
@@ -1,8 +1,7 @@
 import asyncio
-import contextlib
 import logging
-from contextlib import asynccontextmanager
-from typing import Iterable, Optional
+from contextlib import asynccontextmanager, suppress
+from typing import Callable, Iterable, Optional
 
 from fastapi import FastAPI
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
@@ -10,27 +9,95 @@ from fastapi.responses import JSONResponse
 
 from app.config import settings
 from app.database import init_db, SessionUsers, SessionPool
-from app.middleware import SecurityHeadersMiddleware, InputValidationMiddleware
+from app.middleware import (
+    InputValidationMiddleware,
+    RetryBudgetMiddleware,
+    SecurityHeadersMiddleware,
+)
+from app.provider_client import aclose_provider_clients
+from app.scheduler import ScheduledTask, TaskScheduler
 from app.services.services.admin_service import create_or_update_admin_default
 from app.services.services.maintenance import create_maintenance_service
 from app.services.services.rate_limiter_service import init_rate_limiter, close_rate_limiter
+from app.services.pool_api_key_service import flush_key_usage, run_key_revocation_watcher, run_key_usage_flusher
 from app.security import hash_password
+from app.utils.loop_monitor import LoopLagMonitor
 from app.domain_context import (
     ServiceDomain,
     set_service_domain,
 )
 
-try:
-    from app.metrics_prom import maintenance_lock_miss_total, maintenance_lock_acquired_total
-except Exception:  # pragma: no cover - metrics optional
-    maintenance_lock_miss_total = maintenance_lock_acquired_total = None  # type: ignore
-
 logger = logging.getLogger(__name__)
 
 
+def _maintenance_job(method: str, **kwargs) -> Callable[[], Optional[int]]:
+    """包装 MaintenanceService 的一个方法：每次运行使用独立会话。"""
+
+    def _run() -> Optional[int]:
+        db_users = SessionUsers()
+        db_pool = SessionPool()
+        try:
+            service = create_maintenance_service(db_users, db_pool)
+            return getattr(service, method)(**kwargs)
+        finally:
+            db_pool.close()
+            db_users.close()
+
+    _run.__name__ = method
+    return _run
+
+
+def _process_batch_jobs(limit: int = 3) -> int:
+    """处理少量异步批量任务，避免单次运行过长"""
+    from app.services.services.jobs import process_one_job
+
+    db_users = SessionUsers()
+    try:
+        processed = 0
+        for _ in range(limit):
+            if not process_one_job(db_users, pool_session_factory=SessionPool):
+                break
+            processed += 1
+        return processed
+    finally:
+        db_users.close()
+
+
+def build_maintenance_tasks() -> list[ScheduledTask]:
+    """维护任务列表；默认节奏沿用 maintenance_interval_seconds，可通过 SCHEDULER_TASK_OVERRIDES 单独调整"""
+    interval = float(settings.maintenance_interval_seconds)
+    return [
+        ScheduledTask("cleanup_stale_held", _maintenance_job("cleanup_stale_held"), interval),
+        ScheduledTask(
+            "check_mother_health",
+            _maintenance_job("check_mother_health", limit=settings.mother_health_check_batch_size),
+            interval,
+        ),
+        ScheduledTask("cleanup_expired_mother_teams", _maintenance_job("cleanup_expired_mother_teams"), interval),
+        ScheduledTask(
+            "sync_invite_acceptance",
+            _maintenance_job(
+                "sync_invite_acceptance",
+                days=settings.invite_sync_days,
+                limit_groups=settings.invite_sync_group_limit,
+            ),
+            interval,
+        ),
+        ScheduledTask("cleanup_expired_codes", _maintenance_job("cleanup_expired_codes"), interval),
+        ScheduledTask("process_switch_queue", _maintenance_job("process_switch_queue"), interval),
+        ScheduledTask("batch_jobs", _process_batch_jobs, interval),
+        ScheduledTask(
+            "reconcile_stats_counters",
+            _maintenance_job("reconcile_stats_counters"),
+            settings.stats_counters_reconcile_seconds,
+        ),
+        ScheduledTask("rollup_hourly_stats", _maintenance_job("rollup_hourly_stats"), settings.stats_rollup_interval_seconds),
+    ]
+
+
 def build_app_lifespan(domain: ServiceDomain):
     @asynccontextmanager
-    async def _lifespan(_: FastAPI):
+    async def _lifespan(app: FastAPI):
         """
         Shared lifespan manager for every FastAPI 实例（Users/Pool/Monolith）。
         """
@@ -50,147 +117,50 @@ def build_app_lifespan(domain: ServiceDomain):
         except Exception:
             logger.exception("Failed to ensure default admin record on startup")
 
-        stop_event = asyncio.Event()
-        maintenance_task: Optional[asyncio.Task] = None
+        # 测试环境禁用后台维护任务，避免 in-memory sqlite 与外部线程交互导致异常
+        scheduler: Optional[TaskScheduler] = None
+        # API Key last_used_at 缓冲区是进程内的，每个进程各自写回（不经过分片调度）
+        usage_flusher: Optional[asyncio.Task] = None
+        # API Key 缓存同样是进程内的，每个进程各自跟踪其他进程发布的撤销
+        revocation_watcher: Optional[asyncio.Task] = None
+        if settings.env not in ("test", "testing"):
+            scheduler = TaskScheduler(build_maintenance_tasks())
+            scheduler.start()
+            usage_flusher = asyncio.create_task(run_key_usage_flusher(), name="api-key-usage-flusher")
+            revocation_watcher = asyncio.create_task(run_key_revocation_watcher(), name="api-key-revocation-watcher")
+        app.state.scheduler = scheduler
+
+        loop_monitor: Optional[LoopLagMonitor] = None
+        if settings.loop_monitor_enabled:
+            loop_monitor = LoopLagMonitor(
+                interval_seconds=settings.loop_monitor_interval_seconds,
+                threshold_ms=settings.loop_monitor_threshold_ms,
+            )
+            loop_monitor.start()
+        app.state.loop_monitor = loop_monitor
 
-    def _run_maintenance_once():
-        """
-        执行一次维护循环（同步函数，供线程池调用）。
-        """
-        db_users = SessionUsers()
-        db_pool = SessionPool()
-        maintenance_service = create_maintenance_service(db_users, db_pool)
-        # 使用 Redis 分布式锁避免多实例并发执行维护逻辑
-        lock_client = None
-        lock_token = None
         try:
-            from app.utils.locks import try_acquire_lock, release_lock
-
-            lock_ttl = int(max(5, settings.maintenance_interval_seconds * 2))
-            lock_name = f"{settings.rate_limit_namespace}:maintenance_lock"
-            lock_client, lock_token = try_acquire_lock(lock_name, lock_ttl)
-            if lock_client is None and lock_token is None:
-                # 未获取到锁（被其他实例占用），记录一次指标便于观测
-                try:
-                    if maintenance_lock_miss_total is not None:
-                        maintenance_lock_miss_total.inc()
-                except Exception:
-                    pass
-                return
-            else:
+            yield
+        finally:
+            if loop_monitor:
+                await loop_monitor.stop()
+            if revocation_watcher:
+                revocation_watcher.cancel()
+                with suppress(asyncio.CancelledError):
+                    await revocation_watcher
+            if usage_flusher:
+                usage_flusher.cancel()
+                with suppress(asyncio.CancelledError):
+                    await usage_flusher
                 try:
-                    if maintenance_lock_acquired_total is not None and lock_client is not None:
-                        maintenance_lock_acquired_total.inc()
+                    await asyncio.to_thread(flush_key_usage)
                 except Exception:
-                    pass
-        except Exception:
-            # 获取锁异常时继续执行（单实例或无 Redis 场景）
-            pass
-        try:
-            freed = maintenance_service.cleanup_stale_held()
-            if freed:
-                logger.info("cleanup_stale_held: freed %s seats", freed)
-
-            try:
-                checked = maintenance_service.check_mother_health(
-                    limit=settings.mother_health_check_batch_size
-                )
-                if checked:
-                    logger.info("check_mother_health: probed %s mothers", checked)
-            except Exception:
-                logger.exception("check_mother_health error")
-
-            deleted = maintenance_service.cleanup_expired_mother_teams()
-            if deleted:
-                logger.info("cleanup_expired_mother_teams: deleted %s teams", deleted)
-            try:
-                accepted = maintenance_service.sync_invite_acceptance(
-                    days=settings.invite_sync_days,
-                    limit_groups=settings.invite_sync_group_limit,
-                )
-                if accepted:
-                    logger.info("sync_invite_acceptance: updated %s invites to accepted", accepted)
-            except Exception:
-                logger.exception("sync_invite_acceptance error")
-            try:
-                expired_codes = maintenance_service.cleanup_expired_codes()
-                if expired_codes:
-                    logger.info("cleanup_expired_codes: deactivated %s codes", expired_codes)
-            except Exception:
-                logger.exception("cleanup_expired_codes error")
-            try:
-                processed_switch = maintenance_service.process_switch_queue()
-                if processed_switch:
-                    logger.info("process_switch_queue: processed %s requests", processed_switch)
-            except Exception:
-                logger.exception("process_switch_queue error")
-            # 处理异步批量任务
-            try:
-                from app.services.services.jobs import process_one_job
-
-                processed = 0
-                # 处理少量任务，避免阻塞
-                for _ in range(3):
-                    if process_one_job(db_users, pool_session_factory=SessionPool):
-                        processed += 1
-                    else:
-                        break
-                if processed:
-                    logger.info("batch jobs processed: %s", processed)
-            except Exception:
-                logger.exception("batch jobs processing error")
-        finally:
-            # 释放锁
-            try:
-                if lock_client and lock_token:
-                    from app.utils.locks import release_lock
-
-                    release_lock(lock_client, f"{settings.rate_limit_namespace}:maintenance_lock", lock_token)
-            except Exception:
-                pass
-            db_pool.close()
-            db_users.close()
-
-    async def _maintenance_worker():
-        """
-        定期清理过期座位与母号数据。
-        """
-        backoff = 5.0
-        while not stop_event.is_set():
-            try:
-                await asyncio.to_thread(_run_maintenance_once)
-                backoff = 5.0
-            except Exception:
-                logger.exception("maintenance loop error")
-                await asyncio.sleep(backoff)
-                backoff = min(backoff * 2.0, 300.0)
-                continue
-
-            try:
-                await asyncio.wait_for(stop_event.wait(), timeout=float(settings.maintenance_interval_seconds))
-            except asyncio.TimeoutError:
-                continue
-
-        # 测试环境禁用后台维护循环，避免 in-memory sqlite 与外部线程交互导致异常
-        if settings.env not in ("test", "testing"):
-            maintenance_task = asyncio.create_task(_maintenance_worker())
-
-            try:
-                yield
-            finally:
-                stop_event.set()
-                if maintenance_task:
-                    maintenance_task.cancel()
-                    with contextlib.suppress(asyncio.CancelledError):
-                        await maintenance_task
-                await close_rate_limiter()
-                logger.info("Rate limiter cleaned up")
-        else:
-            try:
-                yield
-            finally:
-                await close_rate_limiter()
-                logger.info("Rate limiter cleaned up (test env)")
+                    logger.exception("final api key usage flush failed")
+            if scheduler:
+                await scheduler.stop()
+            await close_rate_limiter()
+            logger.info("Rate limiter cleaned up")
+            await aclose_provider_clients()
 
     return _lifespan
 
@@ -216,6 +186,7 @@ def create_application(
     app.add_middleware(TrustedHostMiddleware, allowed_hosts=allowed_hosts)
     app.add_middleware(InputValidationMiddleware)
     app.add_middleware(SecurityHeadersMiddleware)
+    app.add_middleware(RetryBudgetMiddleware)
 
     if include_pool_api_middleware:
         from app.middleware.pool_api_auth import PoolAPIAuthMiddleware
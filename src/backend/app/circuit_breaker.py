@@ -0,0 +1,435 @@
+"""
+Provider 熔断器
+
+按 (endpoint, team_id) 维护熔断状态，状态存储可插拔：
+- MemoryBreakerBackend：进程内，LRU 限制条目数，避免数千 team_id 下无限增长
+- RedisBreakerBackend：多 worker 共享状态（复用限流器的 Redis 配置），一个进程发现团队
+  不可用后其余进程立即跳过
+
+状态机：closed --(连续失败达到阈值)--> open --(冷却期结束)--> half_open
+half_open 只放行有限个探测请求：探测成功回到 closed，失败重新 open；探测请求若未回报结果，
+租约在 probe_timeout 后失效，允许新的探测。
+
+auto / redis 模式下首次使用时 Redis 不可用会先用进程内后端，并每隔 _REPROBE_SECONDS 重新探测。
+异步调用方使用 aallow / arecord_*：Redis 后端的网络 IO 放到线程中执行，不阻塞事件循环。
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# 自动选择后端时 Redis 不可用，多久后重新探测
+_REPROBE_SECONDS = 30.0
+
+
+@dataclass(frozen=True)
+class BreakerConfig:
+    fail_threshold: int = 3
+    reset_seconds: float = 60.0
+    half_open_max_probes: int = 1
+    probe_timeout_seconds: float = 30.0
+    max_entries: int = 10000
+
+    @classmethod
+    def from_settings(cls, settings) -> "BreakerConfig":
+        return cls(
+            fail_threshold=max(1, settings.circuit_breaker_fail_threshold),
+            reset_seconds=settings.circuit_breaker_reset_seconds,
+            half_open_max_probes=max(1, settings.circuit_breaker_half_open_probes),
+            probe_timeout_seconds=settings.circuit_breaker_probe_timeout_seconds,
+            max_entries=max(1, settings.circuit_breaker_max_entries),
+        )
+
+
+@dataclass
+class BreakerState:
+    endpoint: str
+    team_id: str
+    state: str = STATE_CLOSED
+    failures: int = 0
+    opened_at: float = 0.0
+    probes: int = 0
+    probe_at: float = 0.0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class BreakerBackend(ABC):
+    """熔断状态存储接口；时间使用 wall clock，便于跨进程共享"""
+
+    name = "base"
+
+    @abstractmethod
+    def allow(self, endpoint: str, team_id: str, now: float) -> bool:
+        ...
+
+    @abstractmethod
+    def on_success(self, endpoint: str, team_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def on_failure(self, endpoint: str, team_id: str, now: float) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, endpoint: str, team_id: str) -> Optional[BreakerState]:
+        ...
+
+    @abstractmethod
+    def items(
+        self,
+        limit: int = 200,
+        endpoint: Optional[str] = None,
+        team_id: Optional[str] = None,
+        state: Optional[str] = None,
+    ) -> list[BreakerState]:
+        ...
+
+    @abstractmethod
+    def reset(self, endpoint: Optional[str] = None, team_id: Optional[str] = None) -> int:
+        ...
+
+
+class MemoryBreakerBackend(BreakerBackend):
+    """进程内 LRU 熔断状态；成功后条目直接删除（closed 且无失败无需保存）"""
+
+    name = "memory"
+
+    def __init__(self, config: BreakerConfig):
+        self.config = config
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple[str, str], BreakerState]" = OrderedDict()
+
+    def _touch(self, key: tuple[str, str]) -> BreakerState:
+        st = self._entries.get(key)
+        if st is None:
+            st = BreakerState(endpoint=key[0], team_id=key[1])
+            self._entries[key] = st
+            while len(self._entries) > self.config.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return st
+
+    def allow(self, endpoint: str, team_id: str, now: float) -> bool:
+        key = (endpoint, team_id)
+        cfg = self.config
+        with self._lock:
+            st = self._entries.get(key)
+            if st is None or st.state == STATE_CLOSED:
+                return True
+            self._entries.move_to_end(key)
+            if st.state == STATE_OPEN:
+                if now - st.opened_at < cfg.reset_seconds:
+                    return False
+                st.state = STATE_HALF_OPEN
+                st.probes = 1
+                st.probe_at = now
+                return True
+            # half_open：未回报的探测超过租约后作废
+            if st.probes > 0 and now - st.probe_at >= cfg.probe_timeout_seconds:
+                st.probes = 0
+            if st.probes >= cfg.half_open_max_probes:
+                return False
+            st.probes += 1
+            st.probe_at = now
+            return True
+
+    def on_success(self, endpoint: str, team_id: str) -> None:
+        with self._lock:
+            self._entries.pop((endpoint, team_id), None)
+
+    def on_failure(self, endpoint: str, team_id: str, now: float) -> None:
+        with self._lock:
+            st = self._touch((endpoint, team_id))
+            st.failures += 1
+            if st.state == STATE_HALF_OPEN or (
+                st.state == STATE_CLOSED and st.failures >= self.config.fail_threshold
+            ):
+                st.state = STATE_OPEN
+                st.opened_at = now
+                st.probes = 0
+
+    def get(self, endpoint: str, team_id: str) -> Optional[BreakerState]:
+        with self._lock:
+            st = self._entries.get((endpoint, team_id))
+            return BreakerState(**asdict(st)) if st else None
+
+    def items(
+        self,
+        limit: int = 200,
+        endpoint: Optional[str] = None,
+        team_id: Optional[str] = None,
+        state: Optional[str] = None,
+    ) -> list[BreakerState]:
+        with self._lock:
+            states = [
+                BreakerState(**asdict(st))
+                for st in reversed(self._entries.values())
+                if (endpoint is None or st.endpoint == endpoint)
+                and (team_id is None or st.team_id == team_id)
+                and (state is None or st.state == state)
+            ]
+        return states[:limit]
+
+    def reset(self, endpoint: Optional[str] = None, team_id: Optional[str] = None) -> int:
+        with self._lock:
+            keys = [
+                k for k in self._entries
+                if (endpoint is None or k[0] == endpoint) and (team_id is None or k[1] == team_id)
+            ]
+            for k in keys:
+                del self._entries[k]
+        return len(keys)
+
+
+_ALLOW_SCRIPT = """
+local st = redis.call('HMGET', KEYS[1], 'state', 'opened_at', 'probes', 'probe_at')
+local state = st[1]
+if not state or state == 'closed' then return 1 end
+local now = tonumber(ARGV[1])
+if state == 'open' then
+  if now - tonumber(st[2] or '0') < tonumber(ARGV[2]) then return 0 end
+  redis.call('HSET', KEYS[1], 'state', 'half_open', 'probes', 1, 'probe_at', now)
+  return 1
+end
+local probes = tonumber(st[3] or '0')
+if probes > 0 and now - tonumber(st[4] or '0') >= tonumber(ARGV[4]) then probes = 0 end
+if probes >= tonumber(ARGV[3]) then return 0 end
+redis.call('HSET', KEYS[1], 'probes', probes + 1, 'probe_at', now)
+return 1
+"""
+
+_FAILURE_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+local fails = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+if state == 'half_open' or (state == 'closed' and fails >= tonumber(ARGV[2])) then
+  redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', ARGV[1], 'probes', 0)
+elseif state == 'closed' then
+  redis.call('HSET', KEYS[1], 'state', 'closed')
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+class RedisBreakerBackend(BreakerBackend):
+    """
+    Redis 共享熔断状态
+
+    每个 (endpoint, team_id) 一个 hash，状态迁移通过 Lua 脚本原子完成；
+    键带 TTL，成功即删除，不会随 team_id 数量无限增长。
+    """
+
+    name = "redis"
+
+    def __init__(self, client, config: BreakerConfig, namespace: str = "gpt_invite:cb"):
+        self.client = client
+        self.config = config
+        self.namespace = namespace
+        self._allow = client.register_script(_ALLOW_SCRIPT)
+        self._failure = client.register_script(_FAILURE_SCRIPT)
+        # 失败计数在冷却期的若干倍后自然过期
+        self._ttl = int(max(config.reset_seconds * 10, config.probe_timeout_seconds * 2, 300))
+
+    def _key(self, endpoint: str, team_id: str) -> str:
+        return f"{self.namespace}:{endpoint}:{team_id}"
+
+    def allow(self, endpoint: str, team_id: str, now: float) -> bool:
+        cfg = self.config
+        res = self._allow(
+            keys=[self._key(endpoint, team_id)],
+            args=[now, cfg.reset_seconds, cfg.half_open_max_probes, cfg.probe_timeout_seconds],
+        )
+        return bool(int(res))
+
+    def on_success(self, endpoint: str, team_id: str) -> None:
+        self.client.delete(self._key(endpoint, team_id))
+
+    def on_failure(self, endpoint: str, team_id: str, now: float) -> None:
+        self._failure(
+            keys=[self._key(endpoint, team_id)],
+            args=[now, self.config.fail_threshold, self._ttl],
+        )
+
+    def _load(self, key: str) -> Optional[BreakerState]:
+        data = self.client.hgetall(key)
+        if not data:
+            return None
+        endpoint, _, team_id = key[len(self.namespace) + 1:].partition(":")
+        return BreakerState(
+            endpoint=endpoint,
+            team_id=team_id,
+            state=data.get("state", STATE_CLOSED),
+            failures=int(data.get("failures", 0)),
+            opened_at=float(data.get("opened_at", 0.0)),
+            probes=int(data.get("probes", 0)),
+            probe_at=float(data.get("probe_at", 0.0)),
+        )
+
+    def get(self, endpoint: str, team_id: str) -> Optional[BreakerState]:
+        return self._load(self._key(endpoint, team_id))
+
+    def _scan(self, endpoint: Optional[str] = None, team_id: Optional[str] = None):
+        pattern = f"{self.namespace}:{endpoint or '*'}:{team_id or '*'}"
+        return self.client.scan_iter(match=pattern, count=500)
+
+    def items(
+        self,
+        limit: int = 200,
+        endpoint: Optional[str] = None,
+        team_id: Optional[str] = None,
+        state: Optional[str] = None,
+    ) -> list[BreakerState]:
+        states = []
+        if limit <= 0:
+            return states
+        for key in self._scan(endpoint, team_id):
+            st = self._load(key)
+            if st is not None and (state is None or st.state == state):
+                states.append(st)
+            if len(states) >= limit:
+                break
+        return states
+
+    def reset(self, endpoint: Optional[str] = None, team_id: Optional[str] = None) -> int:
+        keys = list(self._scan(endpoint, team_id))
+        if keys:
+            self.client.delete(*keys)
+        return len(keys)
+
+
+class CircuitBreaker:
+    """
+    熔断器门面
+
+    Redis 后端出错时自动降级到进程内后端，熔断检查不会因 Redis 故障阻断上游调用。
+    """
+
+    def __init__(self, backend: Optional[BreakerBackend] = None, config: Optional[BreakerConfig] = None):
+        self.config = config or BreakerConfig.from_settings(settings)
+        self._backend = backend
+        self._fallback = MemoryBreakerBackend(self.config)
+        self._lock = threading.Lock()
+        # 自动构建的进程内后端：到期后重新尝试 Redis（显式传入的后端不切换）
+        self._reprobe_at: Optional[float] = None
+
+    def _probe_due(self) -> bool:
+        return self._backend is None or (
+            self._reprobe_at is not None and time.monotonic() >= self._reprobe_at
+        )
+
+    @property
+    def backend(self) -> BreakerBackend:
+        if self._probe_due():
+            with self._lock:
+                if self._probe_due():
+                    backend = _build_backend(self.config)
+                    if self._backend is None or backend.name != self._backend.name:
+                        self._backend = backend
+                    wants_redis = (settings.circuit_breaker_backend or "auto").lower() in ("redis", "auto")
+                    self._reprobe_at = (
+                        time.monotonic() + _REPROBE_SECONDS
+                        if wants_redis and isinstance(self._backend, MemoryBreakerBackend)
+                        else None
+                    )
+        return self._backend
+
+    def _inline(self) -> bool:
+        """当前后端为进程内且无需重新探测时，直接在事件循环中调用"""
+        return isinstance(self._backend, MemoryBreakerBackend) and not self._probe_due()
+
+    def _call(self, method: str, *args, default=None):
+        backend = self.backend
+        try:
+            return getattr(backend, method)(*args)
+        except Exception:
+            if backend is self._fallback:
+                raise
+            logger.debug("circuit breaker backend %s failed; using memory", backend.name, exc_info=True)
+            try:
+                return getattr(self._fallback, method)(*args)
+            except Exception:
+                return default
+
+    def allow(self, endpoint: str, team_id: Optional[str]) -> bool:
+        """是否允许调用；half_open 时占用一个探测名额"""
+        return bool(self._call("allow", endpoint, team_id or "-", time.time(), default=True))
+
+    def record_success(self, endpoint: str, team_id: Optional[str]) -> None:
+        self._call("on_success", endpoint, team_id or "-")
+
+    def record_failure(self, endpoint: str, team_id: Optional[str]) -> None:
+        self._call("on_failure", endpoint, team_id or "-", time.time())
+
+    async def aallow(self, endpoint: str, team_id: Optional[str]) -> bool:
+        if self._inline():
+            return self.allow(endpoint, team_id)
+        return await asyncio.to_thread(self.allow, endpoint, team_id)
+
+    async def arecord_success(self, endpoint: str, team_id: Optional[str]) -> None:
+        if self._inline():
+            self.record_success(endpoint, team_id)
+        else:
+            await asyncio.to_thread(self.record_success, endpoint, team_id)
+
+    async def arecord_failure(self, endpoint: str, team_id: Optional[str]) -> None:
+        if self._inline():
+            self.record_failure(endpoint, team_id)
+        else:
+            await asyncio.to_thread(self.record_failure, endpoint, team_id)
+
+    def get(self, endpoint: str, team_id: Optional[str]) -> Optional[BreakerState]:
+        return self._call("get", endpoint, team_id or "-")
+
+    def snapshot(
+        self,
+        limit: int = 200,
+        state: Optional[str] = None,
+        endpoint: Optional[str] = None,
+        team_id: Optional[str] = None,
+    ) -> dict:
+        # 先按状态过滤再截断，limit 不会把符合条件的条目挤掉
+        items = self._call("items", limit, endpoint, team_id, state or None, default=[]) or []
+        return {
+            "backend": self.backend.name,
+            "config": asdict(self.config),
+            "items": [st.to_dict() for st in items],
+        }
+
+    def reset(self, endpoint: Optional[str] = None, team_id: Optional[str] = None) -> int:
+        removed = self._call("reset", endpoint, team_id, default=0) or 0
+        if self.backend is not self._fallback:
+            removed += self._fallback.reset(endpoint, team_id)
+        return removed
+
+
+def _build_backend(config: BreakerConfig) -> BreakerBackend:
+    choice = (settings.circuit_breaker_backend or "auto").lower()
+    if choice in ("redis", "auto"):
+        from app.services.services.rate_limiter_service import get_sync_redis_client
+
+        client = get_sync_redis_client()
+        if client is not None:
+            return RedisBreakerBackend(client, config, namespace=settings.circuit_breaker_namespace)
+        if choice == "redis":
+            logger.warning("Circuit breaker configured for Redis but Redis is unavailable; using memory backend")
+    return MemoryBreakerBackend(config)
+
+
+provider_breaker = CircuitBreaker()
@@ -27,6 +27,9 @@ class Settings:
     strict_domain_guard: bool = os.getenv("STRICT_DOMAIN_GUARD", "false").lower() == "true"
 
     admin_session_ttl_seconds: int = int(os.getenv("ADMIN_SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+    # 管理员会话校验缓存（秒，0 关闭）；Redis 可用时多进程共享撤销
+    admin_session_cache_ttl_seconds: float = float(os.getenv("ADMIN_SESSION_CACHE_TTL_SECONDS", "15"))
+    admin_session_cache_redis: bool = os.getenv("ADMIN_SESSION_CACHE_REDIS", "true").lower() == "true"
     # 默认母号 token 过期逻辑：若上游未提供 expires，则按该天数回退
     token_default_ttl_days: int = int(os.getenv("TOKEN_DEFAULT_TTL_DAYS", "40"))
     # 座位占位 TTL（秒），邀请发送前的持有时间，避免并发抢占
@@ -35,6 +38,15 @@ class Settings:
     seat_claim_retry_attempts: int = int(os.getenv("SEAT_CLAIM_RETRY_ATTEMPTS", "5"))
     seat_claim_backoff_ms_base: int = int(os.getenv("SEAT_CLAIM_BACKOFF_MS_BASE", "10"))
     seat_claim_backoff_ms_max: int = int(os.getenv("SEAT_CLAIM_BACKOFF_MS_MAX", "200"))
+    # 座位可用性索引（选母号时避免扫描全部母号）
+    seat_index_enabled: bool = os.getenv("SEAT_INDEX_ENABLED", "true").lower() == "true"
+    seat_index_reconcile_seconds: float = float(os.getenv("SEAT_INDEX_RECONCILE_SECONDS", "60"))
+    # 批量兑换：单次最多条数、按团队并发发送邀请的并发度
+    redeem_batch_max_items: int = int(os.getenv("REDEEM_BATCH_MAX_ITEMS", "500"))
+    redeem_batch_concurrency: int = int(os.getenv("REDEEM_BATCH_CONCURRENCY", "5"))
+    # 邀请合并：同一团队的邀请缓冲若干毫秒或攒满批次后合并为一次请求（窗口为 0 关闭）
+    provider_invite_coalesce_ms: float = float(os.getenv("PROVIDER_INVITE_COALESCE_MS", "10"))
+    provider_invite_batch_size: int = int(os.getenv("PROVIDER_INVITE_BATCH_SIZE", "50"))
 
     extra_password: Optional[str] = os.getenv("EXTRA_PASSWORD")
     # 可选：备用口令哈希（bcrypt），优先于明文 EXTRA_PASSWORD
@@ -52,24 +64,65 @@ class Settings:
     redis_password: Optional[str] = os.getenv("REDIS_PASSWORD")
     redis_db: int = int(os.getenv("REDIS_DB", "0"))
     redis_url: str = os.getenv("REDIS_URL", f"redis://{redis_host}:{redis_port}/{redis_db}")
+    redis_socket_timeout_seconds: float = float(os.getenv("REDIS_SOCKET_TIMEOUT_SECONDS", "0.5"))
     rate_limit_warn_on_fallback: bool = os.getenv("RATE_LIMIT_WARN_ON_FALLBACK", "true").lower() == "true"
     rate_limit_allow_memory_fallback_raw: Optional[str] = os.getenv("RATE_LIMIT_ALLOW_MEMORY_FALLBACK")
 
     # 限流配置
     rate_limit_enabled: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
     rate_limit_namespace: str = os.getenv("RATE_LIMIT_NAMESPACE", "gpt_invite:rate")
+    # 内存回退限流器的桶数上限与空闲淘汰时间
+    rate_limit_memory_max_keys: int = int(os.getenv("RATE_LIMIT_MEMORY_MAX_KEYS", "100000"))
+    rate_limit_memory_idle_seconds: float = float(os.getenv("RATE_LIMIT_MEMORY_IDLE_SECONDS", "600"))
     csrf_allowed_origins_raw: Optional[str] = os.getenv("CSRF_ALLOWED_ORIGINS")
     # 远程录号 Ingest API
     ingest_api_enabled: bool = os.getenv("INGEST_API_ENABLED", "false").lower() == "true"
     ingest_api_key: Optional[str] = os.getenv("INGEST_API_KEY")
     # 维护与同步
     maintenance_interval_seconds: int = int(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "60"))
+    # 任务锁租期：持有期间后台线程每 1/3 租期续期一次，实例崩溃后最多等待一个租期
+    lock_lease_seconds: int = int(os.getenv("LOCK_LEASE_SECONDS", "30"))
     invite_sync_days: int = int(os.getenv("INVITE_SYNC_DAYS", "30"))
     invite_sync_group_limit: int = int(os.getenv("INVITE_SYNC_GROUP_LIMIT", "20"))
-    mother_health_check_batch_size: int = int(os.getenv("MOTHER_HEALTH_CHECK_BATCH", "5"))
+    # 邀请对账拉取成员的分页大小与单团队最多页数
+    invite_sync_page_size: int = int(os.getenv("INVITE_SYNC_PAGE_SIZE", "100"))
+    invite_sync_max_pages: int = int(os.getenv("INVITE_SYNC_MAX_PAGES", "50"))
+    mother_health_check_batch_size: int = int(os.getenv("MOTHER_HEALTH_CHECK_BATCH", "50"))
+    # 母号健康探测并发数与上游每秒探测上限（0 表示不限速）
+    mother_health_check_workers: int = int(os.getenv("MOTHER_HEALTH_CHECK_WORKERS", "8"))
+    mother_health_probe_rps: float = float(os.getenv("MOTHER_HEALTH_PROBE_RPS", "10"))
+    # 维护任务分块批量更新：每块行数、每轮最长耗时（秒），超出部分留到下一轮
+    maintenance_bulk_chunk_size: int = int(os.getenv("MAINTENANCE_BULK_CHUNK_SIZE", "1000"))
+    maintenance_bulk_max_seconds: float = float(os.getenv("MAINTENANCE_BULK_MAX_SECONDS", "10"))
+    # 统计计数器全量对账间隔（秒）
+    stats_counters_reconcile_seconds: float = float(os.getenv("STATS_COUNTERS_RECONCILE_SECONDS", "600"))
+    # 计数器分片数：并发事务随机写入不同分片行，读取时求和，避免热点行锁排队
+    stats_counter_shards: int = int(os.getenv("STATS_COUNTER_SHARDS", "8"))
+    # 小时汇总：运行间隔（秒）、每轮重算的回看小时数（吸收迟到数据）、每轮最多推进的小时数（回填上限）
+    stats_rollup_interval_seconds: float = float(os.getenv("STATS_ROLLUP_INTERVAL_SECONDS", "300"))
+    stats_rollup_lookback_hours: int = int(os.getenv("STATS_ROLLUP_LOOKBACK_HOURS", "48"))
+    stats_rollup_max_hours_per_run: int = int(os.getenv("STATS_ROLLUP_MAX_HOURS_PER_RUN", "168"))
+    # 后台任务调度：默认超时、按任务覆盖间隔/超时（如 "sync_invite_acceptance=300:120,process_switch_queue=15"）、
+    # 多实例分片（SHARD_COUNT>1 时每个实例只运行 crc32(任务名) % COUNT == INDEX 的任务）
+    scheduler_task_timeout_seconds: float = float(os.getenv("SCHEDULER_TASK_TIMEOUT_SECONDS", "300"))
+    scheduler_task_overrides_raw: Optional[str] = os.getenv("SCHEDULER_TASK_OVERRIDES")
+    # 调度器线程池大小（0 表示与任务数相同）
+    scheduler_max_workers: int = int(os.getenv("SCHEDULER_MAX_WORKERS", "0"))
+    scheduler_shard_count: int = int(os.getenv("SCHEDULER_SHARD_COUNT", "1"))
+    scheduler_shard_index: int = int(os.getenv("SCHEDULER_SHARD_INDEX", "0"))
     # 批量任务队列
     job_visibility_timeout_seconds: int = int(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "300"))
     job_max_attempts: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    # 兑换码批量生成：单次请求上限、每条 INSERT / COPY 的行数
+    code_generate_max_count: int = int(os.getenv("CODE_GENERATE_MAX_COUNT", "1000"))
+    code_generate_chunk_size: int = int(os.getenv("CODE_GENERATE_CHUNK_SIZE", "1000"))
+    # 兑换码导出：每块读取/编码行数、后台导出文件目录（默认与 SQLite 库同在 data/ 下）与保留小时数
+    code_export_chunk_size: int = int(os.getenv("CODE_EXPORT_CHUNK_SIZE", "1000"))
+    code_export_dir: str = os.getenv(
+        "CODE_EXPORT_DIR",
+        os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")), "data", "exports"),
+    )
+    code_export_retention_hours: int = int(os.getenv("CODE_EXPORT_RETENTION_HOURS", "72"))
     # 兑换码生命周期与切换
     code_default_lifecycle_plan: str = os.getenv("CODE_DEFAULT_LIFECYCLE_PLAN", "monthly").lower()
     code_lifecycle_weekly_days: int = int(os.getenv("CODE_LIFECYCLE_WEEKLY_DAYS", "7"))
@@ -94,10 +147,46 @@ class Settings:
     pool_retry_backoff_base_ms: int = int(os.getenv("POOL_RETRY_BACKOFF_BASE_MS", "500"))
     pool_retry_backoff_multiplier: float = float(os.getenv("POOL_RETRY_BACKOFF_MULTIPLIER", "2.0"))
     pool_log_retention_days: int = int(os.getenv("POOL_LOG_RETENTION_DAYS", "30"))
+    # API Key 校验结果进程内缓存（禁用后本进程立即失效；其他进程按检查间隔读取 Redis 中的撤销 epoch，
+    # Redis 不可用时最迟 TTL 后失效）
+    pool_api_key_cache_ttl_seconds: float = float(os.getenv("POOL_API_KEY_CACHE_TTL_SECONDS", "30"))
+    pool_api_key_cache_max_entries: int = int(os.getenv("POOL_API_KEY_CACHE_MAX_ENTRIES", "1024"))
+    pool_api_key_revocation_check_seconds: float = float(os.getenv("POOL_API_KEY_REVOCATION_CHECK_SECONDS", "1"))
+    # last_used_at 先记在内存，按该间隔批量写回
+    pool_api_key_usage_flush_seconds: float = float(os.getenv("POOL_API_KEY_USAGE_FLUSH_SECONDS", "5"))
     capacity_guard_enabled: bool = os.getenv("CAPACITY_GUARD_ENABLED", "true").lower() == "true"
     capacity_warn_threshold: int = int(os.getenv("CAPACITY_WARN_THRESHOLD", "20"))
     mother_health_alive_grace_minutes: int = int(os.getenv("MOTHER_HEALTH_ALIVE_GRACE_MINUTES", "120"))
 
+    # Provider HTTP 连接池（按 host+proxy 复用 keep-alive 连接）
+    provider_pool_max_connections: int = int(os.getenv("PROVIDER_POOL_MAX_CONNECTIONS", "100"))
+    provider_pool_max_keepalive: int = int(os.getenv("PROVIDER_POOL_MAX_KEEPALIVE", "20"))
+    provider_keepalive_expiry_seconds: float = float(os.getenv("PROVIDER_KEEPALIVE_EXPIRY_SECONDS", "30"))
+    provider_http2: bool = os.getenv("PROVIDER_HTTP2", "true").lower() == "true"
+    provider_connect_timeout_seconds: float = float(os.getenv("PROVIDER_CONNECT_TIMEOUT_SECONDS", "5"))
+    provider_read_timeout_seconds: float = float(os.getenv("PROVIDER_READ_TIMEOUT_SECONDS", "30"))
+    provider_pool_timeout_seconds: float = float(os.getenv("PROVIDER_POOL_TIMEOUT_SECONDS", "10"))
+    # Provider 统一重试策略与单请求重试预算
+    provider_retry_attempts: int = int(os.getenv("PROVIDER_RETRY_ATTEMPTS", "3"))
+    provider_retry_base_delay_ms: int = int(os.getenv("PROVIDER_RETRY_BASE_DELAY_MS", "500"))
+    provider_retry_max_delay_ms: int = int(os.getenv("PROVIDER_RETRY_MAX_DELAY_MS", "8000"))
+    provider_retry_jitter: bool = os.getenv("PROVIDER_RETRY_JITTER", "true").lower() == "true"
+    provider_retry_after_max_ms: int = int(os.getenv("PROVIDER_RETRY_AFTER_MAX_MS", "30000"))
+    request_retry_budget: int = int(os.getenv("REQUEST_RETRY_BUDGET", "4"))
+    request_deadline_seconds: float = float(os.getenv("REQUEST_DEADLINE_SECONDS", "25"))
+    # Provider 熔断：auto（有 Redis 时共享状态）/ redis / memory
+    circuit_breaker_backend: str = os.getenv("CIRCUIT_BREAKER_BACKEND", "auto").lower()
+    circuit_breaker_namespace: str = os.getenv("CIRCUIT_BREAKER_NAMESPACE", "gpt_invite:cb")
+    circuit_breaker_fail_threshold: int = int(os.getenv("CIRCUIT_BREAKER_FAIL_THRESHOLD", "3"))
+    circuit_breaker_reset_seconds: float = float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "60"))
+    circuit_breaker_half_open_probes: int = int(os.getenv("CIRCUIT_BREAKER_HALF_OPEN_PROBES", "1"))
+    circuit_breaker_probe_timeout_seconds: float = float(os.getenv("CIRCUIT_BREAKER_PROBE_TIMEOUT_SECONDS", "30"))
+    circuit_breaker_max_entries: int = int(os.getenv("CIRCUIT_BREAKER_MAX_ENTRIES", "10000"))
+    # 事件循环阻塞监控：心跳间隔、单个回调阻塞超过阈值（毫秒）即记录路由与指标
+    loop_monitor_enabled: bool = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+    loop_monitor_interval_seconds: float = float(os.getenv("LOOP_MONITOR_INTERVAL_SECONDS", "0.5"))
+    loop_monitor_threshold_ms: float = float(os.getenv("LOOP_MONITOR_THRESHOLD_MS", "100"))
+
     @property
     def database_url(self) -> str:
         """获取数据库连接URL。
@@ -180,6 +269,27 @@ class Settings:
             origins.append(v.rstrip("/"))
         return origins
 
+    @property
+    def scheduler_task_overrides(self) -> dict[str, tuple[Optional[float], Optional[float]]]:
+        """解析 SCHEDULER_TASK_OVERRIDES：任务名 -> (间隔秒, 超时秒)，未给出的项为 None"""
+        raw = self.scheduler_task_overrides_raw
+        overrides: dict[str, tuple[Optional[float], Optional[float]]] = {}
+        if not raw:
+            return overrides
+        for item in raw.split(","):
+            name, _, spec = item.partition("=")
+            name = name.strip()
+            if not name or not spec.strip():
+                continue
+            interval_raw, _, timeout_raw = spec.strip().partition(":")
+            try:
+                interval = float(interval_raw) if interval_raw.strip() else None
+                timeout = float(timeout_raw) if timeout_raw.strip() else None
+            except ValueError:
+                continue
+            overrides[name] = (interval, timeout)
+        return overrides
+
     @property
     def pool_retry_backoff_sequence_ms(self) -> list[int]:
         """生成重试退避序列（毫秒）：[500, 1000, 2000] 默认"""
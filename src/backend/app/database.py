@@ -40,6 +40,8 @@ BaseUsers = declarative_base()
 BasePool = declarative_base()
 
 from app import models as _models  # noqa: F401 ensure model metadata registered
+from app.services.shared import stats_counters as _stats_counters  # noqa: F401,E402 register counter listeners
+from app.services.shared import text_search as _text_search  # noqa: F401,E402 register search DDL
 
 # 兼容：旧代码仍引用 SessionLocal → 用户组库
 SessionLocal = SessionUsers
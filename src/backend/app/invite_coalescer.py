@@ -0,0 +1,222 @@
+"""
+邀请合并发送
+
+上游 /invites 接口的 email_addresses 支持列表，但调用方（兑换、Pool 批量邀请、互换）
+通常逐个邮箱调用 send_invite。合并器按 (team_id, token, role, resend) 缓冲几毫秒或攒满
+batch_size 后一次发出，再按返回的 invites 数组把结果分发给各调用方：
+
+- 第一个到达的调用方成为 leader，等待窗口结束或批次满后代表整批发送；其余调用方只等待结果
+- 每个调用方拿到与单独调用相同形状的响应：{"invites": [属于自己的那一项], ...}
+- 整批因 400/422 被拒时退化为逐个发送，避免一个坏地址拖累整批
+- 同步版本用于线程中的 provider.send_invite，异步版本用于 provider_async.send_invite
+- 异步版本由 leader 创建独立的 flush 任务负责等待窗口与发送，调用方（包括 leader）只等待自己的
+  future：任一调用方被取消都不会让批次滞留在 _open 中或让其他调用方永远等待
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Optional
+
+from app.config import settings
+from app.metrics import provider_metrics
+
+# 整批被拒绝时改为逐个发送的状态码
+_SPLIT_STATUSES = (400, 422)
+
+SendInvites = Callable[..., dict]
+AsyncSendInvites = Callable[..., Awaitable[dict]]
+
+
+def split_invite_response(resp: Optional[dict], emails: list[str]) -> list[dict]:
+    """将批量响应拆成与 emails 一一对应的单邮箱响应"""
+    resp = resp if isinstance(resp, dict) else {}
+    items = resp.get("invites") or []
+    by_email: dict[str, Any] = {}
+    for item in items:
+        if isinstance(item, dict):
+            addr = item.get("email_address") or item.get("email")
+            if isinstance(addr, str):
+                by_email.setdefault(addr.lower(), item)
+    positional = not by_email and len(items) == len(emails)
+    extra = {k: v for k, v in resp.items() if k != "invites"}
+    out = []
+    for i, email in enumerate(emails):
+        item = items[i] if positional else by_email.get(email.lower())
+        out.append({**extra, "invites": [item] if item is not None else []})
+    return out
+
+
+class _Batch:
+    __slots__ = ("emails", "futures", "full")
+
+    def __init__(self, full):
+        self.emails: list[str] = []
+        self.futures: list[Any] = []
+        self.full = full
+
+
+def _should_split(error: BaseException, size: int) -> bool:
+    return size > 1 and getattr(error, "status", None) in _SPLIT_STATUSES
+
+
+class InviteCoalescer:
+    """线程版合并器：调用方阻塞等待结果"""
+
+    def __init__(
+        self,
+        send_fn: SendInvites,
+        window_ms: Optional[float] = None,
+        max_batch: Optional[int] = None,
+    ):
+        self._send = send_fn
+        self.window_ms = settings.provider_invite_coalesce_ms if window_ms is None else window_ms
+        self.max_batch = settings.provider_invite_batch_size if max_batch is None else max_batch
+        self._lock = threading.Lock()
+        self._open: dict[tuple, _Batch] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_ms > 0 and self.max_batch > 1
+
+    def submit(self, access_token: str, team_id: str, email: str, role: str, resend: bool) -> dict:
+        if not self.enabled:
+            return self._send(access_token, team_id, [email], role=role, resend=resend)
+
+        key = (team_id, access_token, role, resend)
+        fut: Future = Future()
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch(threading.Event())
+            batch.emails.append(email)
+            batch.futures.append(fut)
+            if len(batch.emails) >= self.max_batch:
+                self._open.pop(key, None)
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window_ms / 1000.0)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            self._dispatch(key, batch)
+        return fut.result()
+
+    def _dispatch(self, key: tuple, batch: _Batch) -> None:
+        team_id, access_token, role, resend = key
+        provider_metrics.record_invite_batch(team_id, len(batch.emails))
+        try:
+            resp = self._send(access_token, team_id, batch.emails, role=role, resend=resend)
+        except Exception as e:
+            if _should_split(e, len(batch.emails)):
+                for email, fut in zip(batch.emails, batch.futures):
+                    try:
+                        fut.set_result(self._send(access_token, team_id, [email], role=role, resend=resend))
+                    except Exception as single_error:
+                        fut.set_exception(single_error)
+                return
+            for fut in batch.futures:
+                fut.set_exception(e)
+            return
+        for fut, part in zip(batch.futures, split_invite_response(resp, batch.emails)):
+            fut.set_result(part)
+
+
+class AsyncInviteCoalescer:
+    """asyncio 版合并器：按事件循环隔离批次"""
+
+    def __init__(
+        self,
+        send_fn: AsyncSendInvites,
+        window_ms: Optional[float] = None,
+        max_batch: Optional[int] = None,
+    ):
+        self._send = send_fn
+        self.window_ms = settings.provider_invite_coalesce_ms if window_ms is None else window_ms
+        self.max_batch = settings.provider_invite_batch_size if max_batch is None else max_batch
+        self._open: dict[tuple, _Batch] = {}
+        # 持有 flush 任务的强引用，避免被垃圾回收
+        self._flushing: set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_ms > 0 and self.max_batch > 1
+
+    async def submit(self, access_token: str, team_id: str, email: str, role: str, resend: bool) -> dict:
+        if not self.enabled:
+            return await self._send(access_token, team_id, [email], role=role, resend=resend)
+
+        loop = asyncio.get_running_loop()
+        key = (id(loop), team_id, access_token, role, resend)
+        fut: asyncio.Future = loop.create_future()
+        batch = self._open.get(key)
+        leader = batch is None
+        if leader:
+            batch = self._open[key] = _Batch(asyncio.Event())
+        batch.emails.append(email)
+        batch.futures.append(fut)
+        if len(batch.emails) >= self.max_batch:
+            self._open.pop(key, None)
+            batch.full.set()
+
+        if leader:
+            task = loop.create_task(self._flush(key, batch))
+            self._flushing.add(task)
+            task.add_done_callback(self._flushing.discard)
+        return await fut
+
+    async def _flush(self, key: tuple, batch: _Batch) -> None:
+        try:
+            try:
+                await asyncio.wait_for(batch.full.wait(), self.window_ms / 1000.0)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            await self._dispatch(key[1:], batch)
+        except BaseException as e:
+            # flush 任务本身被取消或意外出错：不让任何调用方悬挂
+            for fut in batch.futures:
+                if not fut.done():
+                    if isinstance(e, asyncio.CancelledError):
+                        fut.cancel()
+                    else:
+                        fut.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+
+    async def _dispatch(self, key: tuple, batch: _Batch) -> None:
+        team_id, access_token, role, resend = key
+        # 已取消的调用方不再发送
+        pending = [(email, fut) for email, fut in zip(batch.emails, batch.futures) if not fut.done()]
+        if not pending:
+            return
+        emails = [email for email, _ in pending]
+        provider_metrics.record_invite_batch(team_id, len(emails))
+        try:
+            resp = await self._send(access_token, team_id, emails, role=role, resend=resend)
+        except Exception as e:
+            if _should_split(e, len(emails)):
+                for email, fut in pending:
+                    if fut.done():
+                        continue
+                    try:
+                        result = await self._send(access_token, team_id, [email], role=role, resend=resend)
+                    except Exception as single_error:
+                        if not fut.done():
+                            fut.set_exception(single_error)
+                    else:
+                        if not fut.done():
+                            fut.set_result(result)
+                return
+            for _, fut in pending:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), part in zip(pending, split_invite_response(resp, emails)):
+            if not fut.done():
+                fut.set_result(part)
@@ -9,6 +9,16 @@ class ProviderMetrics:
         # key: (endpoint, team_id, status_code)
         self._counts = defaultdict(int)
         self._latency = defaultdict(float)
+        # 连接池指标 key: host
+        self._pool_hits = defaultdict(int)
+        self._pool_misses = defaultdict(int)
+        self._inflight = defaultdict(int)
+        # 重试指标 key: endpoint
+        self._retries = defaultdict(int)
+        self._retry_wait_ms = defaultdict(float)
+        # 邀请合并指标
+        self._invite_batches = 0
+        self._invite_batched_emails = 0
     
     def record(self, endpoint: str, team_id: Optional[str], status: int, latency_ms: float):
         key = (endpoint, team_id or "-", status)
@@ -23,6 +33,60 @@ class ProviderMetrics:
             provider_latency_ms.labels(endpoint=endpoint, team_id=team_id or "-", status=str(status)).observe(latency_ms)
         except Exception:
             pass
+
+    def record_pool(self, host: str, hit: bool):
+        """记录一次连接池复用（hit）或新建连接（miss）"""
+        with self._lock:
+            if hit:
+                self._pool_hits[host] += 1
+            else:
+                self._pool_misses[host] += 1
+        try:
+            from app.metrics_prom import provider_pool_requests_total
+            provider_pool_requests_total.labels(host=host, result="hit" if hit else "miss").inc()
+        except Exception:
+            pass
+
+    def record_retry(self, endpoint: str, wait_ms: float):
+        """记录一次重试及其退避等待时间"""
+        with self._lock:
+            self._retries[endpoint] += 1
+            self._retry_wait_ms[endpoint] += wait_ms
+        try:
+            from app.metrics_prom import provider_retries_total, provider_retry_wait_ms
+            provider_retries_total.labels(endpoint=endpoint).inc()
+            provider_retry_wait_ms.labels(endpoint=endpoint).observe(wait_ms)
+        except Exception:
+            pass
+
+    def record_invite_batch(self, team_id: str, size: int):
+        """记录一次合并后的邀请请求包含的邮箱数"""
+        with self._lock:
+            self._invite_batches += 1
+            self._invite_batched_emails += size
+        try:
+            from app.metrics_prom import provider_invite_batch_size
+            provider_invite_batch_size.observe(size)
+        except Exception:
+            pass
+
+    def inflight_inc(self, host: str):
+        with self._lock:
+            self._inflight[host] += 1
+        try:
+            from app.metrics_prom import provider_inflight_requests
+            provider_inflight_requests.labels(host=host).inc()
+        except Exception:
+            pass
+
+    def inflight_dec(self, host: str):
+        with self._lock:
+            self._inflight[host] = max(0, self._inflight[host] - 1)
+        try:
+            from app.metrics_prom import provider_inflight_requests
+            provider_inflight_requests.labels(host=host).dec()
+        except Exception:
+            pass
     
     def snapshot(self):
         with self._lock:
@@ -39,4 +103,41 @@ class ProviderMetrics:
                 })
             return sorted(items, key=lambda x: (-x["count"], x["endpoint"]))
 
+    def pool_snapshot(self):
+        with self._lock:
+            hosts = set(self._pool_hits) | set(self._pool_misses) | set(self._inflight)
+            items = []
+            for host in hosts:
+                hits = self._pool_hits[host]
+                misses = self._pool_misses[host]
+                total = hits + misses
+                items.append({
+                    "host": host,
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_ratio": round(hits / total, 3) if total else 0.0,
+                    "inflight": self._inflight[host],
+                })
+            return sorted(items, key=lambda x: x["host"])
+
+    def retry_snapshot(self):
+        with self._lock:
+            items = []
+            for endpoint, count in self._retries.items():
+                items.append({
+                    "endpoint": endpoint,
+                    "retries": count,
+                    "avg_wait_ms": round(self._retry_wait_ms[endpoint] / count, 1) if count else 0.0,
+                })
+            return sorted(items, key=lambda x: (-x["retries"], x["endpoint"]))
+
+    def invite_batch_snapshot(self):
+        with self._lock:
+            batches = self._invite_batches
+            return {
+                "requests": batches,
+                "emails": self._invite_batched_emails,
+                "avg_batch_size": round(self._invite_batched_emails / batches, 2) if batches else 0.0,
+            }
+
 provider_metrics = ProviderMetrics()
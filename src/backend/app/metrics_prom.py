@@ -1,7 +1,7 @@
 try:
-    from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+    from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
 except Exception:
-    Counter = Histogram = None
+    Counter = Gauge = Histogram = None
     CONTENT_TYPE_LATEST = 'text/plain'
     def generate_latest():
         return b''
@@ -19,6 +19,96 @@ if Counter is not None:
         labelnames=('endpoint', 'team_id', 'status'),
         buckets=(5, 10, 25, 50, 100, 200, 400, 800, 1600, 3200)
     )
+    provider_pool_requests_total = Counter(
+        'provider_pool_requests_total',
+        'Provider HTTP requests by connection pool reuse (hit) or new connection (miss)',
+        labelnames=('host', 'result'),
+    )
+    provider_inflight_requests = Gauge(
+        'provider_inflight_requests',
+        'In-flight provider HTTP requests',
+        labelnames=('host',),
+    )
+    provider_retries_total = Counter(
+        'provider_retries_total',
+        'Provider call retries',
+        labelnames=('endpoint',),
+    )
+    provider_retry_wait_ms = Histogram(
+        'provider_retry_wait_ms',
+        'Backoff wait before each provider retry in milliseconds',
+        labelnames=('endpoint',),
+        buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 30000)
+    )
+    provider_invite_batch_size = Histogram(
+        'provider_invite_batch_size',
+        'Emails per coalesced provider invite request',
+        buckets=(1, 2, 5, 10, 20, 50, 100)
+    )
+    request_retry_wait_ms = Histogram(
+        'request_retry_wait_ms',
+        'Total retry backoff wait per HTTP request in milliseconds',
+        buckets=(0, 100, 500, 1000, 2000, 4000, 8000, 16000, 30000)
+    )
+    request_retry_time_ratio = Histogram(
+        'request_retry_time_ratio',
+        'Share of HTTP request latency spent in retries and backoff waits',
+        buckets=(0, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+    )
+    mother_health_probes_total = Counter(
+        'mother_health_probes_total',
+        'Mother health probes by result',
+        labelnames=('result',),
+    )
+    mother_health_probe_latency_ms = Histogram(
+        'mother_health_probe_latency_ms',
+        'Mother health probe latency in milliseconds, including rate limit wait',
+        buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+    )
+    mother_health_sweep_backlog = Gauge(
+        'mother_health_sweep_backlog',
+        'Active mothers still due for a health probe after the last sweep',
+    )
+    mother_health_sweep_coverage_ratio = Gauge(
+        'mother_health_sweep_coverage_ratio',
+        'Share of due mothers probed by the last sweep',
+    )
+    scheduled_task_runs_total = Counter(
+        'scheduled_task_runs_total',
+        'Background scheduled task runs by result',
+        labelnames=('task', 'result'),
+    )
+    scheduled_task_duration_seconds = Histogram(
+        'scheduled_task_duration_seconds',
+        'Background scheduled task run time in seconds',
+        labelnames=('task',),
+        buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+    )
+    maintenance_bulk_rows_total = Counter(
+        'maintenance_bulk_rows_total',
+        'Rows processed by chunked maintenance updates',
+        labelnames=('op',),
+    )
+    maintenance_bulk_pass_seconds = Histogram(
+        'maintenance_bulk_pass_seconds',
+        'Duration of one chunked maintenance pass in seconds',
+        labelnames=('op',),
+        buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    )
+    invite_sync_team_lag_seconds = Histogram(
+        'invite_sync_team_lag_seconds',
+        'Age of the oldest unconfirmed sent invite per reconciled team in seconds',
+        buckets=(60, 300, 900, 1800, 3600, 7200, 21600, 43200, 86400, 259200, 604800)
+    )
+    invite_sync_team_seconds = Histogram(
+        'invite_sync_team_seconds',
+        'Time spent reconciling invites for one team in seconds',
+        buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    )
+    invite_sync_members_scanned_total = Counter(
+        'invite_sync_members_scanned_total',
+        'Team members fetched by invite acceptance reconciliation',
+    )
     maintenance_lock_acquired_total = Counter(
         'maintenance_lock_acquired_total',
         'Total number of times maintenance lock acquired'
@@ -27,6 +117,48 @@ if Counter is not None:
         'maintenance_lock_miss_total',
         'Total number of times maintenance lock acquisition missed'
     )
+    lock_acquire_seconds = Histogram(
+        'lock_acquire_seconds',
+        'Time spent trying to acquire a distributed lock in seconds',
+        labelnames=('lock', 'result'),
+        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+    )
+    lock_held_seconds = Histogram(
+        'lock_held_seconds',
+        'Time a distributed lock was held in seconds',
+        labelnames=('lock',),
+        buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+    )
+    lock_lease_lost_total = Counter(
+        'lock_lease_lost_total',
+        'Distributed lock leases lost before the holder released them',
+        labelnames=('lock',),
+    )
+    event_loop_lag_ms = Histogram(
+        'event_loop_lag_ms',
+        'Event loop scheduling lag measured by the heartbeat in milliseconds',
+        buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+    )
+    event_loop_blocked_total = Counter(
+        'event_loop_blocked_total',
+        'Event loop callbacks that blocked longer than the threshold',
+        labelnames=('route',),
+    )
+    event_loop_blocked_ms = Histogram(
+        'event_loop_blocked_ms',
+        'Duration of event loop callbacks that blocked longer than the threshold in milliseconds',
+        labelnames=('route',),
+        buckets=(50, 100, 250, 500, 1000, 2500, 5000, 10000)
+    )
+    rate_limiter_memory_keys = Gauge(
+        'rate_limiter_memory_keys',
+        'Buckets held by the in-memory fallback rate limiter',
+    )
+    rate_limiter_memory_evictions_total = Counter(
+        'rate_limiter_memory_evictions_total',
+        'Buckets evicted from the in-memory fallback rate limiter',
+        labelnames=('reason',),
+    )
     admin_api_requests_total = Counter(
         'admin_api_requests_total',
         'Admin API requests count',
@@ -50,11 +182,41 @@ else:
             pass
         def observe(self, *args, **kwargs):
             pass
+        def dec(self, *args, **kwargs):
+            pass
+        def set(self, *args, **kwargs):
+            pass
     
     provider_calls_total = _Dummy()
     provider_latency_ms = _Dummy()
+    provider_pool_requests_total = _Dummy()
+    provider_inflight_requests = _Dummy()
+    provider_retries_total = _Dummy()
+    provider_retry_wait_ms = _Dummy()
+    provider_invite_batch_size = _Dummy()
+    request_retry_wait_ms = _Dummy()
+    request_retry_time_ratio = _Dummy()
+    mother_health_probes_total = _Dummy()
+    mother_health_probe_latency_ms = _Dummy()
+    mother_health_sweep_backlog = _Dummy()
+    mother_health_sweep_coverage_ratio = _Dummy()
+    scheduled_task_runs_total = _Dummy()
+    scheduled_task_duration_seconds = _Dummy()
+    maintenance_bulk_rows_total = _Dummy()
+    maintenance_bulk_pass_seconds = _Dummy()
+    invite_sync_team_lag_seconds = _Dummy()
+    invite_sync_team_seconds = _Dummy()
+    invite_sync_members_scanned_total = _Dummy()
     maintenance_lock_acquired_total = _Dummy()
     maintenance_lock_miss_total = _Dummy()
+    lock_acquire_seconds = _Dummy()
+    lock_held_seconds = _Dummy()
+    lock_lease_lost_total = _Dummy()
+    event_loop_lag_ms = _Dummy()
+    event_loop_blocked_total = _Dummy()
+    event_loop_blocked_ms = _Dummy()
+    rate_limiter_memory_keys = _Dummy()
+    rate_limiter_memory_evictions_total = _Dummy()
     admin_api_requests_total = _Dummy()
     pool_sync_actions_total = _Dummy()
     child_ops_total = _Dummy()
@@ -2,9 +2,11 @@
 中间件包
 """
 from .security import SecurityHeadersMiddleware, CSRFMiddleware, InputValidationMiddleware
+from .retry_budget import RetryBudgetMiddleware
 
 __all__ = [
     "SecurityHeadersMiddleware",
     "CSRFMiddleware",
-    "InputValidationMiddleware"
+    "InputValidationMiddleware",
+    "RetryBudgetMiddleware",
 ]
\ No newline at end of file
@@ -2,41 +2,49 @@
 Pool API 认证中间件
 
 验证 X-API-Key header 并记录请求日志。
+
+纯 ASGI 实现：缓存命中时在事件循环内完成校验；未命中时在线程中用短会话查库，
+会话在调用下游路由之前即已关闭，请求处理期间不占用数据库连接。
 """
-from typing import Callable, Optional
-from fastapi import Request, Response, HTTPException, status
+import asyncio
+from typing import Optional
+from fastapi import Request, status
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from sqlalchemy.orm import Session
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from ..database import SessionPool
 from ..services.pool_api_key_service import APIKeyService
 from ..utils.pool_logger import pool_logger, PoolAction, PoolStatus, generate_request_id
 
 
-class PoolAPIAuthMiddleware(BaseHTTPMiddleware):
+class PoolAPIAuthMiddleware:
     """
     Pool API 认证中间件
     
     拦截所有 /pool/* 路径的请求，验证 X-API-Key header。
     """
     
-    def __init__(self, app, pool_api_prefix: str = "/pool"):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp, pool_api_prefix: str = "/pool"):
+        self.app = app
         self.pool_api_prefix = pool_api_prefix
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """处理请求"""
         # 只拦截 Pool API 路径
-        if not request.url.path.startswith(self.pool_api_prefix):
-            return await call_next(request)
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not path.startswith(self.pool_api_prefix):
+            await self.app(scope, receive, send)
+            return
         
+        method = scope.get("method", "")
+        state = scope.setdefault("state", {})
+
         # 生成请求ID
         request_id = generate_request_id()
-        request.state.request_id = request_id
+        state["request_id"] = request_id
         
         # 提取 API Key
-        api_key = request.headers.get("X-API-Key")
+        api_key = Headers(scope=scope).get("x-api-key")
         
         if not api_key:
             pool_logger.log_event(
@@ -46,102 +54,103 @@ class PoolAPIAuthMiddleware(BaseHTTPMiddleware):
                 error_code="MISSING_API_KEY",
                 error_message="X-API-Key header is required",
                 extra={
-                    "path": request.url.path,
-                    "method": request.method,
-                },
-            )
-            return JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                content={
-                    "ok": False,
-                    "error": "MISSING_API_KEY",
-                    "message": "X-API-Key header is required",
+                    "path": path,
+                    "method": method,
                 },
             )
+            await self._reject(scope, receive, send, status.HTTP_401_UNAUTHORIZED, "MISSING_API_KEY",
+                               "X-API-Key header is required")
+            return
         
-        # 验证 API Key
-        db: Session = SessionPool()
+        # 验证 API Key：先查缓存，未命中再到线程中查库
         try:
-            api_key_obj = APIKeyService.validate_api_key(db, api_key)
-            
-            if not api_key_obj:
-                pool_logger.log_event(
-                    PoolAction.API_REQUEST,
-                    PoolStatus.FAILED,
-                    request_id=request_id,
-                    error_code="INVALID_API_KEY",
-                    error_message="Invalid or inactive API key",
-                    extra={
-                        "path": request.url.path,
-                        "method": request.method,
-                    },
-                )
-                return JSONResponse(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    content={
-                        "ok": False,
-                        "error": "INVALID_API_KEY",
-                        "message": "Invalid or inactive API key",
-                    },
-                )
-            
-            # 验证成功，记录到 request.state
-            request.state.api_key_id = api_key_obj.id
-            request.state.api_key_name = api_key_obj.name
-            
-            # 记录请求日志
+            api_key_obj = APIKeyService.get_cached_key(api_key)
+            if api_key_obj is None:
+                api_key_obj = await asyncio.to_thread(APIKeyService.authenticate, api_key)
+        except Exception as e:
             pool_logger.log_event(
                 PoolAction.API_REQUEST,
-                PoolStatus.OK,
-                request_id=request_id,
-                api_key_id=str(api_key_obj.id),
-                extra={
-                    "path": request.url.path,
-                    "method": request.method,
-                    "api_key_name": api_key_obj.name,
-                },
-            )
-            
-            # 继续处理请求
-            response = await call_next(request)
-            
-            # 记录响应日志
-            pool_logger.log_event(
-                PoolAction.API_RESPONSE,
-                PoolStatus.OK,
+                PoolStatus.FAILED,
                 request_id=request_id,
-                api_key_id=str(api_key_obj.id),
+                error_code="INTERNAL_ERROR",
+                error_message=str(e),
                 extra={
-                    "path": request.url.path,
-                    "method": request.method,
-                    "status_code": response.status_code,
+                    "path": path,
+                    "method": method,
                 },
             )
-            
-            return response
-            
-        except Exception as e:
+            await self._reject(scope, receive, send, status.HTTP_500_INTERNAL_SERVER_ERROR, "INTERNAL_ERROR",
+                               "Internal server error during authentication")
+            return
+
+        if not api_key_obj:
             pool_logger.log_event(
                 PoolAction.API_REQUEST,
                 PoolStatus.FAILED,
                 request_id=request_id,
-                error_code="INTERNAL_ERROR",
-                error_message=str(e),
+                error_code="INVALID_API_KEY",
+                error_message="Invalid or inactive API key",
                 extra={
-                    "path": request.url.path,
-                    "method": request.method,
+                    "path": path,
+                    "method": method,
                 },
             )
-            return JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content={
-                    "ok": False,
-                    "error": "INTERNAL_ERROR",
-                    "message": "Internal server error during authentication",
-                },
-            )
-        finally:
-            db.close()
+            await self._reject(scope, receive, send, status.HTTP_401_UNAUTHORIZED, "INVALID_API_KEY",
+                               "Invalid or inactive API key")
+            return
+        
+        # 验证成功，记录到 request.state
+        state["api_key_id"] = api_key_obj.id
+        state["api_key_name"] = api_key_obj.name
+        
+        # 记录请求日志
+        pool_logger.log_event(
+            PoolAction.API_REQUEST,
+            PoolStatus.OK,
+            request_id=request_id,
+            api_key_id=str(api_key_obj.id),
+            extra={
+                "path": path,
+                "method": method,
+                "api_key_name": api_key_obj.name,
+            },
+        )
+
+        status_code = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        # 继续处理请求
+        await self.app(scope, receive, send_wrapper)
+        
+        # 记录响应日志
+        pool_logger.log_event(
+            PoolAction.API_RESPONSE,
+            PoolStatus.OK,
+            request_id=request_id,
+            api_key_id=str(api_key_obj.id),
+            extra={
+                "path": path,
+                "method": method,
+                "status_code": status_code,
+            },
+        )
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send, status_code: int, error: str, message: str) -> None:
+        response = JSONResponse(
+            status_code=status_code,
+            content={
+                "ok": False,
+                "error": error,
+                "message": message,
+            },
+        )
+        await response(scope, receive, send)
 
 
 def get_request_id(request: Request) -> Optional[str]:
@@ -3,198 +3,298 @@
 
 自动处理响应格式，确保所有API返回统一的格式。
 同时添加请求ID、时间戳等元数据。
+
+中间件均为纯 ASGI 实现。统一响应格式在序列化时完成：UnifiedResponseMiddleware 只在
+contextvar 中记下请求ID与开始时间，UnifiedJSONResponse.render 据此直接包装内容，
+不再把已序列化的 JSON 响应体解析后重新序列化。
+
+其他 JSON 响应（路由显式返回的 JSONResponse、异常处理器的输出、早于 setup_middleware
+注册的路由）仍由中间件缓冲响应体后包装，覆盖范围与原实现一致，只是多一次解析。
 """
 
+import json
+import logging
 import time
 import uuid
-from typing import Callable
-from fastapi import Request, Response
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from app.utils.error_handler import ApiResponse
 
+# (request_id, 开始时间)；未经过 UnifiedResponseMiddleware 时为 None
+_envelope_context: ContextVar[Optional[tuple[Optional[str], Optional[float]]]] = ContextVar(
+    "unified_response_context", default=None
+)
+
+
+# UnifiedJSONResponse 已在渲染时包装时写入 scope，中间件据此跳过缓冲
+_RENDERED_SCOPE_KEY = "unified_response.rendered"
+
+
+def _header_list(headers: dict) -> list[tuple[bytes, bytes]]:
+    return [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+
+
+def _envelope(content: Any, status_code: int, request_id: Optional[str], start_time: Optional[float]) -> dict:
+    # 如果响应已经是标准格式，则只添加元数据
+    if isinstance(content, dict) and "success" in content:
+        wrapped = dict(content)
+        meta = dict(wrapped.get("meta") or {})
+    else:
+        # 包装为标准格式
+        success = 200 <= status_code < 400
+        wrapped = ApiResponse.success(data=content, message="操作成功" if success else "操作失败", meta={})
+        meta = {}
+
+    if request_id is not None:
+        meta["request_id"] = request_id
+    if start_time is not None:
+        meta["processing_time_ms"] = round((time.time() - start_time) * 1000, 2)
+    wrapped["meta"] = meta
+    return wrapped
+
+
+class UnifiedJSONResponse(JSONResponse):
+    """统一格式的 JSON 响应：在渲染时加上标准外层结构与元数据"""
+
+    _enveloped = False
 
-class UnifiedResponseMiddleware(BaseHTTPMiddleware):
-    """统一响应格式中间件"""
+    def render(self, content: Any) -> bytes:
+        context = _envelope_context.get()
+        if context is None:
+            return super().render(content)
+        # render 在 __init__ 中调用，此时 status_code 已设置
+        self._enveloped = True
+        return super().render(_envelope(content, self.status_code, *context))
 
-    def __init__(self, app, add_request_id: bool = True, add_timing: bool = True):
-        super().__init__(app)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self._enveloped:
+            scope[_RENDERED_SCOPE_KEY] = True
+        await super().__call__(scope, receive, send)
+
+
+class UnifiedResponseMiddleware:
+    """统一响应格式中间件（配合 UnifiedJSONResponse 使用）"""
+
+    def __init__(self, app: ASGIApp, add_request_id: bool = True, add_timing: bool = True):
+        self.app = app
         self.add_request_id = add_request_id
         self.add_timing = add_timing
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # 生成请求ID
-        if self.add_request_id:
-            request_id = str(uuid.uuid4())
-            request.state.request_id = request_id
+        request_id = str(uuid.uuid4()) if self.add_request_id else None
+        if request_id is not None:
+            scope.setdefault("state", {})["request_id"] = request_id
 
         # 记录开始时间
-        if self.add_timing:
-            start_time = time.time()
-
-        # 调用下一个中间件或路由处理器
-        response = await call_next(request)
-
-        # 只处理JSON响应
-        if isinstance(response, JSONResponse):
-            # 解析原有响应内容
-            try:
-                import json
-                original_content = json.loads(response.body.decode())
-            except (json.JSONDecodeError, UnicodeDecodeError):
-                original_content = None
-
-            # 如果响应已经是标准格式，则不处理
-            if isinstance(original_content, dict) and "success" in original_content:
-                # 添加元数据
-                if self.add_request_id:
-                    original_content.setdefault("meta", {})["request_id"] = request_id
-
-                if self.add_timing:
-                    processing_time = time.time() - start_time
-                    original_content.setdefault("meta", {})["processing_time_ms"] = round(processing_time * 1000, 2)
-
-                # 更新响应
-                response = JSONResponse(
-                    content=original_content,
-                    status_code=response.status_code,
-                    headers=response.headers,
-                )
-            else:
-                # 包装为标准格式
-                success = 200 <= response.status_code < 400
-                wrapped_content = ApiResponse.success(
-                    data=original_content,
-                    message="操作成功" if success else "操作失败",
-                    meta={}
-                )
-
-                if self.add_request_id:
-                    wrapped_content["meta"]["request_id"] = request_id
-
-                if self.add_timing:
-                    processing_time = time.time() - start_time
-                    wrapped_content["meta"]["processing_time_ms"] = round(processing_time * 1000, 2)
-
-                response = JSONResponse(
-                    content=wrapped_content,
-                    status_code=response.status_code,
-                    headers=response.headers,
-                )
-
-        # 添加响应头
-        if self.add_request_id:
-            response.headers["X-Request-ID"] = getattr(request.state, "request_id", "")
-
-        return response
-
-
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+        start_time = time.time() if self.add_timing else None
+
+        # 未经 UnifiedJSONResponse 渲染的 JSON 响应：暂存响应头并缓冲响应体，结束时包装
+        pending: Optional[Message] = None
+        chunks: list[bytes] = []
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal pending
+            if message["type"] == "http.response.start":
+                if request_id is not None:
+                    headers = [(k, v) for k, v in message.get("headers", ()) if k.lower() != b"x-request-id"]
+                    headers.append((b"x-request-id", request_id.encode("latin-1")))
+                    message["headers"] = headers
+                if not scope.get(_RENDERED_SCOPE_KEY) and _is_json(message):
+                    pending = message
+                    return
+            elif message["type"] == "http.response.body" and pending is not None:
+                chunks.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    return
+                start, pending = pending, None
+                raw = b"".join(chunks)
+                body = self._rewrap(raw, start["status"], request_id, start_time)
+                if body is not raw:
+                    headers = [(k, v) for k, v in start.get("headers", ()) if k.lower() != b"content-length"]
+                    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+                    start["headers"] = headers
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+                return
+            await send(message)
+
+        token = _envelope_context.set((request_id, start_time))
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _envelope_context.reset(token)
+
+    @staticmethod
+    def _rewrap(body: bytes, status_code: int, request_id: Optional[str], start_time: Optional[float]) -> bytes:
+        try:
+            content = json.loads(body.decode())
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return body
+        return JSONResponse(_envelope(content, status_code, request_id, start_time)).body
+
+
+def _is_json(message: Message) -> bool:
+    content_type = Headers(raw=message.get("headers", [])).get("content-type", "")
+    return content_type.split(";")[0].strip() == "application/json"
+
+
+class SecurityHeadersMiddleware:
     """安全头中间件"""
 
-    def __init__(self, app):
-        super().__init__(app)
-
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        response = await call_next(request)
-
-        # 添加安全头
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        from app.config import settings
 
+        headers = {
+            "X-Content-Type-Options": "nosniff",
+            "X-Frame-Options": "DENY",
+            "X-XSS-Protection": "1; mode=block",
+            "Referrer-Policy": "strict-origin-when-cross-origin",
+        }
         # 在生产环境中添加HSTS
-        from app.config import settings
         if settings.env == "prod":
-            response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+            headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+        self._headers = _header_list(headers)
+        self._names = {k for k, _ in self._headers}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        return response
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = [(k, v) for k, v in message.get("headers", ()) if k.lower() not in self._names]
+                headers.extend(self._headers)
+                message["headers"] = headers
+            await send(message)
 
+        await self.app(scope, receive, send_wrapper)
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+
+class RequestLoggingMiddleware:
     """请求日志中间件"""
 
-    def __init__(self, app, log_level: str = "INFO"):
-        super().__init__(app)
-        import logging
+    def __init__(self, app: ASGIApp, log_level: str = "INFO"):
+        self.app = app
         self.logger = logging.getLogger(f"{__name__}.RequestLogging")
         self.logger.setLevel(getattr(logging, log_level.upper()))
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         start_time = time.time()
+        method, path = scope.get("method"), scope.get("path")
+        client = scope.get("client")
+        status_code = 0
 
         # 记录请求信息
         self.logger.info(
-            f"Request started: {request.method} {request.url.path} - "
-            f"Client: {request.client.host if request.client else 'unknown'} - "
-            f"Request-ID: {getattr(request.state, 'request_id', 'unknown')}"
+            f"Request started: {method} {path} - "
+            f"Client: {client[0] if client else 'unknown'} - "
+            f"Request-ID: {scope.get('state', {}).get('request_id', 'unknown')}"
         )
 
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
         # 处理请求
-        response = await call_next(request)
+        await self.app(scope, receive, send_wrapper)
 
         # 记录响应信息
         processing_time = time.time() - start_time
         self.logger.info(
-            f"Request completed: {request.method} {request.url.path} - "
-            f"Status: {response.status_code} - "
+            f"Request completed: {method} {path} - "
+            f"Status: {status_code} - "
             f"Time: {processing_time:.3f}s - "
-            f"Request-ID: {getattr(request.state, 'request_id', 'unknown')}"
+            f"Request-ID: {scope.get('state', {}).get('request_id', 'unknown')}"
         )
 
-        return response
-
 
-class CorsMiddleware(BaseHTTPMiddleware):
+class CorsMiddleware:
     """CORS中间件（简化版）"""
 
     def __init__(
         self,
-        app,
+        app: ASGIApp,
         allow_origins: list = None,
         allow_methods: list = None,
         allow_headers: list = None,
         allow_credentials: bool = True,
     ):
-        super().__init__(app)
+        self.app = app
         self.allow_origins = allow_origins or ["*"]
         self.allow_methods = allow_methods or ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
         self.allow_headers = allow_headers or ["*"]
         self.allow_credentials = allow_credentials
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        origin = request.headers.get("origin")
+        # 与来源无关的头部只计算一次
+        static = {
+            "Access-Control-Allow-Methods": ", ".join(self.allow_methods),
+            "Access-Control-Allow-Headers": ", ".join(self.allow_headers),
+        }
+        if self.allow_credentials:
+            static["Access-Control-Allow-Credentials"] = "true"
+        self._headers = _header_list(static)
+        self._names = {k for k, _ in self._headers} | {b"access-control-allow-origin"}
 
-        # 处理预检请求
-        if request.method == "OPTIONS":
-            response = Response()
-        else:
-            response = await call_next(request)
+    def _allowed(self, origin: Optional[str]) -> bool:
+        return bool(origin) and (self.allow_origins == ["*"] or origin in self.allow_origins)
 
-        # 添加CORS头
-        if origin and (self.allow_origins == ["*"] or origin in self.allow_origins):
-            response.headers["Access-Control-Allow-Origin"] = origin
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        response.headers["Access-Control-Allow-Methods"] = ", ".join(self.allow_methods)
-        response.headers["Access-Control-Allow-Headers"] = ", ".join(self.allow_headers)
+        origin = Headers(scope=scope).get("origin")
+        extra = list(self._headers)
+        # 添加CORS头
+        if self._allowed(origin):
+            extra.append((b"access-control-allow-origin", origin.encode("latin-1")))
 
-        if self.allow_credentials:
-            response.headers["Access-Control-Allow-Credentials"] = "true"
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = [(k, v) for k, v in message.get("headers", ()) if k.lower() not in self._names]
+                headers.extend(extra)
+                message["headers"] = headers
+            await send(message)
 
-        return response
+        # 处理预检请求
+        if scope.get("method") == "OPTIONS":
+            await Response()(scope, receive, send_wrapper)
+            return
+        await self.app(scope, receive, send_wrapper)
 
 
 def setup_middleware(app):
     """
     为FastAPI应用设置所有中间件
 
+    之后注册的路由默认使用 UnifiedJSONResponse，在渲染时完成包装；其他 JSON 响应
+    由 UnifiedResponseMiddleware 缓冲后包装，因此调用顺序只影响性能，不影响格式。
+
     Args:
         app: FastAPI应用实例
     """
     from app.config import settings
 
+    app.router.default_response_class = UnifiedJSONResponse
+
     # 注意：中间件的顺序很重要，后添加的先执行
 
     # 1. 安全头中间件（最外层）
@@ -213,4 +313,4 @@ def setup_middleware(app):
     app.add_middleware(RequestLoggingMiddleware, log_level="INFO")
 
     # 4. 统一响应中间件（最内层，靠近路由处理）
-    app.add_middleware(UnifiedResponseMiddleware, add_request_id=True, add_timing=True)
\ No newline at end of file
+    app.add_middleware(UnifiedResponseMiddleware, add_request_id=True, add_timing=True)
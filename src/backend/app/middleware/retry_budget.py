@@ -0,0 +1,73 @@
+"""
+请求级重试预算中间件
+
+为每个 HTTP 请求开启 RetryBudget（最大重试次数 + 截止时间），下游所有 Provider 调用、
+Pool 包装器与换母号重试共享该预算；请求结束时上报重试等待时间与重试耗时占比。
+逐条调用 Provider 的批量路由与任务在每个条目内用 item_retry_budget 另开预算。
+
+客户端可通过 X-Request-Deadline-Ms 头收紧截止时间（不超过 settings.request_deadline_seconds）。
+"""
+import logging
+from typing import Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import settings
+from app.utils.retry_policy import retry_budget
+
+try:
+    from app.metrics_prom import request_retry_time_ratio, request_retry_wait_ms
+except Exception:
+    request_retry_time_ratio = request_retry_wait_ms = None
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_HEADER = b"x-request-deadline-ms"
+
+
+def _deadline_seconds(scope: Scope) -> Optional[float]:
+    limit = settings.request_deadline_seconds if settings.request_deadline_seconds > 0 else None
+    for name, value in scope.get("headers") or ():
+        if name != DEADLINE_HEADER:
+            continue
+        try:
+            requested = float(value.decode("latin-1")) / 1000.0
+        except ValueError:
+            break
+        if requested > 0:
+            return min(requested, limit) if limit else requested
+        break
+    return limit
+
+
+class RetryBudgetMiddleware:
+    """纯 ASGI 中间件：contextvars 在同一任务内直接传递给路由与线程池调用"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with retry_budget(
+            max_retries=max(0, settings.request_retry_budget),
+            deadline_seconds=_deadline_seconds(scope),
+        ) as budget:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self._observe(budget.snapshot())
+
+    @staticmethod
+    def _observe(snapshot: dict) -> None:
+        if request_retry_wait_ms is None or not snapshot["retries_used"]:
+            return
+        try:
+            elapsed = snapshot["elapsed_ms"] or 1.0
+            spent = snapshot["wait_ms"] + snapshot["retry_attempt_ms"]
+            request_retry_wait_ms.observe(snapshot["wait_ms"])
+            request_retry_time_ratio.observe(min(1.0, spent / elapsed))
+        except Exception:
+            logger.debug("request retry metrics failed", exc_info=True)
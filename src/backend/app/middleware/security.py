@@ -1,12 +1,16 @@
 """
 安全中间件模块
+
+SecurityHeadersMiddleware 与 InputValidationMiddleware 为纯 ASGI 实现：不经过
+BaseHTTPMiddleware 的额外任务与响应体转发，直接在 send 中注入响应头。
 """
 from typing import Callable, Iterable, Optional, Set
 from urllib.parse import urlparse
 from fastapi import Request, Response
 from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from app.security import get_security_headers, generate_nonce
 try:
     from app.metrics_prom import admin_api_requests_total
@@ -16,47 +20,67 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+# 预计算 CSP 时使用的 nonce 占位符，每个请求只做一次字符串拼接
+_NONCE_PLACEHOLDER = "__CSP_NONCE__"
+
+
+class SecurityHeadersMiddleware:
     """安全头部中间件"""
 
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
+        self.app = app
+        # 静态头部在构建中间件栈时计算一次；CSP 只有 nonce 随请求变化
+        static = get_security_headers(_NONCE_PLACEHOLDER)
+        csp = static.pop("Content-Security-Policy")
+        self._csp_parts = [part.encode("latin-1") for part in csp.split(_NONCE_PLACEHOLDER)]
+        self._static_headers = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in static.items()]
+        self._managed = {k for k, _ in self._static_headers} | {
+            b"content-security-policy",
+            b"x-csp-nonce",
+            b"x-domain-ack",
+        }
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # 生成nonce用于此请求的CSP
-        nonce = generate_nonce()
-        domain = request.headers.get("X-Domain")
-
-        # 获取响应
-        response = await call_next(request)
-
-        # 添加安全头部
-        security_headers = get_security_headers(nonce)
-        for header, value in security_headers.items():
-            response.headers[header] = value
-
-        # 将nonce添加到响应状态，以便前端模板使用
-        response.headers["X-CSP-Nonce"] = nonce
-        if domain:
-            response.headers["X-Domain-Ack"] = domain
-            try:
-                logger.debug("domain=%s path=%s", domain, request.url.path)
-            except Exception:
-                logger.debug("domain log failed", exc_info=True)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
+        # 生成nonce用于此请求的CSP
+        nonce = generate_nonce().encode("latin-1")
+        domain = Headers(scope=scope).get("x-domain")
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # 与原实现一致：覆盖路由中已设置的同名头部
+                headers = [(k, v) for k, v in message.get("headers", ()) if k.lower() not in self._managed]
+                headers.extend(self._static_headers)
+                headers.append((b"content-security-policy", nonce.join(self._csp_parts)))
+                # 将nonce添加到响应头，以便前端模板使用
+                headers.append((b"x-csp-nonce", nonce))
+                if domain:
+                    headers.append((b"x-domain-ack", domain.encode("latin-1")))
+                    logger.debug("domain=%s path=%s", domain, scope.get("path"))
+                message["headers"] = headers
+                self._observe(scope, domain, message.get("status", 0))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _observe(scope: Scope, domain: Optional[str], status_code: int) -> None:
         # 指标：记录 Admin API 请求
+        if admin_api_requests_total is None:
+            return
         try:
-            if admin_api_requests_total is not None:
-                path = request.url.path
-                method = request.method
-                status = str(getattr(response, 'status_code', 0))
-                dom = domain or 'unknown'
-                admin_api_requests_total.labels(path=path, method=method, domain=dom, status=status).inc()
+            admin_api_requests_total.labels(
+                path=scope.get("path", ""),
+                method=scope.get("method", ""),
+                domain=domain or "unknown",
+                status=str(status_code),
+            ).inc()
         except Exception:
             logger.debug("admin_api_requests_total increment failed", exc_info=True)
 
-        return response
-
 
 class CSRFMiddleware(BaseHTTPMiddleware):
     """CSRF防护中间件"""
@@ -148,60 +172,65 @@ class CSRFMiddleware(BaseHTTPMiddleware):
         return any(indicator in user_agent for indicator in browser_indicators)
 
 
-class InputValidationMiddleware(BaseHTTPMiddleware):
+_SUSPICIOUS_PATTERNS = (
+    '<script', 'javascript:', 'vbscript:', 'onload=', 'onerror=',
+    'eval(', 'alert(', 'confirm(', 'prompt(',
+    '../../', '..\\', 'sqlinject', 'union select'
+)
+
+_ALLOWED_CONTENT_TYPES = (
+    'application/json',
+    'application/x-www-form-urlencoded',
+    'multipart/form-data',
+    'text/plain'
+)
+
+
+class InputValidationMiddleware:
     """输入验证中间件"""
 
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
+        self.app = app
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # 检查请求头中的恶意内容
-        suspicious_headers = []
-        for header_name, header_value in request.headers.items():
-            if self._contains_suspicious_content(str(header_value)):
-                suspicious_headers.append(header_name)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
+        # 检查请求头中的恶意内容
+        suspicious_headers = [
+            name.decode("latin-1")
+            for name, value in scope.get("headers") or ()
+            if self._contains_suspicious_content(value.decode("latin-1"))
+        ]
         if suspicious_headers:
             logger.warning(f"Suspicious content in headers: {suspicious_headers}")
-            return JSONResponse(
-                status_code=400,
-                content={"detail": "Invalid request headers"}
-            )
+            response = JSONResponse(status_code=400, content={"detail": "Invalid request headers"})
+            await response(scope, receive, send)
+            return
 
         # 对于POST/PUT请求，检查内容类型
-        if request.method.upper() in ['POST', 'PUT', 'PATCH']:
-            content_type = request.headers.get("content-type", "")
-            if not self._is_valid_content_type(content_type, request.url.path):
-                logger.warning(f"Invalid content type for path {request.url.path}: {content_type}")
-                return JSONResponse(
-                    status_code=415,
-                    content={"detail": "Unsupported Media Type"}
-                )
+        if scope.get("method", "").upper() in ('POST', 'PUT', 'PATCH'):
+            path = scope.get("path", "")
+            content_type = Headers(scope=scope).get("content-type", "")
+            if not self._is_valid_content_type(content_type, path):
+                logger.warning(f"Invalid content type for path {path}: {content_type}")
+                response = JSONResponse(status_code=415, content={"detail": "Unsupported Media Type"})
+                await response(scope, receive, send)
+                return
 
-        return await call_next(request)
+        await self.app(scope, receive, send)
 
     def _contains_suspicious_content(self, content: str) -> bool:
         """检查是否包含可疑内容"""
-        suspicious_patterns = [
-            '<script', 'javascript:', 'vbscript:', 'onload=', 'onerror=',
-            'eval(', 'alert(', 'confirm(', 'prompt(',
-            '../../', '..\\', 'sqlinject', 'union select'
-        ]
         content_lower = content.lower()
-        return any(pattern in content_lower for pattern in suspicious_patterns)
+        return any(pattern in content_lower for pattern in _SUSPICIOUS_PATTERNS)
 
     def _is_valid_content_type(self, content_type: str, path: str) -> bool:
         """检查内容类型是否有效"""
-        allowed_types = [
-            'application/json',
-            'application/x-www-form-urlencoded',
-            'multipart/form-data',
-            'text/plain'
-        ]
-
         # 对于API路径，通常期望JSON
         if path.startswith('/api/'):
             return content_type.startswith('application/json') or 'multipart/form-data' in content_type
 
         # 检查是否为允许的类型
-        return any(allowed_type in content_type for allowed_type in allowed_types)
+        return any(allowed_type in content_type for allowed_type in _ALLOWED_CONTENT_TYPES)
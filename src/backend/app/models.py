@@ -1,6 +1,8 @@
 from sqlalchemy import (
     Column,
     Integer,
+    BigInteger,
+    SmallInteger,
     String,
     DateTime,
     Enum,
@@ -246,6 +248,7 @@ class InviteRequest(BaseUsers):
     __table_args__ = (
         Index("ix_invite_email_team", "email", "team_id"),
         Index("ix_invite_status", "status"),
+        Index("ix_invite_created_id", "created_at", "id"),
     )
 
 
@@ -302,6 +305,8 @@ class RedeemCode(BaseUsers):
         Index("ix_redeem_mother_group", "mother_group_id"),
         Index("ix_redeem_sku_id", "sku_id"),
         Index("ix_redeem_bound_email", "bound_email"),
+        Index("ix_redeem_used_at", "used_at"),
+        Index("ix_redeem_created_id", "created_at", "id"),
     )
 
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -363,6 +368,10 @@ class AuditLog(BaseUsers):
     ua = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
+    __table_args__ = (
+        Index("ix_audit_created_id", "created_at", "id"),
+    )
+
 class BulkOperationType(str, enum.Enum):
     mother_import = "mother_import"
     mother_import_text = "mother_import_text"
@@ -382,7 +391,7 @@ class BulkOperationLog(BaseUsers):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     __table_args__ = (
-        Index("ix_bulk_operation_created_at", "created_at"),
+        Index("ix_bulk_operation_created_id", "created_at", "id"),
     )
 
 class BatchJobStatus(str, enum.Enum):
@@ -397,6 +406,7 @@ class BatchJobType(str, enum.Enum):
     users_remove = "users_remove"
     codes_disable = "codes_disable"
     pool_sync_mother = "pool_sync_mother"
+    codes_export = "codes_export"
 
 class BatchJob(BaseUsers):
     __tablename__ = "batch_jobs"
@@ -421,7 +431,7 @@ class BatchJob(BaseUsers):
 
     __table_args__ = (
         Index("ix_batch_job_status", "status"),
-        Index("ix_batch_job_created_at", "created_at"),
+        Index("ix_batch_job_created_id", "created_at", "id"),
     )
 
 
@@ -454,6 +464,7 @@ class SwitchRequest(BaseUsers):
         Index("ix_switch_requests_status", "status"),
         Index("ix_switch_requests_email", "email"),
         Index("ix_switch_requests_expires", "expires_at"),
+        Index("ix_switch_requests_created_at", "created_at"),
     )
 
 
@@ -481,4 +492,45 @@ class CodeRefreshHistory(BaseUsers):
     __table_args__ = (
         Index("ix_code_refresh_history_code_id", "code_id"),
         Index("ix_code_refresh_history_event", "event_type"),
+        Index("ix_code_refresh_history_created_at", "created_at"),
+    )
+
+
+# --- 统计计数器：各域一张表，由 app.services.shared.stats_counters 在写入事务内增量维护 ---
+class StatsCounter(BasePool):
+    __tablename__ = "stats_counters"
+
+    key = Column(String(64), primary_key=True)
+    dim = Column(String(128), primary_key=True, default="")
+    shard = Column(SmallInteger, primary_key=True, default=0)
+    value = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class StatsCounterUsers(BaseUsers):
+    __tablename__ = "stats_counters"
+
+    key = Column(String(64), primary_key=True)
+    dim = Column(String(128), primary_key=True, default="")
+    shard = Column(SmallInteger, primary_key=True, default=0)
+    value = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class StatsHourlyRollup(BaseUsers):
+    """按小时汇总的历史计数（由 app.services.services.stats_rollup 生成）"""
+    __tablename__ = "stats_hourly_rollups"
+
+    id = Column(Integer, primary_key=True)
+    metric = Column(String(32), nullable=False)  # invites / redemptions / switches / refreshes
+    hour_start = Column(DateTime, nullable=False)
+    status = Column(String(32), nullable=False, default="")
+    mother_group_id = Column(Integer, nullable=False, default=0)  # 0 = 未分组
+    sku_id = Column(Integer, nullable=False, default=0)  # 0 = 无 SKU
+    count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("metric", "hour_start", "status", "mother_group_id", "sku_id", name="uq_rollup_dims"),
+        Index("ix_rollup_metric_hour", "metric", "hour_start"),
     )
@@ -1,91 +1,61 @@
 from typing import Any, Optional, Tuple
-import requests
 from datetime import datetime, timedelta
 from app.config import settings
 import time
 from app.metrics import provider_metrics
-import threading
-
-# 简易熔断与退避实现（进程内）
-_cb_lock = threading.Lock()
-_cb_state: dict[tuple[str, Optional[str]], dict] = {}
-
-CB_FAIL_THRESHOLD = 3
-CB_RESET_SECONDS = 60
-RETRY_STATUSES = {429, 500, 502, 503, 504}
+from app.circuit_breaker import provider_breaker
+from app.provider_client import provider_client
+from app.invite_coalescer import InviteCoalescer
+from app.utils.retry_policy import (
+    DeadlineExceeded,
+    call_with_retry,
+    parse_retry_after,
+    provider_retry_policy,
+)
 
 class ProviderError(Exception):
-    def __init__(self, status: int, code: str, message: str):
+    def __init__(self, status: int, code: str, message: str, retry_after: Optional[float] = None):
         super().__init__(f"ProviderError {status} {code}: {message}")
         self.status = status
         self.code = code
         self.message = message
+        # 上游 Retry-After（秒），由重试策略作为退避下限
+        self.retry_after = retry_after
 
-def _proxies():
-    proxies = {}
-    if settings.http_proxy:
-        proxies["http"] = settings.http_proxy
-    if settings.https_proxy:
-        proxies["https"] = settings.https_proxy
-    return proxies or None
 
+def _response_error(r, code: str, limit: int = 1000) -> ProviderError:
+    """根据上游响应构造 ProviderError（携带 Retry-After）"""
+    return ProviderError(
+        r.status_code,
+        code,
+        r.text[:limit],
+        retry_after=parse_retry_after(r.headers.get("retry-after")),
+    )
 
+# 熔断状态由 app.circuit_breaker 维护（进程内 LRU 或 Redis 共享）
 def _circuit_open(endpoint: str, team_id: Optional[str]) -> bool:
-    key = (endpoint, team_id)
-    with _cb_lock:
-        st = _cb_state.get(key)
-        if not st:
-            return False
-        if st.get('state') == 'open':
-            opened_at = st.get('opened_at', 0.0)
-            if (time.monotonic() - opened_at) < CB_RESET_SECONDS:
-                return True
-            # 半开
-            st['state'] = 'half'
-            return False
-    return False
+    return not provider_breaker.allow(endpoint, team_id)
 
 
 def _record_success(endpoint: str, team_id: Optional[str]):
-    key = (endpoint, team_id)
-    with _cb_lock:
-        _cb_state[key] = {'state': 'closed', 'fail': 0, 'opened_at': 0.0}
+    provider_breaker.record_success(endpoint, team_id)
 
 
 def _record_failure(endpoint: str, team_id: Optional[str]):
-    key = (endpoint, team_id)
-    with _cb_lock:
-        st = _cb_state.get(key) or {'state': 'closed', 'fail': 0, 'opened_at': 0.0}
-        st['fail'] = st.get('fail', 0) + 1
-        if st['fail'] >= CB_FAIL_THRESHOLD:
-            st['state'] = 'open'
-            st['opened_at'] = time.monotonic()
-        _cb_state[key] = st
+    provider_breaker.record_failure(endpoint, team_id)
 
 
 def _with_resilience(do_request, endpoint: str, team_id: Optional[str]):
+    """熔断检查 + 统一重试策略（共享请求级重试预算，嵌套时由最外层重试）"""
     if _circuit_open(endpoint, team_id):
         raise ProviderError(503, 'circuit_open', f'Circuit open for {endpoint}:{team_id or "-"}')
-    last_exc: Optional[Exception] = None
-    for attempt in range(3):
-        try:
-            return do_request()
-        except ProviderError as e:
-            last_exc = e
-            if e.status in RETRY_STATUSES and attempt < 2:
-                time.sleep(0.5 * (2 ** attempt))
-                continue
-            _record_failure(endpoint, team_id)
-            raise
-        except Exception as e:
-            last_exc = e
-            if attempt < 2:
-                time.sleep(0.5 * (2 ** attempt))
-                continue
-            _record_failure(endpoint, team_id)
-            raise
-    if last_exc:
-        raise last_exc
+    try:
+        return call_with_retry(do_request, policy=provider_retry_policy, endpoint=endpoint)
+    except DeadlineExceeded as e:
+        raise ProviderError(504, 'deadline_exceeded', str(e)) from e
+    except Exception:
+        _record_failure(endpoint, team_id)
+        raise
 
 def parse_cookie_string(cookie_string: str) -> dict:
     """
@@ -134,8 +104,15 @@ def fetch_session_via_cookie(cookie: str) -> Tuple[str, Optional[datetime], Opti
         - team_id: 账户ID (account.id)，即team_id
         - expires_at: token过期时间
     """
-    url = "https://chatgpt.com/api/auth/session"
-    headers = {
+    r = provider_client.get(SESSION_URL, headers=_session_headers(cookie))
+    if r.status_code != 200:
+        raise _response_error(r, "session_fetch_failed", 500)
+    return _parse_session_payload(r.json())
+
+SESSION_URL = "https://chatgpt.com/api/auth/session"
+
+def _session_headers(cookie: str) -> dict:
+    return {
         "cookie": cookie,
         "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120 Safari/537.36",
         "accept": "application/json, */*",
@@ -145,11 +122,9 @@ def fetch_session_via_cookie(cookie: str) -> Tuple[str, Optional[datetime], Opti
         "sec-fetch-mode": "cors",
         "sec-fetch-dest": "empty",
     }
-    r = requests.get(url, headers=headers, timeout=30, proxies=_proxies())
-    if r.status_code != 200:
-        raise ProviderError(r.status_code, "session_fetch_failed", r.text[:500])
-    
-    data = r.json()
+
+def _parse_session_payload(data: dict) -> Tuple[str, Optional[datetime], Optional[str], Optional[str]]:
+    """从 session 响应中提取 (access_token, expires_at, email, team_id)"""
     token = data.get("accessToken")
     user = data.get("user", {}) or {}
     email = user.get("email")
@@ -193,18 +168,30 @@ def _headers(access_token: str, team_id: Optional[str] = None) -> dict:
     return h
 
 def send_invite(access_token: str, team_id: str, email: str, role: str = "standard-user", resend: bool = True) -> dict:
+    """单邮箱邀请；同一团队的并发调用会被合并为一次 send_invites 请求"""
+    return _invite_coalescer.submit(access_token, team_id, email, role, resend)
+
+
+def send_invites(
+    access_token: str,
+    team_id: str,
+    emails: list[str],
+    role: str = "standard-user",
+    resend: bool = True,
+) -> dict:
+    """一次请求向同一团队邀请多个邮箱（email_addresses 支持列表）"""
     def _do():
         url = f"{BASE}/accounts/{team_id}/invites"
         payload = {
-            "email_addresses": [email],
+            "email_addresses": list(emails),
             "role": role,
             "resend_emails": resend,
         }
         t0 = time.time()
-        r = requests.post(url, headers=_headers(access_token, team_id), json=payload, timeout=30, proxies=_proxies())
+        r = provider_client.post(url, headers=_headers(access_token, team_id), json=payload)
         provider_metrics.record("send_invite", team_id, r.status_code, (time.time()-t0)*1000)
         if r.status_code not in (200, 201):
-            raise ProviderError(r.status_code, "invite_failed", r.text[:1000])
+            raise _response_error(r, "invite_failed")
         try:
             return r.json()
         except Exception:
@@ -213,14 +200,19 @@ def send_invite(access_token: str, team_id: str, email: str, role: str = "standa
     _record_success('send_invite', team_id)
     return resp
 
+
+# 调用时再取 send_invites，便于测试替换
+_invite_coalescer = InviteCoalescer(lambda *args, **kwargs: send_invites(*args, **kwargs))
+
+
 def delete_member(access_token: str, team_id: str, member_id: str) -> dict:
     def _do():
         url = f"{BASE}/accounts/{team_id}/users/{member_id}"
         t0 = time.time()
-        r = requests.delete(url, headers=_headers(access_token, team_id), timeout=30, proxies=_proxies())
+        r = provider_client.delete(url, headers=_headers(access_token, team_id))
         provider_metrics.record("delete_member", team_id, r.status_code, (time.time()-t0)*1000)
         if r.status_code not in (200, 204):
-            raise ProviderError(r.status_code, "remove_member_failed", r.text[:1000])
+            raise _response_error(r, "remove_member_failed")
         try:
             return r.json() if r.text else {"ok": True}
         except Exception:
@@ -238,15 +230,49 @@ def list_members(access_token: str, team_id: str, offset: int = 0, limit: int =
             "query": query
         }
         t0 = time.time()
-        r = requests.get(url, headers=_headers(access_token, team_id), params=params, timeout=30, proxies=_proxies())
+        r = provider_client.get(url, headers=_headers(access_token, team_id), params=params)
         provider_metrics.record("list_members", team_id, r.status_code, (time.time()-t0)*1000)
         if r.status_code != 200:
-            raise ProviderError(r.status_code, "list_members_failed", r.text[:1000])
+            raise _response_error(r, "list_members_failed")
         return r.json()
     resp = _with_resilience(_do, 'list_members', team_id)
     _record_success('list_members', team_id)
     return resp
 
+def member_page_items(payload: Any) -> list:
+    """从 list_members 响应中取出成员列表（兼容 items / data / members 字段）"""
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict):
+        for key in ("items", "data", "members", "users"):
+            value = payload.get(key)
+            if isinstance(value, list):
+                return value
+    return []
+
+
+def iter_member_pages(
+    access_token: str,
+    team_id: str,
+    page_size: int = 100,
+    max_pages: Optional[int] = None,
+):
+    """逐页拉取团队成员，按页产出原始响应；max_pages 限制单次最多请求的页数"""
+    offset = 0
+    pages = 0
+    while True:
+        payload = list_members(access_token, team_id, offset=offset, limit=page_size)
+        yield payload
+        items = member_page_items(payload)
+        pages += 1
+        offset += len(items)
+        total = payload.get("total") if isinstance(payload, dict) else None
+        if len(items) < page_size or (isinstance(total, int) and offset >= total):
+            return
+        if max_pages and pages >= max_pages:
+            return
+
+
 def list_teams(access_token: str, account_id: str, cursor: Optional[str] = None, limit: int = 50) -> dict:
     def _do():
         url = f"{BASE}/accounts/{account_id}/teams"
@@ -254,10 +280,10 @@ def list_teams(access_token: str, account_id: str, cursor: Optional[str] = None,
         if cursor:
             params["cursor"] = cursor
         t0 = time.time()
-        r = requests.get(url, headers=_headers(access_token, account_id), params=params, timeout=30, proxies=_proxies())
+        r = provider_client.get(url, headers=_headers(access_token, account_id), params=params)
         provider_metrics.record("list_teams", account_id, r.status_code, (time.time() - t0) * 1000)
         if r.status_code != 200:
-            raise ProviderError(r.status_code, "list_teams_failed", r.text[:1000])
+            raise _response_error(r, "list_teams_failed")
         try:
             return r.json()
         except Exception as exc:
@@ -275,10 +301,10 @@ def list_invites(access_token: str, team_id: str, offset: int = 0, limit: int =
             "query": query
         }
         t0 = time.time()
-        r = requests.get(url, headers=_headers(access_token, team_id), params=params, timeout=30, proxies=_proxies())
+        r = provider_client.get(url, headers=_headers(access_token, team_id), params=params)
         provider_metrics.record("list_invites", team_id, r.status_code, (time.time()-t0)*1000)
         if r.status_code != 200:
-            raise ProviderError(r.status_code, "list_invites_failed", r.text[:1000])
+            raise _response_error(r, "list_invites_failed")
         return r.json()
     resp = _with_resilience(_do, 'list_invites', team_id)
     _record_success('list_invites', team_id)
@@ -288,10 +314,10 @@ def cancel_invite(access_token: str, team_id: str, invite_id: str) -> dict:
     def _do():
         url = f"{BASE}/accounts/{team_id}/invites/{invite_id}"
         t0 = time.time()
-        r = requests.delete(url, headers=_headers(access_token, team_id), timeout=30, proxies=_proxies())
+        r = provider_client.delete(url, headers=_headers(access_token, team_id))
         provider_metrics.record("cancel_invite", team_id, r.status_code, (time.time()-t0)*1000)
         if r.status_code not in (200, 204):
-            raise ProviderError(r.status_code, "cancel_invite_failed", r.text[:1000])
+            raise _response_error(r, "cancel_invite_failed")
         try:
             return r.json() if r.text else {"ok": True}
         except Exception:
@@ -307,10 +333,10 @@ def update_team_info(access_token: str, team_id: str, team_name: str) -> dict:
             "name": team_name
         }
         t0 = time.time()
-        r = requests.patch(url, headers=_headers(access_token, team_id), json=payload, timeout=30, proxies=_proxies())
+        r = provider_client.patch(url, headers=_headers(access_token, team_id), json=payload)
         provider_metrics.record("update_team_info", team_id, r.status_code, (time.time()-t0)*1000)
         if r.status_code not in (200, 204):
-            raise ProviderError(r.status_code, "update_team_info_failed", r.text[:1000])
+            raise _response_error(r, "update_team_info_failed")
         try:
             return r.json() if r.text else {"ok": True}
         except Exception:
@@ -326,10 +352,10 @@ def enable_beta_feature(access_token: str, team_id: str, feature: str) -> dict:
             "feature": feature
         }
         t0 = time.time()
-        r = requests.post(url, headers=_headers(access_token, team_id), json=payload, timeout=30, proxies=_proxies())
+        r = provider_client.post(url, headers=_headers(access_token, team_id), json=payload)
         provider_metrics.record("enable_beta_feature", team_id, r.status_code, (time.time()-t0)*1000)
         if r.status_code not in (200, 201):
-            raise ProviderError(r.status_code, "enable_beta_feature_failed", r.text[:1000])
+            raise _response_error(r, "enable_beta_feature_failed")
         try:
             return r.json()
         except Exception:
@@ -0,0 +1,219 @@
+"""
+Provider 异步接口
+
+与 app.provider 一一对应的 asyncio 版本：基于共享的 httpx.AsyncClient 连接池，
+重试退避使用 asyncio.sleep，不占用线程池。熔断状态与同步版本共享。
+"""
+import time
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+from app.circuit_breaker import provider_breaker
+from app.invite_coalescer import AsyncInviteCoalescer
+from app.metrics import provider_metrics
+from app.provider import (
+    BASE,
+    SESSION_URL,
+    ProviderError,
+    _headers,
+    _parse_session_payload,
+    _response_error,
+    _session_headers,
+)
+from app.provider_client import async_provider_client
+from app.utils.retry_policy import DeadlineExceeded, acall_with_retry, provider_retry_policy
+
+
+async def _record_success(endpoint: str, team_id: Optional[str]) -> None:
+    # Redis 熔断后端的网络 IO 在线程中执行，不阻塞事件循环
+    await provider_breaker.arecord_success(endpoint, team_id)
+
+
+async def _with_resilience(do_request, endpoint: str, team_id: Optional[str]):
+    if not await provider_breaker.aallow(endpoint, team_id):
+        raise ProviderError(503, 'circuit_open', f'Circuit open for {endpoint}:{team_id or "-"}')
+    try:
+        return await acall_with_retry(do_request, policy=provider_retry_policy, endpoint=endpoint)
+    except DeadlineExceeded as e:
+        raise ProviderError(504, 'deadline_exceeded', str(e)) from e
+    except Exception:
+        await provider_breaker.arecord_failure(endpoint, team_id)
+        raise
+
+
+async def fetch_session_via_cookie(cookie: str) -> Tuple[str, Optional[datetime], Optional[str], Optional[str]]:
+    """异步版 provider.fetch_session_via_cookie"""
+    r = await async_provider_client.get(SESSION_URL, headers=_session_headers(cookie))
+    if r.status_code != 200:
+        raise _response_error(r, "session_fetch_failed", 500)
+    return _parse_session_payload(r.json())
+
+
+async def send_invite(access_token: str, team_id: str, email: str, role: str = "standard-user", resend: bool = True) -> dict:
+    """单邮箱邀请；同一团队的并发调用会被合并为一次 send_invites 请求"""
+    return await _invite_coalescer.submit(access_token, team_id, email, role, resend)
+
+
+async def send_invites(
+    access_token: str,
+    team_id: str,
+    emails: list[str],
+    role: str = "standard-user",
+    resend: bool = True,
+) -> dict:
+    """一次请求向同一团队邀请多个邮箱（email_addresses 支持列表）"""
+    async def _do():
+        url = f"{BASE}/accounts/{team_id}/invites"
+        payload = {
+            "email_addresses": list(emails),
+            "role": role,
+            "resend_emails": resend,
+        }
+        t0 = time.time()
+        r = await async_provider_client.post(url, headers=_headers(access_token, team_id), json=payload)
+        provider_metrics.record("send_invite", team_id, r.status_code, (time.time()-t0)*1000)
+        if r.status_code not in (200, 201):
+            raise _response_error(r, "invite_failed")
+        try:
+            return r.json()
+        except Exception:
+            return {"raw": r.text}
+    resp = await _with_resilience(_do, 'send_invite', team_id)
+    await _record_success('send_invite', team_id)
+    return resp
+
+
+# 调用时再取 send_invites，便于测试替换
+_invite_coalescer = AsyncInviteCoalescer(lambda *args, **kwargs: send_invites(*args, **kwargs))
+
+
+async def delete_member(access_token: str, team_id: str, member_id: str) -> dict:
+    async def _do():
+        url = f"{BASE}/accounts/{team_id}/users/{member_id}"
+        t0 = time.time()
+        r = await async_provider_client.delete(url, headers=_headers(access_token, team_id))
+        provider_metrics.record("delete_member", team_id, r.status_code, (time.time()-t0)*1000)
+        if r.status_code not in (200, 204):
+            raise _response_error(r, "remove_member_failed")
+        try:
+            return r.json() if r.text else {"ok": True}
+        except Exception:
+            return {"ok": True}
+    resp = await _with_resilience(_do, 'delete_member', team_id)
+    await _record_success('delete_member', team_id)
+    return resp
+
+
+async def list_members(access_token: str, team_id: str, offset: int = 0, limit: int = 25, query: str = "") -> dict:
+    async def _do():
+        url = f"{BASE}/accounts/{team_id}/users"
+        params = {
+            "offset": offset,
+            "limit": limit,
+            "query": query
+        }
+        t0 = time.time()
+        r = await async_provider_client.get(url, headers=_headers(access_token, team_id), params=params)
+        provider_metrics.record("list_members", team_id, r.status_code, (time.time()-t0)*1000)
+        if r.status_code != 200:
+            raise _response_error(r, "list_members_failed")
+        return r.json()
+    resp = await _with_resilience(_do, 'list_members', team_id)
+    await _record_success('list_members', team_id)
+    return resp
+
+
+async def list_teams(access_token: str, account_id: str, cursor: Optional[str] = None, limit: int = 50) -> dict:
+    async def _do():
+        url = f"{BASE}/accounts/{account_id}/teams"
+        params: dict[str, Any] = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        t0 = time.time()
+        r = await async_provider_client.get(url, headers=_headers(access_token, account_id), params=params)
+        provider_metrics.record("list_teams", account_id, r.status_code, (time.time() - t0) * 1000)
+        if r.status_code != 200:
+            raise _response_error(r, "list_teams_failed")
+        try:
+            return r.json()
+        except Exception as exc:
+            raise ProviderError(r.status_code, "list_teams_invalid_json", str(exc)) from exc
+    resp = await _with_resilience(_do, 'list_teams', account_id)
+    await _record_success('list_teams', account_id)
+    return resp
+
+
+async def list_invites(access_token: str, team_id: str, offset: int = 0, limit: int = 25, query: str = "") -> dict:
+    async def _do():
+        url = f"{BASE}/accounts/{team_id}/invites"
+        params = {
+            "offset": offset,
+            "limit": limit,
+            "query": query
+        }
+        t0 = time.time()
+        r = await async_provider_client.get(url, headers=_headers(access_token, team_id), params=params)
+        provider_metrics.record("list_invites", team_id, r.status_code, (time.time()-t0)*1000)
+        if r.status_code != 200:
+            raise _response_error(r, "list_invites_failed")
+        return r.json()
+    resp = await _with_resilience(_do, 'list_invites', team_id)
+    await _record_success('list_invites', team_id)
+    return resp
+
+
+async def cancel_invite(access_token: str, team_id: str, invite_id: str) -> dict:
+    async def _do():
+        url = f"{BASE}/accounts/{team_id}/invites/{invite_id}"
+        t0 = time.time()
+        r = await async_provider_client.delete(url, headers=_headers(access_token, team_id))
+        provider_metrics.record("cancel_invite", team_id, r.status_code, (time.time()-t0)*1000)
+        if r.status_code not in (200, 204):
+            raise _response_error(r, "cancel_invite_failed")
+        try:
+            return r.json() if r.text else {"ok": True}
+        except Exception:
+            return {"ok": True}
+    resp = await _with_resilience(_do, 'cancel_invite', team_id)
+    await _record_success('cancel_invite', team_id)
+    return resp
+
+
+async def update_team_info(access_token: str, team_id: str, team_name: str) -> dict:
+    async def _do():
+        url = f"{BASE}/accounts/{team_id}"
+        payload = {
+            "name": team_name
+        }
+        t0 = time.time()
+        r = await async_provider_client.patch(url, headers=_headers(access_token, team_id), json=payload)
+        provider_metrics.record("update_team_info", team_id, r.status_code, (time.time()-t0)*1000)
+        if r.status_code not in (200, 204):
+            raise _response_error(r, "update_team_info_failed")
+        try:
+            return r.json() if r.text else {"ok": True}
+        except Exception:
+            return {"ok": True}
+    resp = await _with_resilience(_do, 'update_team_info', team_id)
+    await _record_success('update_team_info', team_id)
+    return resp
+
+
+async def enable_beta_feature(access_token: str, team_id: str, feature: str) -> dict:
+    async def _do():
+        url = f"{BASE}/accounts/{team_id}/beta_features"
+        payload = {
+            "feature": feature
+        }
+        t0 = time.time()
+        r = await async_provider_client.post(url, headers=_headers(access_token, team_id), json=payload)
+        provider_metrics.record("enable_beta_feature", team_id, r.status_code, (time.time()-t0)*1000)
+        if r.status_code not in (200, 201):
+            raise _response_error(r, "enable_beta_feature_failed")
+        try:
+            return r.json()
+        except Exception:
+            return {"raw": r.text}
+    resp = await _with_resilience(_do, 'enable_beta_feature', team_id)
+    await _record_success('enable_beta_feature', team_id)
+    return resp
@@ -0,0 +1,315 @@
+"""
+Provider HTTP 客户端连接池
+
+为 app.provider 提供共享的 keep-alive 连接池，按 (scheme://host, proxy) 复用 httpx 客户端，
+避免每次上游调用都重新进行 TCP+TLS 握手。
+
+- 可按 host / proxy 覆盖连接池大小、keep-alive、HTTP/2 与超时配置
+- 安装了 h2 时启用 HTTP/2，否则自动回退 HTTP/1.1
+- 通过 app.metrics.provider_metrics 上报连接复用（hit/miss）与在途请求数
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, replace
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.config import settings
+from app.metrics import provider_metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # type: ignore  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except Exception:  # pragma: no cover - h2 可选
+    HTTP2_AVAILABLE = False
+
+# httpcore trace 事件：出现该事件说明本次请求新建了连接（连接池未命中）
+_NEW_CONNECTION_EVENTS = ("connection.connect_tcp.started", "connection.connect_unix_socket.started")
+
+
+@dataclass(frozen=True)
+class ProviderClientConfig:
+    """单个连接池（host+proxy）的配置"""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = True
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    write_timeout: float = 30.0
+    pool_timeout: float = 10.0
+
+    @classmethod
+    def from_settings(cls, settings) -> "ProviderClientConfig":
+        return cls(
+            max_connections=settings.provider_pool_max_connections,
+            max_keepalive_connections=settings.provider_pool_max_keepalive,
+            keepalive_expiry=settings.provider_keepalive_expiry_seconds,
+            http2=settings.provider_http2,
+            connect_timeout=settings.provider_connect_timeout_seconds,
+            read_timeout=settings.provider_read_timeout_seconds,
+            write_timeout=settings.provider_read_timeout_seconds,
+            pool_timeout=settings.provider_pool_timeout_seconds,
+        )
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+    @property
+    def use_http2(self) -> bool:
+        return self.http2 and HTTP2_AVAILABLE
+
+
+def proxy_for_url(url: str) -> Optional[str]:
+    """按 URL scheme 选择代理（与 settings.http_proxy / https_proxy 对应）"""
+    scheme = urlsplit(url).scheme
+    if scheme == "https":
+        return settings.https_proxy or None
+    if scheme == "http":
+        return settings.http_proxy or None
+    return None
+
+
+def origin_of(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class _PoolTrace:
+    """收集 httpcore trace 事件，判断本次请求是否复用了已有连接"""
+
+    __slots__ = ("new_connection",)
+
+    def __init__(self):
+        self.new_connection = False
+
+    def __call__(self, event_name: str, info: dict) -> None:
+        if event_name in _NEW_CONNECTION_EVENTS:
+            self.new_connection = True
+
+
+class _AsyncPoolTrace(_PoolTrace):
+    """异步接口要求 trace 回调为协程函数"""
+
+    __slots__ = ()
+
+    async def __call__(self, event_name: str, info: dict) -> None:  # type: ignore[override]
+        if event_name in _NEW_CONNECTION_EVENTS:
+            self.new_connection = True
+
+
+class _ClientRegistry(ABC):
+    """按 (origin, proxy) 管理客户端实例与配置覆盖（同步/异步客户端共用）"""
+
+    def __init__(self, default_config: Optional[ProviderClientConfig] = None):
+        self._lock = threading.Lock()
+        self._default = default_config or ProviderClientConfig.from_settings(settings)
+        self._host_overrides: dict[str, dict[str, Any]] = {}
+        self._proxy_overrides: dict[str, dict[str, Any]] = {}
+        self._clients: dict[tuple[str, Optional[str]], Any] = {}
+
+    @property
+    def default_config(self) -> ProviderClientConfig:
+        return self._default
+
+    def configure(self, config: ProviderClientConfig) -> None:
+        """替换默认配置；已创建的客户端会被关闭并在下次请求时重建"""
+        with self._lock:
+            self._default = config
+        self.reset()
+
+    def configure_host(self, host: str, **overrides: Any) -> None:
+        """覆盖某个 host（如 chatgpt.com）的连接池配置"""
+        with self._lock:
+            self._host_overrides[host.lower()] = overrides
+        self.reset()
+
+    def configure_proxy(self, proxy_url: str, **overrides: Any) -> None:
+        """覆盖经由某个代理的连接池配置（host 覆盖优先级更高）"""
+        with self._lock:
+            self._proxy_overrides[proxy_url] = overrides
+        self.reset()
+
+    def config_for(self, origin: str, proxy: Optional[str]) -> ProviderClientConfig:
+        host = (urlsplit(origin).hostname or "").lower()
+        overrides: dict[str, Any] = {}
+        if proxy and proxy in self._proxy_overrides:
+            overrides.update(self._proxy_overrides[proxy])
+        if host in self._host_overrides:
+            overrides.update(self._host_overrides[host])
+        return replace(self._default, **overrides) if overrides else self._default
+
+    @abstractmethod
+    def _build_client(self, config: ProviderClientConfig, proxy: Optional[str]) -> Any:
+        ...
+
+    def _get_client(self, url: str):
+        origin = origin_of(url)
+        proxy = proxy_for_url(url)
+        key = (origin, proxy)
+        client = self._clients.get(key)
+        if client is not None:
+            return origin, client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._build_client(self.config_for(origin, proxy), proxy)
+                self._clients[key] = client
+        return origin, client
+
+    def _pop_clients(self) -> list:
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        return clients
+
+    @abstractmethod
+    def reset(self) -> None:
+        ...
+
+
+class ProviderHttpClient(_ClientRegistry):
+    """
+    同步 Provider HTTP 客户端
+
+    线程安全；每个 (origin, proxy) 对应一个 httpx.Client，内部维护 keep-alive 连接池。
+    """
+
+    def _build_client(self, config: ProviderClientConfig, proxy: Optional[str]) -> httpx.Client:
+        transport = httpx.HTTPTransport(
+            http2=config.use_http2,
+            limits=config.limits,
+            proxy=httpx.Proxy(proxy) if proxy else None,
+        )
+        return httpx.Client(transport=transport, timeout=config.timeout, trust_env=False)
+
+    def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        发送请求（复用连接池）
+
+        Args:
+            method: HTTP 方法
+            url: 完整 URL
+            **kwargs: 透传给 httpx.Client.request（headers/params/json/timeout 等）
+        """
+        origin, client = self._get_client(url)
+        trace = _PoolTrace()
+        extensions = dict(kwargs.pop("extensions", None) or {})
+        extensions["trace"] = trace
+        provider_metrics.inflight_inc(origin)
+        try:
+            return client.request(method, url, extensions=extensions, **kwargs)
+        finally:
+            provider_metrics.inflight_dec(origin)
+            provider_metrics.record_pool(origin, hit=not trace.new_connection)
+
+    def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url: str, **kwargs: Any) -> httpx.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url: str, **kwargs: Any) -> httpx.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def reset(self) -> None:
+        for client in self._pop_clients():
+            try:
+                client.close()
+            except Exception:
+                logger.debug("close provider client failed", exc_info=True)
+
+    def close(self) -> None:
+        self.reset()
+
+
+class AsyncProviderHttpClient(_ClientRegistry):
+    """
+    异步 Provider HTTP 客户端
+
+    与同步客户端共享配置与指标；每个 (origin, proxy) 对应一个 httpx.AsyncClient，
+    在事件循环内复用连接，不占用线程池。
+    """
+
+    def _build_client(self, config: ProviderClientConfig, proxy: Optional[str]) -> httpx.AsyncClient:
+        transport = httpx.AsyncHTTPTransport(
+            http2=config.use_http2,
+            limits=config.limits,
+            proxy=httpx.Proxy(proxy) if proxy else None,
+        )
+        return httpx.AsyncClient(transport=transport, timeout=config.timeout, trust_env=False)
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        origin, client = self._get_client(url)
+        trace = _AsyncPoolTrace()
+        extensions = dict(kwargs.pop("extensions", None) or {})
+        extensions["trace"] = trace
+        provider_metrics.inflight_inc(origin)
+        try:
+            return await client.request(method, url, extensions=extensions, **kwargs)
+        finally:
+            provider_metrics.inflight_dec(origin)
+            provider_metrics.record_pool(origin, hit=not trace.new_connection)
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("PATCH", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    def reset(self) -> None:
+        # 配置变更时丢弃旧客户端引用；连接由 aclose() 或 GC 回收
+        self._pop_clients()
+
+    async def aclose(self) -> None:
+        for client in self._pop_clients():
+            try:
+                await client.aclose()
+            except Exception:
+                logger.debug("close async provider client failed", exc_info=True)
+
+
+provider_client = ProviderHttpClient()
+async_provider_client = AsyncProviderHttpClient()
+
+
+def close_provider_clients() -> None:
+    """关闭所有同步 Provider 连接池（应用关闭时调用）"""
+    provider_client.close()
+
+
+async def aclose_provider_clients() -> None:
+    """关闭同步与异步 Provider 连接池（应用 lifespan 结束时调用）"""
+    provider_client.close()
+    await async_provider_client.aclose()
@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session, joinedload
 
 from app import models
 from app.domains.mother import MotherSummary, MotherListFilters
+from app.services.shared.text_search import search_clause
 
 
 class MotherRepository:
@@ -51,9 +52,9 @@ class MotherRepository:
         limit: int = 20,
     ) -> List[models.MotherAccount]:
         query = self._session.query(models.MotherAccount)
-        if search:
-            like = f"%{search.lower()}%"
-            query = query.filter(func.lower(models.MotherAccount.name).like(like))
+        clause = search_clause(self._session, models.MotherAccount, search)
+        if clause is not None:
+            query = query.filter(clause)
         return (
             query.order_by(models.MotherAccount.created_at.desc())
             .offset(offset)
@@ -63,9 +64,9 @@ class MotherRepository:
 
     def count(self, *, search: Optional[str] = None) -> int:
         query = self._session.query(models.MotherAccount)
-        if search:
-            like = f"%{search.lower()}%"
-            query = query.filter(func.lower(models.MotherAccount.name).like(like))
+        clause = search_clause(self._session, models.MotherAccount, search)
+        if clause is not None:
+            query = query.filter(clause)
         return query.count()
 
     def fetch_teams(self, mother_ids: Sequence[int]) -> List[models.MotherTeam]:
@@ -315,9 +316,9 @@ class MotherRepository:
         query = self._session.query(models.MotherAccount)
 
         # 应用过滤器
-        if filters.search:
-            like = f"%{filters.search.lower()}%"
-            query = query.filter(func.lower(models.MotherAccount.name).like(like))
+        clause = search_clause(self._session, models.MotherAccount, filters.search)
+        if clause is not None:
+            query = query.filter(clause)
 
         if filters.status:
             query = query.filter(models.MotherAccount.status == models.MotherStatus(filters.status.value))
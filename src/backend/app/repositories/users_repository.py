@@ -16,6 +16,7 @@ from sqlalchemy import func, select, update
 from sqlalchemy.orm import Session
 
 from app import models
+from app.services.shared.stats_counters import record_transition
 
 
 class UsersRepository:
@@ -97,6 +98,14 @@ class UsersRepository:
                 models.RedeemCode.status == models.CodeStatus.unused,
             )
             .values(status=models.CodeStatus.blocked)
+            .execution_options(stats_tracked=True)
+        )
+        record_transition(
+            self._session,
+            models.RedeemCode,
+            {"status": models.CodeStatus.unused},
+            {"status": models.CodeStatus.blocked},
+            count=res.rowcount,
         )
         return res.rowcount == 1
 
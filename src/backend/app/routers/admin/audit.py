@@ -1,10 +1,12 @@
 """
 管理员审计日志相关路由
 """
-from fastapi import APIRouter, Depends, Query, Request
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from app.utils.pagination import compute_pagination
+from app.utils.pagination import compute_pagination, keyset_page, with_estimated_total
 
 from app import models
 
@@ -19,22 +21,40 @@ def list_audit_logs(
     db: Session = Depends(get_db),
     page: int = Query(1, ge=1, description="页码（从1开始）"),
     page_size: int = Query(50, ge=1, le=200, description="每页数量，默认50，最大200"),
+    cursor: Optional[str] = Query(None, description="游标分页：首页传空串，之后传上一页的 next_cursor；提供时忽略 page"),
+    approx_total: bool = Query(False, description="游标分页时附带估算总数（仅 PostgreSQL）"),
 ):
     require_admin(request, db)
     # 建议传 X-Domain=users；读取接口不强制
 
-    total = db.query(func.count(models.AuditLog.id)).scalar() or 0
-    meta, offset = compute_pagination(total, page, page_size)
-    if total == 0:
-        return {"items": [], "pagination": meta.as_dict()}
+    if cursor is not None:
+        query = db.query(models.AuditLog)
+        try:
+            logs, pagination = keyset_page(
+                query,
+                created_col=models.AuditLog.created_at,
+                id_col=models.AuditLog.id,
+                cursor=cursor,
+                page_size=page_size,
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail="无效的分页游标") from exc
+        if approx_total:
+            with_estimated_total(db, query, pagination)
+    else:
+        total = db.query(func.count(models.AuditLog.id)).scalar() or 0
+        meta, offset = compute_pagination(total, page, page_size)
+        pagination = meta.as_dict()
+        if total == 0:
+            return {"items": [], "pagination": pagination}
 
-    logs = (
-        db.query(models.AuditLog)
-        .order_by(models.AuditLog.created_at.desc())
-        .offset(offset)
-        .limit(page_size)
-        .all()
-    )
+        logs = (
+            db.query(models.AuditLog)
+            .order_by(models.AuditLog.created_at.desc(), models.AuditLog.id.desc())
+            .offset(offset)
+            .limit(page_size)
+            .all()
+        )
 
     items = [
         {
@@ -51,7 +71,7 @@ def list_audit_logs(
         for log in logs
     ]
 
-    return {"items": items, "pagination": meta.as_dict()}
+    return {"items": items, "pagination": pagination}
 
 
 __all__ = ["router"]
@@ -1,7 +1,9 @@
 """
 管理员认证与会话相关路由
 """
+import asyncio
 from datetime import datetime, timedelta
+from typing import Optional
 import uuid
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Response
@@ -24,6 +26,11 @@ from app.security import (
 )
 from app.services.services import audit as audit_svc
 from app.services.services.admin_service import create_or_update_admin_default
+from app.services.services.admin_session_cache import (
+    invalidate_admin_session,
+    invalidate_all_admin_sessions,
+    resolve_admin_session,
+)
 from app.utils.csrf import generate_csrf_token_for_session
 
 from .dependencies import (
@@ -45,7 +52,42 @@ async def admin_login(
     _: None = Depends(admin_login_rate_limit_dep),
 ):
     """管理员登录 - 限流：每分钟100次（按IP）"""
-    ip = request.client.host if request.client else "_"
+    client_ip = request.client.host if request.client else None
+    ua = request.headers.get("user-agent")
+
+    # bcrypt 校验与数据库 / Redis 读写都是阻塞调用，放到线程池执行
+    sid = await asyncio.to_thread(_authenticate, db, payload.password, client_ip, ua)
+
+    token = sign_session(sid)
+    cookie_kwargs = {
+        "httponly": True,
+        "path": "/",
+        "max_age": settings.admin_session_ttl_seconds,
+    }
+
+    if settings.env in ("prod", "production"):
+        cookie_kwargs.update(
+            {
+                "secure": True,
+                "samesite": "strict",
+                "domain": f".{settings.domain}" if settings.domain != "localhost" else None,
+            }
+        )
+    else:
+        cookie_kwargs.update({"samesite": "lax"})
+
+    response.set_cookie("admin_session", token, **cookie_kwargs)
+
+    for header, value in get_security_headers().items():
+        response.headers[header] = value
+
+    await asyncio.to_thread(audit_svc.log, db, actor="admin", action="login", ip=client_ip, ua=ua)
+    return {"success": True, "message": "登录成功"}
+
+
+def _authenticate(db: Session, password: str, client_ip: Optional[str], ua: Optional[str]) -> str:
+    """校验密码并创建会话，返回会话 ID；失败时抛出 HTTPException"""
+    ip = client_ip or "_"
 
     if not check_login_attempts(ip):
         remaining = get_lockout_remaining(ip)
@@ -60,8 +102,8 @@ async def admin_login(
             row = db.query(models.AdminConfig).first()
         except Exception:
             row = None
-    
-    if not verify_admin_password(payload.password, row.password_hash):
+
+    if not verify_admin_password(password, row.password_hash):
         record_login_attempt(ip, False)
         raise HTTPException(status_code=401, detail="密码错误")
 
@@ -73,43 +115,12 @@ async def admin_login(
         models.AdminSession(
             session_id=sid,
             expires_at=expires_at,
-            ip=request.client.host if request.client else None,
-            ua=request.headers.get("user-agent"),
+            ip=client_ip,
+            ua=ua,
         )
     )
     db.commit()
-
-    token = sign_session(sid)
-    cookie_kwargs = {
-        "httponly": True,
-        "path": "/",
-        "max_age": settings.admin_session_ttl_seconds,
-    }
-
-    if settings.env in ("prod", "production"):
-        cookie_kwargs.update(
-            {
-                "secure": True,
-                "samesite": "strict",
-                "domain": f".{settings.domain}" if settings.domain != "localhost" else None,
-            }
-        )
-    else:
-        cookie_kwargs.update({"samesite": "lax"})
-
-    response.set_cookie("admin_session", token, **cookie_kwargs)
-
-    for header, value in get_security_headers().items():
-        response.headers[header] = value
-
-    audit_svc.log(
-        db,
-        actor="admin",
-        action="login",
-        ip=request.client.host if request.client else None,
-        ua=request.headers.get("user-agent"),
-    )
-    return {"success": True, "message": "登录成功"}
+    return sid
 
 
 @router.post("/logout")
@@ -122,6 +133,7 @@ def admin_logout(request: Request, response: Response, db: Session = Depends(get
             row.revoked = True
             db.add(row)
             db.commit()
+        invalidate_admin_session(sess)
 
     delete_kwargs = {"path": "/", "httponly": True}
     if settings.env in ("prod", "production"):
@@ -150,6 +162,7 @@ def admin_logout_all(request: Request, db: Session = Depends(get_db)):
         db.add(row)
         count += 1
     db.commit()
+    invalidate_all_admin_sessions()
     return {"success": True, "message": f"已撤销 {count} 个会话"}
 
 
@@ -159,16 +172,7 @@ def admin_me(request: Request, db: Session = Depends(get_db)):
     if not sess or not verify_session(sess, max_age_seconds=settings.admin_session_ttl_seconds):
         return AdminMeOut(authenticated=False)
 
-    sid = unsign_session(sess, max_age_seconds=settings.admin_session_ttl_seconds)
-    if not sid:
-        return AdminMeOut(authenticated=False)
-
-    row = db.query(models.AdminSession).filter(models.AdminSession.session_id == sid).first()
-    now = datetime.utcnow()
-    if not row or row.revoked or row.expires_at <= now:
-        return AdminMeOut(authenticated=False)
-
-    return AdminMeOut(authenticated=True)
+    return AdminMeOut(authenticated=resolve_admin_session(db, sess) is not None)
 
 
 @router.get("/csrf-token")
@@ -177,15 +181,10 @@ def get_csrf_token(request: Request, db: Session = Depends(get_db)):
     if not sess or not verify_session(sess, max_age_seconds=settings.admin_session_ttl_seconds):
         raise HTTPException(status_code=401, detail="未认证")
 
-    sid = unsign_session(sess, max_age_seconds=settings.admin_session_ttl_seconds)
+    sid = resolve_admin_session(db, sess)
     if not sid:
         raise HTTPException(status_code=401, detail="未认证")
 
-    row = db.query(models.AdminSession).filter(models.AdminSession.session_id == sid).first()
-    now = datetime.utcnow()
-    if not row or row.revoked or row.expires_at <= now:
-        raise HTTPException(status_code=401, detail="未认证")
-
     csrf_token = generate_csrf_token_for_session(sid)
     return {"csrf_token": csrf_token}
 
@@ -207,6 +206,7 @@ def admin_change_password(
     row.password_hash = hash_password(payload.new_password)
     db.add(row)
     db.commit()
+    invalidate_all_admin_sessions()
 
     audit_svc.log(db, actor="admin", action="change_password")
     return {"ok": True}
@@ -14,6 +14,7 @@ from app.services.services.bulk_history import record_bulk_operation
 from app.repositories import UsersRepository
 from app.repositories.mother_repository import MotherRepository
 from app.services.services.invites import InviteService
+from app.utils.retry_policy import item_retry_budget
 
 from .dependencies import admin_ops_rate_limit_dep, get_db, get_db_pool, require_admin
 
@@ -176,14 +177,16 @@ def batch_users(
             continue
 
         email = invite.email.strip().lower()
-        if action == "resend":
-            ok, _ = resend_invite(email, invite.team_id)
-        elif action == "cancel":
-            ok, _ = cancel_invite(email, invite.team_id)
-        elif action == "remove":
-            ok, _ = remove_member(email, invite.team_id)
-        else:
-            raise HTTPException(status_code=400, detail="不支持的操作")
+        # 每个条目独立的重试预算，避免整批共用请求级预算
+        with item_retry_budget():
+            if action == "resend":
+                ok, _ = resend_invite(email, invite.team_id)
+            elif action == "cancel":
+                ok, _ = cancel_invite(email, invite.team_id)
+            elif action == "remove":
+                ok, _ = remove_member(email, invite.team_id)
+            else:
+                raise HTTPException(status_code=400, detail="不支持的操作")
 
         if ok:
             success += 1
@@ -3,10 +3,12 @@
 """
 import json
 
-from fastapi import APIRouter, Depends, Query, Request
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from app.utils.pagination import compute_pagination
+from app.utils.pagination import compute_pagination, keyset_page, with_estimated_total
 
 from app import models
 
@@ -21,22 +23,40 @@ def bulk_history(
     db: Session = Depends(get_db),
     page: int = Query(1, ge=1, description="页码（从1开始）"),
     page_size: int = Query(50, ge=1, le=200, description="每页数量，默认50，最大200"),
+    cursor: Optional[str] = Query(None, description="游标分页：首页传空串，之后传上一页的 next_cursor；提供时忽略 page"),
+    approx_total: bool = Query(False, description="游标分页时附带估算总数（仅 PostgreSQL）"),
 ):
     """列出最近的批量操作记录"""
     require_admin(request, db)
 
-    total = db.query(func.count(models.BulkOperationLog.id)).scalar() or 0
-    meta, offset = compute_pagination(total, page, page_size)
-    if total == 0:
-        return {"items": [], "pagination": meta.as_dict()}
+    if cursor is not None:
+        query = db.query(models.BulkOperationLog)
+        try:
+            logs, pagination = keyset_page(
+                query,
+                created_col=models.BulkOperationLog.created_at,
+                id_col=models.BulkOperationLog.id,
+                cursor=cursor,
+                page_size=page_size,
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail="无效的分页游标") from exc
+        if approx_total:
+            with_estimated_total(db, query, pagination)
+    else:
+        total = db.query(func.count(models.BulkOperationLog.id)).scalar() or 0
+        meta, offset = compute_pagination(total, page, page_size)
+        pagination = meta.as_dict()
+        if total == 0:
+            return {"items": [], "pagination": pagination}
 
-    logs = (
-        db.query(models.BulkOperationLog)
-        .order_by(models.BulkOperationLog.created_at.desc())
-        .offset(offset)
-        .limit(page_size)
-        .all()
-    )
+        logs = (
+            db.query(models.BulkOperationLog)
+            .order_by(models.BulkOperationLog.created_at.desc(), models.BulkOperationLog.id.desc())
+            .offset(offset)
+            .limit(page_size)
+            .all()
+        )
 
     items = [
         {
@@ -54,7 +74,7 @@ def bulk_history(
         for log in logs
     ]
 
-    return {"items": items, "pagination": meta.as_dict()}
+    return {"items": items, "pagination": pagination}
 
 
 __all__ = ["router"]
@@ -1,35 +1,40 @@
 """
 兑换码管理相关路由
 """
-import csv
-import io
-import hashlib
+import asyncio
+import json
 import logging
+import os
 from datetime import datetime
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from fastapi.responses import PlainTextResponse, Response
-from sqlalchemy import func, or_
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
 from app import models
+from app.config import settings
 from app.schemas import (
     BatchCodesIn,
     BatchCodesOut,
     CodeSkuCreateIn,
     CodeSkuUpdateIn,
     CodeSkuOut,
+    RedeemBatchIn,
+    RedeemBatchOut,
 )
 from app.services.services import audit as audit_svc
+from app.services.services import code_export
 from app.services.services.bulk_history import record_bulk_operation
 from app.services.services.redeem import generate_codes
+from app.services.services.redeem_batch import BatchRedeemItem, redeem_codes_batch_async
 from app.services.services.code_sku_service import CodeSkuService
 from app.services.shared.capacity_guard import CapacityGuard, CapacityGuardError
+from app.services.shared.text_search import search_clause
 from app.repositories import UsersRepository
 from app.utils.csrf import require_csrf_token
 from app.utils.performance import monitor_session_queries
-from app.utils.pagination import compute_pagination
+from app.utils.pagination import compute_pagination, keyset_page, with_estimated_total
 
 from .dependencies import admin_ops_rate_limit_dep, get_db, get_db_pool, require_admin, require_domain
 
@@ -46,23 +51,20 @@ async def generate_batch_codes(
     db_pool: Session = Depends(get_db_pool),
     _: None = Depends(admin_ops_rate_limit_dep),
 ):
-    require_admin(request, db_users)
+    # 同步数据库操作统一放到线程池，async 路由内不直接阻塞事件循环
+    await asyncio.to_thread(require_admin, request, db_users)
     await require_domain('users')(request)
     await require_csrf_token(request)
 
-    repo = UsersRepository(db_users)
-    sku = repo.get_code_sku_by_slug(payload.sku_slug)
-    if not sku:
-        raise HTTPException(status_code=400, detail="指定的兑换码商品不可用")
+    if payload.count > settings.code_generate_max_count:
+        raise HTTPException(status_code=400, detail=f"单次最多生成 {settings.code_generate_max_count} 个")
 
-    guard = CapacityGuard(db_users, db_pool)
-    try:
-        capacity_snapshot = guard.ensure_capacity(payload.count)
-    except CapacityGuardError as exc:
-        raise HTTPException(status_code=400, detail=str(exc))
+    capacity_snapshot = await asyncio.to_thread(_check_generate_capacity, db_users, db_pool, payload)
 
     try:
-        batch_id, codes = generate_codes(
+        # 整批写入（含用户组）在线程中执行，避免阻塞事件循环
+        batch_id, codes = await asyncio.to_thread(
+            generate_codes,
             db_users,
             payload.count,
             payload.prefix,
@@ -71,23 +73,46 @@ async def generate_batch_codes(
             sku_slug=payload.sku_slug,
             lifecycle_plan=payload.lifecycle_plan,
             switch_limit=payload.switch_limit,
+            mother_group_id=payload.mother_group_id or None,
         )
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
 
-    # 如果指定了用户组，将 group_id 直接写入列（不再使用 meta_json）
-    if payload.mother_group_id:
-        for code_hash in [hashlib.sha256(c.encode()).hexdigest() for c in codes]:
-            code_row = (
-                db_users.query(models.RedeemCode)
-                .filter(models.RedeemCode.code_hash == code_hash)
-                .first()
-            )
-            if code_row:
-                code_row.mother_group_id = payload.mother_group_id
-                db_users.add(code_row)
-        db_users.commit()
+    await asyncio.to_thread(
+        _record_generate,
+        db_users,
+        payload,
+        batch_id,
+        request.client.host if request.client else None,
+    )
 
+    after_active = capacity_snapshot.reserved_codes + len(codes)
+    remaining_quota = max(0, capacity_snapshot.total_slots - after_active)
+    return BatchCodesOut(
+        batch_id=batch_id,
+        codes=codes,
+        enabled_teams=None,
+        max_code_capacity=capacity_snapshot.total_slots,
+        active_codes=after_active,
+        remaining_quota=remaining_quota,
+        sku_slug=payload.sku_slug,
+    )
+
+
+def _check_generate_capacity(db_users: Session, db_pool: Session, payload: BatchCodesIn):
+    repo = UsersRepository(db_users)
+    sku = repo.get_code_sku_by_slug(payload.sku_slug)
+    if not sku:
+        raise HTTPException(status_code=400, detail="指定的兑换码商品不可用")
+
+    guard = CapacityGuard(db_users, db_pool)
+    try:
+        return guard.ensure_capacity(payload.count)
+    except CapacityGuardError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+def _record_generate(db_users: Session, payload: BatchCodesIn, batch_id: str, request_ip: Optional[str]) -> None:
     audit_svc.log(
         db_users,
         actor="admin",
@@ -110,22 +135,47 @@ async def generate_batch_codes(
                 "lifecycle_plan": payload.lifecycle_plan,
                 "switch_limit": payload.switch_limit,
                 "sku_slug": payload.sku_slug,
-                "request_ip": request.client.host if request.client else None,
+                "request_ip": request_ip,
             },
         )
     except Exception as e:
         logger.warning("record_bulk_operation failed: %s", e)
 
-    after_active = capacity_snapshot.reserved_codes + len(codes)
-    remaining_quota = max(0, capacity_snapshot.total_slots - after_active)
-    return BatchCodesOut(
-        batch_id=batch_id,
-        codes=codes,
-        enabled_teams=None,
-        max_code_capacity=capacity_snapshot.total_slots,
-        active_codes=after_active,
-        remaining_quota=remaining_quota,
-        sku_slug=payload.sku_slug,
+
+@router.post("/codes/redeem-batch", response_model=RedeemBatchOut)
+async def redeem_codes_batch(
+    payload: RedeemBatchIn,
+    request: Request,
+    db_users: Session = Depends(get_db),
+    db_pool: Session = Depends(get_db_pool),
+    _: None = Depends(admin_ops_rate_limit_dep),
+):
+    """批量兑换：一次锁定兑换码与座位，按团队并发发送邀请，逐条返回结果"""
+    await asyncio.to_thread(require_admin, request, db_users)
+    await require_domain('users')(request)
+    await require_csrf_token(request)
+
+    if len(payload.items) > settings.redeem_batch_max_items:
+        raise HTTPException(status_code=400, detail=f"单次最多 {settings.redeem_batch_max_items} 条")
+
+    items = [BatchRedeemItem(code=item.code, email=item.email) for item in payload.items]
+    outcomes = await redeem_codes_batch_async(db_users, db_pool, items)
+    succeeded = sum(1 for o in outcomes if o.success)
+    try:
+        await asyncio.to_thread(
+            audit_svc.log,
+            db_users,
+            actor="admin",
+            action="redeem_batch",
+            payload_redacted=f"total={len(outcomes)} succeeded={succeeded}",
+        )
+    except Exception:
+        logger.debug("audit redeem_batch failed", exc_info=True)
+    return RedeemBatchOut(
+        total=len(outcomes),
+        succeeded=succeeded,
+        failed=len(outcomes) - succeeded,
+        results=[o.to_dict() for o in outcomes],
     )
 
 
@@ -193,63 +243,52 @@ def update_code_sku(
 
 @router.get("/export/codes")
 def export_codes(request: Request, db: Session = Depends(get_db), format: str = "csv", status: str = "all"):
+    """流式导出（csv / ndjson / txt）；超大导出请用 POST /export/codes/jobs 走任务队列"""
+    require_admin(request, db)
+    try:
+        code_export.validate_export_args(format, status)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    headers = {"Content-Disposition": f"attachment; filename={code_export.export_filename(format)}"}
+    return StreamingResponse(
+        code_export.stream_export(db.get_bind(), format, status=status),
+        media_type=code_export.MEDIA_TYPES[format],
+        headers=headers,
+    )
+
+
+@router.post("/export/codes/jobs")
+def enqueue_export_codes(
+    request: Request,
+    db: Session = Depends(get_db),
+    format: str = "csv",
+    status: str = "all",
+    _: None = Depends(admin_ops_rate_limit_dep),
+):
+    """后台导出：写入本地文件，完成后通过 /export/codes/jobs/{job_id}/download 下载"""
     require_admin(request, db)
+    try:
+        job = code_export.enqueue_export_job(db, format, status)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"success": True, "job_id": job.id, "status": job.status.value}
 
-    with monitor_session_queries(db, "admin_export_codes"):
-        q = db.query(models.RedeemCode).order_by(models.RedeemCode.created_at.desc())
-        if status == "unused":
-            q = q.filter(models.RedeemCode.status == models.CodeStatus.unused)
-        elif status == "used":
-            q = q.filter(models.RedeemCode.status == models.CodeStatus.used)
-
-        rows = q.all()
-
-        if format == "txt":
-            content = "\n".join([r.code for r in rows])
-            headers = {
-                "Content-Disposition": f"attachment; filename=codes-{datetime.utcnow().date()}.txt"
-            }
-            return PlainTextResponse(content, headers=headers)
-
-        users_map = {}
-        if rows:
-            code_ids = [r.id for r in rows]
-            invites = db.query(models.InviteRequest).filter(models.InviteRequest.code_id.in_(code_ids)).all()
-            for invite in invites:
-                if invite.code_id not in users_map:
-                    users_map[invite.code_id] = invite
-                else:
-                    existing = users_map[invite.code_id]
-                    if (
-                        invite.status == models.InviteStatus.sent
-                        and existing.status != models.InviteStatus.sent
-                    ) or (
-                        invite.status == existing.status
-                        and (invite.updated_at or invite.created_at)
-                        > (existing.updated_at or existing.created_at)
-                    ):
-                        users_map[invite.code_id] = invite
-
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["code", "batch_id", "is_used", "created_at", "used_by", "used_at"])
-        for row in rows:
-            invite = users_map.get(row.id)
-            writer.writerow(
-                [
-                    row.code,
-                    row.batch_id or "",
-                    "1" if row.is_used else "0",
-                    row.created_at.isoformat() if row.created_at else "",
-                    invite.email if invite else "",
-                    invite.updated_at.isoformat() if invite and row.is_used and invite.updated_at else "",
-                ]
-            )
 
-        headers = {
-            "Content-Disposition": f"attachment; filename=codes-{datetime.utcnow().date()}.csv"
-        }
-        return Response(output.getvalue(), media_type="text/csv; charset=utf-8", headers=headers)
+@router.get("/export/codes/jobs/{job_id}/download")
+def download_export_codes(job_id: int, request: Request, db: Session = Depends(get_db)):
+    require_admin(request, db)
+    job = db.get(models.BatchJob, job_id)
+    if not job or job.job_type != models.BatchJobType.codes_export:
+        raise HTTPException(status_code=404, detail="导出任务不存在")
+    if job.status != models.BatchJobStatus.succeeded:
+        raise HTTPException(status_code=409, detail=f"导出任务尚未完成: {job.status.value}")
+    meta = json.loads(job.metadata_json or "{}")
+    path = code_export.export_file_path(meta.get("file", ""))
+    if not path:
+        raise HTTPException(status_code=410, detail="导出文件已过期或不存在")
+    fmt = path.rsplit(".", 1)[-1]
+    return FileResponse(path, media_type=code_export.MEDIA_TYPES.get(fmt), filename=os.path.basename(path))
 
 
 @router.get("/codes")
@@ -259,7 +298,9 @@ def list_codes(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
     status: Optional[str] = Query(None),
-    search: Optional[str] = Query(None),
+    search: Optional[str] = Query(None, description="子串搜索；'=值' 精确匹配，'值*' 前缀匹配"),
+    cursor: Optional[str] = Query(None, description="游标分页：首页传空串，之后传上一页的 next_cursor；提供时忽略 page"),
+    approx_total: bool = Query(False, description="游标分页时附带估算总数（仅 PostgreSQL）"),
 ):
     require_admin(request, db)
     # 只读接口可不强制域，但建议前端仍传 X-Domain=users
@@ -275,30 +316,37 @@ def list_codes(
                 raise HTTPException(status_code=400, detail="无效的兑换码状态")
             query = query.filter(models.RedeemCode.status == status_enum)
 
-        search_value = (search or "").strip()
-        if search_value:
-            like = f"%{search_value.lower()}%"
-            query = query.filter(
-                or_(
-                    func.lower(models.RedeemCode.code_hash).like(like),
-                    func.lower(models.RedeemCode.batch_id).like(like),
-                    func.lower(models.RedeemCode.used_by_email).like(like),
-                    func.lower(models.RedeemCode.used_by_team_id).like(like),
+        clause = search_clause(db, models.RedeemCode, search)
+        if clause is not None:
+            query = query.filter(clause)
+
+        if cursor is not None:
+            try:
+                codes, pagination = keyset_page(
+                    query,
+                    created_col=models.RedeemCode.created_at,
+                    id_col=models.RedeemCode.id,
+                    cursor=cursor,
+                    page_size=page_size,
                 )
+            except ValueError as exc:
+                raise HTTPException(status_code=400, detail="无效的分页游标") from exc
+            if approx_total:
+                with_estimated_total(db, query, pagination)
+        else:
+            total = query.count()
+            meta, offset = compute_pagination(total, page, page_size)
+            pagination = meta.as_dict()
+            if total == 0:
+                return {"items": [], "pagination": pagination}
+            codes = (
+                query.order_by(models.RedeemCode.created_at.desc(), models.RedeemCode.id.desc())
+                .offset(offset)
+                .limit(page_size)
+                .all()
             )
-
-        total = query.count()
-        meta, offset = compute_pagination(total, page, page_size)
-        if total == 0:
-            return {"items": [], "pagination": meta.as_dict()}
-        codes = (
-            query.order_by(models.RedeemCode.created_at.desc())
-            .offset(offset)
-            .limit(page_size)
-            .all()
-        )
         if not codes:
-            return {"items": [], "pagination": meta.as_dict()}
+            return {"items": [], "pagination": pagination}
 
         code_ids = [c.id for c in codes]
         invites = (
@@ -394,7 +442,7 @@ def list_codes(
                 }
             )
 
-        return {"items": items, "pagination": meta.as_dict()}
+        return {"items": items, "pagination": pagination}
 
 
 @router.post("/codes/{code_id}/disable")
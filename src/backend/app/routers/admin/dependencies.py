@@ -6,7 +6,8 @@ from app.database import SessionLocal
 from app.database import get_db as _get_db
 from app.database import get_db_pool as _get_db_pool
 from app.config import settings
-from app.security import verify_session, unsign_session
+from app.security import verify_session
+from app.services.services.admin_session_cache import resolve_admin_session
 from app.services.services.rate_limiter_service import get_rate_limiter, ip_strategy
 from app.utils.utils.rate_limiter.fastapi_integration import rate_limit
 
@@ -26,22 +27,14 @@ def require_admin(request: Request, db: Session = Depends(get_db)):
     sess = request.cookies.get("admin_session")
     if not sess or not verify_session(sess, max_age_seconds=settings.admin_session_ttl_seconds):
         raise HTTPException(status_code=401, detail="未认证")
-    sid = unsign_session(sess, max_age_seconds=settings.admin_session_ttl_seconds)
-    if not sid:
-        raise HTTPException(status_code=401, detail="未认证")
-    # 可选：校验 session 未被撤销和未过期
+    # 校验 session 未被撤销和未过期（短 TTL 缓存，登出时显式失效）
     try:
-        from app import models
-        row = db.query(models.AdminSession).filter(models.AdminSession.session_id == sid).first()
-        import datetime as _dt
-        now = _dt.datetime.utcnow()
-        if not row or row.revoked or row.expires_at <= now:
-            raise HTTPException(status_code=401, detail="会话失效")
-    except HTTPException:
-        raise
+        sid = resolve_admin_session(db, sess)
     except Exception:
         # 容错：查询异常按未认证处理
         raise HTTPException(status_code=401, detail="未认证")
+    if not sid:
+        raise HTTPException(status_code=401, detail="会话失效")
     request.state.admin_session = sid
     request.state.admin_user = "admin"
     return None
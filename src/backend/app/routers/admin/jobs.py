@@ -55,6 +55,8 @@ def list_jobs(
     status: Optional[str] = Query(None),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="游标分页：首页传空串，之后传上一页的 next_cursor；提供时忽略 page"),
+    approx_total: bool = Query(False, description="游标分页时附带估算总数（仅 PostgreSQL）"),
 ):
     require_admin(request, db)
 
@@ -64,7 +66,11 @@ def list_jobs(
             status=status,
             page=page,
             page_size=page_size,
+            cursor=cursor,
+            approx_total=approx_total,
         )
+    except admin_jobs.InvalidCursor:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
     except ValueError:
         raise HTTPException(status_code=400, detail="无效的状态")
     return {"items": items, "pagination": pagination}
@@ -80,6 +86,8 @@ def get_job(job_id: int, request: Request, db: Session = Depends(get_db)):
     payload_json = data.pop("payload", None)
     payload = json.loads(payload_json or "{}") if isinstance(payload_json, str) else payload_json
     data["payload"] = payload
+    metadata_json = data.pop("metadata", None)
+    data["metadata"] = json.loads(metadata_json) if isinstance(metadata_json, str) else metadata_json
     return data
 
 
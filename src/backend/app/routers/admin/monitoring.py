@@ -6,7 +6,7 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, Any, Optional
 from fastapi import APIRouter, Depends, Request, Response
 from sqlalchemy.orm import Session
@@ -14,6 +14,9 @@ from sqlalchemy.orm import Session
 from app.database import get_db_users, get_db_pool
 from app.monitoring.metrics import business_metrics, DatabaseMetricsCollector, health_checker
 from app.routers.admin.dependencies import require_admin
+from app.services.shared.stats_counters import DOMAIN_POOL, DOMAIN_USERS, read_counters
+from app.services.shared.trends import metric_trend
+from app.utils.time_buckets import BUCKET_DAY, BUCKET_HOUR, BUCKETS
 
 router = APIRouter()
 
@@ -89,11 +92,13 @@ def get_monitoring_overview(
     }
 
     try:
+        # 计数类指标读各域计数器表（各一条 SELECT）
+        users_counters = read_counters(users_db, DOMAIN_USERS)
+        pool_counters = read_counters(pool_db, DOMAIN_POOL)
+
         # 业务指标 - Users域
-        total_invites = users_db.query(models.InviteRequest).count()
-        accepted_invites = users_db.query(models.InviteRequest).filter(
-            models.InviteRequest.status == models.InviteStatus.accepted
-        ).count()
+        total_invites = users_counters.get("invites")
+        accepted_invites = users_counters.get("invites.status", models.InviteStatus.accepted.value)
 
         overview["business_metrics"]["invites"] = {
             "total": total_invites,
@@ -102,10 +107,8 @@ def get_monitoring_overview(
         }
 
         # 兑换码统计
-        total_codes = users_db.query(models.RedeemCode).count()
-        used_codes = users_db.query(models.RedeemCode).filter(
-            models.RedeemCode.status == models.CodeStatus.used
-        ).count()
+        total_codes = users_counters.get("codes")
+        used_codes = users_counters.get("codes.status", models.CodeStatus.used.value)
 
         overview["business_metrics"]["redeem_codes"] = {
             "total": total_codes,
@@ -114,10 +117,8 @@ def get_monitoring_overview(
         }
 
         # 批处理作业统计
-        total_jobs = users_db.query(models.BatchJob).count()
-        failed_jobs = users_db.query(models.BatchJob).filter(
-            models.BatchJob.status == 'failed'
-        ).count()
+        total_jobs = users_counters.get("jobs")
+        failed_jobs = users_counters.get("jobs.status", models.BatchJobStatus.failed.value)
 
         overview["business_metrics"]["batch_jobs"] = {
             "total": total_jobs,
@@ -126,13 +127,9 @@ def get_monitoring_overview(
         }
 
         # 业务指标 - Pool域
-        total_mothers = pool_db.query(models.MotherAccount).count()
-        active_mothers = pool_db.query(models.MotherAccount).filter(
-            models.MotherAccount.status == models.MotherStatus.active
-        ).count()
-        invalid_mothers = pool_db.query(models.MotherAccount).filter(
-            models.MotherAccount.status == models.MotherStatus.invalid
-        ).count()
+        total_mothers = pool_counters.get("mothers")
+        active_mothers = pool_counters.get("mothers.status", models.MotherStatus.active.value)
+        invalid_mothers = pool_counters.get("mothers.status", models.MotherStatus.invalid.value)
 
         overview["business_metrics"]["mothers"] = {
             "total": total_mothers,
@@ -142,10 +139,8 @@ def get_monitoring_overview(
         }
 
         # 子账号统计
-        total_children = pool_db.query(models.ChildAccount).count()
-        active_children = pool_db.query(models.ChildAccount).filter(
-            models.ChildAccount.status == 'active'
-        ).count()
+        total_children = pool_counters.get("children")
+        active_children = pool_counters.get("children.status", "active")
 
         overview["business_metrics"]["child_accounts"] = {
             "total": total_children,
@@ -153,10 +148,10 @@ def get_monitoring_overview(
         }
 
         # 席位统计
-        total_seats = pool_db.query(models.SeatAllocation).count()
-        used_seats = pool_db.query(models.SeatAllocation).filter(
-            models.SeatAllocation.status.in_(['held', 'used'])
-        ).count()
+        total_seats = pool_counters.get("seats")
+        used_seats = pool_counters.get("seats.status", models.SeatStatus.held.value) + pool_counters.get(
+            "seats.status", models.SeatStatus.used.value
+        )
 
         overview["business_metrics"]["seats"] = {
             "total": total_seats,
@@ -210,6 +205,7 @@ def get_monitoring_trends(
     pool_db: Session = Depends(get_db_pool),
     days: int = 7,
     metric: str = "invites",
+    bucket: str = BUCKET_DAY,
 ):
     """
     获取监控趋势数据
@@ -217,63 +213,21 @@ def get_monitoring_trends(
     Args:
         days: 统计天数
         metric: 统计指标类型
+        bucket: 时间粒度 (day, hour)
     """
     require_admin(request, users_db)
 
     if metric not in ['invites', 'codes', 'jobs', 'mothers', 'children']:
         raise ValueError(f"不支持的统计指标: {metric}")
+    if bucket not in BUCKETS:
+        raise ValueError(f"不支持的时间粒度: {bucket}")
 
-    trends = []
-    end_date = datetime.utcnow().date()
-    start_date = end_date - timedelta(days=days - 1)
-
-    for i in range(days):
-        current_date = start_date + timedelta(days=i)
-        day_start = datetime.combine(current_date, datetime.min.time())
-        day_end = datetime.combine(current_date, datetime.max.time())
-
-        if metric == 'invites':
-            from app import models
-            count = users_db.query(models.InviteRequest).filter(
-                models.InviteRequest.created_at >= day_start,
-                models.InviteRequest.created_at <= day_end
-            ).count()
-        elif metric == 'codes':
-            from app import models
-            count = users_db.query(models.RedeemCode).filter(
-                models.RedeemCode.used_at >= day_start,
-                models.RedeemCode.used_at <= day_end
-            ).count()
-        elif metric == 'jobs':
-            from app import models
-            count = users_db.query(models.BatchJob).filter(
-                models.BatchJob.created_at >= day_start,
-                models.BatchJob.created_at <= day_end
-            ).count()
-        elif metric == 'mothers':
-            from app import models
-            count = pool_db.query(models.MotherAccount).filter(
-                models.MotherAccount.created_at >= day_start,
-                models.MotherAccount.created_at <= day_end
-            ).count()
-        elif metric == 'children':
-            from app import models
-            count = pool_db.query(models.ChildAccount).filter(
-                models.ChildAccount.created_at >= day_start,
-                models.ChildAccount.created_at <= day_end
-            ).count()
-        else:
-            count = 0
-
-        trends.append({
-            "date": current_date.isoformat(),
-            "count": count,
-        })
-
+    periods = days * 24 if bucket == BUCKET_HOUR else days
     return {
         "metric": metric,
         "days": days,
-        "data": trends,
+        "bucket": bucket,
+        "data": metric_trend(users_db, pool_db, metric, periods, bucket),
     }
 
 
@@ -16,12 +16,15 @@ from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_, case
+from sqlalchemy import func
 
 from app.database import get_db_users, get_db_pool
 from app.services.services import get_mother_query_service
 from app.services.services.mother_query import MotherQueryService
 from app.services.services.quota_service import QuotaService
+from app.services.shared.stats_counters import DOMAIN_POOL, DOMAIN_USERS, read_counters
+from app.services.shared.trends import metric_trend, recent_activity_by_day
+from app.utils.time_buckets import BUCKET_DAY, BUCKET_HOUR, BUCKETS
 from app.repositories.users_repository import UsersRepository
 from app.routers.admin.dependencies import require_admin
 
@@ -55,126 +58,38 @@ class UnifiedStatsService:
         """
         from app import models
 
-        # 统一配额口径（跨库）
-        snapshot = QuotaService.get_quota_snapshot(self.users_db, self.pool_db).to_dict()
+        # 计数类指标读各域计数器表（各一条 SELECT），配额沿用 QuotaService 口径
+        users_counters = read_counters(self.users_db, DOMAIN_USERS)
+        pool_counters = read_counters(self.pool_db, DOMAIN_POOL)
+        snapshot = QuotaService.get_quota_snapshot(
+            self.users_db, self.pool_db, users_counters=users_counters, pool_counters=pool_counters
+        ).to_dict()
         total_codes = snapshot["total_codes"]
         used_codes = snapshot["used_codes"]
         code_usage_rate = round((used_codes / total_codes * 100) if total_codes > 0 else 0, 1)
 
         # —— Users 域：邀请统计 ——
-        total_invites = self.users_db.query(models.InviteRequest).count()
-        pending_invites = self.users_db.query(models.InviteRequest).filter(
-            models.InviteRequest.status == models.InviteStatus.pending
-        ).count()
-        successful_invites = self.users_db.query(models.InviteRequest).filter(
-            models.InviteRequest.status == models.InviteStatus.sent
-        ).count()
-        failed_invites = self.users_db.query(models.InviteRequest).filter(
-            models.InviteRequest.status == models.InviteStatus.failed
-        ).count()
-        accepted_invites = self.users_db.query(models.InviteRequest).filter(
-            models.InviteRequest.status == models.InviteStatus.accepted
-        ).count()
+        status_breakdown = users_counters.by_dim("invites.status")
+        total_invites = users_counters.get("invites")
+        pending_invites = status_breakdown.get(models.InviteStatus.pending.value, 0)
+        successful_invites = status_breakdown.get(models.InviteStatus.sent.value, 0)
+        failed_invites = status_breakdown.get(models.InviteStatus.failed.value, 0)
+        accepted_invites = status_breakdown.get(models.InviteStatus.accepted.value, 0)
 
         top_level_success_rate = round(accepted_invites / total_invites * 100, 2) if total_invites > 0 else 0
 
         # —— Pool 域：母号/团队/席位统计 ——
-        total_mothers = self.pool_db.query(models.MotherAccount).count()
-        active_mothers = self.pool_db.query(models.MotherAccount).filter(
-            models.MotherAccount.status == models.MotherStatus.active
-        ).count()
-        total_teams = self.pool_db.query(models.MotherTeam).count()
-        active_teams = self.pool_db.query(models.MotherTeam).filter(models.MotherTeam.is_enabled == True).count()  # noqa: E712
-
-        total_seats = self.pool_db.query(models.SeatAllocation).count()
+        total_mothers = pool_counters.get("mothers")
+        active_mothers = pool_counters.get("mothers.status", models.MotherStatus.active.value)
+        total_teams = pool_counters.get("teams")
+        active_teams = pool_counters.get("teams.enabled", "1")
+
+        total_seats = pool_counters.get("seats")
         used_seats = snapshot["used_seats"]
         usage_rate = round((used_seats / total_seats * 100) if total_seats > 0 else 0, 1)
 
-        # —— 最近7天活动（Users库：邀请/兑换） ——
-        recent_activity: list[dict[str, Any]] = []
-        dates: list[datetime.date] = []
-        date_ranges: list[tuple[datetime, datetime]] = []
-        for i in range(7):
-            d = datetime.utcnow().date() - timedelta(days=i)
-            start_time = datetime.combine(d, datetime.min.time())
-            end_time = datetime.combine(d, datetime.max.time())
-            dates.append(d)
-            date_ranges.append((start_time, end_time))
-
-        if date_ranges:
-            # SQLite 兼容的天粒度截断
-            dialect = self.users_db.bind.dialect.name if self.users_db.bind else ""
-
-            def trunc_day(column):
-                if dialect == "sqlite":
-                    return func.strftime('%Y-%m-%d', column)
-                return func.date_trunc('day', column)
-
-            truncate_invite = trunc_day(models.InviteRequest.created_at)
-            truncate_redeem = trunc_day(models.RedeemCode.used_at)
-
-            invite_conditions = [
-                and_(
-                    models.InviteRequest.created_at >= start,
-                    models.InviteRequest.created_at <= end,
-                )
-                for start, end in date_ranges
-            ]
-            redemption_conditions = [
-                and_(
-                    models.RedeemCode.status == models.CodeStatus.used,
-                    models.RedeemCode.used_at >= start,
-                    models.RedeemCode.used_at <= end,
-                )
-                for start, end in date_ranges
-            ]
-
-            daily_stats = self.users_db.query(
-                truncate_invite.label('date'),
-                func.count(models.InviteRequest.id).label('invites'),
-            ).filter(
-                or_(*invite_conditions)
-            ).group_by(
-                truncate_invite
-            ).all() if invite_conditions else []
-
-            redemption_stats = self.users_db.query(
-                truncate_redeem.label('date'),
-                func.count(models.RedeemCode.id).label('redemptions'),
-            ).filter(
-                and_(
-                    models.RedeemCode.status == models.CodeStatus.used,
-                    or_(*redemption_conditions),
-                )
-            ).group_by(
-                truncate_redeem
-            ).all() if redemption_conditions else []
-
-            def _normalize_date(value):
-                if isinstance(value, datetime):
-                    return value.date()
-                if isinstance(value, str):
-                    return datetime.strptime(value, '%Y-%m-%d').date()
-                return value
-
-            invites_map = {_normalize_date(stat.date): stat.invites for stat in daily_stats}
-            redemptions_map = {_normalize_date(stat.date): stat.redemptions for stat in redemption_stats}
-
-            for d in dates:
-                daily_invites = invites_map.get(d, 0)
-                daily_redemptions = redemptions_map.get(d, 0)
-                recent_activity.append({
-                    "date": d.strftime("%m-%d"),
-                    "invites": daily_invites,
-                    "redemptions": daily_redemptions,
-                })
-
-        # —— 邀请状态分布（Users库） ——
-        invite_status_stats = self.users_db.query(
-            models.InviteRequest.status,
-            func.count(models.InviteRequest.id).label('count'),
-        ).group_by(models.InviteRequest.status).all()
-        status_breakdown = {status.value: count for status, count in invite_status_stats}
+        # —— 最近7天活动（Users库：邀请/兑换），各一条分桶查询 ——
+        recent_activity = recent_activity_by_day(self.users_db, days=7)
 
         # —— 母号使用情况（Pool库） ——
         mother_usage: list[dict[str, Any]] = []
@@ -201,23 +116,16 @@ class UnifiedStatsService:
                 })
 
         # —— 兑换码批次统计（Users库） ——
-        batch_stats = self.users_db.query(
-            models.RedeemCode.batch_id,
-            func.count(models.RedeemCode.id).label('total'),
-            func.sum(
-                case((models.RedeemCode.status == models.CodeStatus.used, 1), else_=0)
-            ).label('used'),
-        ).group_by(models.RedeemCode.batch_id).all()
+        batch_used = users_counters.by_dim("codes.batch_used")
         batch_breakdown = []
-        for batch_id, total, used in batch_stats:
-            if batch_id:
-                used_val = int(used or 0)
-                batch_breakdown.append({
-                    "batch_id": batch_id,
-                    "total_codes": int(total or 0),
-                    "used_codes": used_val,
-                    "usage_rate": round(((used_val) / (total or 1) * 100) if (total or 0) > 0 else 0, 1),
-                })
+        for batch_id, total in users_counters.by_dim("codes.batch").items():
+            used_val = batch_used.get(batch_id, 0)
+            batch_breakdown.append({
+                "batch_id": batch_id,
+                "total_codes": total,
+                "used_codes": used_val,
+                "usage_rate": round((used_val / total * 100) if total > 0 else 0, 1),
+            })
 
         # —— 汇总（DashboardStats 形状） ——
         result: Dict[str, Any] = {
@@ -263,6 +171,9 @@ class UnifiedStatsService:
         if hasattr(provider_metrics, 'snapshot'):
             try:
                 result["provider_metrics"] = provider_metrics.snapshot()
+                result["provider_pool"] = provider_metrics.pool_snapshot()
+                result["provider_retries"] = provider_metrics.retry_snapshot()
+                result["provider_invite_batches"] = provider_metrics.invite_batch_snapshot()
             except Exception:
                 # 指标不可用不影响整体
                 pass
@@ -272,73 +183,19 @@ class UnifiedStatsService:
     def get_usage_trends(
         self,
         days: int = 7,
-        metric: str = 'invites'
+        metric: str = 'invites',
+        bucket: str = BUCKET_DAY,
     ) -> List[Dict[str, Any]]:
         """
-        获取使用趋势数据
+        获取使用趋势数据（每个指标一条分桶查询）
 
         Args:
             days: 统计天数
             metric: 统计指标类型（invites, codes, jobs, mothers）
+            bucket: 时间粒度（day, hour）
         """
-        trends = []
-        end_date = datetime.utcnow().date()
-        start_date = end_date - timedelta(days=days - 1)
-
-        for i in range(days):
-            current_date = start_date + timedelta(days=i)
-            day_start = datetime.combine(current_date, datetime.min.time())
-            day_end = datetime.combine(current_date, datetime.max.time())
-
-            if metric == 'invites':
-                count = self._count_invites_in_range(day_start, day_end)
-            elif metric == 'codes':
-                count = self._count_codes_in_range(day_start, day_end)
-            elif metric == 'jobs':
-                count = self._count_jobs_in_range(day_start, day_end)
-            elif metric == 'mothers':
-                count = self._count_mothers_in_range(day_start, day_end)
-            else:
-                count = 0
-
-            trends.append({
-                'date': current_date.isoformat(),
-                'count': count,
-            })
-
-        return trends
-
-    def _count_invites_in_range(self, start: datetime, end: datetime) -> int:
-        """统计指定时间范围内的邀请数量"""
-        from app import models
-        return self.users_db.query(models.InviteRequest).filter(
-            models.InviteRequest.created_at >= start,
-            models.InviteRequest.created_at <= end
-        ).count()
-
-    def _count_codes_in_range(self, start: datetime, end: datetime) -> int:
-        """统计指定时间范围内的兑换码使用数量"""
-        from app import models
-        return self.users_db.query(models.RedeemCode).filter(
-            models.RedeemCode.used_at >= start,
-            models.RedeemCode.used_at <= end
-        ).count()
-
-    def _count_jobs_in_range(self, start: datetime, end: datetime) -> int:
-        """统计指定时间范围内的批处理作业数量"""
-        from app import models
-        return self.users_db.query(models.BatchJob).filter(
-            models.BatchJob.created_at >= start,
-            models.BatchJob.created_at <= end
-        ).count()
-
-    def _count_mothers_in_range(self, start: datetime, end: datetime) -> int:
-        """统计指定时间范围内创建的Mother账号数量"""
-        from app import models
-        return self.pool_db.query(models.MotherAccount).filter(
-            models.MotherAccount.created_at >= start,
-            models.MotherAccount.created_at <= end
-        ).count()
+        periods = days * 24 if bucket == BUCKET_HOUR else days
+        return metric_trend(self.users_db, self.pool_db, metric, periods, bucket)
 
     def get_health_status(self) -> Dict[str, Any]:
         """
@@ -456,6 +313,7 @@ def get_usage_trends(
     request: Request,
     days: int = Query(7, ge=1, le=90, description="统计天数"),
     metric: str = Query("invites", description="统计指标: invites, codes, jobs, mothers"),
+    bucket: str = Query(BUCKET_DAY, description="时间粒度: day, hour"),
 ):
     """
     获取使用趋势数据
@@ -476,11 +334,14 @@ def get_usage_trends(
 
         if metric not in ['invites', 'codes', 'jobs', 'mothers']:
             raise ValueError(f"不支持的统计指标: {metric}")
+        if bucket not in BUCKETS:
+            raise ValueError(f"不支持的时间粒度: {bucket}")
 
         return {
             'metric': metric,
             'days': days,
-            'data': unified_stats.get_usage_trends(days, metric),
+            'bucket': bucket,
+            'data': unified_stats.get_usage_trends(days, metric, bucket),
         }
     finally:
         try:
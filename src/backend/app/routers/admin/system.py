@@ -3,12 +3,18 @@
 """
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, Request
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy import text
+from sqlalchemy.orm import Session
 
-from .dependencies import require_admin, get_db  # noqa: F401 (保留以确保依赖可用)
+from .dependencies import require_admin, get_db, get_db_pool  # noqa: F401 (保留以确保依赖可用)
 from app.database import engine_users, engine_pool
 from app.config import settings
+from app.circuit_breaker import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, provider_breaker
+from app.services.services.health_probe import mother_health_prober
 from app.services.services.rate_limiter_service import get_rate_limiter
 from app.utils.utils.rate_limiter.config import RateLimitConfig
 
@@ -131,6 +137,7 @@ async def get_admin_settings(request: Request):
 
     policies = {
         "redeem": await _to_window("redeem:by_ip"),
+        "redeem_email": await _to_window("redeem:by_email"),
         "admin": await _to_window("admin:by_ip"),
         "ingest": await _to_window("ingest:by_ip"),
         "resend_ip": await _to_window("resend:by_ip"),
@@ -144,3 +151,48 @@ async def get_admin_settings(request: Request):
     }
 
     return {"rate_limit_policies": policies, "cookie_policy": cookie_policy}
+
+
+@router.get("/circuit-breakers")
+def list_circuit_breakers(
+    request: Request,
+    db: Session = Depends(get_db),
+    state: Optional[str] = Query(None, pattern=f"^({STATE_CLOSED}|{STATE_OPEN}|{STATE_HALF_OPEN})$"),
+    endpoint: Optional[str] = Query(None),
+    team_id: Optional[str] = Query(None),
+    limit: int = Query(200, ge=1, le=2000),
+):
+    """查看 Provider 熔断状态（后端类型、配置与各 endpoint/team 的状态；endpoint / team_id 可单独过滤）"""
+    require_admin(request, db)
+    if endpoint and team_id:
+        st = provider_breaker.get(endpoint, team_id)
+        snapshot = provider_breaker.snapshot(limit=0)
+        snapshot["items"] = [st.to_dict()] if st and (not state or st.state == state) else []
+        return snapshot
+    return provider_breaker.snapshot(limit=limit, state=state, endpoint=endpoint, team_id=team_id)
+
+
+@router.post("/circuit-breakers/reset")
+def reset_circuit_breakers(
+    request: Request,
+    db: Session = Depends(get_db),
+    endpoint: Optional[str] = Query(None),
+    team_id: Optional[str] = Query(None),
+):
+    """手动关闭熔断（不带参数时重置全部）"""
+    require_admin(request, db)
+    removed = provider_breaker.reset(endpoint=endpoint, team_id=team_id)
+    return {"success": True, "removed": removed}
+
+
+@router.get("/mother-health")
+def mother_health_status(
+    request: Request,
+    db: Session = Depends(get_db),
+    pool_db: Session = Depends(get_db_pool),
+):
+    """母号健康探测进度（最近一轮结果为当前进程视角，backlog 为实时值）"""
+    require_admin(request, db)
+    snapshot = mother_health_prober.snapshot()
+    snapshot["backlog"] = mother_health_prober.backlog(pool_db, datetime.utcnow())
+    return snapshot
@@ -1,15 +1,16 @@
 """
 管理员用户列表相关路由
 """
+import asyncio
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from sqlalchemy import func, or_
 from sqlalchemy.orm import Session
 
 from app import models
+from app.services.shared.text_search import search_clause
 from app.utils.performance import monitor_session_queries
-from app.utils.pagination import compute_pagination
+from app.utils.pagination import compute_pagination, keyset_page, with_estimated_total
 
 from .dependencies import get_db, get_db_pool, require_admin, require_domain
 
@@ -24,12 +25,39 @@ async def list_users(
     page: int = Query(1, ge=1, description="页码（从1开始）"),
     page_size: int = Query(50, ge=1, le=200, description="每页数量，默认50，最大200"),
     status: Optional[str] = Query(None, description="用户状态过滤"),
-    search: Optional[str] = Query(None, description="按邮箱/团队搜索"),
+    search: Optional[str] = Query(None, description="按邮箱/团队搜索；'=值' 精确匹配，'值*' 前缀匹配"),
+    cursor: Optional[str] = Query(None, description="游标分页：首页传空串，之后传上一页的 next_cursor；提供时忽略 page"),
+    approx_total: bool = Query(False, description="游标分页时附带估算总数（仅 PostgreSQL）"),
 ):
     """用户列表接口 - 支持分页并优化 N+1 查询"""
-    require_admin(request, db)
+    await asyncio.to_thread(require_admin, request, db)
     await require_domain('users')(request)
 
+    # 查询与组装均为同步 IO，放到线程池执行，避免阻塞事件循环
+    return await asyncio.to_thread(
+        _list_users,
+        db,
+        db_pool,
+        page=page,
+        page_size=page_size,
+        status=status,
+        search=search,
+        cursor=cursor,
+        approx_total=approx_total,
+    )
+
+
+def _list_users(
+    db: Session,
+    db_pool: Session,
+    *,
+    page: int,
+    page_size: int,
+    status: Optional[str],
+    search: Optional[str],
+    cursor: Optional[str],
+    approx_total: bool,
+) -> dict:
     with monitor_session_queries(db, "admin_list_users"):
         query = db.query(models.InviteRequest)
 
@@ -41,30 +69,38 @@ async def list_users(
                 raise HTTPException(status_code=400, detail="无效的用户状态") from exc
             query = query.filter(models.InviteRequest.status == status_enum)
 
-        search_value = (search or "").strip()
-        if search_value:
-            like = f"%{search_value.lower()}%"
-            query = query.filter(
-                or_(
-                    func.lower(models.InviteRequest.email).like(like),
-                    func.lower(models.InviteRequest.team_id).like(like),
-                    func.lower(models.InviteRequest.error_msg).like(like),
+        clause = search_clause(db, models.InviteRequest, search)
+        if clause is not None:
+            query = query.filter(clause)
+
+        if cursor is not None:
+            try:
+                users, pagination = keyset_page(
+                    query,
+                    created_col=models.InviteRequest.created_at,
+                    id_col=models.InviteRequest.id,
+                    cursor=cursor,
+                    page_size=page_size,
                 )
+            except ValueError as exc:
+                raise HTTPException(status_code=400, detail="无效的分页游标") from exc
+            if approx_total:
+                with_estimated_total(db, query, pagination)
+        else:
+            total = query.count()
+            meta, offset = compute_pagination(total, page, page_size)
+            pagination = meta.as_dict()
+            if total == 0:
+                return {"items": [], "pagination": pagination}
+            users = (
+                query.order_by(models.InviteRequest.created_at.desc(), models.InviteRequest.id.desc())
+                .offset(offset)
+                .limit(page_size)
+                .all()
             )
 
-        total = query.count()
-        meta, offset = compute_pagination(total, page, page_size)
-        if total == 0:
-            return {"items": [], "pagination": meta.as_dict()}
-        users = (
-            query.order_by(models.InviteRequest.created_at.desc())
-            .offset(offset)
-            .limit(page_size)
-            .all()
-        )
-
         if not users:
-            return {"items": [], "pagination": meta.as_dict()}
+            return {"items": [], "pagination": pagination}
 
         code_ids = [u.code_id for u in users if u.code_id]
         team_ids = {u.team_id for u in users if u.team_id}
@@ -107,7 +143,7 @@ async def list_users(
                 }
             )
 
-        return {"items": result, "pagination": meta.as_dict()}
+        return {"items": result, "pagination": pagination}
 
 
 __all__ = ["router"]
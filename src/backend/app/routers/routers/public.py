@@ -10,14 +10,13 @@ from app.schemas import (
     CodeRefreshOut,
 )
 from app.utils.utils.email_utils import is_valid_email
-from app.services.services.redeem import redeem_code
-from app.services.services.invites import resend_invite
+from app.services.services.redeem import redeem_code_async
+from app.services.services.invites import resend_invite_async
 from app.services.services.switch import SwitchService
 from app.services.services.code_refresh import CodeRefreshService
-from app.services.services.rate_limiter_service import get_rate_limiter, ip_strategy
-from app.utils.utils.rate_limiter.fastapi_integration import rate_limit
+from app.services.services.rate_limiter_service import email_body_strategy, get_rate_limiter, ip_strategy
+from app.utils.utils.rate_limiter.fastapi_integration import RateLimitRule, rate_limit, rate_limit_many
 from starlette.requests import Request as StarletteRequest
-from fastapi.concurrency import run_in_threadpool
 # 注意：不要改名，测试会在 conftest 中覆盖 public.SessionLocal
 from app.database import SessionLocal, SessionPool
 from app.repositories import UsersRepository
@@ -50,8 +49,12 @@ async def get_rate_limiter_dep():
 
 
 async def redeem_rate_limit_dep(request: StarletteRequest, limiter = Depends(get_rate_limiter_dep)):
-    """兑换接口限流依赖"""
-    dependency = rate_limit(limiter, ip_strategy, config_id="redeem:by_ip")
+    """兑换接口限流依赖：IP 与邮箱两个桶在一次检查中完成"""
+    dependency = rate_limit_many(
+        limiter,
+        RateLimitRule(ip_strategy, config_id="redeem:by_ip"),
+        RateLimitRule(email_body_strategy, config_id="redeem:by_email"),
+    )
     await dependency(request)
 
 
@@ -86,20 +89,18 @@ async def redeem(
     if not is_valid_email(req.email):
         raise HTTPException(status_code=400, detail="邮箱格式不正确")
 
-    def _redeem_sync() -> RedeemOut:
-        with users_session_scope() as db:
-            ok, msg, invite_request_id, mother_id, team_id = redeem_code(
-                db, req.code.strip(), req.email.strip().lower()
-            )
-            return RedeemOut(
-                success=ok,
-                message=msg,
-                invite_request_id=invite_request_id,
-                mother_id=mother_id,
-                team_id=team_id,
-            )
-
-    return await run_in_threadpool(_redeem_sync)
+    # 数据库阶段在线程池执行，Provider 调用走异步客户端，不占用线程
+    with users_session_scope() as db:
+        ok, msg, invite_request_id, mother_id, team_id = await redeem_code_async(
+            db, req.code.strip(), req.email.strip().lower()
+        )
+    return RedeemOut(
+        success=ok,
+        message=msg,
+        invite_request_id=invite_request_id,
+        mother_id=mother_id,
+        team_id=team_id,
+    )
 
 
 @router.post("/redeem/resend")
@@ -116,12 +117,9 @@ async def redeem_resend(
     if not req.team_id:
         raise HTTPException(status_code=400, detail="缺少 team_id")
 
-    def _resend_sync() -> dict:
-        with dual_session_scope() as (db_users, db_pool):
-            ok, msg = resend_invite(db_users, db_pool, req.email.strip().lower(), req.team_id)
-            return {"success": ok, "message": msg}
-
-    return await run_in_threadpool(_resend_sync)
+    with dual_session_scope() as (db_users, db_pool):
+        ok, msg = await resend_invite_async(db_users, db_pool, req.email.strip().lower(), req.team_id)
+    return {"success": ok, "message": msg}
 
 
 @router.post("/redeem/refresh", response_model=CodeRefreshOut)
@@ -130,23 +128,20 @@ async def redeem_refresh(
     request: StarletteRequest,
     _: None = Depends(refresh_rate_limit_dep),
 ):
-    def _refresh_sync() -> CodeRefreshOut:
-        with dual_session_scope() as (db_users, db_pool):
-            service = CodeRefreshService(UsersRepository(db_users), MotherRepository(db_pool))
-            ok, msg, extra = service.refresh(
-                code_plain=req.code.strip().upper(),
-                email=req.email.strip().lower(),
-                new_email=req.new_email,
-            )
-            return CodeRefreshOut(
-                success=ok,
-                message=msg,
-                queued=extra.get("queued", False),
-                cooldown_seconds=extra.get("cooldown_seconds"),
-                refresh_remaining=extra.get("refresh_remaining"),
-            )
-
-    return await run_in_threadpool(_refresh_sync)
+    with dual_session_scope() as (db_users, db_pool):
+        service = CodeRefreshService(UsersRepository(db_users), MotherRepository(db_pool))
+        ok, msg, extra = await service.refresh_async(
+            code_plain=req.code.strip().upper(),
+            email=req.email.strip().lower(),
+            new_email=req.new_email,
+        )
+    return CodeRefreshOut(
+        success=ok,
+        message=msg,
+        queued=extra.get("queued", False),
+        cooldown_seconds=extra.get("cooldown_seconds"),
+        refresh_remaining=extra.get("refresh_remaining"),
+    )
 
 
 @router.post("/switch")
@@ -157,17 +152,14 @@ async def switch_seat(
 ):
     """用户触发切换：限制每小时 5 次（按IP）"""
 
-    def _switch_sync() -> dict:
-        with dual_session_scope() as (db_users, db_pool):
-            svc = SwitchService(UsersRepository(db_users), MotherRepository(db_pool))
-            result = svc.switch_email(req.email.strip().lower(), code_plain=req.code.strip().upper())
-            response = {
-                "success": result.success,
-                "message": result.message,
-                "queued": result.queued,
-            }
-            if result.request:
-                response["request_id"] = result.request.id
-            return response
-
-    return await run_in_threadpool(_switch_sync)
+    with dual_session_scope() as (db_users, db_pool):
+        svc = SwitchService(UsersRepository(db_users), MotherRepository(db_pool))
+        result = await svc.switch_email_async(req.email.strip().lower(), code_plain=req.code.strip().upper())
+        response = {
+            "success": result.success,
+            "message": result.message,
+            "queued": result.queued,
+        }
+        if result.request:
+            response["request_id"] = result.request.id
+    return response
@@ -117,6 +117,7 @@ async def list_rate_limit_configs(
         if hasattr(limiter, 'get_config'):
             config_ids = [
                 "redeem:by_ip",
+                "redeem:by_email",
                 "resend:by_ip",
                 "resend:by_email",
                 "admin:by_ip"
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, case, or_
+from sqlalchemy import func, and_, case
 from app import models
 from app.metrics import provider_metrics
 from app.routers.admin.dependencies import get_db, get_db_pool, require_admin
@@ -8,6 +8,9 @@ from app.utils.performance import monitor_session_queries, log_performance_summa
 from datetime import datetime, timedelta
 import logging
 from app.services.services.quota_service import QuotaService
+from app.services.services.stats_rollup import rollup_series
+from app.services.shared.trends import recent_activity_by_day
+from app.utils.time_buckets import BUCKET_DAY, BUCKET_HOUR, BUCKETS, count_by_bucket, format_bucket, trailing_window
 
 router = APIRouter(prefix="/api/admin", tags=["admin-stats"])
 
@@ -52,91 +55,8 @@ def stats(request: Request, db: Session = Depends(get_db), db_pool: Session = De
         active_codes = snapshot["active_codes"]
         remaining_quota = snapshot["remaining_quota"]
 
-        # 最近7天的活动统计 - 优化N+1查询
-        recent_activity = []
-        dates = []
-        date_ranges = []
-
-        # 构建7天的日期范围
-        for i in range(7):
-            date = datetime.utcnow().date() - timedelta(days=i)
-            start_time = datetime.combine(date, datetime.min.time())
-            end_time = datetime.combine(date, datetime.max.time())
-            dates.append(date)
-            date_ranges.append((start_time, end_time))
-
-        if date_ranges:
-            # 一次性查询所有日期范围的邀请统计
-            invite_conditions = []
-            redemption_conditions = []
-
-            for start_time, end_time in date_ranges:
-                invite_conditions.append(
-                    and_(
-                        models.InviteRequest.created_at >= start_time,
-                        models.InviteRequest.created_at <= end_time
-                    )
-                )
-                redemption_conditions.append(
-                    and_(
-                        models.RedeemCode.status == models.CodeStatus.used,
-                        models.RedeemCode.used_at >= start_time,
-                        models.RedeemCode.used_at <= end_time
-                    )
-                )
-
-            # 针对 SQLite 缺少 date_trunc 的兼容处理
-            dialect = db.bind.dialect.name if db.bind else ""
-
-            def trunc_day(column):
-                if dialect == "sqlite":
-                    return func.strftime('%Y-%m-%d', column)
-                return func.date_trunc('day', column)
-
-            truncate_invite = trunc_day(models.InviteRequest.created_at)
-            truncate_redeem = trunc_day(models.RedeemCode.used_at)
-
-            daily_stats = db.query(
-                truncate_invite.label('date'),
-                func.count(models.InviteRequest.id).label('invites')
-            ).filter(
-                or_(*invite_conditions)
-            ).group_by(
-                truncate_invite
-            ).all() if invite_conditions else []
-
-            redemption_stats = db.query(
-                truncate_redeem.label('date'),
-                func.count(models.RedeemCode.id).label('redemptions')
-            ).filter(
-                and_(
-                    models.RedeemCode.status == models.CodeStatus.used,
-                    or_(*redemption_conditions)
-                )
-            ).group_by(
-                truncate_redeem
-            ).all() if redemption_conditions else []
-
-            # 构建映射表
-            def _normalize_date(value):
-                if isinstance(value, datetime):
-                    return value.date()
-                if isinstance(value, str):
-                    return datetime.strptime(value, '%Y-%m-%d').date()
-                return value
-
-            invites_map = {_normalize_date(stat.date): stat.invites for stat in daily_stats}
-            redemptions_map = {_normalize_date(stat.date): stat.redemptions for stat in redemption_stats}
-
-            # 组装结果
-            for i, date in enumerate(dates):
-                daily_invites = invites_map.get(date, 0)
-                daily_redemptions = redemptions_map.get(date, 0)
-                recent_activity.append({
-                    "date": date.strftime("%m-%d"),
-                    "invites": daily_invites,
-                    "redemptions": daily_redemptions
-                })
+        # 最近7天的活动统计：邀请/兑换各一条分桶查询
+        recent_activity = recent_activity_by_day(db, days=7)
 
         # 按状态分组的邀请统计
         invite_status_stats = db.query(
@@ -307,57 +227,34 @@ def dashboard_stats(request: Request, db: Session = Depends(get_db)):
     }
 
 @router.get("/stats/trends")
-def trends_stats(request: Request, db: Session = Depends(get_db), days: int = 30):
-    """获取趋势统计数据"""
+def trends_stats(request: Request, db: Session = Depends(get_db), days: int = 30, bucket: str = BUCKET_DAY):
+    """获取趋势统计数据（每个指标一条分桶查询）"""
     require_admin(request, db)
-    
+    if bucket not in BUCKETS:
+        raise ValueError(f"不支持的时间粒度: {bucket}")
+
     # 限制查询天数
     days = min(days, 90)
-    
-    trends = []
-    for i in range(days):
-        date = datetime.utcnow().date() - timedelta(days=i)
-        start_time = datetime.combine(date, datetime.min.time())
-        end_time = datetime.combine(date, datetime.max.time())
-        
-        # 当天统计
-        daily_invites = db.query(models.InviteRequest).filter(
-            and_(
-                models.InviteRequest.created_at >= start_time,
-                models.InviteRequest.created_at <= end_time
-            )
-        ).count()
-        
-        daily_redemptions = db.query(models.RedeemCode).filter(
-            and_(
-                models.RedeemCode.status == models.CodeStatus.used,
-                models.RedeemCode.used_at >= start_time,
-                models.RedeemCode.used_at <= end_time
-            )
-        ).count()
-        
-        daily_successful = db.query(models.InviteRequest).filter(
-            and_(
-                models.InviteRequest.status == models.InviteStatus.sent,
-                models.InviteRequest.updated_at >= start_time,
-                models.InviteRequest.updated_at <= end_time
-            )
-        ).count()
-        
-        daily_failed = db.query(models.InviteRequest).filter(
-            and_(
-                models.InviteRequest.status == models.InviteStatus.failed,
-                models.InviteRequest.updated_at >= start_time,
-                models.InviteRequest.updated_at <= end_time
-            )
-        ).count()
-        
-        trends.append({
-            "date": date.isoformat(),
-            "invites": daily_invites,
-            "redemptions": daily_redemptions,
-            "successful": daily_successful,
-            "failed": daily_failed
-        })
-    
-    return {"trends": list(reversed(trends))}
+    start, end = trailing_window(days * 24 if bucket == BUCKET_HOUR else days, bucket)
+
+    def _series(column, *filters):
+        return count_by_bucket(db, column, start=start, end=end, bucket=bucket, filters=filters)
+
+    invites = rollup_series(db, "invites", start=start, end=end, bucket=bucket)
+    redemptions = rollup_series(
+        db, "redemptions", start=start, end=end, bucket=bucket, statuses=[models.CodeStatus.used.value]
+    )
+    successful = _series(models.InviteRequest.updated_at, models.InviteRequest.status == models.InviteStatus.sent)
+    failed = _series(models.InviteRequest.updated_at, models.InviteRequest.status == models.InviteStatus.failed)
+
+    trends = [
+        {
+            "date": format_bucket(ts, bucket),
+            "invites": inv,
+            "redemptions": red,
+            "successful": ok,
+            "failed": bad,
+        }
+        for (ts, inv), (_, red), (_, ok), (_, bad) in zip(invites, redemptions, successful, failed)
+    ]
+    return {"trends": trends}
@@ -0,0 +1,259 @@
+"""
+后台任务调度
+
+把原先串行的维护循环拆成独立任务，每个任务有自己的节奏：
+
+- 间隔 / 超时：按任务配置，可用 SCHEDULER_TASK_OVERRIDES 覆盖
+- 防重叠：同一任务上一次仍在线程中运行（包括已超时但线程尚未返回）时跳过本轮
+- 线程池：任务在调度器自己的有界线程池中运行，不占用 asyncio.to_thread / 路由使用的默认线程池；
+  由于防重叠，每个任务最多占一个线程，默认大小即任务数
+- 锁：每个任务单独一把 Redis 锁，按 LOCK_LEASE_SECONDS 租期持有并在后台续期，
+  锁在任务线程结束时释放（超时后线程仍在运行时继续持有）；无 Redis 时直接运行。
+  任务在 holding(lease) 中执行，长时间的分块处理在块边界检查 lease_lost()，锁丢失后停止
+- 分片：SCHEDULER_SHARD_COUNT > 1 时按任务名哈希分配到各实例，实例间不再争抢同一把全局锁
+- 指标：每个任务的运行耗时直方图与结果计数（ok/error/timeout/locked/overlap/lost）
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+
+from app.config import settings
+from app.utils.locks import holding, release_lock, try_acquire_lock
+
+try:
+    from app.metrics_prom import (
+        maintenance_lock_acquired_total,
+        maintenance_lock_miss_total,
+        scheduled_task_duration_seconds,
+        scheduled_task_runs_total,
+    )
+except Exception:  # pragma: no cover - metrics optional
+    maintenance_lock_acquired_total = maintenance_lock_miss_total = None  # type: ignore
+    scheduled_task_duration_seconds = scheduled_task_runs_total = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+RESULT_OK = "ok"
+RESULT_ERROR = "error"
+RESULT_TIMEOUT = "timeout"
+RESULT_LOCKED = "locked"
+RESULT_OVERLAP = "overlap"
+RESULT_LOST = "lost"
+
+# 任务线程内部返回值：未拿到锁 / 运行中锁被他人接管
+_LOCK_MISSED = object()
+_LEASE_LOST = object()
+
+
+@dataclass
+class ScheduledTask:
+    name: str
+    fn: Callable[[], Optional[int]]
+    interval_seconds: float
+    timeout_seconds: Optional[float] = None
+    use_lock: bool = True
+    # 启动时的随机延迟上限，避免所有任务同一时刻触发
+    jitter_seconds: float = 1.0
+
+    def __post_init__(self):
+        interval, timeout = settings.scheduler_task_overrides.get(self.name, (None, None))
+        if interval is not None:
+            self.interval_seconds = interval
+        if timeout is not None:
+            self.timeout_seconds = timeout
+        if self.timeout_seconds is None:
+            self.timeout_seconds = settings.scheduler_task_timeout_seconds
+        self.interval_seconds = max(0.1, float(self.interval_seconds))
+
+
+def owns_task(name: str, shard_count: Optional[int] = None, shard_index: Optional[int] = None) -> bool:
+    """按任务名哈希判断是否由本实例运行"""
+    count = settings.scheduler_shard_count if shard_count is None else shard_count
+    index = settings.scheduler_shard_index if shard_index is None else shard_index
+    if count <= 1:
+        return True
+    return zlib.crc32(name.encode("utf-8")) % count == index % count
+
+
+class _TaskState:
+    __slots__ = ("running", "last_started", "last_result", "last_duration", "last_value", "runs")
+
+    def __init__(self):
+        self.running: Optional[asyncio.Future] = None
+        self.last_started: Optional[datetime] = None
+        self.last_result: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self.last_value: Optional[int] = None
+        self.runs = 0
+
+
+class TaskScheduler:
+    def __init__(self, tasks: list[ScheduledTask], *, lock_namespace: Optional[str] = None):
+        self.tasks = [t for t in tasks if owns_task(t.name)]
+        self.skipped = [t.name for t in tasks if t not in self.tasks]
+        self.lock_namespace = lock_namespace or f"{settings.rate_limit_namespace}:task_lock"
+        self._states = {t.name: _TaskState() for t in self.tasks}
+        self._stop = asyncio.Event()
+        self._loops: list[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            workers = settings.scheduler_max_workers or len(self.tasks)
+            self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="scheduler")
+        return self._executor
+
+    # ---- 单次执行 ----
+
+    def _invoke(self, task: ScheduledTask) -> object:
+        """在线程中执行：取锁 -> 运行 -> 释放锁"""
+        lease = lock_token = None
+        lock_name = f"{self.lock_namespace}:{task.name}"
+        if task.use_lock:
+            lease, lock_token = try_acquire_lock(lock_name, max(5, settings.lock_lease_seconds))
+            if lease is None and lock_token is None:
+                _inc(maintenance_lock_miss_total)
+                return _LOCK_MISSED
+            if lease is not None:
+                _inc(maintenance_lock_acquired_total)
+                logger.debug("scheduled task %s holds lock (fence=%s)", task.name, lease.fence)
+        try:
+            with holding(lease):
+                value = task.fn()
+        finally:
+            release_lock(lease, lock_name, lock_token)
+        if lease is not None and lease.lost.is_set():
+            logger.warning(
+                "scheduled task %s lost its lock (fence=%s) during the run (partial result: %r)",
+                task.name, lease.fence, value,
+            )
+            return _LEASE_LOST
+        return value
+
+    async def run_once(self, task: ScheduledTask) -> str:
+        state = self._states[task.name]
+        if state.running is not None and not state.running.done():
+            _record(task.name, RESULT_OVERLAP)
+            logger.warning("scheduled task %s still running, skip this round", task.name)
+            return RESULT_OVERLAP
+
+        loop = asyncio.get_running_loop()
+        state.last_started = datetime.utcnow()
+        t0 = time.monotonic()
+        fut = loop.run_in_executor(self._pool(), self._invoke, task)
+        # 超时后线程仍可能抛错，提前取走异常避免“never retrieved”告警
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        state.running = fut
+        try:
+            value = await asyncio.wait_for(asyncio.shield(fut), timeout=task.timeout_seconds)
+        except asyncio.TimeoutError:
+            result, value = RESULT_TIMEOUT, None
+            logger.error("scheduled task %s timed out after %.1fs", task.name, task.timeout_seconds)
+        except Exception:
+            result, value = RESULT_ERROR, None
+            logger.exception("scheduled task %s error", task.name)
+        else:
+            if value is _LOCK_MISSED:
+                result = RESULT_LOCKED
+            elif value is _LEASE_LOST:
+                result, value = RESULT_LOST, None
+            else:
+                result = RESULT_OK
+        duration = time.monotonic() - t0
+
+        state.runs += 1
+        state.last_result = result
+        state.last_duration = duration
+        if result == RESULT_OK:
+            state.last_value = value if isinstance(value, int) else None
+            if value:
+                logger.info("%s: %s", task.name, value)
+        _record(task.name, result, None if result == RESULT_LOCKED else duration)
+        return result
+
+    # ---- 循环 ----
+
+    async def _loop(self, task: ScheduledTask) -> None:
+        if await self._sleep(random.uniform(0, task.jitter_seconds)):
+            return
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                await self.run_once(task)
+            except Exception:  # pragma: no cover - run_once 已处理异常
+                logger.exception("scheduled task %s loop error", task.name)
+            delay = max(0.0, task.interval_seconds - (time.monotonic() - started))
+            if await self._sleep(delay):
+                return
+
+    async def _sleep(self, seconds: float) -> bool:
+        """等待指定秒数，期间收到停止信号返回 True"""
+        try:
+            await asyncio.wait_for(self._stop.wait(), timeout=seconds)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def start(self) -> None:
+        if self.skipped:
+            logger.info("scheduler: tasks owned by other shards: %s", ", ".join(self.skipped))
+        self._stop.clear()
+        self._loops = [asyncio.create_task(self._loop(t), name=f"scheduler:{t.name}") for t in self.tasks]
+
+    async def stop(self) -> None:
+        self._stop.set()
+        for t in self._loops:
+            t.cancel()
+        for t in self._loops:
+            try:
+                await t
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._loops = []
+        # 不等待仍在运行（已超时）的任务线程
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot(self) -> list[dict]:
+        out = []
+        for task in self.tasks:
+            st = self._states[task.name]
+            out.append({
+                "name": task.name,
+                "interval_seconds": task.interval_seconds,
+                "timeout_seconds": task.timeout_seconds,
+                "running": bool(st.running is not None and not st.running.done()),
+                "runs": st.runs,
+                "last_started": st.last_started.isoformat() if st.last_started else None,
+                "last_result": st.last_result,
+                "last_duration_ms": None if st.last_duration is None else round(st.last_duration * 1000, 1),
+                "last_value": st.last_value,
+            })
+        return out
+
+
+def _inc(counter) -> None:
+    try:
+        if counter is not None:
+            counter.inc()
+    except Exception:
+        pass
+
+
+def _record(name: str, result: str, duration: Optional[float] = None) -> None:
+    try:
+        if scheduled_task_runs_total is not None:
+            scheduled_task_runs_total.labels(task=name, result=result).inc()
+        if duration is not None and scheduled_task_duration_seconds is not None:
+            scheduled_task_duration_seconds.labels(task=name).observe(duration)
+    except Exception:
+        pass
@@ -171,8 +171,21 @@ class RedeemOut(BaseModel):
     mother_id: Optional[int] = None
     team_id: Optional[str] = None
 
+class RedeemBatchIn(BaseModel):
+    items: List[RedeemIn] = Field(..., min_length=1, max_length=1000, description="兑换码与邮箱列表")
+
+class RedeemBatchItemOut(RedeemOut):
+    code: str
+    email: str
+
+class RedeemBatchOut(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    results: List[RedeemBatchItemOut]
+
 class BatchCodesIn(BaseModel):
-    count: int = Field(gt=0, le=1000, description="生成数量")
+    count: int = Field(gt=0, description="生成数量（上限见 CODE_GENERATE_MAX_COUNT）")
     prefix: Optional[str] = Field(None, max_length=10, description="前缀")
     expires_at: Optional[datetime] = None
     batch_id: Optional[str] = Field(None, max_length=50, description="批次ID")
@@ -2,16 +2,185 @@
 Pool API Key 管理服务
 
 提供 API Key 的生成、验证、管理等功能。
+
+请求路径上的校验走进程内缓存（按 key 哈希，TTL 有界），命中时不访问数据库；
+禁用 / 启用会立即使本进程缓存失效，并递增 Redis 中的撤销 epoch。各进程的
+run_key_revocation_watcher 按间隔读取该 epoch，变化时清空本进程缓存，因此其他 worker
+上的撤销约一个检查间隔后生效；Redis 不可用时退回到 TTL。last_used_at 不再每次请求提交，
+而是记入内存，由 flush_key_usage 定期用一条 UPDATE 批量写回。
 """
+import asyncio
 import hashlib
+import logging
 import secrets
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import case, select, update
 
+from ..config import settings
+from ..database import SessionPool
 from ..models_pool_api import APIKey
 
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AuthenticatedKey:
+    """校验通过的 API Key（脱离会话，可跨请求缓存）"""
+
+    id: int
+    name: Optional[str]
+
+
+# key_hash -> (AuthenticatedKey, 过期时间)
+_key_cache: dict[str, tuple[AuthenticatedKey, float]] = {}
+_key_cache_lock = threading.Lock()
+
+# 最近一次读到的共享撤销 epoch；None 表示尚未读取
+_seen_epoch: Optional[int] = None
+
+# key_id -> 最近使用时间，等待批量写回
+_pending_usage: dict[int, datetime] = {}
+_usage_lock = threading.Lock()
+
+
+def _cache_get(key_hash: str) -> Optional[AuthenticatedKey]:
+    entry = _key_cache.get(key_hash)
+    if entry is None:
+        return None
+    if entry[1] <= time.monotonic():
+        with _key_cache_lock:
+            if _key_cache.get(key_hash) is entry:
+                del _key_cache[key_hash]
+        return None
+    return entry[0]
+
+
+def _cache_put(key_hash: str, key: AuthenticatedKey) -> None:
+    ttl = settings.pool_api_key_cache_ttl_seconds
+    if ttl <= 0:
+        return
+    now = time.monotonic()
+    with _key_cache_lock:
+        if len(_key_cache) >= max(1, settings.pool_api_key_cache_max_entries):
+            # 先清过期项，仍然满则淘汰最早写入的一项
+            for stale in [h for h, (_, exp) in _key_cache.items() if exp <= now]:
+                del _key_cache[stale]
+            if len(_key_cache) >= max(1, settings.pool_api_key_cache_max_entries):
+                del _key_cache[next(iter(_key_cache))]
+        _key_cache[key_hash] = (key, now + ttl)
+
+
+def invalidate_key_cache(key_id: Optional[int] = None) -> None:
+    """使缓存失效；不传 key_id 时清空"""
+    with _key_cache_lock:
+        if key_id is None:
+            _key_cache.clear()
+            return
+        for key_hash in [h for h, (k, _) in _key_cache.items() if k.id == key_id]:
+            del _key_cache[key_hash]
+
+
+def _epoch_key() -> str:
+    return f"{settings.rate_limit_namespace}:pool_api_key:epoch"
+
+
+def _redis():
+    from .services.rate_limiter_service import get_sync_redis_client
+
+    return get_sync_redis_client()
+
+
+def publish_key_revocation() -> None:
+    """递增共享撤销 epoch，通知其他进程清空缓存（Redis 不可用时忽略）"""
+    client = _redis()
+    if client is None:
+        return
+    try:
+        client.incr(_epoch_key())
+    except Exception:
+        logger.warning("publish api key revocation failed", exc_info=True)
+
+
+def sync_key_revocations() -> bool:
+    """读取共享撤销 epoch；自上次读取后有变化时清空本进程缓存，返回是否清空"""
+    global _seen_epoch
+    client = _redis()
+    if client is None:
+        return False
+    try:
+        epoch = int(client.get(_epoch_key()) or 0)
+    except Exception:
+        logger.debug("read api key revocation epoch failed", exc_info=True)
+        return False
+    changed = _seen_epoch is not None and epoch != _seen_epoch
+    if changed:
+        invalidate_key_cache()
+    _seen_epoch = epoch
+    return changed
+
+
+async def run_key_revocation_watcher(interval_seconds: Optional[float] = None) -> None:
+    """后台循环：定期同步其他进程的撤销（由应用生命周期启动与取消）"""
+    interval = max(0.2, float(interval_seconds or settings.pool_api_key_revocation_check_seconds))
+    while True:
+        try:
+            await asyncio.to_thread(sync_key_revocations)
+        except Exception:
+            logger.exception("sync api key revocations failed")
+        await asyncio.sleep(interval)
+
+
+def record_key_usage(key_id: int, when: Optional[datetime] = None) -> None:
+    with _usage_lock:
+        _pending_usage[key_id] = when or datetime.utcnow()
+
+
+def flush_key_usage(session_factory: Callable[[], Session] = SessionPool) -> int:
+    """把缓冲的 last_used_at 用一条 UPDATE 写回，返回更新的 key 数"""
+    global _pending_usage
+    with _usage_lock:
+        if not _pending_usage:
+            return 0
+        pending, _pending_usage = _pending_usage, {}
+
+    db = session_factory()
+    try:
+        db.execute(
+            update(APIKey)
+            .where(APIKey.id.in_(list(pending)))
+            .values(last_used_at=case(pending, value=APIKey.id))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        # 写回失败时放回缓冲区（保留更新的时间），下一轮重试
+        with _usage_lock:
+            for key_id, when in pending.items():
+                current = _pending_usage.get(key_id)
+                if current is None or current < when:
+                    _pending_usage[key_id] = when
+        raise
+    finally:
+        db.close()
+    return len(pending)
+
+
+async def run_key_usage_flusher(interval_seconds: Optional[float] = None) -> None:
+    """后台循环：定期批量写回 last_used_at（由应用生命周期启动与取消）"""
+    interval = max(0.5, float(interval_seconds or settings.pool_api_key_usage_flush_seconds))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(flush_key_usage)
+        except Exception:
+            logger.exception("flush api key usage failed")
+
 
 class APIKeyService:
     """API Key 管理服务"""
@@ -116,11 +285,45 @@ class APIKeyService:
         api_key = db.execute(stmt).scalar_one_or_none()
         
         if api_key:
-            # 更新最后使用时间
-            api_key.last_used_at = datetime.utcnow()
-            db.commit()
+            # 最后使用时间记入缓冲区，批量写回
+            record_key_usage(api_key.id)
         
         return api_key
+
+    @staticmethod
+    def get_cached_key(key: str) -> Optional[AuthenticatedKey]:
+        """只查进程内缓存；命中时记录使用时间"""
+        cached = _cache_get(APIKeyService.hash_key(key))
+        if cached is not None:
+            record_key_usage(cached.id)
+        return cached
+
+    @staticmethod
+    def authenticate(
+        key: str,
+        session_factory: Callable[[], Session] = SessionPool,
+    ) -> Optional[AuthenticatedKey]:
+        """
+        校验 API Key（先查缓存，未命中时查库并回填）
+
+        查库使用独立短会话，返回前即关闭，调用方不持有数据库连接。
+        """
+        key_hash = APIKeyService.hash_key(key)
+        cached = _cache_get(key_hash)
+        if cached is not None:
+            record_key_usage(cached.id)
+            return cached
+
+        db = session_factory()
+        try:
+            api_key = APIKeyService.validate_api_key(db, key)
+            if api_key is None:
+                return None
+            result = AuthenticatedKey(id=api_key.id, name=api_key.name)
+        finally:
+            db.close()
+        _cache_put(key_hash, result)
+        return result
     
     @staticmethod
     def disable_api_key(db: Session, key_id: int) -> bool:
@@ -142,6 +345,8 @@ class APIKeyService:
         
         api_key.is_active = False
         db.commit()
+        invalidate_key_cache(key_id)
+        publish_key_revocation()
         return True
     
     @staticmethod
@@ -164,6 +369,8 @@ class APIKeyService:
         
         api_key.is_active = True
         db.commit()
+        invalidate_key_cache(key_id)
+        publish_key_revocation()
         return True
     
     @staticmethod
@@ -10,7 +10,7 @@ from dataclasses import dataclass
 from .pool_provider_wrapper import PoolProviderWrapper
 from ..utils.pool_executor import ConcurrentExecutor, TaskResult
 from ..utils.pool_retry import RetryResult
-from ..config import pool_config
+from ..config import pool_config, settings
 
 
 @dataclass
@@ -46,6 +46,12 @@ class PoolMemberService:
         self.access_token = access_token
         self.concurrency = concurrency or pool_config.concurrency
         self.executor = ConcurrentExecutor(self.concurrency)
+        # 邀请在 provider 层按团队合并发送，并发等待的邮箱越多合并后的请求越少，
+        # 实际上游并发仍由合并后的请求数决定
+        invite_concurrency = self.concurrency
+        if settings.provider_invite_coalesce_ms > 0:
+            invite_concurrency = max(self.concurrency, settings.provider_invite_batch_size)
+        self.invite_executor = ConcurrentExecutor(invite_concurrency)
         self.wrapper = PoolProviderWrapper()
     
     def list_members(
@@ -197,7 +203,7 @@ class PoolMemberService:
         ]
         
         # 并发执行
-        results: list[TaskResult[RetryResult]] = await self.executor.execute_many(tasks)
+        results: list[TaskResult[RetryResult]] = await self.invite_executor.execute_many(tasks)
         
         # 转换结果
         operation_results = []
@@ -4,6 +4,11 @@ from typing import Optional, Tuple, List
 
 from sqlalchemy.orm import Session
 from app import models
+from app.utils.pagination import keyset_page, with_estimated_total
+
+
+class InvalidCursor(ValueError):
+    pass
 
 
 def _serialize_job(job: models.BatchJob) -> dict:
@@ -20,6 +25,7 @@ def _serialize_job(job: models.BatchJob) -> dict:
         "started_at": job.started_at.isoformat() if job.started_at else None,
         "finished_at": job.finished_at.isoformat() if job.finished_at else None,
         "payload": job.payload_json,
+        "metadata": job.metadata_json,
         "visible_until": job.visible_until.isoformat() if job.visible_until else None,
         "attempts": job.attempts,
     }
@@ -31,7 +37,10 @@ def list_jobs(
     status: Optional[str] = None,
     page: int = 1,
     page_size: int = 20,
+    cursor: Optional[str] = None,
+    approx_total: bool = False,
 ) -> Tuple[List[dict], dict]:
+    """cursor 为 None 时按页码分页（含精确总数）；否则按 (created_at, id) 游标分页"""
     query = session.query(models.BatchJob)
     if status:
         try:
@@ -40,6 +49,21 @@ def list_jobs(
             raise ValueError("invalid status") from exc
         query = query.filter(models.BatchJob.status == status_enum)
 
+    if cursor is not None:
+        try:
+            rows, pagination = keyset_page(
+                query,
+                created_col=models.BatchJob.created_at,
+                id_col=models.BatchJob.id,
+                cursor=cursor,
+                page_size=page_size,
+            )
+        except ValueError as exc:
+            raise InvalidCursor("invalid cursor") from exc
+        if approx_total:
+            with_estimated_total(session, query, pagination)
+        return [_serialize_job(job) for job in rows], pagination
+
     total = query.count()
     if total == 0:
         return [], {"page": page, "page_size": page_size, "total": 0, "total_pages": 0}
@@ -47,7 +71,7 @@ def list_jobs(
     total_pages = max(1, (total + page_size - 1) // page_size)
     current_page = max(1, min(page, total_pages))
     rows = (
-        query.order_by(models.BatchJob.created_at.desc())
+        query.order_by(models.BatchJob.created_at.desc(), models.BatchJob.id.desc())
         .offset((current_page - 1) * page_size)
         .limit(page_size)
         .all()
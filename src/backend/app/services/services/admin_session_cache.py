@@ -0,0 +1,165 @@
+"""
+管理员会话校验缓存
+
+require_admin 原先每个管理请求都查一次 AdminSession。这里在签名校验之后按会话 token 的
+SHA-256 缓存校验结果（短 TTL，且不超过会话本身的过期时间），命中时不访问数据库：
+
+- Redis 可用时缓存放在 Redis，多个 worker 共享：登出写入墓碑值，"全部登出"递增 epoch，
+  所有 worker 下一次请求即可见；写入正向结果使用 NX，不会覆盖已有墓碑
+- Redis 不可用时退回进程内缓存，其他 worker 上的撤销最迟在 TTL 后生效
+- 只缓存有效会话；修改密码同样使全部缓存失效
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+from app.security import unsign_session
+
+logger = logging.getLogger(__name__)
+
+_TOMBSTONE = "-"
+_LOCAL_MAX_ENTRIES = 1024
+
+# token_hash -> (sid 或墓碑, epoch, 过期时间)
+_local: dict[str, tuple[str, int, float]] = {}
+_local_epoch = 0
+_local_lock = threading.Lock()
+
+
+def _token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _namespace() -> str:
+    return f"{settings.rate_limit_namespace}:admin_session"
+
+
+def _redis():
+    if not settings.admin_session_cache_redis:
+        return None
+    from app.services.services.rate_limiter_service import get_sync_redis_client
+
+    return get_sync_redis_client()
+
+
+def _lookup(token_hash: str) -> tuple[Optional[str], int]:
+    """返回 (缓存值, 当前 epoch)；缓存值为 sid、墓碑或 None"""
+    client = _redis()
+    if client is not None:
+        ns = _namespace()
+        try:
+            value, epoch_raw = client.mget(f"{ns}:{token_hash}", f"{ns}:epoch")
+            epoch = int(epoch_raw or 0)
+            if value is None:
+                return None, epoch
+            if value == _TOMBSTONE:
+                return _TOMBSTONE, epoch
+            sid, _, stored_epoch = value.rpartition("|")
+            return (sid if stored_epoch == str(epoch) else None), epoch
+        except Exception:
+            logger.debug("admin session cache redis lookup failed", exc_info=True)
+
+    entry = _local.get(token_hash)
+    if entry is None or entry[2] <= time.monotonic():
+        return None, _local_epoch
+    value, epoch, _ = entry
+    if value != _TOMBSTONE and epoch != _local_epoch:
+        return None, _local_epoch
+    return value, _local_epoch
+
+
+def _store(token_hash: str, sid: str, epoch: int, ttl: float) -> None:
+    client = _redis()
+    if client is not None:
+        try:
+            client.set(f"{_namespace()}:{token_hash}", f"{sid}|{epoch}", ex=max(1, int(ttl)), nx=True)
+            return
+        except Exception:
+            logger.debug("admin session cache redis store failed", exc_info=True)
+    now = time.monotonic()
+    with _local_lock:
+        current = _local.get(token_hash)
+        if current is not None and current[0] == _TOMBSTONE and current[2] > now:
+            return
+        if len(_local) >= _LOCAL_MAX_ENTRIES:
+            for key in [k for k, v in _local.items() if v[2] <= now]:
+                del _local[key]
+        _local[token_hash] = (sid, epoch, now + ttl)
+
+
+def resolve_admin_session(db: Session, token: Optional[str]) -> Optional[str]:
+    """校验签名后的会话 token，返回有效的 session_id；无效返回 None"""
+    if not token:
+        return None
+    sid = unsign_session(token, max_age_seconds=settings.admin_session_ttl_seconds)
+    if not sid:
+        return None
+
+    ttl = settings.admin_session_cache_ttl_seconds
+    token_hash = _token_hash(token)
+    epoch = 0
+    if ttl > 0:
+        cached, epoch = _lookup(token_hash)
+        if cached == _TOMBSTONE:
+            return None
+        if cached == sid:
+            return sid
+
+    row = db.query(models.AdminSession).filter(models.AdminSession.session_id == sid).first()
+    now = datetime.utcnow()
+    if not row or row.revoked or row.expires_at <= now:
+        return None
+
+    if ttl > 0:
+        remaining = (row.expires_at - now).total_seconds()
+        _store(token_hash, sid, epoch, min(ttl, remaining))
+    return sid
+
+
+def invalidate_admin_session(token: Optional[str]) -> None:
+    """登出：使单个会话的缓存失效（写入墓碑，阻止并发请求回填）"""
+    if not token:
+        return
+    token_hash = _token_hash(token)
+    ttl = max(1.0, settings.admin_session_cache_ttl_seconds)
+    client = _redis()
+    if client is not None:
+        try:
+            client.set(f"{_namespace()}:{token_hash}", _TOMBSTONE, ex=max(1, int(ttl)))
+        except Exception:
+            logger.warning("admin session cache redis invalidation failed", exc_info=True)
+    with _local_lock:
+        _local[token_hash] = (_TOMBSTONE, _local_epoch, time.monotonic() + ttl)
+
+
+def invalidate_all_admin_sessions() -> None:
+    """全部登出 / 修改密码：使所有缓存的会话失效"""
+    global _local_epoch
+    client = _redis()
+    if client is not None:
+        try:
+            client.incr(f"{_namespace()}:epoch")
+        except Exception:
+            logger.warning("admin session cache redis epoch bump failed", exc_info=True)
+    with _local_lock:
+        _local_epoch += 1
+        now = time.monotonic()
+        # 保留未过期的墓碑，其余清空
+        for key in [k for k, v in _local.items() if v[0] != _TOMBSTONE or v[2] <= now]:
+            del _local[key]
+
+
+__all__ = [
+    "invalidate_admin_session",
+    "invalidate_all_admin_sessions",
+    "resolve_admin_session",
+]
@@ -0,0 +1,250 @@
+"""
+兑换码导出
+
+原先导出一次性 .all() 读出全部兑换码与关联邀请，在内存里拼好整个 CSV 再返回，
+大批次导出时内存随行数增长，且整个构建期间占用连接。这里改为：
+
+- 按 yield_per 分块读取（PostgreSQL 上为服务端游标），每块只查询该块兑换码的邀请
+- 每块编码成一段 CSV / NDJSON / TXT 后立即交给调用方，内存只与块大小有关
+- 在线导出由 StreamingResponse 逐块下发；超大导出走批量任务队列，写入
+  code_export_dir 下的本地文件，完成后通过任务接口下载
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "ndjson", "txt")
+EXPORT_STATUSES = ("all", "unused", "used")
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "txt": "text/plain; charset=utf-8",
+}
+
+CSV_COLUMNS = ["code", "batch_id", "is_used", "created_at", "used_by", "used_at"]
+
+
+def validate_export_args(fmt: str, status: str) -> None:
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    if status not in EXPORT_STATUSES:
+        raise ValueError(f"不支持的状态过滤: {status}")
+
+
+def export_filename(fmt: str, suffix: Optional[str] = None) -> str:
+    stem = f"codes-{datetime.utcnow().date()}" + (f"-{suffix}" if suffix else "")
+    return f"{stem}.{fmt}"
+
+
+def _pick_invites(session: Session, code_ids: list[int]) -> dict[int, models.InviteRequest]:
+    """每个兑换码取一条代表邀请：优先已发送，其次最近更新"""
+    picked: dict[int, models.InviteRequest] = {}
+    if not code_ids:
+        return picked
+    invites = session.execute(
+        select(models.InviteRequest).where(models.InviteRequest.code_id.in_(code_ids))
+    ).scalars()
+    for invite in invites:
+        existing = picked.get(invite.code_id)
+        if existing is None or (
+            invite.status == models.InviteStatus.sent and existing.status != models.InviteStatus.sent
+        ) or (
+            invite.status == existing.status
+            and (invite.updated_at or invite.created_at) > (existing.updated_at or existing.created_at)
+        ):
+            picked[invite.code_id] = invite
+    return picked
+
+
+def iter_export_chunks(
+    session: Session,
+    *,
+    status: str = "all",
+    chunk_size: Optional[int] = None,
+) -> Iterator[list[dict[str, Any]]]:
+    """按块产出导出行（dict），每块最多 chunk_size 行"""
+    chunk_size = max(1, int(chunk_size or settings.code_export_chunk_size))
+    stmt = select(models.RedeemCode).order_by(models.RedeemCode.created_at.desc(), models.RedeemCode.id.desc())
+    if status == "unused":
+        stmt = stmt.where(models.RedeemCode.status == models.CodeStatus.unused)
+    elif status == "used":
+        stmt = stmt.where(models.RedeemCode.status == models.CodeStatus.used)
+
+    result = session.execute(stmt.execution_options(yield_per=chunk_size))
+    try:
+        for partition in result.scalars().partitions():
+            invites = _pick_invites(session, [c.id for c in partition])
+            rows = []
+            for code in partition:
+                invite = invites.get(code.id)
+                rows.append(
+                    {
+                        "code": code.code,
+                        "batch_id": code.batch_id or "",
+                        "is_used": code.is_used,
+                        "created_at": code.created_at.isoformat() if code.created_at else "",
+                        "used_by": invite.email if invite else "",
+                        "used_at": (
+                            invite.updated_at.isoformat() if invite and code.is_used and invite.updated_at else ""
+                        ),
+                    }
+                )
+            # 已转换的块不再需要 ORM 对象，移出 identity map 以保持内存有界
+            for obj in (*partition, *invites.values()):
+                session.expunge(obj)
+            yield rows
+    finally:
+        result.close()
+
+
+def encode_chunk(fmt: str, rows: list[dict[str, Any]], *, header: bool = False) -> bytes:
+    if fmt == "txt":
+        return "".join(f"{r['code']}\n" for r in rows).encode("utf-8")
+    if fmt == "ndjson":
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows).encode("utf-8")
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    for r in rows:
+        writer.writerow(
+            [r["code"], r["batch_id"], "1" if r["is_used"] else "0", r["created_at"], r["used_by"], r["used_at"]]
+        )
+    return buf.getvalue().encode("utf-8")
+
+
+def iter_export_bytes(
+    session: Session,
+    fmt: str,
+    *,
+    status: str = "all",
+    chunk_size: Optional[int] = None,
+    on_chunk: Optional[Callable[[int], None]] = None,
+) -> Iterator[bytes]:
+    """逐块产出编码后的导出内容；on_chunk 收到累计行数（用于任务心跳）"""
+    validate_export_args(fmt, status)
+    if fmt == "csv":
+        yield encode_chunk(fmt, [], header=True)
+    total = 0
+    for rows in iter_export_chunks(session, status=status, chunk_size=chunk_size):
+        total += len(rows)
+        yield encode_chunk(fmt, rows)
+        if on_chunk is not None:
+            on_chunk(total)
+
+
+def stream_export(bind: Any, fmt: str, *, status: str = "all") -> Iterable[bytes]:
+    """供 StreamingResponse 使用：在独立会话中读取，响应结束（或客户端断开）时关闭"""
+    session = Session(bind=bind)
+    try:
+        yield from iter_export_bytes(session, fmt, status=status)
+    finally:
+        session.close()
+
+
+# ---- 后台导出任务 ----
+
+
+def export_dir() -> str:
+    return os.path.abspath(settings.code_export_dir)
+
+
+def export_file_path(filename: str) -> Optional[str]:
+    """任务元数据中的文件名 -> 导出目录内的绝对路径；不存在或越界返回 None"""
+    name = os.path.basename(filename or "")
+    if not name:
+        return None
+    path = os.path.join(export_dir(), name)
+    return path if os.path.isfile(path) else None
+
+
+def enqueue_export_job(db: Session, fmt: str, status: str, *, actor: str = "admin") -> models.BatchJob:
+    validate_export_args(fmt, status)
+    job = models.BatchJob(
+        job_type=models.BatchJobType.codes_export,
+        status=models.BatchJobStatus.pending,
+        actor=actor,
+        payload_json=json.dumps({"format": fmt, "status": status}, ensure_ascii=False),
+        total_count=0,
+        success_count=0,
+        failed_count=0,
+        attempts=0,
+        max_attempts=settings.job_max_attempts,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def prune_exports(max_age_hours: Optional[int] = None) -> int:
+    """删除超过保留期的导出文件"""
+    max_age = (max_age_hours if max_age_hours is not None else settings.code_export_retention_hours) * 3600
+    directory = export_dir()
+    if max_age <= 0 or not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_file() and entry.name.startswith("codes-") and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            logger.warning("failed to prune export file %s", entry.path)
+    return removed
+
+
+def write_export_file(
+    bind: Any,
+    job_id: int,
+    fmt: str,
+    *,
+    status: str = "all",
+    on_chunk: Optional[Callable[[int], None]] = None,
+) -> tuple[str, int]:
+    """把导出写入本地文件（先写 .part 再原子改名），返回 (文件名, 行数)"""
+    directory = export_dir()
+    os.makedirs(directory, exist_ok=True)
+    filename = export_filename(fmt, suffix=f"job{job_id}")
+    final_path = os.path.join(directory, filename)
+    tmp_path = final_path + ".part"
+    rows = 0
+
+    def _count(total: int) -> None:
+        nonlocal rows
+        rows = total
+        if on_chunk is not None:
+            on_chunk(total)
+
+    session = Session(bind=bind)
+    try:
+        with open(tmp_path, "wb") as fh:
+            for data in iter_export_bytes(session, fmt, status=status, on_chunk=_count):
+                fh.write(data)
+        os.replace(tmp_path, final_path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    finally:
+        session.close()
+    return filename, rows
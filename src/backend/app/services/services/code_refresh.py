@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import asyncio
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
 
@@ -8,7 +10,17 @@ from app.config import settings
 from app.repositories import UsersRepository
 from app.repositories.mother_repository import MotherRepository
 from app.services.services.redeem import hash_code
-from app.services.services.switch import SwitchService
+from app.services.services.switch import SwitchResult, SwitchService
+
+
+@dataclass
+class _RefreshContext:
+    code: models.RedeemCode
+    code_value: str
+    target_email: str
+    limit: Optional[int]
+    used: int
+    now: datetime
 
 
 class CodeRefreshService:
@@ -26,6 +38,44 @@ class CodeRefreshService:
         email: str,
         new_email: Optional[str] = None,
     ) -> Tuple[bool, str, dict]:
+        prepared = self._prepare_refresh(code_plain, email, new_email)
+        if isinstance(prepared, tuple):
+            return prepared
+
+        result = self.switch_service.switch_email(
+            prepared.target_email,
+            code_plain=prepared.code_value,
+            prefer_recent_team=True,
+            recent_window_days=settings.code_refresh_recent_team_days,
+        )
+        return self._finish_refresh(prepared, result)
+
+    async def refresh_async(
+        self,
+        *,
+        code_plain: str,
+        email: str,
+        new_email: Optional[str] = None,
+    ) -> Tuple[bool, str, dict]:
+        """refresh 的异步版本：切换过程中的 Provider 调用不占用线程池"""
+        prepared = await asyncio.to_thread(self._prepare_refresh, code_plain, email, new_email)
+        if isinstance(prepared, tuple):
+            return prepared
+
+        result = await self.switch_service.switch_email_async(
+            prepared.target_email,
+            code_plain=prepared.code_value,
+            prefer_recent_team=True,
+            recent_window_days=settings.code_refresh_recent_team_days,
+        )
+        return await asyncio.to_thread(self._finish_refresh, prepared, result)
+
+    def _prepare_refresh(
+        self,
+        code_plain: str,
+        email: str,
+        new_email: Optional[str],
+    ) -> "Tuple[bool, str, dict] | _RefreshContext":
         code_value = code_plain.strip().upper()
         email_norm = email.strip().lower()
         new_email_norm = new_email.strip().lower() if new_email else None
@@ -44,7 +94,6 @@ class CodeRefreshService:
 
         limit = code.refresh_limit
         used = code.refresh_used or 0
-        remaining = None if limit is None else max(limit - used, 0)
         if limit is not None and used >= limit:
             return False, "刷新次数已用尽", {"refresh_remaining": 0}
 
@@ -53,20 +102,24 @@ class CodeRefreshService:
             cooldown = int((code.refresh_cooldown_until - now).total_seconds())
             return False, "刷新冷却中，请稍后再试", {"cooldown_seconds": max(1, cooldown)}
 
-        target_email = new_email_norm or email_norm
-        result = self.switch_service.switch_email(
-            target_email,
-            code_plain=code_value,
-            prefer_recent_team=True,
-            recent_window_days=settings.code_refresh_recent_team_days,
+        return _RefreshContext(
+            code=code,
+            code_value=code_value,
+            target_email=new_email_norm or email_norm,
+            limit=limit,
+            used=used,
+            now=now,
         )
+
+    def _finish_refresh(self, ctx: "_RefreshContext", result: SwitchResult) -> Tuple[bool, str, dict]:
         if not result.success:
             payload = {}
             if result.queued:
                 payload["queued"] = True
             return False, result.message, payload
 
-        code.refresh_used = used + 1
+        code, now, target_email = ctx.code, ctx.now, ctx.target_email
+        code.refresh_used = ctx.used + 1
         code.last_refresh_at = now
         code.refresh_cooldown_until = now + timedelta(seconds=settings.code_refresh_cooldown_seconds)
         code.bound_email = target_email
@@ -84,10 +137,9 @@ class CodeRefreshService:
         self.users_repo.session.add(code)
         self.users_repo.commit()
 
-        remaining_after = None if limit is None else max(limit - code.refresh_used, 0)
+        remaining_after = None if ctx.limit is None else max(ctx.limit - code.refresh_used, 0)
         return True, "刷新成功", {
             "refresh_remaining": remaining_after,
             "cooldown_seconds": settings.code_refresh_cooldown_seconds,
             "team_id": result.team_id,
         }
-
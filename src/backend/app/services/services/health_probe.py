@@ -0,0 +1,288 @@
+"""
+母号健康探测引擎
+
+维护任务每个周期调用一次 sweep()：
+
+- 选择：从“活跃且超过宽限期未探测”的母号中多取一个窗口，按 陈旧时长 × (1 + 近期失败率权重)
+  排序后取前 limit 个，从未探测过的母号最优先
+- 预取：一次查询取出这些母号的默认团队（启用、默认优先、创建时间最早）
+- 探测：有界线程池并发调用 provider.list_members(limit=1)，按上游主机令牌桶限速；
+  工作线程只访问上游，数据库读写都在调用线程完成
+- 进度：导出探测结果计数、时延、剩余待探测数量与本轮覆盖率
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app import models, provider
+from app.config import settings
+from app.security import decrypt_token
+
+try:
+    from app.metrics_prom import (
+        mother_health_probe_latency_ms,
+        mother_health_probes_total,
+        mother_health_sweep_backlog,
+        mother_health_sweep_coverage_ratio,
+    )
+except Exception:  # pragma: no cover
+    mother_health_probes_total = mother_health_probe_latency_ms = None
+    mother_health_sweep_backlog = mother_health_sweep_coverage_ratio = None
+
+logger = logging.getLogger(__name__)
+
+RESULT_ALIVE = "alive"
+RESULT_NO_TEAM = "no_team"
+RESULT_INVALID = "invalid"
+RESULT_ERROR = "error"
+
+# 候选窗口放大倍数：在更大的窗口内按优先级重排
+_CANDIDATE_FACTOR = 4
+# 近期失败率权重：失败率为 1 的母号等同于陈旧时长放大 (1 + 权重) 倍
+_ERROR_WEIGHT = 3.0
+# 失败率 EWMA 平滑系数
+_ERROR_ALPHA = 0.3
+
+
+class HostRateLimiter:
+    """按上游主机的令牌桶（进程内，线程安全）"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = max(0.0, float(rate))
+        self.burst = max(1.0, float(burst if burst is not None else max(1.0, self.rate)))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def acquire(self, host: str) -> None:
+        """取一个令牌，不足时阻塞等待；rate 为 0 表示不限速"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = self._clock()
+                tokens, last = self._buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens >= 1.0:
+                    self._buckets[host] = (tokens - 1.0, now)
+                    return
+                self._buckets[host] = (tokens, now)
+                wait = (1.0 - tokens) / self.rate
+            time.sleep(wait)
+
+
+@dataclass
+class ProbeOutcome:
+    mother_id: int
+    team_id: Optional[str]
+    result: str
+    status: Optional[int] = None
+    latency_ms: float = 0.0
+
+
+@dataclass
+class _ProbeTarget:
+    mother_id: int
+    team_id: str
+    access_token_enc: Optional[str]
+
+
+class MotherHealthProber:
+    """并发探测母号健康状态，跨维护周期保留失败率与进度统计"""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        rate_per_host: Optional[float] = None,
+        max_tracked: int = 10000,
+    ):
+        self.workers = max(1, workers or settings.mother_health_check_workers)
+        rps = settings.mother_health_probe_rps if rate_per_host is None else rate_per_host
+        self.limiter = HostRateLimiter(rps)
+        self.host = urlparse(provider.BASE).netloc or "provider"
+        self._lock = threading.Lock()
+        self._max_tracked = max_tracked
+        # mother_id -> 近期失败率（EWMA），LRU 限制规模
+        self._error_rate: OrderedDict[int, float] = OrderedDict()
+        self._last_sweep: dict = {}
+
+    # ---- 失败率 ----
+
+    def error_rate(self, mother_id: int) -> float:
+        with self._lock:
+            return self._error_rate.get(mother_id, 0.0)
+
+    def _observe(self, mother_id: int, failed: bool) -> None:
+        with self._lock:
+            prev = self._error_rate.pop(mother_id, 0.0)
+            rate = prev + _ERROR_ALPHA * ((1.0 if failed else 0.0) - prev)
+            if rate > 0.01:
+                self._error_rate[mother_id] = rate
+                while len(self._error_rate) > self._max_tracked:
+                    self._error_rate.popitem(last=False)
+
+    # ---- 选择与预取 ----
+
+    def _priority(self, mother: models.MotherAccount, now: datetime) -> float:
+        if mother.last_health_check_at is None:
+            return float("inf")
+        staleness = max(0.0, (now - mother.last_health_check_at).total_seconds())
+        return staleness * (1.0 + _ERROR_WEIGHT * self.error_rate(mother.id))
+
+    def select(self, session: Session, limit: int, now: datetime) -> list[models.MotherAccount]:
+        threshold = now - timedelta(minutes=max(1, settings.mother_health_alive_grace_minutes))
+        window = (
+            session.query(models.MotherAccount)
+            .filter(models.MotherAccount.status == models.MotherStatus.active)
+            .filter(
+                (models.MotherAccount.last_health_check_at == None)  # noqa: E711
+                | (models.MotherAccount.last_health_check_at < threshold)
+            )
+            .order_by(models.MotherAccount.last_health_check_at.asc().nullsfirst())
+            .limit(limit * _CANDIDATE_FACTOR)
+            .all()
+        )
+        window.sort(key=lambda m: self._priority(m, now), reverse=True)
+        return window[:limit]
+
+    @staticmethod
+    def default_teams(session: Session, mother_ids: list[int]) -> dict[int, str]:
+        """一次查询取出每个母号的默认团队"""
+        if not mother_ids:
+            return {}
+        rows = (
+            session.query(models.MotherTeam.mother_id, models.MotherTeam.team_id)
+            .filter(
+                models.MotherTeam.mother_id.in_(mother_ids),
+                models.MotherTeam.is_enabled == True,  # noqa: E712
+                models.MotherTeam.team_id.isnot(None),
+            )
+            .order_by(
+                models.MotherTeam.mother_id,
+                models.MotherTeam.is_default.desc(),
+                models.MotherTeam.created_at.asc(),
+            )
+            .all()
+        )
+        teams: dict[int, str] = {}
+        for mother_id, team_id in rows:
+            teams.setdefault(mother_id, team_id)
+        return teams
+
+    @staticmethod
+    def backlog(session: Session, now: datetime) -> int:
+        threshold = now - timedelta(minutes=max(1, settings.mother_health_alive_grace_minutes))
+        return (
+            session.query(func.count(models.MotherAccount.id))
+            .filter(models.MotherAccount.status == models.MotherStatus.active)
+            .filter(
+                (models.MotherAccount.last_health_check_at == None)  # noqa: E711
+                | (models.MotherAccount.last_health_check_at < threshold)
+            )
+            .scalar()
+            or 0
+        )
+
+    # ---- 探测 ----
+
+    def _probe(self, target: _ProbeTarget) -> ProbeOutcome:
+        self.limiter.acquire(self.host)
+        t0 = time.monotonic()
+        try:
+            access_token = decrypt_token(target.access_token_enc)
+            provider.list_members(access_token, target.team_id, limit=1)
+            result, status = RESULT_ALIVE, None
+        except provider.ProviderError as exc:
+            status = exc.status
+            result = RESULT_INVALID if exc.status in (401, 403) else RESULT_ERROR
+        except Exception:
+            # 忽略网络波动，保持原状态
+            result, status = RESULT_ERROR, None
+        latency_ms = (time.monotonic() - t0) * 1000
+        self._observe(target.mother_id, result == RESULT_ERROR)
+        return ProbeOutcome(target.mother_id, target.team_id, result, status, latency_ms)
+
+    def probe_all(self, targets: list[_ProbeTarget]) -> list[ProbeOutcome]:
+        if not targets:
+            return []
+        workers = min(self.workers, len(targets))
+        if workers == 1:
+            return [self._probe(t) for t in targets]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mother-health") as pool:
+            return list(pool.map(self._probe, targets))
+
+    def sweep(self, session: Session, limit: int) -> list[ProbeOutcome]:
+        """选出本轮母号并完成探测，返回结果；调用方负责落库"""
+        now = datetime.utcnow()
+        started = time.monotonic()
+        mothers = self.select(session, limit, now)
+        teams = self.default_teams(session, [m.id for m in mothers])
+
+        outcomes: list[ProbeOutcome] = []
+        targets: list[_ProbeTarget] = []
+        for mother in mothers:
+            team_id = teams.get(mother.id)
+            if team_id:
+                targets.append(_ProbeTarget(mother.id, team_id, mother.access_token_enc))
+            else:
+                outcomes.append(ProbeOutcome(mother.id, None, RESULT_NO_TEAM))
+        outcomes.extend(self.probe_all(targets))
+
+        remaining = max(0, self.backlog(session, now) - len(mothers))
+        self._export(outcomes, remaining, time.monotonic() - started)
+        return outcomes
+
+    # ---- 指标 ----
+
+    def _export(self, outcomes: list[ProbeOutcome], remaining: int, duration: float) -> None:
+        counts: dict[str, int] = {}
+        for o in outcomes:
+            counts[o.result] = counts.get(o.result, 0) + 1
+            try:
+                if mother_health_probes_total is not None:
+                    mother_health_probes_total.labels(result=o.result).inc()
+                if mother_health_probe_latency_ms is not None and o.result != RESULT_NO_TEAM:
+                    mother_health_probe_latency_ms.observe(o.latency_ms)
+            except Exception:
+                pass
+        total = len(outcomes) + remaining
+        coverage = len(outcomes) / total if total else 1.0
+        try:
+            if mother_health_sweep_backlog is not None:
+                mother_health_sweep_backlog.set(remaining)
+            if mother_health_sweep_coverage_ratio is not None:
+                mother_health_sweep_coverage_ratio.set(coverage)
+        except Exception:
+            pass
+        with self._lock:
+            self._last_sweep = {
+                "at": datetime.utcnow().isoformat(),
+                "probed": len(outcomes),
+                "results": counts,
+                "backlog": remaining,
+                "coverage": round(coverage, 4),
+                "duration_ms": round(duration * 1000, 1),
+                "tracked_error_rates": len(self._error_rate),
+            }
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "rate_per_host": self.limiter.rate,
+                "last_sweep": dict(self._last_sweep),
+            }
+
+
+mother_health_prober = MotherHealthProber()
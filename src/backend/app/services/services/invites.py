@@ -1,5 +1,6 @@
+import asyncio
 from collections import defaultdict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from typing import Optional, Sequence, Set
 
@@ -7,13 +8,14 @@ from sqlalchemy import select, update
 import time as _time
 from sqlalchemy.orm import Session
 
-from app import models, provider
+from app import models, provider, provider_async
 from app.config import settings
 from app.security import decrypt_token
 from app.repositories import UsersRepository
 from app.repositories.mother_repository import MotherRepository
-
-RETRY_STATUS = (429, 500, 502, 503, 504)
+from app.services.services import seat_index
+from app.services.shared.stats_counters import record_transition
+from app.utils.retry_policy import RETRY_STATUSES, consume_retry
 
 
 @dataclass
@@ -23,6 +25,60 @@ class TargetSelection:
     seat_id: int
 
 
+# 以下待发送状态只保存普通值：异步路径在两次 to_thread 之间不访问 ORM 属性
+# （提交后对象已过期，读取会在事件循环上触发懒加载），完成阶段在线程中按 id 重新加载。
+
+@dataclass
+class _PendingInvite:
+    """已抢占座位并创建 InviteRequest、等待发送的邀请"""
+    mother_id: int
+    team_id: str
+    seat_id: int
+    invite_request_id: int
+    access_token: str
+
+
+@dataclass
+class _PendingResend:
+    mother_id: int
+    seat_id: int
+    invite_request_id: int
+    access_token: str
+
+
+@dataclass
+class _PendingRemoval:
+    mother_id: int
+    seat_id: int
+    member_id: Optional[str]
+    access_token: str
+
+
+@dataclass
+class _InviteLoopState:
+    """invite_email 跨多次母号切换共享的状态"""
+    group_id: Optional[int] = None
+    prefer_recent_team: bool = False
+    recent_window_days: Optional[int] = None
+    tried_mothers: set[int] = field(default_factory=set)
+    switch_remaining: int = 1
+
+    @classmethod
+    def for_code(
+        cls,
+        code_row: Optional[models.RedeemCode],
+        prefer_recent_team: bool,
+        recent_window_days: Optional[int],
+    ) -> "_InviteLoopState":
+        # 提取用户组 ID（如果码绑定了组）
+        group_id = getattr(code_row, "mother_group_id", None) if code_row else None
+        return cls(
+            group_id=group_id or None,
+            prefer_recent_team=prefer_recent_team,
+            recent_window_days=recent_window_days,
+        )
+
+
 def _clear_seat(seat: models.SeatAllocation) -> None:
     seat.status = models.SeatStatus.free
     seat.held_until = None
@@ -104,6 +160,9 @@ class InviteService:
         except Exception:
             self.mother_repo.rollback()
 
+    def _mark_mother_invalid_by_id(self, mother_id: int) -> None:
+        self._mark_mother_invalid(self.mother_repo.get(mother_id))
+
     def _choose_target(
         self,
         email: str,
@@ -118,10 +177,87 @@ class InviteService:
         - 优先填满单个母号再切换（按母号创建时间由早到晚遍历）
         - 仅考虑活跃母号，且需存在可用团队与空位
         - 同一邮箱允许加入多个 team，但同一 team 内不能重复
-        - 按批次流式遍历母号，逐个查询空座与可用团队，避免一次性加载全部数据
+        - 默认从座位可用性索引取候选母号，再由数据库校验；关闭索引时按批次流式遍历全部母号
         - 如果指定了 group_id，则仅在该用户组内选择母号
         """
-        exclude_ids = exclude_mother_ids or set()
+        recent_cutoff = (
+            datetime.utcnow() - timedelta(days=recent_window_days)
+            if prefer_recent and recent_window_days
+            else None
+        )
+        if settings.seat_index_enabled:
+            selection = self._choose_target_indexed(
+                email,
+                exclude_mother_ids or set(),
+                group_id,
+                prefer_recent=prefer_recent,
+                recent_cutoff=recent_cutoff,
+            )
+        else:
+            selection = self._choose_target_scan(
+                email,
+                exclude_mother_ids or set(),
+                group_id,
+                prefer_recent=prefer_recent,
+                recent_cutoff=recent_cutoff,
+            )
+        if selection:
+            return selection
+
+        if prefer_recent:
+            return self._choose_target(
+                email,
+                exclude_mother_ids=exclude_mother_ids,
+                group_id=group_id,
+                prefer_recent=False,
+            )
+        return None
+
+    def _choose_target_indexed(
+        self,
+        email: str,
+        exclude_ids: set[int],
+        group_id: Optional[int],
+        *,
+        prefer_recent: bool,
+        recent_cutoff: Optional[datetime],
+    ) -> Optional[TargetSelection]:
+        """从索引按序取少量候选并校验；索引过期的候选当场刷新后跳过"""
+        index = seat_index.index_for(self.pool_session)
+        index.ensure_fresh(self.pool_session)
+        skipped = set(exclude_ids)
+        while True:
+            candidate_ids = index.candidates(group_id, exclude=skipped, newest_first=prefer_recent)
+            if not candidate_ids:
+                return None
+            rows = (
+                self.pool_session.query(models.MotherAccount)
+                .filter(
+                    models.MotherAccount.id.in_(candidate_ids),
+                    models.MotherAccount.status == models.MotherStatus.active,
+                )
+                .all()
+            )
+            by_id = {m.id: m for m in rows}
+            mothers = [by_id[mid] for mid in candidate_ids if mid in by_id]
+            selection = self._choose_from_batch(
+                mothers, email, prefer_recent=prefer_recent, recent_cutoff=recent_cutoff
+            )
+            if selection:
+                return selection
+            skipped.update(candidate_ids)
+            index.refresh(self.pool_session, candidate_ids)
+
+    def _choose_target_scan(
+        self,
+        email: str,
+        exclude_ids: set[int],
+        group_id: Optional[int],
+        *,
+        prefer_recent: bool,
+        recent_cutoff: Optional[datetime],
+    ) -> Optional[TargetSelection]:
+        """按批次流式遍历全部活跃母号（索引关闭时使用）"""
 
         order_column = (
             models.MotherAccount.created_at.desc()
@@ -144,12 +280,6 @@ class InviteService:
         mothers_iter = mothers_query.yield_per(batch_size)
         batch: list[models.MotherAccount] = []
 
-        recent_cutoff = (
-            datetime.utcnow() - timedelta(days=recent_window_days)
-            if prefer_recent and recent_window_days
-            else None
-        )
-
         for mother in mothers_iter:
             batch.append(mother)
             if len(batch) >= batch_size:
@@ -166,14 +296,6 @@ class InviteService:
             )
             if selection:
                 return selection
-
-        if prefer_recent:
-            return self._choose_target(
-                email,
-                exclude_mother_ids=exclude_mother_ids,
-                group_id=group_id,
-                prefer_recent=False,
-            )
         return None
 
     def _choose_from_batch(
@@ -269,30 +391,80 @@ class InviteService:
         prefer_recent_team: bool = False,
         recent_window_days: Optional[int] = None,
     ) -> tuple[bool, str, Optional[int], Optional[int], Optional[str]]:
-        # 提取用户组 ID（如果码绑定了组）
-        target_group_id: Optional[int] = None
-        if code_row and getattr(code_row, "mother_group_id", None):
-            target_group_id = code_row.mother_group_id
-        tried_mothers: set[int] = set()
-        switch_remaining = 1
+        state = _InviteLoopState.for_code(code_row, prefer_recent_team, recent_window_days)
+        while True:
+            prepared = self._prepare_invite(email, code_row, state)
+            if not isinstance(prepared, _PendingInvite):
+                return prepared
+
+            resp: Optional[dict] = None
+            error: Optional[Exception] = None
+            try:
+                resp = provider.send_invite(prepared.access_token, prepared.team_id, email)
+            except Exception as e:
+                error = e
+
+            result = self._complete_invite(email, code_row, prepared, state, resp, error)
+            if result is not None:
+                return result
 
+    async def invite_email_async(
+        self,
+        email: str,
+        code_row: Optional[models.RedeemCode],
+        *,
+        prefer_recent_team: bool = False,
+        recent_window_days: Optional[int] = None,
+    ) -> tuple[bool, str, Optional[int], Optional[int], Optional[str]]:
+        """
+        invite_email 的异步版本：数据库阶段在线程池中短暂执行，
+        Provider 调用与退避走 asyncio，不在等待上游期间占用线程。
+        """
+        state = await asyncio.to_thread(
+            _InviteLoopState.for_code, code_row, prefer_recent_team, recent_window_days
+        )
+        while True:
+            prepared = await asyncio.to_thread(self._prepare_invite, email, code_row, state)
+            if not isinstance(prepared, _PendingInvite):
+                return prepared
+
+            resp: Optional[dict] = None
+            error: Optional[Exception] = None
+            try:
+                resp = await provider_async.send_invite(prepared.access_token, prepared.team_id, email)
+            except Exception as e:
+                error = e
+
+            result = await asyncio.to_thread(
+                self._complete_invite, email, code_row, prepared, state, resp, error
+            )
+            if result is not None:
+                return result
+
+    def _prepare_invite(
+        self,
+        email: str,
+        code_row: Optional[models.RedeemCode],
+        state: "_InviteLoopState",
+    ) -> "tuple[bool, str, Optional[int], Optional[int], Optional[str]] | _PendingInvite":
+        """选择目标、抢占座位并创建 InviteRequest；返回待发送的邀请或最终结果。"""
         while True:
             choice = self._choose_target(
                 email,
-                exclude_mother_ids=tried_mothers,
-                group_id=target_group_id,
-                prefer_recent=prefer_recent_team,
-                recent_window_days=recent_window_days,
+                exclude_mother_ids=state.tried_mothers,
+                group_id=state.group_id,
+                prefer_recent=state.prefer_recent_team,
+                recent_window_days=state.recent_window_days,
             )
             if not choice:
                 msg = "暂无可用座位（所有母号已满或团队不可用）"
-                if target_group_id:
-                    msg += f"（限定用户组 {target_group_id}）"
+                if state.group_id:
+                    msg += f"（限定用户组 {state.group_id}）"
                 return False, msg, None, None, None
 
             mother = choice.mother
             team = choice.team
-            tried_mothers.add(mother.id)
+            state.tried_mothers.add(mother.id)
 
             # 若 token 已过期，则标记为不可用并尝试下一个母号
             try:
@@ -369,8 +541,16 @@ class InviteService:
                             team_id=team.team_id,
                             email=email,
                         )
+                        .execution_options(seat_index_tracked=True, stats_tracked=True)
                     )
                     if res.rowcount == 1:
+                        seat_index.note_seat_change(self.pool_session, mother.id, -1)
+                        record_transition(
+                            self.pool_session,
+                            models.SeatAllocation,
+                            {"status": models.SeatStatus.free},
+                            {"status": models.SeatStatus.held},
+                        )
                         self.mother_repo.commit()
                         seat = self.pool_session.get(models.SeatAllocation, candidate.id)
                         break
@@ -380,8 +560,8 @@ class InviteService:
                         backoff_ms = min(backoff_ms * 2, settings.seat_claim_backoff_ms_max)
 
             if seat is None:
-                if switch_remaining > 0:
-                    switch_remaining -= 1
+                if state.switch_remaining > 0:
+                    state.switch_remaining -= 1
                     continue
                 return False, "暂无可用座位（座位被占用）", None, mother.id, team.team_id
 
@@ -393,6 +573,14 @@ class InviteService:
                 code_id=code_row.id if code_row else None,
                 status=models.InviteStatus.pending,
             )
+            # 提交前取出普通值，提交后对象即过期
+            pending = _PendingInvite(
+                mother_id=mother.id,
+                team_id=team.team_id,
+                seat_id=seat.id,
+                invite_request_id=inv.id,
+                access_token=access_token,
+            )
             try:
                 seat.invite_request_id = inv.id
                 self.pool_session.add(seat)
@@ -406,69 +594,111 @@ class InviteService:
                 self.mother_repo.commit()
                 raise
 
-            # 发送邀请
-            try:
-                resp = provider.send_invite(access_token, team.team_id, email)
-                invites = resp.get("invites", [])
-                if invites:
-                    invite_data = invites[0]
-                    inv.invite_id = invite_data.get("id")
-                    inv.status = models.InviteStatus.sent
-                    seat.invite_id = inv.invite_id
-                    seat.status = models.SeatStatus.used
-                else:
-                    inv.status = models.InviteStatus.failed
-                    inv.error_msg = "No invites in response"
-                    _clear_seat(seat)
-            except provider.ProviderError as e:
-                inv.status = models.InviteStatus.failed
-                inv.error_code = e.code
-                inv.error_msg = e.message
-                _clear_seat(seat)
-                # 401/403 代表令牌失效或权限问题：标记母号为 invalid，切换下一个母号
-                if e.status in (401, 403):
-                    try:
-                        mother.status = models.MotherStatus.invalid
-                        self.pool_session.add(mother)
-                        self.mother_repo.commit()
-                    except Exception:
-                        self.mother_repo.rollback()
+            return pending
 
-                if e.status in RETRY_STATUS and switch_remaining > 0:
-                    switch_remaining -= 1
-                    self.users_session.add(inv)
-                    self.pool_session.add(seat)
-                    self.mother_repo.commit()
-                    self.users_repo.commit()
-                    continue
-            except Exception as e:
+    def _complete_invite(
+        self,
+        email: str,
+        code_row: Optional[models.RedeemCode],
+        pending: "_PendingInvite",
+        state: "_InviteLoopState",
+        resp: Optional[dict],
+        error: Optional[Exception],
+    ) -> Optional[tuple[bool, str, Optional[int], Optional[int], Optional[str]]]:
+        """根据 Provider 结果落库；返回 None 表示需要切换母号重试。"""
+        mother = self.mother_repo.get(pending.mother_id)
+        seat = self.pool_session.get(models.SeatAllocation, pending.seat_id)
+        inv = self.users_session.get(models.InviteRequest, pending.invite_request_id)
+        team_id = pending.team_id
+        try:
+            if error is not None:
+                raise error
+            invites = resp.get("invites", [])
+            if invites:
+                invite_data = invites[0]
+                inv.invite_id = invite_data.get("id")
+                inv.status = models.InviteStatus.sent
+                seat.invite_id = inv.invite_id
+                seat.status = models.SeatStatus.used
+            else:
                 inv.status = models.InviteStatus.failed
-                inv.error_msg = str(e)
+                inv.error_msg = "No invites in response"
                 _clear_seat(seat)
+        except provider.ProviderError as e:
+            inv.status = models.InviteStatus.failed
+            inv.error_code = e.code
+            inv.error_msg = e.message
+            _clear_seat(seat)
+            # 401/403 代表令牌失效或权限问题：标记母号为 invalid，切换下一个母号
+            if e.status in (401, 403) and mother is not None:
+                try:
+                    mother.status = models.MotherStatus.invalid
+                    self.pool_session.add(mother)
+                    self.mother_repo.commit()
+                except Exception:
+                    self.mother_repo.rollback()
 
-            inv.attempt_count += 1
-            inv.last_attempt_at = datetime.utcnow()
-            self.users_session.add(inv)
-            self.pool_session.add(seat)
-            self.mother_repo.commit()
-            self.users_repo.commit()
-
-            if code_row and inv.status == models.InviteStatus.sent:
-                code_row.status = models.CodeStatus.used
-                code_row.used_by_email = email
-                code_row.used_by_team_id = team.team_id
-                code_row.used_at = datetime.utcnow()
-                self.users_session.add(code_row)
+            # 换母号重试同样计入请求级重试预算
+            if e.status in RETRY_STATUSES and state.switch_remaining > 0 and consume_retry():
+                state.switch_remaining -= 1
+                self.users_session.add(inv)
+                self.pool_session.add(seat)
+                self.mother_repo.commit()
                 self.users_repo.commit()
+                return None
+        except Exception as e:
+            inv.status = models.InviteStatus.failed
+            inv.error_msg = str(e)
+            _clear_seat(seat)
 
-            if inv.status == models.InviteStatus.sent:
-                return True, "邀请已发送", inv.id, mother.id, team.team_id
-            else:
-                # 返回中性化错误，具体错误保存在 inv.error_msg
-                return False, "邀请发送失败，请稍后重试", inv.id, mother.id, team.team_id
+        inv.attempt_count += 1
+        inv.last_attempt_at = datetime.utcnow()
+        self.users_session.add(inv)
+        self.pool_session.add(seat)
+        self.mother_repo.commit()
+        self.users_repo.commit()
+
+        if code_row and inv.status == models.InviteStatus.sent:
+            code_row.status = models.CodeStatus.used
+            code_row.used_by_email = email
+            code_row.used_by_team_id = team_id
+            code_row.used_at = datetime.utcnow()
+            self.users_session.add(code_row)
+            self.users_repo.commit()
 
+        if inv.status == models.InviteStatus.sent:
+            return True, "邀请已发送", pending.invite_request_id, pending.mother_id, team_id
+        # 返回中性化错误，具体错误保存在 inv.error_msg
+        return False, "邀请发送失败，请稍后重试", pending.invite_request_id, pending.mother_id, team_id
 
     def resend_invite(self, email: str, team_id: str) -> tuple[bool, str]:
+        prepared = self._prepare_resend(email, team_id)
+        if not isinstance(prepared, _PendingResend):
+            return prepared
+
+        resp: Optional[dict] = None
+        error: Optional[Exception] = None
+        try:
+            resp = provider.send_invite(prepared.access_token, team_id, email, resend=True)
+        except Exception as e:
+            error = e
+        return self._complete_resend(prepared, resp, error)
+
+    async def resend_invite_async(self, email: str, team_id: str) -> tuple[bool, str]:
+        """resend_invite 的异步版本"""
+        prepared = await asyncio.to_thread(self._prepare_resend, email, team_id)
+        if not isinstance(prepared, _PendingResend):
+            return prepared
+
+        resp: Optional[dict] = None
+        error: Optional[Exception] = None
+        try:
+            resp = await provider_async.send_invite(prepared.access_token, team_id, email, resend=True)
+        except Exception as e:
+            error = e
+        return await asyncio.to_thread(self._complete_resend, prepared, resp, error)
+
+    def _prepare_resend(self, email: str, team_id: str) -> "tuple[bool, str] | _PendingResend":
         seat = (
             self.pool_session.query(models.SeatAllocation)
             .filter(models.SeatAllocation.team_id == team_id, models.SeatAllocation.email == email)
@@ -486,9 +716,22 @@ class InviteService:
             return False, "操作失败，请稍后重试"
 
         access_token = decrypt_token(mother.access_token_enc)
+        return _PendingResend(
+            mother_id=mother.id, seat_id=seat.id, invite_request_id=inv.id, access_token=access_token
+        )
 
+    def _complete_resend(
+        self,
+        pending: "_PendingResend",
+        resp: Optional[dict],
+        error: Optional[Exception],
+    ) -> tuple[bool, str]:
+        mother = self.mother_repo.get(pending.mother_id)
+        seat = self.pool_session.get(models.SeatAllocation, pending.seat_id)
+        inv = self.users_session.get(models.InviteRequest, pending.invite_request_id)
         try:
-            resp = provider.send_invite(access_token, team_id, email, resend=True)
+            if error is not None:
+                raise error
             invites = resp.get("invites", [])
             if invites:
                 invite_data = invites[0]
@@ -556,20 +799,10 @@ class InviteService:
         return True, "取消成功"
 
     def remove_member(self, email: str, team_id: str) -> tuple[bool, str]:
-        seat = (
-            self.pool_session.query(models.SeatAllocation)
-            .filter(models.SeatAllocation.team_id == team_id, models.SeatAllocation.email == email)
-            .first()
-        )
-        if not seat:
-            return False, "操作失败，请稍后重试"
-
-        mother = self.mother_repo.get(seat.mother_id)
-        if not mother:
-            return False, "操作失败，请稍后重试"
-
-        access_token = decrypt_token(mother.access_token_enc)
-        member_id = seat.member_id
+        prepared = self._prepare_remove(email, team_id)
+        if not isinstance(prepared, _PendingRemoval):
+            return prepared
+        access_token, member_id = prepared.access_token, prepared.member_id
 
         if not member_id:
             try:
@@ -577,7 +810,7 @@ class InviteService:
                 member_id = _find_member_id_by_email(members_payload, email)
             except provider.ProviderError as e:
                 if e.status in (401, 403):
-                    self._mark_mother_invalid(mother)
+                    self._mark_mother_invalid_by_id(prepared.mother_id)
                 return False, "操作失败，请稍后重试"
             except Exception:
                 return False, "操作失败，请稍后重试"
@@ -589,11 +822,67 @@ class InviteService:
             provider.delete_member(access_token, team_id, member_id)
         except provider.ProviderError as e:
             if e.status in (401, 403):
-                self._mark_mother_invalid(mother)
+                self._mark_mother_invalid_by_id(prepared.mother_id)
             return False, "移除失败，请稍后重试"
         except Exception:
             return False, "移除失败，请稍后重试"
 
+        return self._complete_remove(prepared.seat_id)
+
+    async def remove_member_async(self, email: str, team_id: str) -> tuple[bool, str]:
+        """remove_member 的异步版本"""
+        prepared = await asyncio.to_thread(self._prepare_remove, email, team_id)
+        if not isinstance(prepared, _PendingRemoval):
+            return prepared
+        access_token, member_id = prepared.access_token, prepared.member_id
+
+        if not member_id:
+            try:
+                members_payload = await provider_async.list_members(access_token, team_id)
+                member_id = _find_member_id_by_email(members_payload, email)
+            except provider.ProviderError as e:
+                if e.status in (401, 403):
+                    await asyncio.to_thread(self._mark_mother_invalid_by_id, prepared.mother_id)
+                return False, "操作失败，请稍后重试"
+            except Exception:
+                return False, "操作失败，请稍后重试"
+
+            if not member_id:
+                return False, "操作失败，请稍后重试"
+
+        try:
+            await provider_async.delete_member(access_token, team_id, member_id)
+        except provider.ProviderError as e:
+            if e.status in (401, 403):
+                await asyncio.to_thread(self._mark_mother_invalid_by_id, prepared.mother_id)
+            return False, "移除失败，请稍后重试"
+        except Exception:
+            return False, "移除失败，请稍后重试"
+
+        return await asyncio.to_thread(self._complete_remove, prepared.seat_id)
+
+    def _prepare_remove(self, email: str, team_id: str) -> "tuple[bool, str] | _PendingRemoval":
+        seat = (
+            self.pool_session.query(models.SeatAllocation)
+            .filter(models.SeatAllocation.team_id == team_id, models.SeatAllocation.email == email)
+            .first()
+        )
+        if not seat:
+            return False, "操作失败，请稍后重试"
+
+        mother = self.mother_repo.get(seat.mother_id)
+        if not mother:
+            return False, "操作失败，请稍后重试"
+
+        access_token = decrypt_token(mother.access_token_enc)
+        return _PendingRemoval(
+            mother_id=mother.id, seat_id=seat.id, member_id=seat.member_id, access_token=access_token
+        )
+
+    def _complete_remove(self, seat_id: int) -> tuple[bool, str]:
+        seat = self.pool_session.get(models.SeatAllocation, seat_id)
+        if seat is None:
+            return True, "移除成功"
         _clear_seat(seat)
         self.pool_session.add(seat)
         self._commit_with_rollback()
@@ -613,3 +902,8 @@ def cancel_invite(users_db: Session, pool_db: Session, email: str, team_id: str)
 def remove_member(users_db: Session, pool_db: Session, email: str, team_id: str) -> tuple[bool, str]:
     service = InviteService(UsersRepository(users_db), MotherRepository(pool_db))
     return service.remove_member(email, team_id)
+
+
+async def resend_invite_async(users_db: Session, pool_db: Session, email: str, team_id: str) -> tuple[bool, str]:
+    service = InviteService(UsersRepository(users_db), MotherRepository(pool_db))
+    return await service.resend_invite_async(email, team_id)
@@ -7,6 +7,7 @@ from typing import Callable, List, Optional, Tuple
 from sqlalchemy.orm import Session
 
 from app import models
+from app.services.shared.stats_counters import record_transition
 from app.metrics_prom import CONTENT_TYPE_LATEST  # noqa: F401 ensure init
 try:
     from app.metrics_prom import Counter, Histogram
@@ -21,6 +22,7 @@ if Counter is not None:
 from app.repositories import UsersRepository
 from app.repositories.mother_repository import MotherRepository
 from app.services.services.invites import InviteService
+from app.utils.retry_policy import item_retry_budget
 import app.services.services.pool as pool
 from app.config import settings
 from app.database import SessionPool
@@ -61,7 +63,7 @@ def get_next_pending_job(db: Session) -> Optional[models.BatchJob]:
     # 使过期 running 的任务可再次被调度
     try:
         from sqlalchemy import update
-        db.execute(
+        res = db.execute(
             update(models.BatchJob)
             .where(
                 models.BatchJob.status == models.BatchJobStatus.running,
@@ -69,6 +71,11 @@ def get_next_pending_job(db: Session) -> Optional[models.BatchJob]:
                 models.BatchJob.visible_until < now,
             )
             .values(status=models.BatchJobStatus.pending, started_at=None, visible_until=None)
+            .execution_options(stats_tracked=True)
+        )
+        record_transition(
+            db, models.BatchJob, {"status": models.BatchJobStatus.running},
+            {"status": models.BatchJobStatus.pending}, count=res.rowcount,
         )
         db.commit()
     except Exception:
@@ -116,8 +123,13 @@ def get_next_pending_job(db: Session) -> Optional[models.BatchJob]:
                 started_at=now,
                 visible_until=now + __import__("datetime").timedelta(seconds=settings.job_visibility_timeout_seconds),
             )
+            .execution_options(stats_tracked=True)
         )
         if res.rowcount == 1:
+            record_transition(
+                db, models.BatchJob, {"status": models.BatchJobStatus.pending},
+                {"status": models.BatchJobStatus.running},
+            )
             db.commit()
             job = db.get(models.BatchJob, candidate.id)
             return job
@@ -165,14 +177,16 @@ class JobRunner:
                     continue
                 email = inv.email.strip().lower()
                 try:
-                    if action == models.BatchJobType.users_resend:
-                        ok, _ = invite_service.resend_invite(email, inv.team_id)
-                    elif action == models.BatchJobType.users_cancel:
-                        ok, _ = invite_service.cancel_invite(email, inv.team_id)
-                    elif action == models.BatchJobType.users_remove:
-                        ok, _ = invite_service.remove_member(email, inv.team_id)
-                    else:
-                        ok = False
+                    # 每个条目独立的重试预算
+                    with item_retry_budget():
+                        if action == models.BatchJobType.users_resend:
+                            ok, _ = invite_service.resend_invite(email, inv.team_id)
+                        elif action == models.BatchJobType.users_cancel:
+                            ok, _ = invite_service.cancel_invite(email, inv.team_id)
+                        elif action == models.BatchJobType.users_remove:
+                            ok, _ = invite_service.remove_member(email, inv.team_id)
+                        else:
+                            ok = False
                 except Exception:
                     invite_service.users_repo.rollback()
                     invite_service.mother_repo.rollback()
@@ -200,6 +214,42 @@ class JobRunner:
                 pool_session.close()
         return success, failed
 
+    def _run_codes_export_job(self, job: models.BatchJob) -> Tuple[int, int]:
+        from app.services.services import code_export
+
+        payload = json.loads(job.payload_json or "{}")
+        heartbeat_interval = max(5, int(settings.job_visibility_timeout_seconds / 3))
+        last_heartbeat = time.time()
+
+        def _heartbeat(rows: int) -> None:
+            nonlocal last_heartbeat
+            now_ts = time.time()
+            if now_ts - last_heartbeat < heartbeat_interval:
+                return
+            last_heartbeat = now_ts
+            try:
+                job.visible_until = datetime.utcnow() + __import__("datetime").timedelta(
+                    seconds=settings.job_visibility_timeout_seconds
+                )
+                job.success_count = rows
+                self.users_session.add(job)
+                self.users_session.commit()
+            except Exception:
+                self.users_session.rollback()
+
+        code_export.prune_exports()
+        # 读取走独立会话，心跳提交不会打断导出查询的游标
+        filename, rows = code_export.write_export_file(
+            self.users_session.get_bind(),
+            job.id,
+            payload.get("format", "csv"),
+            status=payload.get("status", "all"),
+            on_chunk=_heartbeat,
+        )
+        job.total_count = rows
+        job.metadata_json = json.dumps({"file": filename, "rows": rows}, ensure_ascii=False)
+        return rows, 0
+
     def _run_pool_sync_job(self, job: models.BatchJob) -> Tuple[int, int]:
         payload = json.loads(job.payload_json or "{}")
         mother_id = int(payload.get("mother_id"))
@@ -240,6 +290,8 @@ class JobRunner:
                 models.BatchJobType.users_remove,
             ):
                 ok, fail = self._process_users_job(job)
+            elif job.job_type == models.BatchJobType.codes_export:
+                ok, fail = self._run_codes_export_job(job)
             elif job.job_type == models.BatchJobType.pool_sync_mother:
                 try:
                     ok, fail = self._run_pool_sync_job(job)
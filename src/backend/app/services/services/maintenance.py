@@ -1,12 +1,21 @@
+import logging
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Sequence
 
-from sqlalchemy import or_
+from sqlalchemy import case, delete, exists, or_, select, update
 from sqlalchemy.orm import Session
 
 from app import models, provider
 from app.config import settings
 from app.metrics_prom import CONTENT_TYPE_LATEST  # noqa: F401 (ensure module init)
+from app.metrics_prom import (
+    invite_sync_members_scanned_total,
+    invite_sync_team_lag_seconds,
+    invite_sync_team_seconds,
+    maintenance_bulk_pass_seconds,
+    maintenance_bulk_rows_total,
+)
 try:
     from app.metrics_prom import Counter
 except Exception:
@@ -15,7 +24,40 @@ except Exception:
 from app.repositories import UsersRepository
 from app.repositories.mother_repository import MotherRepository
 from app.security import decrypt_token
+from app.services.services.health_probe import (
+    RESULT_ALIVE,
+    RESULT_INVALID,
+    RESULT_NO_TEAM,
+    mother_health_prober,
+)
+from app.services.services.seat_index import note_mothers_changed, note_seat_change
+from app.services.services.stats_rollup import StatsRollupService
 from app.services.services.switch import SwitchService
+from app.services.shared import stats_counters
+from app.services.shared.stats_counters import record_transition
+from app.utils.bulk import BulkPassResult, chunked_update
+from app.utils.locks import lease_lost
+
+
+logger = logging.getLogger(__name__)
+
+# 释放座位时清空的字段
+_FREE_SEAT_VALUES = {
+    "status": models.SeatStatus.free,
+    "held_until": None,
+    "team_id": None,
+    "email": None,
+    "invite_request_id": None,
+    "invite_id": None,
+}
+
+
+# 批量回填 member_id 时单条 CASE 语句的最大行数
+_CASE_CHUNK = 500
+
+
+def _dialect(session: Session, model):
+    return session.get_bind(model).dialect
 
 
 if Counter:
@@ -25,8 +67,8 @@ if Counter:
     )
 
 
-def _find_member_id_by_email(payload: object, email: str):
-    target = (email or "").lower()
+def _collect_member_ids(payload: object, into: dict[str, str]) -> None:
+    """遍历一次成员响应，把 小写邮箱 -> member_id 写入 into（已存在的邮箱不覆盖）"""
     stack = [payload]
     seen: set[int] = set()
     while stack:
@@ -41,11 +83,12 @@ def _find_member_id_by_email(payload: object, email: str):
                 u = cur.get("user") or cur.get("member") or cur.get("account")
                 if isinstance(u, dict):
                     cand = u.get("email") or u.get("email_address")
-            if isinstance(cand, str) and cand.lower() == target:
+            if isinstance(cand, str):
                 for k in ("id", "member_id", "user_id", "account_user_id"):
                     v = cur.get(k)
                     if v:
-                        return str(v)
+                        into.setdefault(cand.lower(), str(v))
+                        break
             for v in cur.values():
                 if isinstance(v, (dict, list)):
                     stack.append(v)
@@ -53,7 +96,6 @@ def _find_member_id_by_email(payload: object, email: str):
             for it in cur:
                 if isinstance(it, (dict, list)):
                     stack.append(it)
-    return None
 
 
 class MaintenanceService:
@@ -193,59 +235,38 @@ class MaintenanceService:
         return granted
 
     def check_mother_health(self, limit: int = 5) -> int:
-        """定期探测母号是否仍可用，更新 last_health_check/last_seen_alive。"""
-        now = datetime.utcnow()
-        grace_minutes = max(1, settings.mother_health_alive_grace_minutes)
-        threshold = now - timedelta(minutes=grace_minutes)
-        mothers = (
-            self.pool_session.query(models.MotherAccount)
-            .filter(models.MotherAccount.status == models.MotherStatus.active)
-            .filter(
-                (models.MotherAccount.last_health_check_at == None)  # noqa: E711
-                | (models.MotherAccount.last_health_check_at < threshold)
-            )
-            .order_by(models.MotherAccount.last_health_check_at.asc().nullsfirst())
-            .limit(limit)
-            .all()
-        )
-        if not mothers:
+        """定期探测母号是否仍可用，更新 last_health_check/last_seen_alive。
+
+        并发探测、限速与优先级由 mother_health_prober 负责，这里只负责落库。
+        """
+        outcomes = mother_health_prober.sweep(self.pool_session, limit)
+        if not outcomes:
             return 0
 
-        checked = 0
-        for mother in mothers:
-            checked += 1
-            mother.last_health_check_at = now
-            team = (
-                self.pool_session.query(models.MotherTeam)
-                .filter(
-                    models.MotherTeam.mother_id == mother.id,
-                    models.MotherTeam.is_enabled == True,  # noqa: E712
-                )
-                .order_by(models.MotherTeam.is_default.desc(), models.MotherTeam.created_at.asc())
-                .first()
-            )
-            if not team or not team.team_id:
-                mother.last_seen_alive_at = now
-                self.pool_session.add(mother)
+        now = datetime.utcnow()
+        mothers = {
+            m.id: m
+            for m in self.pool_session.query(models.MotherAccount)
+            .filter(models.MotherAccount.id.in_([o.mother_id for o in outcomes]))
+            .all()
+        }
+        dead_team_ids: list[str] = []
+        for outcome in outcomes:
+            mother = mothers.get(outcome.mother_id)
+            if mother is None:
                 continue
-            try:
-                access_token = decrypt_token(mother.access_token_enc)
-                provider.list_members(access_token, team.team_id, limit=1)
+            mother.last_health_check_at = now
+            if outcome.result in (RESULT_ALIVE, RESULT_NO_TEAM):
                 mother.last_seen_alive_at = now
-            except provider.ProviderError as exc:
-                if exc.status in (401, 403):
-                    mother.status = models.MotherStatus.invalid
-                    self.pool_session.add(mother)
-                    self._commit_pool()
-                    self._grant_refresh_for_team_ids([team.team_id])
-                    continue
-            except Exception:
-                # 忽略网络波动，保持原状态
-                pass
+            elif outcome.result == RESULT_INVALID:
+                mother.status = models.MotherStatus.invalid
+                dead_team_ids.append(outcome.team_id)
             self.pool_session.add(mother)
 
         self._commit_pool()
-        return checked
+        if dead_team_ids:
+            self._grant_refresh_for_team_ids(dead_team_ids)
+        return len(outcomes)
 
         requests = (
             self.users_session.query(models.SwitchRequest)
@@ -264,85 +285,155 @@ class MaintenanceService:
 
     # ------------------------------------------------------------------ #
     # Public methods
+    def _report_bulk(self, op: str, result: BulkPassResult) -> None:
+        if result.rows or result.truncated or result.lost:
+            logger.info(
+                "%s: %s rows in %s chunks, %.1fms%s",
+                op,
+                result.rows,
+                result.chunks,
+                result.elapsed_ms,
+                " (lock lost, stopped)" if result.lost
+                else " (truncated, continues next run)" if result.truncated else "",
+            )
+        try:
+            maintenance_bulk_rows_total.labels(op=op).inc(result.rows)
+            maintenance_bulk_pass_seconds.labels(op=op).observe(result.elapsed_ms / 1000)
+        except Exception:
+            pass
+
     def cleanup_stale_held(self) -> int:
+        """释放占位超时的座位：按主键分块 UPDATE，不加载 ORM 对象。"""
         now = datetime.utcnow()
-        rows = (
-            self.pool_session.query(models.SeatAllocation)
-            .filter(models.SeatAllocation.status == models.SeatStatus.held)
-            .filter(models.SeatAllocation.held_until != None)  # noqa: E711
-            .filter(models.SeatAllocation.held_until < now)
-            .all()
-        )
 
-        count = 0
-        for seat in rows:
-            seat.status = models.SeatStatus.free
-            seat.held_until = None
-            seat.team_id = None
-            seat.email = None
-            seat.invite_request_id = None
-            seat.invite_id = None
-            count += 1
-            self.pool_session.add(seat)
-
-        if count:
-            self._commit_pool()
-        return count
+        def _note_freed(rows: list[tuple]) -> None:
+            freed: dict[int, int] = {}
+            for _, mother_id in rows:
+                if mother_id is not None:
+                    freed[mother_id] = freed.get(mother_id, 0) + 1
+            for mother_id, count in freed.items():
+                note_seat_change(self.pool_session, mother_id, count)
+            record_transition(
+                self.pool_session,
+                models.SeatAllocation,
+                {"status": models.SeatStatus.held},
+                {"status": models.SeatStatus.free},
+                count=len(rows),
+            )
+
+        result = chunked_update(
+            self.pool_session,
+            models.SeatAllocation,
+            where=(
+                models.SeatAllocation.status == models.SeatStatus.held,
+                models.SeatAllocation.held_until.isnot(None),
+                models.SeatAllocation.held_until < now,
+            ),
+            values=dict(_FREE_SEAT_VALUES),
+            returning=(models.SeatAllocation.mother_id,),
+            chunk_size=settings.maintenance_bulk_chunk_size,
+            max_seconds=settings.maintenance_bulk_max_seconds,
+            execution_options={"seat_index_tracked": True, "stats_tracked": True},
+            on_chunk=_note_freed,
+            commit=self._commit_pool,
+        )
+        self._report_bulk("cleanup_stale_held", result)
+        return result.rows
 
     def cleanup_expired_mother_teams(self) -> int:
-        """删除已过期母号的团队，并清理其席位。"""
+        """删除已过期母号的团队，并清理其席位（按母号分块的集合操作）。"""
         now = datetime.utcnow()
-        mothers = (
-            self.pool_session.query(models.MotherAccount)
-            .filter(models.MotherAccount.token_expires_at != None)  # noqa: E711
-            .filter(models.MotherAccount.token_expires_at < now)
-            .all()
+        Mother, Team, Seat = models.MotherAccount, models.MotherTeam, models.SeatAllocation
+        seat_dirty = or_(
+            Seat.status != models.SeatStatus.free,
+            Seat.team_id.isnot(None),
+            Seat.email.isnot(None),
         )
+        # 已处理过（已失效、无团队、座位已清空）的母号不再重复处理
+        pending = (
+            Mother.token_expires_at.isnot(None),
+            Mother.token_expires_at < now,
+            or_(
+                Mother.status != models.MotherStatus.invalid,
+                exists().where(Team.mother_id == Mother.id),
+                exists().where(Seat.mother_id == Mother.id, seat_dirty),
+            ),
+        )
+        # 每个母号带若干座位，按母号数折算块大小
+        chunk = max(1, settings.maintenance_bulk_chunk_size // 10)
+        tracked = {"seat_index_tracked": True, "synchronize_session": False}
+        delete_returning = _dialect(self.pool_session, Team).delete_returning
 
+        result = BulkPassResult()
+        started = time.monotonic()
         total_deleted_teams = 0
-        changed = False
-        if not mothers:
-            return 0
-
-        for mother in mothers:
-            teams = (
-                self.pool_session.query(models.MotherTeam)
-                .filter(models.MotherTeam.mother_id == mother.id)
-                .all()
-            )
-            team_ids = [team.team_id for team in teams if team.team_id]
-            seats = (
-                self.pool_session.query(models.SeatAllocation)
-                .filter(models.SeatAllocation.mother_id == mother.id)
-                .all()
+        while True:
+            if lease_lost():
+                result.lost = True
+                break
+            mother_ids = list(
+                self.pool_session.execute(
+                    select(Mother.id).where(*pending).order_by(Mother.id).limit(chunk)
+                ).scalars()
             )
-            for seat in seats:
-                seat.status = models.SeatStatus.free
-                seat.held_until = None
-                seat.team_id = None
-                seat.email = None
-                seat.invite_request_id = None
-                seat.invite_id = None
-                seat.member_id = None
-                self.pool_session.add(seat)
-                changed = True
-
-            deleted = (
-                self.pool_session.query(models.MotherTeam)
-                .filter(models.MotherTeam.mother_id == mother.id)
-                .delete()
+            if not mother_ids:
+                break
+
+            seat_rows = self.pool_session.execute(
+                update(Seat)
+                .where(Seat.mother_id.in_(mother_ids), seat_dirty)
+                .values(member_id=None, **_FREE_SEAT_VALUES)
+                .execution_options(**tracked)
+            ).rowcount or 0
+            delete_teams = delete(Team).where(Team.mother_id.in_(mother_ids)).execution_options(**tracked)
+            if delete_returning:
+                team_ids = list(self.pool_session.execute(delete_teams.returning(Team.team_id)).scalars())
+                deleted = len(team_ids)
+            else:
+                team_ids = list(
+                    self.pool_session.execute(
+                        select(Team.team_id).where(Team.mother_id.in_(mother_ids))
+                    ).scalars()
+                )
+                deleted = self.pool_session.execute(delete_teams).rowcount or 0
+            self.pool_session.execute(
+                update(Mother)
+                .where(Mother.id.in_(mother_ids))
+                .values(status=models.MotherStatus.invalid)
+                .execution_options(**tracked)
             )
-            total_deleted_teams += deleted
-            mother.status = models.MotherStatus.invalid
-            self.pool_session.add(mother)
-            changed = True
+            note_mothers_changed(self.pool_session, mother_ids)
+            self._commit_pool()
+
+            team_ids = [t for t in team_ids if t]
             if team_ids:
                 self._grant_refresh_for_team_ids(team_ids)
 
-        if changed:
-            self._commit_pool()
+            total_deleted_teams += deleted
+            result.rows += len(mother_ids) + seat_rows + deleted
+            result.chunks += 1
+            if len(mother_ids) < chunk:
+                break
+            if time.monotonic() - started >= settings.maintenance_bulk_max_seconds:
+                result.truncated = True
+                break
+
+        result.elapsed_ms = (time.monotonic() - started) * 1000
+        self._report_bulk("cleanup_expired_mother_teams", result)
         return total_deleted_teams
 
+    def reconcile_stats_counters(self) -> int:
+        """用 GROUP BY 重建两个域的统计计数器，纠正批量语句或外部写入造成的偏差。"""
+        written = stats_counters.reconcile(self.users_session, stats_counters.DOMAIN_USERS)
+        self._commit_users()
+        written += stats_counters.reconcile(self.pool_session, stats_counters.DOMAIN_POOL)
+        self._commit_pool()
+        return written
+
+    def rollup_hourly_stats(self) -> int:
+        """把已结束的小时汇总进 stats_hourly_rollups（幂等，可重复运行）。"""
+        return StatsRollupService(self.users_session).run()
+
     def cleanup_expired_codes(self, limit: int = 50) -> int:
         """Deactivate expired redeem codes并自动移除对应成员。"""
         now = datetime.utcnow()
@@ -417,38 +508,92 @@ class MaintenanceService:
                     self.users_repo.rollback()
         return processed
 
+    def _fetch_member_index(self, access_token: str, team_id: str) -> tuple[dict[str, str], int]:
+        """拉取团队全部成员页，返回 (小写邮箱 -> member_id, 页数)"""
+        index: dict[str, str] = {}
+        pages = 0
+        for payload in provider.iter_member_pages(
+            access_token,
+            team_id,
+            page_size=settings.invite_sync_page_size,
+            max_pages=settings.invite_sync_max_pages,
+        ):
+            pages += 1
+            _collect_member_ids(payload, index)
+        return index, pages
+
+    def _apply_acceptances(
+        self, mother_id: int, team_id: str, matches: list[tuple[int, str, str]]
+    ) -> int:
+        """按团队批量回填：邀请与座位各一条 UPDATE ... CASE（超长时分块）"""
+        updated = 0
+        for i in range(0, len(matches), _CASE_CHUNK):
+            chunk = matches[i:i + _CASE_CHUNK]
+            by_invite = {inv_id: member_id for inv_id, _, member_id in chunk}
+            by_email = {email: member_id for _, email, member_id in chunk}
+            accepted = self.users_session.execute(
+                update(models.InviteRequest)
+                .where(
+                    models.InviteRequest.id.in_(list(by_invite)),
+                    models.InviteRequest.status == models.InviteStatus.sent,
+                )
+                .values(
+                    status=models.InviteStatus.accepted,
+                    member_id=case(by_invite, value=models.InviteRequest.id),
+                )
+                .execution_options(synchronize_session=False, stats_tracked=True)
+            ).rowcount or 0
+            record_transition(
+                self.users_session,
+                models.InviteRequest,
+                {"status": models.InviteStatus.sent},
+                {"status": models.InviteStatus.accepted},
+                count=accepted,
+            )
+            updated += accepted
+            self.pool_session.execute(
+                update(models.SeatAllocation)
+                .where(
+                    models.SeatAllocation.mother_id == mother_id,
+                    models.SeatAllocation.team_id == team_id,
+                    models.SeatAllocation.email.in_(list(by_email)),
+                )
+                .values(member_id=case(by_email, value=models.SeatAllocation.email))
+                .execution_options(synchronize_session=False, seat_index_tracked=True, stats_tracked=True)
+            )
+        return updated
+
     def sync_invite_acceptance(self, *, days: int = 30, limit_groups: int = 20) -> int:
-        """同步邀请接受状态：将已加入团队的用户标记为 accepted，并回填 member_id。"""
+        """同步邀请接受状态：将已加入团队的用户标记为 accepted，并回填 member_id。
+
+        每个团队拉取全部成员页并建立一次 邮箱 -> member_id 索引，邀请与座位按团队批量更新。
+        """
         from sqlalchemy import func
 
         now = datetime.utcnow()
         since = now.replace(microsecond=0) - timedelta(days=days)
+        touched_at = func.coalesce(models.InviteRequest.updated_at, models.InviteRequest.created_at)
 
         q = (
             self.users_session.query(
                 models.InviteRequest.team_id,
                 func.count(models.InviteRequest.id),
+                func.min(touched_at),
             )
             .filter(
                 models.InviteRequest.status == models.InviteStatus.sent,
-                func.coalesce(
-                    models.InviteRequest.updated_at, models.InviteRequest.created_at
-                )
-                >= since,
+                touched_at >= since,
             )
             .group_by(models.InviteRequest.team_id)
-            .order_by(
-                func.max(
-                    func.coalesce(
-                        models.InviteRequest.updated_at, models.InviteRequest.created_at
-                    )
-                ).desc()
-            )
+            .order_by(func.max(touched_at).desc())
         )
 
         updated_total = 0
         groups = q.limit(limit_groups).all()
-        for team_id, _ in groups:
+        for team_id, pending_count, oldest in groups:
+            if lease_lost():
+                logger.warning("sync_invite_acceptance: lock lost, stopping after %s updates", updated_total)
+                break
             if not team_id:
                 continue
 
@@ -468,9 +613,12 @@ class MaintenanceService:
                 continue
 
             for mother, team in mother_teams:
+                if lease_lost():
+                    break
+                t0 = time.monotonic()
                 try:
                     access_token = decrypt_token(mother.access_token_enc)
-                    payload = provider.list_members(access_token, team_id)
+                    member_index, pages = self._fetch_member_index(access_token, team_id)
                 except provider.ProviderError as e:
                     if e.status in (401, 403):
                         self._mark_mother_invalid(mother)
@@ -478,48 +626,70 @@ class MaintenanceService:
                 except Exception:
                     continue
 
-                invites = (
-                    self.users_session.query(models.InviteRequest)
-                    .filter(
+                invites = self.users_session.execute(
+                    select(models.InviteRequest.id, models.InviteRequest.email).where(
                         models.InviteRequest.team_id == team_id,
                         models.InviteRequest.status == models.InviteStatus.sent,
                     )
-                    .all()
-                )
+                ).all()
+                matches = [
+                    (inv_id, email, member_index[(email or "").lower()])
+                    for inv_id, email in invites
+                    if (email or "").lower() in member_index
+                ]
 
                 updated_in_group = 0
-                for inv in invites:
-                    member_id = _find_member_id_by_email(payload, inv.email)
-                    if not member_id:
-                        continue
-                    seat = (
-                        self.pool_session.query(models.SeatAllocation)
-                        .filter(
-                            models.SeatAllocation.mother_id == mother.id,
-                            models.SeatAllocation.team_id == team_id,
-                            models.SeatAllocation.email == inv.email,
-                    )
-                    .first()
-                )
-                if seat:
-                    seat.member_id = member_id
-                    self.pool_session.add(seat)
-                inv.member_id = member_id
-                inv.status = models.InviteStatus.accepted
-                self.users_session.add(inv)
-                updated_in_group += 1
-
-            if updated_in_group:
-                updated_total += updated_in_group
-                self._commit_both()
-                if Counter:
+                if matches:
                     try:
-                        invite_accept_updates_total.inc(updated_in_group)
+                        updated_in_group = self._apply_acceptances(mother.id, team_id, matches)
+                        self._commit_both()
                     except Exception:
-                        pass
+                        logger.exception("sync_invite_acceptance: bulk update failed for team %s", team_id)
+                        continue
+
+                elapsed = time.monotonic() - t0
+                lag = (now - oldest).total_seconds() if isinstance(oldest, datetime) else None
+                self._report_invite_sync(team_id, len(invites), len(member_index), pages, updated_in_group, lag, elapsed)
+                if updated_in_group:
+                    updated_total += updated_in_group
+                    if Counter:
+                        try:
+                            invite_accept_updates_total.inc(updated_in_group)
+                        except Exception:
+                            pass
 
         return updated_total
 
+    @staticmethod
+    def _report_invite_sync(
+        team_id: str,
+        pending: int,
+        members: int,
+        pages: int,
+        accepted: int,
+        lag_seconds: Optional[float],
+        elapsed: float,
+    ) -> None:
+        """单个团队的对账报告：最老待确认邀请的滞后时间与处理吞吐"""
+        throughput = members / elapsed if elapsed > 0 else 0.0
+        logger.info(
+            "sync_invite_acceptance team=%s pending=%s accepted=%s members=%s pages=%s lag=%ss %.0f members/s",
+            team_id,
+            pending,
+            accepted,
+            members,
+            pages,
+            None if lag_seconds is None else int(lag_seconds),
+            throughput,
+        )
+        try:
+            if lag_seconds is not None:
+                invite_sync_team_lag_seconds.observe(lag_seconds)
+            invite_sync_members_scanned_total.inc(members)
+            invite_sync_team_seconds.observe(elapsed)
+        except Exception:
+            pass
+
 
 def create_maintenance_service(users_session: Session, pool_session: Session) -> MaintenanceService:
     return MaintenanceService(UsersRepository(users_session), MotherRepository(pool_session))
@@ -176,7 +176,7 @@ def enqueue_pool_group_sync(
     lock_token = None
     lock_name = f"pool_sync:{int(mother_id)}:{int(group_id)}"
     try:
-        lock_client, lock_token = try_acquire_lock(lock_name, ttl_seconds=60)
+        lock_client, lock_token = try_acquire_lock(lock_name, ttl_seconds=60, renew=False)
     except Exception:
         lock_client, lock_token = None, None
 
@@ -9,6 +9,7 @@ from sqlalchemy.orm import Session
 
 from app import models
 from app.services.shared.capacity_guard import CapacityGuard
+from app.services.shared.stats_counters import DOMAIN_POOL, DOMAIN_USERS, CounterSnapshot, read_counters
 from app.config import settings
 
 
@@ -61,12 +62,14 @@ class QuotaService:
         )
 
     @staticmethod
-    def count_used_codes(users_db: Session) -> int:
-        return users_db.query(models.RedeemCode).filter(models.RedeemCode.status == models.CodeStatus.used).count()
+    def count_used_codes(users_db: Session, counters: CounterSnapshot | None = None) -> int:
+        counters = counters or read_counters(users_db, DOMAIN_USERS)
+        return counters.get("codes.status", models.CodeStatus.used.value)
 
     @staticmethod
-    def count_total_codes(users_db: Session) -> int:
-        return users_db.query(models.RedeemCode).count()
+    def count_total_codes(users_db: Session, counters: CounterSnapshot | None = None) -> int:
+        counters = counters or read_counters(users_db, DOMAIN_USERS)
+        return counters.get("codes")
 
     @staticmethod
     def count_free_seats(pool_db: Session) -> int:
@@ -84,32 +87,38 @@ class QuotaService:
         return int(query.scalar() or 0)
 
     @staticmethod
-    def count_used_seats(pool_db: Session) -> int:
-        return (
-            pool_db.query(models.SeatAllocation)
-            .filter(models.SeatAllocation.status.in_([models.SeatStatus.held, models.SeatStatus.used]))
-            .count()
+    def count_used_seats(pool_db: Session, counters: CounterSnapshot | None = None) -> int:
+        counters = counters or read_counters(pool_db, DOMAIN_POOL)
+        return counters.get("seats.status", models.SeatStatus.held.value) + counters.get(
+            "seats.status", models.SeatStatus.used.value
         )
 
     @staticmethod
-    def count_pending_invites(users_db: Session) -> int:
-        return (
-            users_db.query(models.InviteRequest)
-            .filter(models.InviteRequest.status == models.InviteStatus.pending)
-            .count()
-        )
+    def count_pending_invites(users_db: Session, counters: CounterSnapshot | None = None) -> int:
+        counters = counters or read_counters(users_db, DOMAIN_USERS)
+        return counters.get("invites.status", models.InviteStatus.pending.value)
 
     @classmethod
-    def get_quota_snapshot(cls, users_db: Session, pool_db: Session) -> QuotaSnapshot:
+    def get_quota_snapshot(
+        cls,
+        users_db: Session,
+        pool_db: Session,
+        *,
+        users_counters: CounterSnapshot | None = None,
+        pool_counters: CounterSnapshot | None = None,
+    ) -> QuotaSnapshot:
         now = datetime.utcnow()
-        total_codes = cls.count_total_codes(users_db)
-        used_codes = cls.count_used_codes(users_db)
+        # 计数类指标各域一条 SELECT 读计数器表；容量仍需按存活宽限期现算
+        users_counters = users_counters or read_counters(users_db, DOMAIN_USERS)
+        pool_counters = pool_counters or read_counters(pool_db, DOMAIN_POOL)
+        total_codes = cls.count_total_codes(users_db, users_counters)
+        used_codes = cls.count_used_codes(users_db, users_counters)
         guard = CapacityGuard(users_db, pool_db)
-        capacity = guard.snapshot()
+        capacity = guard.snapshot(users_counters=users_counters)
         active_codes = capacity.reserved_codes
         free_seats = capacity.total_slots
-        used_seats = cls.count_used_seats(pool_db)
-        pending_invites = cls.count_pending_invites(users_db)
+        used_seats = cls.count_used_seats(pool_db, pool_counters)
+        pending_invites = cls.count_pending_invites(users_db, users_counters)
         remaining_quota = max(0, capacity.available_slots)
         return QuotaSnapshot(
             total_codes=total_codes,
@@ -2,6 +2,7 @@
 限流器服务
 """
 import logging
+import time
 from typing import Optional
 
 try:
@@ -9,6 +10,11 @@ try:
 except ImportError:  # pragma: no cover - optional dependency
     redis = None
 
+try:  # pragma: no cover - optional dependency
+    import redis as redis_sync  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    redis_sync = None
+
 try:  # pragma: no cover - optional dependency
     from redis.exceptions import RedisError
 except Exception:  # pragma: no cover
@@ -22,13 +28,20 @@ from app.utils.utils.rate_limiter import (
     RateLimitConfig,
     RateLimiter,
 )
-from app.utils.utils.rate_limiter.strategies import IPKeyStrategy, EmailKeyStrategy, PathKeyStrategy
+from app.utils.utils.rate_limiter.strategies import (
+    EmailKeyStrategy,
+    IPKeyStrategy,
+    JSONBodyKeyStrategy,
+    PathKeyStrategy,
+)
 
 logger = logging.getLogger(__name__)
 
 # 全局限流器实例
 _rate_limiter: Optional[RateLimiter] = None
 _redis_client: Optional[redis.Redis] = None
+_sync_redis_client = None
+_sync_redis_checked_at = 0.0
 
 
 async def get_redis_client() -> Optional[redis.Redis]:
@@ -53,6 +66,44 @@ async def get_redis_client() -> Optional[redis.Redis]:
     return _redis_client
 
 
+def get_sync_redis_client():
+    """
+    获取同步 Redis 客户端（与限流器使用同一 Redis 配置）
+
+    供线程内的同步调用方（如 Provider 熔断器）共享；连接失败时返回 None，
+    30 秒内不再重试，避免每次调用都等待连接超时。
+    """
+    global _sync_redis_client, _sync_redis_checked_at
+    if _sync_redis_client is not None or redis_sync is None:
+        return _sync_redis_client
+    now = time.monotonic()
+    if _sync_redis_checked_at and now - _sync_redis_checked_at < 30:
+        return None
+    _sync_redis_checked_at = now
+    try:
+        client = redis_sync.Redis.from_url(
+            settings.redis_url,
+            decode_responses=True,
+            password=settings.redis_password,
+            socket_timeout=settings.redis_socket_timeout_seconds,
+            socket_connect_timeout=settings.redis_socket_timeout_seconds,
+        )
+        client.ping()
+        _sync_redis_client = client
+    except Exception as e:
+        logger.debug("Sync Redis unavailable (%s)", e)
+        _sync_redis_client = None
+    return _sync_redis_client
+
+
+def _memory_limiter(default_config: RateLimitConfig) -> MemoryTokenBucketLimiter:
+    return MemoryTokenBucketLimiter(
+        default_config,
+        max_keys=settings.rate_limit_memory_max_keys,
+        idle_seconds=settings.rate_limit_memory_idle_seconds,
+    )
+
+
 async def init_rate_limiter() -> RateLimiter:
     """初始化限流器"""
     global _rate_limiter
@@ -61,7 +112,7 @@ async def init_rate_limiter() -> RateLimiter:
 
     if not settings.rate_limit_enabled:
         logger.info("Rate limiting is disabled")
-        _rate_limiter = MemoryTokenBucketLimiter(RateLimitConfig(capacity=1000, refill_rate=100.0))
+        _rate_limiter = _memory_limiter(RateLimitConfig(capacity=1000, refill_rate=100.0))
         return _rate_limiter
 
     redis_client = await get_redis_client()
@@ -78,6 +129,7 @@ async def init_rate_limiter() -> RateLimiter:
                 redis_client,
                 default_config,
                 namespace=settings.rate_limit_namespace,
+                fallback=_memory_limiter(default_config),
             )
             logger.info("Redis rate limiter initialized successfully")
         except Exception as e:
@@ -87,7 +139,7 @@ async def init_rate_limiter() -> RateLimiter:
                     "set RATE_LIMIT_ALLOW_MEMORY_FALLBACK=true to permit in-memory fallback."
                 ) from e
             logger.error(f"Failed to initialize Redis rate limiter: {e}. Using memory limiter.")
-            _rate_limiter = MemoryTokenBucketLimiter(RateLimitConfig(capacity=60, refill_rate=1.0))
+            _rate_limiter = _memory_limiter(RateLimitConfig(capacity=60, refill_rate=1.0))
     else:
         if settings.rate_limit_enabled and not settings.rate_limit_allow_memory_fallback:
             raise RuntimeError(
@@ -95,7 +147,7 @@ async def init_rate_limiter() -> RateLimiter:
                 "configure Redis or set RATE_LIMIT_ALLOW_MEMORY_FALLBACK=true to allow in-memory fallback."
             )
         logger.info("Using memory rate limiter")
-        _rate_limiter = MemoryTokenBucketLimiter(RateLimitConfig(capacity=60, refill_rate=1.0))
+        _rate_limiter = _memory_limiter(RateLimitConfig(capacity=60, refill_rate=1.0))
 
     try:
         await setup_rate_limit_configs()
@@ -116,6 +168,13 @@ async def setup_rate_limit_configs():
             expire_seconds=3600,
             name="redeem_ip"
         ),
+        # 兑换码接口：同一邮箱每小时5次（与按IP在同一次检查中完成）
+        "redeem:by_email": RateLimitConfig(
+            capacity=5,
+            refill_rate=5.0 / 3600.0,
+            expire_seconds=3600,
+            name="redeem_email"
+        ),
         # 重发邀请：每小时3次
         "resend:by_ip": RateLimitConfig(
             capacity=3,
@@ -170,9 +229,22 @@ async def close_rate_limiter():
         finally:
             _redis_client = None
     _rate_limiter = None
+    _close_sync_redis_client()
+
+
+def _close_sync_redis_client() -> None:
+    global _sync_redis_client, _sync_redis_checked_at
+    if _sync_redis_client is not None:
+        try:
+            _sync_redis_client.close()
+        except Exception:
+            logger.debug("Error closing sync Redis client", exc_info=True)
+    _sync_redis_client = None
+    _sync_redis_checked_at = 0.0
 
 
 # 键策略实例
 ip_strategy = IPKeyStrategy()
 email_strategy = EmailKeyStrategy()
+email_body_strategy = JSONBodyKeyStrategy("email")
 path_strategy = PathKeyStrategy()
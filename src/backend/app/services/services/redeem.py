@@ -1,4 +1,7 @@
+import asyncio
+import csv
 import hashlib
+import io
 import os
 from typing import Optional, Tuple
 from sqlalchemy.orm import Session
@@ -7,6 +10,7 @@ from datetime import datetime, timedelta
 from app import models
 from app.config import settings
 from app.services.services.invites import InviteService
+from app.services.shared.stats_counters import record_transition
 from app.repositories import UsersRepository
 from app.repositories.mother_repository import MotherRepository
 from app.database import SessionPool
@@ -26,9 +30,13 @@ def generate_codes(
     sku_slug: str,
     lifecycle_plan: Optional[str] = None,
     switch_limit: Optional[int] = None,
+    mother_group_id: Optional[int] = None,
 ) -> Tuple[str, list[str]]:
+    """批量生成兑换码：整批行在内存中构建（含分组），分块批量写入，一次提交。
+
+    code_hash 唯一冲突的行（ON CONFLICT DO NOTHING 未返回的）只为这些行重新生成并重试。
+    """
     batch = batch_id or datetime.utcnow().strftime("%Y%m%d%H%M%S")
-    codes: list[str] = []
     resolved_plan = settings.resolve_lifecycle_plan(lifecycle_plan)
     resolved_switch_limit = (
         switch_limit if switch_limit is not None else settings.code_default_switch_limit
@@ -41,26 +49,145 @@ def generate_codes(
     if resolved_switch_limit is not None:
         resolved_switch_limit = max(1, min(100, resolved_switch_limit))
 
-    for _ in range(count):
+    now = datetime.utcnow()
+    template = {
+        "batch_id": batch,
+        "status": models.CodeStatus.unused,
+        "expires_at": expires_at,
+        "lifecycle_plan": models.RedeemCodeLifecycle(resolved_plan),
+        "switch_limit": resolved_switch_limit,
+        "switch_count": 0,
+        "active": True,
+        "sku_id": sku.id,
+        "refresh_limit": sku.default_refresh_limit,
+        "refresh_used": 0,
+        "mother_group_id": mother_group_id,
+        "created_at": now,
+    }
+
+    codes: list[str] = []
+    pending = count
+    try:
+        for _ in range(_GENERATE_MAX_ROUNDS):
+            if pending <= 0:
+                break
+            plain = _new_codes(pending, prefix)
+            by_hash = {hash_code(code): code for code in plain}
+            inserted = _bulk_insert_codes(db, [{**template, "code_hash": h} for h in by_hash])
+            codes.extend(by_hash[h] for h in by_hash if h in inserted)
+            pending = count - len(codes)
+        if pending > 0:
+            raise RuntimeError(f"兑换码生成冲突过多，仍有 {pending} 个未写入")
+        record_transition(
+            db,
+            models.RedeemCode,
+            None,
+            {"status": models.CodeStatus.unused, "active": True, "batch_id": batch},
+            count=len(codes),
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return batch, codes
+
+
+_GENERATE_MAX_ROUNDS = 5
+
+
+def _new_codes(count: int, prefix: Optional[str]) -> list[str]:
+    out: set[str] = set()
+    while len(out) < count:
         rand = base36(os.urandom(16))
-        code = f"{prefix}{rand}" if prefix else rand
-        codes.append(code)
-        db.add(
-            models.RedeemCode(
-                code_hash=hash_code(code),
-                batch_id=batch,
-                expires_at=expires_at,
-                lifecycle_plan=models.RedeemCodeLifecycle(resolved_plan),
-                switch_limit=resolved_switch_limit,
-                switch_count=0,
-                active=True,
-                sku_id=sku.id,
-                refresh_limit=sku.default_refresh_limit,
+        out.add(f"{prefix}{rand}" if prefix else rand)
+    return list(out)
+
+
+def _bulk_insert_codes(db: Session, rows: list[dict]) -> set[str]:
+    """写入兑换码行，返回实际写入的 code_hash（已存在的被跳过）"""
+    table = models.RedeemCode.__table__
+    dialect = db.get_bind(models.RedeemCode).dialect.name
+    chunk_size = max(1, settings.code_generate_chunk_size)
+    inserted: set[str] = set()
+    if dialect == "postgresql" and _copy_supported(db):
+        for i in range(0, len(rows), chunk_size):
+            inserted |= _copy_insert_codes(db, rows[i:i + chunk_size])
+        return inserted
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        for i in range(0, len(rows), chunk_size):
+            stmt = (
+                dialect_insert(table)
+                .values(rows[i:i + chunk_size])
+                .on_conflict_do_nothing(index_elements=[table.c.code_hash])
+                .returning(table.c.code_hash)
+                .execution_options(stats_tracked=True)
             )
+            inserted.update(db.execute(stmt).scalars())
+        return inserted
+    # 其他方言：先查出已存在的哈希，其余 executemany 写入
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        existing = set(
+            db.execute(select(table.c.code_hash).where(table.c.code_hash.in_([r["code_hash"] for r in chunk])))
+            .scalars()
         )
+        fresh = [r for r in chunk if r["code_hash"] not in existing]
+        if fresh:
+            db.execute(table.insert().execution_options(stats_tracked=True), fresh)
+            inserted.update(r["code_hash"] for r in fresh)
+    return inserted
+
+
+_COPY_COLUMNS = (
+    "code_hash", "batch_id", "status", "expires_at", "lifecycle_plan", "switch_limit", "switch_count",
+    "active", "sku_id", "refresh_limit", "refresh_used", "mother_group_id", "created_at",
+)
 
-    db.commit()
-    return batch, codes
+
+def _copy_supported(db: Session) -> bool:
+    return db.get_bind(models.RedeemCode).dialect.driver == "psycopg2"
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(getattr(value, "name", value))
+
+
+def _copy_insert_codes(db: Session, rows: list[dict]) -> set[str]:
+    """PostgreSQL：COPY 到会话内临时表，再 INSERT ... SELECT ... ON CONFLICT DO NOTHING"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([_copy_value(row[c]) for c in _COPY_COLUMNS])
+    buf.seek(0)
+
+    cols = ", ".join(_COPY_COLUMNS)
+    conn = db.connection()
+    # 临时表只复制列类型（不带约束与序列默认值），事务结束时自动删除
+    conn.exec_driver_sql(
+        f"CREATE TEMP TABLE IF NOT EXISTS redeem_codes_staging ON COMMIT DROP AS "
+        f"SELECT {cols} FROM redeem_codes WITH NO DATA"
+    )
+    conn.exec_driver_sql("TRUNCATE redeem_codes_staging")
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY redeem_codes_staging ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+    finally:
+        cursor.close()
+    result = conn.exec_driver_sql(
+        f"INSERT INTO redeem_codes ({cols}) SELECT {cols} FROM redeem_codes_staging "
+        "ON CONFLICT (code_hash) DO NOTHING RETURNING code_hash"
+    )
+    return {r[0] for r in result}
 
 
 def base36(b: bytes) -> str:
@@ -74,9 +201,12 @@ def base36(b: bytes) -> str:
     return s
 
 
+RedeemResult = Tuple[bool, str, Optional[int], Optional[int], Optional[str]]
+
+
 def redeem_code(
     db: Session, code: str, email: str
-) -> Tuple[bool, str, Optional[int], Optional[int], Optional[str]]:
+) -> RedeemResult:
     """
     Atomic redemption to prevent double-spend under concurrency.
     Strategy:
@@ -84,6 +214,56 @@ def redeem_code(
     - Others: CAS update from unused -> blocked
     - On success: mark code used; on failure: rollback to unused
     """
+    row, error = _claim_code(db, code)
+    if error:
+        return error
+
+    pool_session = None
+    try:
+        pool_session = SessionPool()
+        svc = InviteService(UsersRepository(db), MotherRepository(pool_session))
+        result = svc.invite_email(email, row)
+        return _finish_redeem(db, row, email, result)
+    except Exception:
+        return _release_code(db, row)
+    finally:
+        if pool_session is not None:
+            try:
+                pool_session.close()
+            except Exception:
+                pass
+
+
+async def redeem_code_async(
+    db: Session, code: str, email: str
+) -> RedeemResult:
+    """
+    redeem_code 的异步版本：数据库阶段在线程池中执行，邀请发送走 InviteService.invite_email_async。
+    """
+    row, error = await asyncio.to_thread(_claim_code, db, code)
+    if error:
+        return error
+
+    pool_session = None
+    try:
+        pool_session = SessionPool()
+        svc = InviteService(UsersRepository(db), MotherRepository(pool_session))
+        result = await svc.invite_email_async(email, row)
+        return await asyncio.to_thread(_finish_redeem, db, row, email, result)
+    except Exception:
+        return await asyncio.to_thread(_release_code, db, row)
+    finally:
+        if pool_session is not None:
+            try:
+                pool_session.close()
+            except Exception:
+                pass
+
+
+def _claim_code(
+    db: Session, code: str
+) -> Tuple[Optional[models.RedeemCode], Optional[RedeemResult]]:
+    """将兑换码从 unused 置为 blocked；返回 (row, None) 或 (None, 失败结果)。"""
     h = hash_code(code)
     now = datetime.utcnow()
 
@@ -102,11 +282,11 @@ def redeem_code(
         ).scalars().first()
 
         if not row:
-            return False, "\u5151\u6362\u7801\u65e0\u6548", None, None, None
+            return None, (False, "\u5151\u6362\u7801\u65e0\u6548", None, None, None)
         if row.status != models.CodeStatus.unused:
-            return False, "\u5151\u6362\u7801\u5df2\u4f7f\u7528\u6216\u4e0d\u53ef\u7528", None, None, None
+            return None, (False, "\u5151\u6362\u7801\u5df2\u4f7f\u7528\u6216\u4e0d\u53ef\u7528", None, None, None)
         if row.expires_at and row.expires_at < now:
-            return False, "\u5151\u6362\u7801\u5df2\u8fc7\u671f", None, None, None
+            return None, (False, "\u5151\u6362\u7801\u5df2\u8fc7\u671f", None, None, None)
 
         row.status = models.CodeStatus.blocked
         db.add(row)
@@ -121,106 +301,114 @@ def redeem_code(
                 ((models.RedeemCode.expires_at == None) | (models.RedeemCode.expires_at > now)),  # noqa: E711
             )
             .values(status=models.CodeStatus.blocked)
+            .execution_options(stats_tracked=True)
+        )
+        record_transition(
+            db, models.RedeemCode, {"status": models.CodeStatus.unused}, {"status": models.CodeStatus.blocked},
+            count=res.rowcount,
         )
         if res.rowcount != 1:
             # Re-check to return accurate message
             row = db.query(models.RedeemCode).filter(models.RedeemCode.code_hash == h).first()
             if not row:
-                return False, "\u5151\u6362\u7801\u65e0\u6548", None, None, None
+                return None, (False, "\u5151\u6362\u7801\u65e0\u6548", None, None, None)
             if row.expires_at and row.expires_at < now:
-                return False, "\u5151\u6362\u7801\u5df2\u8fc7\u671f", None, None, None
-            return False, "\u5151\u6362\u7801\u5df2\u4f7f\u7528\u6216\u4e0d\u53ef\u7528", None, None, None
+                return None, (False, "\u5151\u6362\u7801\u5df2\u8fc7\u671f", None, None, None)
+            return None, (False, "\u5151\u6362\u7801\u5df2\u4f7f\u7528\u6216\u4e0d\u53ef\u7528", None, None, None)
         db.commit()
         row = db.query(models.RedeemCode).filter(models.RedeemCode.code_hash == h).first()
 
     if not row:
-        return False, "\u5151\u6362\u7801\u65e0\u6548", None, None, None
+        return None, (False, "\u5151\u6362\u7801\u65e0\u6548", None, None, None)
 
     lifecycle_expired = bool(row.lifecycle_expires_at and row.lifecycle_expires_at < now)
     if lifecycle_expired:
         row.active = False
         db.add(row)
         db.commit()
-        return False, "\u5151\u6362\u7801\u5df2\u8fc7\u671f", None, None, None
+        return None, (False, "\u5151\u6362\u7801\u5df2\u8fc7\u671f", None, None, None)
 
     if row.active is False:
-        return False, "\u5151\u6362\u7801\u5df2\u505c\u7528", None, None, None
+        return None, (False, "\u5151\u6362\u7801\u5df2\u505c\u7528", None, None, None)
 
-    # Invite
+    return row, None
+
+
+def _finish_redeem(
+    db: Session, row: models.RedeemCode, email: str, result: RedeemResult
+) -> RedeemResult:
+    """根据邀请结果完成兑换：成功则绑定生命周期，失败则回滚为 unused。"""
+    ok, msg, invite_id, mother_id, team_id = result
+    # Redundant safeguard for success
+    if ok:
+        if row:
+            _mark_code_used(db, row, email, team_id)
+            db.commit()
+        return ok, msg, invite_id, mother_id, team_id
+    else:
+        # Rollback on failure
+        if row:
+            row.status = models.CodeStatus.unused
+            db.add(row)
+            db.commit()
+        return ok, msg, invite_id, mother_id, team_id
+
+
+def _mark_code_used(
+    db: Session, row: models.RedeemCode, email: str, team_id: Optional[str]
+) -> None:
+    """标记兑换码已使用并绑定生命周期（不提交，由调用方统一 commit）。"""
     users_repo = UsersRepository(db)
-    pool_session = None
+    now = datetime.utcnow()
+    if isinstance(row.lifecycle_plan, models.RedeemCodeLifecycle):
+        plan_value = row.lifecycle_plan.value
+    elif isinstance(row.lifecycle_plan, str) and row.lifecycle_plan:
+        plan_value = row.lifecycle_plan.lower()
+    else:
+        plan_value = settings.resolve_lifecycle_plan(None)
+    if not isinstance(row.lifecycle_plan, models.RedeemCodeLifecycle):
+        row.lifecycle_plan = models.RedeemCodeLifecycle(plan_value)
+    if row.lifecycle_started_at is None:
+        row.lifecycle_started_at = now
+        duration_days = settings.lifecycle_duration_days(plan_value)
+        row.lifecycle_expires_at = row.lifecycle_started_at + timedelta(days=duration_days)
+    if row.switch_limit is None:
+        row.switch_limit = max(1, settings.code_default_switch_limit)
+    if row.refresh_limit is None:
+        sku = getattr(row, "sku", None)
+        if sku and sku.default_refresh_limit is not None:
+            row.refresh_limit = sku.default_refresh_limit
+
+    first_bind = not row.bound_email
+    row.active = True
+    row.status = models.CodeStatus.used
+    row.used_by_email = email
+    row.used_by_team_id = team_id
+    row.used_at = now
+    if first_bind:
+        row.bound_email = email
+        row.bound_team_id = team_id
+        row.bound_at = now
+    row.current_team_id = team_id
+    row.current_team_assigned_at = now
+    db.add(row)
+    if first_bind:
+        users_repo.add_refresh_history(
+            row,
+            event_type=models.CodeRefreshEventType.bind,
+            delta_refresh=0,
+            triggered_by=email,
+            metadata={"team_id": team_id},
+        )
+
+
+def _release_code(db: Session, row: Optional[models.RedeemCode]) -> RedeemResult:
+    # Rollback and return generic error
     try:
-        pool_session = SessionPool()
-        mother_repo = MotherRepository(pool_session)
-        svc = InviteService(users_repo, mother_repo)
-        ok, msg, invite_id, mother_id, team_id = svc.invite_email(email, row)
-
-        # Redundant safeguard for success
-        if ok:
-            if row:
-                now = datetime.utcnow()
-                if isinstance(row.lifecycle_plan, models.RedeemCodeLifecycle):
-                    plan_value = row.lifecycle_plan.value
-                elif isinstance(row.lifecycle_plan, str) and row.lifecycle_plan:
-                    plan_value = row.lifecycle_plan.lower()
-                else:
-                    plan_value = settings.resolve_lifecycle_plan(None)
-                if not isinstance(row.lifecycle_plan, models.RedeemCodeLifecycle):
-                    row.lifecycle_plan = models.RedeemCodeLifecycle(plan_value)
-                if row.lifecycle_started_at is None:
-                    row.lifecycle_started_at = now
-                    duration_days = settings.lifecycle_duration_days(plan_value)
-                    row.lifecycle_expires_at = row.lifecycle_started_at + timedelta(days=duration_days)
-                if row.switch_limit is None:
-                    row.switch_limit = max(1, settings.code_default_switch_limit)
-                if row.refresh_limit is None:
-                    sku = getattr(row, "sku", None)
-                    if sku and sku.default_refresh_limit is not None:
-                        row.refresh_limit = sku.default_refresh_limit
-
-                first_bind = not row.bound_email
-                row.active = True
-                row.status = models.CodeStatus.used
-                row.used_by_email = email
-                row.used_by_team_id = team_id
-                row.used_at = now
-                if first_bind:
-                    row.bound_email = email
-                    row.bound_team_id = team_id
-                    row.bound_at = now
-                row.current_team_id = team_id
-                row.current_team_assigned_at = now
-                db.add(row)
-                if first_bind:
-                    users_repo.add_refresh_history(
-                        row,
-                        event_type=models.CodeRefreshEventType.bind,
-                        delta_refresh=0,
-                        triggered_by=email,
-                        metadata={"team_id": team_id},
-                    )
-                db.commit()
-            return ok, msg, invite_id, mother_id, team_id
-        else:
-            # Rollback on failure
-            if row:
-                row.status = models.CodeStatus.unused
-                db.add(row)
-                db.commit()
-            return ok, msg, invite_id, mother_id, team_id
+        if row:
+            row.status = models.CodeStatus.unused
+            db.add(row)
+            db.commit()
     except Exception:
-        # Rollback and return generic error
-        try:
-            if row:
-                row.status = models.CodeStatus.unused
-                db.add(row)
-                db.commit()
-        except Exception:
-            db.rollback()
-        return False, "\u5151\u6362\u5931\u8d25\uff0c\u8bf7\u7a0d\u540e\u91cd\u8bd5", None, None, None
-    finally:
-        if pool_session is not None:
-            try:
-                pool_session.close()
-            except Exception:
-                pass
+        db.rollback()
+    return False, "\u5151\u6362\u5931\u8d25\uff0c\u8bf7\u7a0d\u540e\u91cd\u8bd5", None, None, None
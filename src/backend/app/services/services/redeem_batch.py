@@ -0,0 +1,526 @@
+"""
+批量兑换
+
+面向代理商一次提交成百上千个 (兑换码, 邮箱)：
+1. 一条 UPDATE ... RETURNING 校验并锁定（unused -> blocked）全部兑换码
+2. 按用户组一次性抢占 N 个空座（PostgreSQL 用 FOR UPDATE SKIP LOCKED，其余数据库用 CAS 批量更新）
+3. 批量插入 InviteRequest，Users/Pool 各提交一次
+4. 按团队聚合邮箱，并发调用 send_invites（email_addresses 为列表）；每个团队一份独立的重试预算，
+   座位保留时间按发送阶段的最长耗时延长
+5. 根据结果批量落库：成功绑定兑换码，失败释放座位并回滚兑换码；发送期间已被回收的座位不再改动
+
+批量路径不做“换母号重试”，失败项在结果中逐条返回，可由调用方单独重试。
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
+
+from sqlalchemy import exists, or_, select, update
+from sqlalchemy.orm import Session
+
+from app import models, provider, provider_async
+from app.config import settings
+from app.security import decrypt_token
+from app.services.services import seat_index
+from app.services.services.invites import _clear_seat
+from app.services.services.redeem import _mark_code_used, hash_code
+from app.services.shared.stats_counters import record_transition
+from app.utils.retry_policy import item_retry_budget
+
+logger = logging.getLogger(__name__)
+
+MSG_INVALID = "兑换码无效"
+MSG_USED = "兑换码已使用或不可用"
+MSG_EXPIRED = "兑换码已过期"
+MSG_DISABLED = "兑换码已停用"
+MSG_DUPLICATE = "兑换码在本批次中重复"
+MSG_NO_SEAT = "暂无可用座位（所有母号已满或团队不可用）"
+
+
+@dataclass
+class BatchRedeemItem:
+    code: str
+    email: str
+
+
+@dataclass
+class BatchRedeemOutcome:
+    code: str
+    email: str
+    success: bool = False
+    message: str = ""
+    invite_request_id: Optional[int] = None
+    mother_id: Optional[int] = None
+    team_id: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "code": self.code,
+            "email": self.email,
+            "success": self.success,
+            "message": self.message,
+            "invite_request_id": self.invite_request_id,
+            "mother_id": self.mother_id,
+            "team_id": self.team_id,
+        }
+
+
+@dataclass
+class _Assignment:
+    """已锁定兑换码并分配座位、等待发送邀请的一项
+
+    team_id / mother_id / seat_id 为普通值：发送阶段在事件循环上运行，不访问已过期的 ORM 属性。
+    """
+    index: int
+    row: models.RedeemCode
+    email: str
+    seat: models.SeatAllocation
+    mother: models.MotherAccount
+    team_id: str
+    mother_id: int
+    seat_id: int
+    inv: Optional[models.InviteRequest] = None
+
+
+@dataclass
+class _BatchPlan:
+    outcomes: list[BatchRedeemOutcome]
+    assignments: list[_Assignment] = field(default_factory=list)
+    # team_id -> 已解密的母号令牌（准备阶段在线程中填好）
+    tokens: dict[str, str] = field(default_factory=dict)
+
+    def by_team(self) -> dict[str, list[_Assignment]]:
+        groups: dict[str, list[_Assignment]] = defaultdict(list)
+        for a in self.assignments:
+            groups[a.team_id].append(a)
+        return groups
+
+
+def _send_window_seconds(groups: int) -> float:
+    """发送阶段最长耗时：按并发度分批，每批以单个团队的截止时间（加一次读超时）为上限"""
+    per_team = settings.request_deadline_seconds
+    if per_team <= 0:
+        per_team = settings.provider_read_timeout_seconds * (max(0, settings.request_retry_budget) + 1)
+    waves = -(-groups // max(1, settings.redeem_batch_concurrency))
+    return waves * (per_team + settings.provider_read_timeout_seconds)
+
+
+def _is_pg(session: Session) -> bool:
+    dialect = getattr(getattr(session, "bind", None), "dialect", None)
+    return bool(dialect and getattr(dialect, "name", "").startswith("postgres"))
+
+
+def _invite_ids_by_email(resp: Optional[dict], emails: Sequence[str]) -> dict[str, Optional[str]]:
+    """从 send_invites 响应中按邮箱取 invite id；响应不带邮箱时按顺序对应"""
+    invites = (resp or {}).get("invites") or []
+    mapped: dict[str, Optional[str]] = {}
+    for item in invites:
+        if not isinstance(item, dict):
+            continue
+        addr = item.get("email_address") or item.get("email")
+        if isinstance(addr, str):
+            mapped[addr.lower()] = item.get("id")
+    if not mapped and len(invites) == len(emails):
+        for email, item in zip(emails, invites):
+            if isinstance(item, dict):
+                mapped[email] = item.get("id")
+    return mapped
+
+
+class BatchRedeemService:
+    def __init__(self, users_db: Session, pool_db: Session):
+        self.users_db = users_db
+        self.pool_db = pool_db
+
+    # ---- 阶段一：锁定兑换码 + 抢占座位 + 创建 InviteRequest ----
+
+    def prepare(self, items: Sequence[BatchRedeemItem]) -> _BatchPlan:
+        outcomes = [BatchRedeemOutcome(code=i.code, email=i.email) for i in items]
+        plan = _BatchPlan(outcomes=outcomes)
+
+        index_by_hash: dict[str, int] = {}
+        for idx, item in enumerate(items):
+            h = hash_code(item.code)
+            if h in index_by_hash:
+                outcomes[idx].message = MSG_DUPLICATE
+                continue
+            index_by_hash[h] = idx
+        if not index_by_hash:
+            return plan
+
+        rows = self._block_codes(index_by_hash, outcomes)
+        if not rows:
+            return plan
+
+        try:
+            self._assign_all(plan, items, rows)
+        except Exception:
+            self.pool_db.rollback()
+            self.users_db.rollback()
+            self._abort(plan, [row for _, row in rows])
+            raise
+        return plan
+
+    def _assign_all(
+        self,
+        plan: _BatchPlan,
+        items: Sequence[BatchRedeemItem],
+        rows: list[tuple[int, models.RedeemCode]],
+    ) -> None:
+        # 按兑换码绑定的用户组分别抢座
+        by_group: dict[Optional[int], list[tuple[int, models.RedeemCode]]] = defaultdict(list)
+        for idx, row in rows:
+            by_group[getattr(row, "mother_group_id", None) or None].append((idx, row))
+
+        for group_id, entries in by_group.items():
+            assigned = self._assign_seats(group_id, entries, [items[i].email for i, _ in entries])
+            assigned_idx = {a.index for a in assigned}
+            plan.assignments.extend(assigned)
+            for idx, row in entries:
+                if idx not in assigned_idx:
+                    plan.outcomes[idx].message = MSG_NO_SEAT
+                    row.status = models.CodeStatus.unused
+                    self.users_db.add(row)
+
+        invites = [
+            models.InviteRequest(
+                mother_id=a.mother_id,
+                team_id=a.team_id,
+                email=a.email,
+                code_id=a.row.id,
+                status=models.InviteStatus.pending,
+            )
+            for a in plan.assignments
+        ]
+        self.users_db.add_all(invites)
+        self.users_db.flush()
+        # 座位保留到发送阶段结束之后，避免慢批次的座位被 cleanup_stale_held 提前回收
+        groups = plan.by_team()
+        held_until = datetime.utcnow() + timedelta(
+            seconds=settings.seat_hold_ttl_seconds + _send_window_seconds(len(groups))
+        )
+        for a, inv in zip(plan.assignments, invites):
+            a.inv = inv
+            a.seat.invite_request_id = inv.id
+            a.seat.held_until = held_until
+        for team_id, group in groups.items():
+            plan.tokens[team_id] = decrypt_token(group[0].mother.access_token_enc)
+        self.pool_db.commit()
+        self.users_db.commit()
+
+    def _block_codes(
+        self, index_by_hash: dict[str, int], outcomes: list[BatchRedeemOutcome]
+    ) -> list[tuple[int, models.RedeemCode]]:
+        """一条语句将可用兑换码置为 blocked，返回 [(输入下标, 行)]，其余填写失败原因"""
+        now = datetime.utcnow()
+        Code = models.RedeemCode
+        conditions = (
+            Code.code_hash.in_(list(index_by_hash)),
+            Code.status == models.CodeStatus.unused,
+            or_(Code.expires_at.is_(None), Code.expires_at > now),
+            or_(Code.lifecycle_expires_at.is_(None), Code.lifecycle_expires_at > now),
+            or_(Code.active.is_(None), Code.active == True),  # noqa: E712
+        )
+        # CAS：WHERE 中的 status 条件在并发更新后会被重新求值，同一兑换码只会被一方锁定
+        blocked_ids = set(
+            self.users_db.execute(
+                update(Code)
+                .where(*conditions)
+                .values(status=models.CodeStatus.blocked)
+                .returning(Code.id)
+                .execution_options(synchronize_session=False, stats_tracked=True)
+            ).scalars().all()
+        )
+        record_transition(
+            self.users_db, Code, {"status": models.CodeStatus.unused}, {"status": models.CodeStatus.blocked},
+            count=len(blocked_ids),
+        )
+        self.users_db.commit()
+
+        rows = self.users_db.query(Code).filter(Code.code_hash.in_(list(index_by_hash))).all()
+        claimed: list[tuple[int, models.RedeemCode]] = []
+        seen: set[str] = set()
+        for row in rows:
+            seen.add(row.code_hash)
+            idx = index_by_hash[row.code_hash]
+            if row.id in blocked_ids:
+                claimed.append((idx, row))
+            elif row.expires_at and row.expires_at < now:
+                outcomes[idx].message = MSG_EXPIRED
+            elif row.lifecycle_expires_at and row.lifecycle_expires_at < now:
+                outcomes[idx].message = MSG_EXPIRED
+            elif row.active is False:
+                outcomes[idx].message = MSG_DISABLED
+            else:
+                outcomes[idx].message = MSG_USED
+        for h, idx in index_by_hash.items():
+            if h not in seen:
+                outcomes[idx].message = MSG_INVALID
+        claimed.sort(key=lambda pair: pair[0])
+        return claimed
+
+    def _candidate_seats(self, group_id: Optional[int], limit: int, skip: set[int]) -> list[int]:
+        now = datetime.utcnow()
+        Seat, Mother, Team = models.SeatAllocation, models.MotherAccount, models.MotherTeam
+        q = (
+            select(Seat.id)
+            .join(Mother, Mother.id == Seat.mother_id)
+            .where(
+                Seat.status == models.SeatStatus.free,
+                Mother.status == models.MotherStatus.active,
+                or_(Mother.token_expires_at.is_(None), Mother.token_expires_at > now),
+                exists().where(
+                    Team.mother_id == Mother.id,
+                    Team.is_enabled == True,  # noqa: E712
+                    Team.team_id.isnot(None),
+                ),
+            )
+            .order_by(Mother.created_at.asc(), Mother.id.asc(), Seat.slot_index.asc())
+            .limit(limit)
+        )
+        if group_id is not None:
+            q = q.where(Mother.group_id == group_id)
+        if skip:
+            q = q.where(~Seat.id.in_(skip))
+        if _is_pg(self.pool_db):
+            q = q.with_for_update(of=Seat, skip_locked=True)
+        return list(self.pool_db.execute(q).scalars().all())
+
+    def _claim_seats(self, group_id: Optional[int], count: int) -> list[models.SeatAllocation]:
+        """批量将 free 座位置为 held；并发冲突时补抢，最多 seat_claim_retry_attempts 轮"""
+        held_until = datetime.utcnow() + timedelta(seconds=settings.seat_hold_ttl_seconds)
+        Seat = models.SeatAllocation
+        claimed: list[tuple[int, int]] = []
+        tried: set[int] = set()
+        for _ in range(max(1, settings.seat_claim_retry_attempts)):
+            need = count - len(claimed)
+            if need <= 0:
+                break
+            ids = self._candidate_seats(group_id, need, tried)
+            if not ids:
+                break
+            tried.update(ids)
+            stmt = (
+                update(Seat)
+                .where(Seat.id.in_(ids), Seat.status == models.SeatStatus.free)
+                .values(status=models.SeatStatus.held, held_until=held_until)
+                .returning(Seat.id, Seat.mother_id)
+                .execution_options(synchronize_session=False, seat_index_tracked=True, stats_tracked=True)
+            )
+            claimed.extend(tuple(r) for r in self.pool_db.execute(stmt).all())
+        for _, mother_id in claimed:
+            seat_index.note_seat_change(self.pool_db, mother_id, -1)
+        record_transition(
+            self.pool_db, Seat, {"status": models.SeatStatus.free}, {"status": models.SeatStatus.held},
+            count=len(claimed),
+        )
+        self.pool_db.commit()
+        if not claimed:
+            return []
+        seats = self.pool_db.query(Seat).filter(Seat.id.in_([sid for sid, _ in claimed])).all()
+        order = {sid: i for i, (sid, _) in enumerate(claimed)}
+        return sorted(seats, key=lambda s: order[s.id])
+
+    def _assign_seats(
+        self,
+        group_id: Optional[int],
+        entries: list[tuple[int, models.RedeemCode]],
+        emails: list[str],
+    ) -> list[_Assignment]:
+        seats = self._claim_seats(group_id, len(entries))
+        if not seats:
+            return []
+
+        mother_ids = sorted({s.mother_id for s in seats})
+        mothers = {
+            m.id: m
+            for m in self.pool_db.query(models.MotherAccount)
+            .filter(models.MotherAccount.id.in_(mother_ids))
+            .all()
+        }
+        teams_by_mother: dict[int, list[models.MotherTeam]] = defaultdict(list)
+        for team in (
+            self.pool_db.query(models.MotherTeam)
+            .filter(
+                models.MotherTeam.mother_id.in_(mother_ids),
+                models.MotherTeam.is_enabled == True,  # noqa: E712
+                models.MotherTeam.team_id.isnot(None),
+            )
+            .order_by(models.MotherTeam.is_default.desc(), models.MotherTeam.id.asc())
+        ):
+            teams_by_mother[team.mother_id].append(team)
+
+        # 同一团队内同一邮箱只能占一个座位（含本批次内已分配的）
+        team_ids = [t.team_id for ts in teams_by_mother.values() for t in ts]
+        taken: set[tuple[str, str]] = set()
+        if team_ids:
+            taken = {
+                (team_id, email)
+                for team_id, email in self.pool_db.query(
+                    models.SeatAllocation.team_id, models.SeatAllocation.email
+                ).filter(
+                    models.SeatAllocation.team_id.in_(team_ids),
+                    models.SeatAllocation.email.in_(set(emails)),
+                )
+            }
+
+        free = list(seats)
+        assignments: list[_Assignment] = []
+        for (idx, row), email in zip(entries, emails):
+            for pos, seat in enumerate(free):
+                team = next(
+                    (t for t in teams_by_mother.get(seat.mother_id, []) if (t.team_id, email) not in taken),
+                    None,
+                )
+                if team is None:
+                    continue
+                free.pop(pos)
+                taken.add((team.team_id, email))
+                seat.team_id = team.team_id
+                seat.email = email
+                self.pool_db.add(seat)
+                assignments.append(
+                    _Assignment(
+                        index=idx,
+                        row=row,
+                        email=email,
+                        seat=seat,
+                        mother=mothers[seat.mother_id],
+                        team_id=team.team_id,
+                        mother_id=seat.mother_id,
+                        seat_id=seat.id,
+                    )
+                )
+                break
+
+        for seat in free:
+            _clear_seat(seat)
+            self.pool_db.add(seat)
+        return assignments
+
+    def _abort(self, plan: _BatchPlan, rows: list[models.RedeemCode]) -> None:
+        """准备阶段失败：释放已分配座位并回滚兑换码"""
+        try:
+            for a in plan.assignments:
+                _clear_seat(a.seat)
+                self.pool_db.add(a.seat)
+            for row in rows:
+                row.status = models.CodeStatus.unused
+                self.users_db.add(row)
+            self.pool_db.commit()
+            self.users_db.commit()
+        except Exception:
+            logger.exception("batch redeem abort failed")
+            self.pool_db.rollback()
+            self.users_db.rollback()
+        plan.assignments.clear()
+
+    # ---- 阶段二：按团队并发发送邀请 ----
+
+    @staticmethod
+    async def send(plan: _BatchPlan) -> dict[str, tuple[Optional[dict], Optional[Exception]]]:
+        sem = asyncio.Semaphore(max(1, settings.redeem_batch_concurrency))
+
+        async def _one(team_id: str, group: list[_Assignment]):
+            async with sem:
+                try:
+                    # 每个团队独立的重试预算：整批共用请求级预算会在截止时间后让剩余团队全部失败
+                    with item_retry_budget():
+                        resp = await provider_async.send_invites(
+                            plan.tokens[team_id], team_id, [a.email for a in group]
+                        )
+                    return team_id, (resp, None)
+                except Exception as e:
+                    return team_id, (None, e)
+
+        results = await asyncio.gather(*(_one(tid, grp) for tid, grp in plan.by_team().items()))
+        return dict(results)
+
+    # ---- 阶段三：批量落库 ----
+
+    def complete(
+        self,
+        plan: _BatchPlan,
+        results: dict[str, tuple[Optional[dict], Optional[Exception]]],
+    ) -> list[BatchRedeemOutcome]:
+        now = datetime.utcnow()
+        # 锁定本批座位并读取最新状态：发送期间被回收（可能已分给他人）的座位不能再改动
+        Seat = models.SeatAllocation
+        self.pool_db.execute(
+            select(Seat)
+            .where(Seat.id.in_([a.seat_id for a in plan.assignments]))
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        ).scalars().all()
+        for team_id, group in plan.by_team().items():
+            resp, error = results.get(team_id, (None, RuntimeError("未发送")))
+            invite_ids = _invite_ids_by_email(resp, [a.email for a in group]) if error is None else {}
+            if isinstance(error, provider.ProviderError) and error.status in (401, 403):
+                group[0].mother.status = models.MotherStatus.invalid
+                self.pool_db.add(group[0].mother)
+
+            for a in group:
+                inv, seat, outcome = a.inv, a.seat, plan.outcomes[a.index]
+                outcome.invite_request_id = inv.id
+                outcome.mother_id = a.mother_id
+                outcome.team_id = team_id
+                inv.attempt_count += 1
+                inv.last_attempt_at = now
+                still_held = seat.status == models.SeatStatus.held and seat.invite_request_id == inv.id
+                if error is None and a.email in invite_ids:
+                    inv.invite_id = invite_ids[a.email]
+                    inv.status = models.InviteStatus.sent
+                    if still_held:
+                        seat.invite_id = inv.invite_id
+                        seat.status = models.SeatStatus.used
+                    else:
+                        # 邀请已发出，座位却已被回收：不覆盖他人的座位，由成员同步对账
+                        logger.warning("batch redeem seat %s released before completion (invite %s)", a.seat_id, inv.id)
+                    _mark_code_used(self.users_db, a.row, a.email, team_id)
+                    outcome.success = True
+                    outcome.message = "邀请已发送"
+                    continue
+
+                inv.status = models.InviteStatus.failed
+                if isinstance(error, provider.ProviderError):
+                    inv.error_code = error.code
+                    inv.error_msg = error.message
+                else:
+                    inv.error_msg = str(error) if error else "No invites in response"
+                if still_held:
+                    _clear_seat(seat)
+                a.row.status = models.CodeStatus.unused
+                self.users_db.add(a.row)
+                outcome.message = f"邀请发送失败: {inv.error_msg}"[:200]
+                outcome.team_id = None
+            for a in group:
+                self.users_db.add(a.inv)
+                self.pool_db.add(a.seat)
+
+        try:
+            self.pool_db.commit()
+            self.users_db.commit()
+        except Exception:
+            self.pool_db.rollback()
+            self.users_db.rollback()
+            raise
+        return plan.outcomes
+
+
+async def redeem_codes_batch_async(
+    users_db: Session,
+    pool_db: Session,
+    items: Sequence[BatchRedeemItem],
+) -> list[BatchRedeemOutcome]:
+    """批量兑换：数据库阶段在线程池执行，邀请按团队并发发送"""
+    svc = BatchRedeemService(users_db, pool_db)
+    plan = await asyncio.to_thread(svc.prepare, items)
+    if not plan.assignments:
+        return plan.outcomes
+    results = await svc.send(plan)
+    return await asyncio.to_thread(svc.complete, plan, results)
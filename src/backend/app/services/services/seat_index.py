@@ -0,0 +1,320 @@
+"""
+座位可用性索引
+
+为 InviteService 选母号提供进程内索引：按用户组维护“有空位且有可用团队的活跃母号”，
+按母号创建时间排序，选目标时直接取前几个候选，而不是分批扫描全部母号。
+
+- 增量更新：监听 ORM flush，座位 free <-> 非 free 的变化在事务提交后以 ±1 计入；
+  母号、团队、座位的新增/删除及批量 UPDATE/DELETE 会标记对应母号（或整个索引）待刷新
+- 定期对账：超过 seat_index_reconcile_seconds 后，下一次选目标前用三条聚合查询全量重建
+- 索引只负责给出候选，最终仍由数据库校验空位与团队；校验失败的候选会被立即刷新
+
+每个数据库引擎一份索引（多 worker 时各自维护，靠对账与校验纠偏）。
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+
+_PENDING_KEY = "seat_index_pending"
+_TRACKED = (models.SeatAllocation, models.MotherAccount, models.MotherTeam)
+
+
+@dataclass
+class _MotherSlot:
+    group_id: Optional[int]
+    sort_key: tuple[float, int]
+    free: int
+    has_team: bool
+
+    @property
+    def available(self) -> bool:
+        return self.free > 0 and self.has_team
+
+
+class _Pending:
+    """单个会话中尚未提交的索引变更"""
+
+    __slots__ = ("deltas", "dirty", "invalidate")
+
+    def __init__(self):
+        self.deltas: dict[int, int] = {}
+        self.dirty: set[int] = set()
+        self.invalidate = False
+
+
+class SeatAvailabilityIndex:
+    def __init__(self, reconcile_seconds: Optional[float] = None):
+        self._lock = threading.RLock()
+        self._reconcile_seconds = (
+            settings.seat_index_reconcile_seconds if reconcile_seconds is None else reconcile_seconds
+        )
+        self._mothers: dict[int, _MotherSlot] = {}
+        # None 对应全部母号；其余为各用户组，元素为 (created_ts, mother_id)，升序
+        self._buckets: dict[Optional[int], list[tuple[float, int]]] = {}
+        self._dirty: set[int] = set()
+        self._built_at: Optional[float] = None
+
+    # ---- 维护 ----
+
+    def _unlink(self, mother_id: int, slot: _MotherSlot) -> None:
+        for key in {None, slot.group_id}:
+            bucket = self._buckets.get(key)
+            if not bucket:
+                continue
+            i = bisect.bisect_left(bucket, slot.sort_key)
+            if i < len(bucket) and bucket[i] == slot.sort_key:
+                bucket.pop(i)
+
+    def _link(self, mother_id: int, slot: _MotherSlot) -> None:
+        for key in {None, slot.group_id}:
+            bisect.insort(self._buckets.setdefault(key, []), slot.sort_key)
+
+    def _put(self, mother_id: int, slot: Optional[_MotherSlot]) -> None:
+        old = self._mothers.pop(mother_id, None)
+        if old is not None and old.available:
+            self._unlink(mother_id, old)
+        if slot is not None:
+            self._mothers[mother_id] = slot
+            if slot.available:
+                self._link(mother_id, slot)
+
+    def apply_delta(self, mother_id: int, delta: int) -> None:
+        """座位 free 数量变化（+1 释放 / -1 占用）"""
+        with self._lock:
+            slot = self._mothers.get(mother_id)
+            if slot is None:
+                return
+            was = slot.available
+            slot.free = max(0, slot.free + delta)
+            if was and not slot.available:
+                self._unlink(mother_id, slot)
+            elif not was and slot.available:
+                self._link(mother_id, slot)
+
+    def mark_dirty(self, mother_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._dirty.update(mother_ids)
+
+    def invalidate(self) -> None:
+        """下一次选目标前全量对账"""
+        with self._lock:
+            self._built_at = None
+
+    def _apply_pending(self, pending: _Pending) -> None:
+        with self._lock:
+            if pending.invalidate:
+                self._built_at = None
+            for mother_id, delta in pending.deltas.items():
+                if delta:
+                    self.apply_delta(mother_id, delta)
+            self._dirty.update(pending.dirty)
+
+    # ---- 对账 ----
+
+    @staticmethod
+    def _load(session: Session, mother_ids: Optional[list[int]] = None) -> dict[int, _MotherSlot]:
+        mothers_q = select(
+            models.MotherAccount.id, models.MotherAccount.group_id, models.MotherAccount.created_at
+        ).where(models.MotherAccount.status == models.MotherStatus.active)
+        seats_q = (
+            select(models.SeatAllocation.mother_id, func.count())
+            .where(models.SeatAllocation.status == models.SeatStatus.free)
+            .group_by(models.SeatAllocation.mother_id)
+        )
+        teams_q = select(models.MotherTeam.mother_id).where(
+            models.MotherTeam.is_enabled == True,  # noqa: E712
+            models.MotherTeam.team_id.isnot(None),
+        ).distinct()
+        if mother_ids is not None:
+            mothers_q = mothers_q.where(models.MotherAccount.id.in_(mother_ids))
+            seats_q = seats_q.where(models.SeatAllocation.mother_id.in_(mother_ids))
+            teams_q = teams_q.where(models.MotherTeam.mother_id.in_(mother_ids))
+
+        free_counts = dict(session.execute(seats_q).all())
+        with_team = set(session.execute(teams_q).scalars().all())
+        slots: dict[int, _MotherSlot] = {}
+        for mother_id, group_id, created_at in session.execute(mothers_q).all():
+            ts = created_at.timestamp() if isinstance(created_at, datetime) else 0.0
+            slots[mother_id] = _MotherSlot(
+                group_id=group_id,
+                sort_key=(ts, mother_id),
+                free=int(free_counts.get(mother_id, 0)),
+                has_team=mother_id in with_team,
+            )
+        return slots
+
+    def reconcile(self, session: Session) -> None:
+        """从 seats / mother_accounts / mother_teams 全量重建"""
+        slots = self._load(session)
+        with self._lock:
+            self._mothers.clear()
+            self._buckets.clear()
+            self._dirty.clear()
+            for mother_id, slot in slots.items():
+                self._put(mother_id, slot)
+            self._built_at = time.monotonic()
+
+    def refresh(self, session: Session, mother_ids: Iterable[int]) -> None:
+        ids = sorted(set(mother_ids))
+        if not ids:
+            return
+        slots = self._load(session, ids)
+        with self._lock:
+            for mother_id in ids:
+                self._put(mother_id, slots.get(mother_id))
+            self._dirty.difference_update(ids)
+
+    def ensure_fresh(self, session: Session) -> None:
+        with self._lock:
+            built_at = self._built_at
+            dirty = list(self._dirty)
+        if built_at is None or time.monotonic() - built_at >= self._reconcile_seconds:
+            self.reconcile(session)
+        elif dirty:
+            self.refresh(session, dirty)
+
+    # ---- 查询 ----
+
+    def candidates(
+        self,
+        group_id: Optional[int] = None,
+        *,
+        exclude: Optional[set[int]] = None,
+        newest_first: bool = False,
+        limit: int = 8,
+    ) -> list[int]:
+        """按创建时间顺序返回最多 limit 个有空位的母号 ID"""
+        exclude = exclude or set()
+        out: list[int] = []
+        with self._lock:
+            bucket = self._buckets.get(group_id) or []
+            ordered = reversed(bucket) if newest_first else iter(bucket)
+            for _, mother_id in ordered:
+                if mother_id in exclude:
+                    continue
+                out.append(mother_id)
+                if len(out) >= limit:
+                    break
+        return out
+
+    def free_seats(self, mother_id: int) -> int:
+        with self._lock:
+            slot = self._mothers.get(mother_id)
+            return slot.free if slot else 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mothers": len(self._mothers),
+                "available": len(self._buckets.get(None) or []),
+                "dirty": len(self._dirty),
+                "age_seconds": None if self._built_at is None else round(time.monotonic() - self._built_at, 1),
+            }
+
+
+_indexes: dict[object, SeatAvailabilityIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _engine_key(session: Session) -> Optional[object]:
+    try:
+        bind = session.get_bind(models.SeatAllocation)
+    except Exception:
+        return None
+    return getattr(bind, "engine", bind)
+
+
+def index_for(session: Session) -> SeatAvailabilityIndex:
+    """获取会话所在数据库的座位索引"""
+    key = _engine_key(session)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(key, SeatAvailabilityIndex())
+    return index
+
+
+def _pending(session: Session) -> _Pending:
+    pending = session.info.get(_PENDING_KEY)
+    if pending is None:
+        pending = session.info[_PENDING_KEY] = _Pending()
+    return pending
+
+
+def note_seat_change(session: Session, mother_id: int, delta: int) -> None:
+    """记录 ORM 无法感知的座位变化（如批量 UPDATE 抢座），在提交后生效"""
+    pending = _pending(session)
+    pending.deltas[mother_id] = pending.deltas.get(mother_id, 0) + delta
+
+
+def note_mothers_changed(session: Session, mother_ids: Iterable[int]) -> None:
+    """记录批量语句改动了这些母号（状态、团队或座位），提交后按母号刷新"""
+    _pending(session).dirty.update(mother_ids)
+
+
+def _status_delta(obj: models.SeatAllocation) -> int:
+    hist = inspect(obj).attrs.status.history
+    if not hist.has_changes():
+        return 0
+    old = hist.deleted[0] if hist.deleted else None
+    new = hist.added[0] if hist.added else obj.status
+    was_free = old == models.SeatStatus.free
+    is_free = new == models.SeatStatus.free
+    return int(is_free) - int(was_free)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session: Session, flush_context) -> None:
+    pending: Optional[_Pending] = None
+    for obj in session.new:
+        if isinstance(obj, _TRACKED):
+            pending = pending or _pending(session)
+            pending.dirty.add(obj.id if isinstance(obj, models.MotherAccount) else obj.mother_id)
+    for obj in session.deleted:
+        if isinstance(obj, _TRACKED):
+            pending = pending or _pending(session)
+            pending.dirty.add(obj.id if isinstance(obj, models.MotherAccount) else obj.mother_id)
+    for obj in session.dirty:
+        if isinstance(obj, models.SeatAllocation):
+            delta = _status_delta(obj)
+            if delta:
+                pending = pending or _pending(session)
+                pending.deltas[obj.mother_id] = pending.deltas.get(obj.mother_id, 0) + delta
+        elif isinstance(obj, (models.MotherAccount, models.MotherTeam)):
+            if session.is_modified(obj, include_collections=False):
+                pending = pending or _pending(session)
+                pending.dirty.add(obj.id if isinstance(obj, models.MotherAccount) else obj.mother_id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk(orm_execute_state) -> None:
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if orm_execute_state.execution_options.get("seat_index_tracked"):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in _TRACKED:
+        _pending(orm_execute_state.session).invalidate = True
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_on_commit(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending is not None:
+        index_for(session)._apply_pending(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
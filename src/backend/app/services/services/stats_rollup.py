@@ -0,0 +1,187 @@
+"""
+按小时预汇总
+
+邀请、兑换、换车与刷新次数的历史曲线原先每次都从原始表现算，成本随历史增长。
+这里把已结束的小时按 (状态, 母号分组, SKU) 汇总进 stats_hourly_rollups：
+
+- 水位：已汇总到的小时（不含），记在 stats_counters 中；首次运行从最早一条数据开始回填，
+  每轮最多处理 stats_rollup_max_hours_per_run 小时
+- 幂等：每轮在一个事务内删除并重算 [水位 - 回看窗口, 新水位) 的汇总行，
+  回看窗口内的迟到数据与状态变化会被吸收；更早的小时不再改动
+- 读取：rollup_series 对水位之前的区间读汇总表，水位之后（当前小时及尚未汇总的小时）读原始表
+"""
+from __future__ import annotations
+
+import calendar
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+from app.utils.time_buckets import (
+    BUCKET_HOUR,
+    bucket_expr,
+    bucket_starts,
+    count_by_bucket,
+    parse_bucket,
+    truncate,
+)
+
+logger = logging.getLogger(__name__)
+
+_WATERMARK_KEY = ("_rollup", "watermark")
+
+
+@dataclass(frozen=True)
+class _Source:
+    ts: Any
+    status: Any
+    # 关联兑换码（取母号分组与 SKU）；None 表示来源本身就是兑换码
+    code_fk: Any = None
+
+
+ROLLUP_SOURCES: dict[str, _Source] = {
+    "invites": _Source(models.InviteRequest.created_at, models.InviteRequest.status, models.InviteRequest.code_id),
+    "redemptions": _Source(models.RedeemCode.used_at, models.RedeemCode.status),
+    "switches": _Source(
+        models.SwitchRequest.created_at, models.SwitchRequest.status, models.SwitchRequest.redeem_code_id
+    ),
+    "refreshes": _Source(
+        models.CodeRefreshHistory.created_at, models.CodeRefreshHistory.event_type, models.CodeRefreshHistory.code_id
+    ),
+}
+
+
+def _status_value(value: Any) -> str:
+    return "" if value is None else str(getattr(value, "value", value))
+
+
+def _to_epoch(ts: datetime) -> int:
+    return calendar.timegm(ts.timetuple())
+
+
+def get_watermark(session: Session) -> Optional[datetime]:
+    row = session.get(models.StatsCounterUsers, (*_WATERMARK_KEY, 0))
+    return datetime.utcfromtimestamp(row.value) if row is not None else None
+
+
+def _set_watermark(session: Session, ts: datetime) -> None:
+    session.merge(
+        models.StatsCounterUsers(
+            key=_WATERMARK_KEY[0],
+            dim=_WATERMARK_KEY[1],
+            shard=0,
+            value=_to_epoch(ts),
+            updated_at=datetime.utcnow(),
+        )
+    )
+
+
+class StatsRollupService:
+    def __init__(self, session: Session):
+        self.session = session
+
+    def _earliest(self) -> Optional[datetime]:
+        found = [
+            ts
+            for src in ROLLUP_SOURCES.values()
+            if (ts := self.session.execute(select(func.min(src.ts))).scalar()) is not None
+        ]
+        return min(found) if found else None
+
+    def _aggregate(self, metric: str, src: _Source, start: datetime, end: datetime) -> list[dict]:
+        dialect = self.session.get_bind(models.StatsHourlyRollup).dialect.name
+        hour = bucket_expr(src.ts, BUCKET_HOUR, dialect)
+        Code = models.RedeemCode
+        group_id = func.coalesce(Code.mother_group_id, 0)
+        sku_id = func.coalesce(Code.sku_id, 0)
+        stmt = select(hour, src.status, group_id, sku_id, func.count()).where(src.ts >= start, src.ts < end)
+        if src.code_fk is not None:
+            stmt = stmt.select_from(src.ts.class_).outerjoin(Code, Code.id == src.code_fk)
+        stmt = stmt.group_by(hour, src.status, group_id, sku_id)
+        now = datetime.utcnow()
+        return [
+            {
+                "metric": metric,
+                "hour_start": parse_bucket(h),
+                "status": _status_value(status),
+                "mother_group_id": int(gid or 0),
+                "sku_id": int(sid or 0),
+                "count": int(n),
+                "created_at": now,
+            }
+            for h, status, gid, sid, n in self.session.execute(stmt)
+        ]
+
+    def run(self, now: Optional[datetime] = None) -> int:
+        """汇总到最近一个已结束的小时，返回写入的汇总行数"""
+        closed = truncate(now or datetime.utcnow(), BUCKET_HOUR)
+        watermark = get_watermark(self.session)
+        if watermark is None:
+            earliest = self._earliest()
+            if earliest is None:
+                _set_watermark(self.session, closed)
+                self.session.commit()
+                return 0
+            start = truncate(earliest, BUCKET_HOUR)
+            frontier = start
+        else:
+            start = watermark - timedelta(hours=max(0, settings.stats_rollup_lookback_hours))
+            frontier = watermark
+        end = min(closed, frontier + timedelta(hours=max(1, settings.stats_rollup_max_hours_per_run)))
+        if end <= start:
+            return 0
+
+        Rollup = models.StatsHourlyRollup
+        rows: list[dict] = []
+        for metric, src in ROLLUP_SOURCES.items():
+            rows.extend(self._aggregate(metric, src, start, end))
+        try:
+            self.session.execute(delete(Rollup).where(Rollup.hour_start >= start, Rollup.hour_start < end))
+            if rows:
+                self.session.execute(insert(Rollup), rows)
+            _set_watermark(self.session, max(end, watermark or end))
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        if end < closed:
+            logger.info("stats rollup: backfilled to %s, %s behind", end.isoformat(), closed - end)
+        return len(rows)
+
+
+def rollup_series(
+    session: Session,
+    metric: str,
+    *,
+    start: datetime,
+    end: datetime,
+    bucket: str,
+    statuses: Optional[Iterable[str]] = None,
+) -> list[tuple[datetime, int]]:
+    """[start, end) 的分桶计数：水位之前读汇总表，之后读原始表，各一条 GROUP BY"""
+    src = ROLLUP_SOURCES[metric]
+    statuses = list(statuses) if statuses is not None else None
+    watermark = get_watermark(session)
+    split = min(max(watermark or start, start), end)
+
+    counts: dict[datetime, int] = {}
+    if split > start:
+        Rollup = models.StatsHourlyRollup
+        filters = [Rollup.metric == metric]
+        if statuses is not None:
+            filters.append(Rollup.status.in_(statuses))
+        for ts, n in count_by_bucket(
+            session, Rollup.hour_start, start=start, end=split, bucket=bucket, filters=filters, measure=Rollup.count
+        ):
+            counts[ts] = counts.get(ts, 0) + n
+    if end > split:
+        filters = [src.status.in_(statuses)] if statuses is not None else []
+        for ts, n in count_by_bucket(session, src.ts, start=split, end=end, bucket=bucket, filters=filters):
+            counts[ts] = counts.get(ts, 0) + n
+    return [(b, counts.get(b, 0)) for b in bucket_starts(start, end, bucket)]
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
@@ -27,6 +28,14 @@ class SwitchResult:
     team_id: Optional[str] = None
 
 
+@dataclass
+class _PreviousSeat:
+    """当前占用的旧席位（只含普通值，异步路径在线程间传递时不访问 ORM 属性）"""
+    seat_id: int
+    team_id: Optional[str]
+    mother_id: Optional[int]
+
+
 class SwitchService:
     """Handles mailbox seat switching backed by redeem codes."""
 
@@ -49,26 +58,13 @@ class SwitchService:
         recent_window_days: Optional[int] = None,
     ) -> SwitchResult:
         normalized_email = email.lower().strip()
-        code = code_row or self._load_code(normalized_email, code_plain)
-        if not code:
-            return SwitchResult(False, "未找到匹配的兑换码")
-
-        now = datetime.utcnow()
-        if code.lifecycle_expires_at and code.lifecycle_expires_at < now:
-            code.active = False
-            self.users_session.add(code)
-            self.users_repo.commit()
-            return SwitchResult(False, "兑换码生命周期已到期")
-
-        if code.active is False:
-            return SwitchResult(False, "兑换码已被停用")
+        prepared = self._prepare_switch(normalized_email, code_plain, code_row)
+        if isinstance(prepared, SwitchResult):
+            return prepared
+        code, previous = prepared
+        prev_mother_id = previous.mother_id if previous else None
 
-        limit = code.switch_limit or 0
-        if limit and (code.switch_count or 0) >= limit:
-            return SwitchResult(False, "可用切换次数已用尽")
-
-        seat, prev_mother_id = self._locate_active_seat(normalized_email, code)
-        remove_ok, remove_msg = self._detach_previous_membership(normalized_email, seat)
+        remove_ok, remove_msg = self._detach_previous_membership(normalized_email, previous)
         if not remove_ok:
             return SwitchResult(False, remove_msg or "移除旧团队失败")
 
@@ -78,17 +74,42 @@ class SwitchService:
             prefer_recent_team=prefer_recent_team,
             recent_window_days=recent_window_days,
         )
-        if ok:
-            self._mark_successful_switch(code, new_team_id)
-            self._close_pending_requests(code.id, normalized_email, new_mother_id)
-            return SwitchResult(True, "切换成功", mother_id=new_mother_id, team_id=new_team_id)
+        return self._finish_switch(
+            code, normalized_email, prev_mother_id, allow_queue, ok, msg, new_mother_id, new_team_id
+        )
 
-        needs_queue = NO_SLOT_MESSAGE in (msg or "")
-        if not needs_queue or not allow_queue:
-            return SwitchResult(False, msg or "切换失败", queued=needs_queue)
+    async def switch_email_async(
+        self,
+        email: str,
+        code_plain: Optional[str] = None,
+        *,
+        allow_queue: bool = True,
+        code_row: Optional[models.RedeemCode] = None,
+        prefer_recent_team: bool = False,
+        recent_window_days: Optional[int] = None,
+    ) -> SwitchResult:
+        """switch_email 的异步版本：Provider 调用不占用线程池"""
+        normalized_email = email.lower().strip()
+        prepared = await asyncio.to_thread(self._prepare_switch, normalized_email, code_plain, code_row)
+        if isinstance(prepared, SwitchResult):
+            return prepared
+        code, previous = prepared
+        prev_mother_id = previous.mother_id if previous else None
 
-        request = self._enqueue_switch_request(code, normalized_email, prev_mother_id, msg or NO_SLOT_MESSAGE)
-        return SwitchResult(False, "暂无可用座位，已加入排队", queued=True, request=request)
+        remove_ok, remove_msg = await self._detach_previous_membership_async(normalized_email, previous)
+        if not remove_ok:
+            return SwitchResult(False, remove_msg or "移除旧团队失败")
+
+        ok, msg, _, new_mother_id, new_team_id = await self.invite_service.invite_email_async(
+            normalized_email,
+            code,
+            prefer_recent_team=prefer_recent_team,
+            recent_window_days=recent_window_days,
+        )
+        return await asyncio.to_thread(
+            self._finish_switch,
+            code, normalized_email, prev_mother_id, allow_queue, ok, msg, new_mother_id, new_team_id,
+        )
 
     def process_request(self, request: models.SwitchRequest) -> SwitchResult:
         code = self.users_session.get(models.RedeemCode, request.redeem_code_id)
@@ -128,6 +149,57 @@ class SwitchService:
         return result
 
     # Internal helpers ------------------------------------------------
+    def _prepare_switch(
+        self,
+        email: str,
+        code_plain: Optional[str],
+        code_row: Optional[models.RedeemCode],
+    ) -> "SwitchResult | Tuple[models.RedeemCode, Optional[_PreviousSeat]]":
+        code = code_row or self._load_code(email, code_plain)
+        if not code:
+            return SwitchResult(False, "未找到匹配的兑换码")
+
+        now = datetime.utcnow()
+        if code.lifecycle_expires_at and code.lifecycle_expires_at < now:
+            code.active = False
+            self.users_session.add(code)
+            self.users_repo.commit()
+            return SwitchResult(False, "兑换码生命周期已到期")
+
+        if code.active is False:
+            return SwitchResult(False, "兑换码已被停用")
+
+        limit = code.switch_limit or 0
+        if limit and (code.switch_count or 0) >= limit:
+            return SwitchResult(False, "可用切换次数已用尽")
+
+        seat, prev_mother_id = self._locate_active_seat(email, code)
+        previous = _PreviousSeat(seat.id, seat.team_id, prev_mother_id) if seat else None
+        return code, previous
+
+    def _finish_switch(
+        self,
+        code: models.RedeemCode,
+        email: str,
+        prev_mother_id: Optional[int],
+        allow_queue: bool,
+        ok: bool,
+        msg: str,
+        new_mother_id: Optional[int],
+        new_team_id: Optional[str],
+    ) -> SwitchResult:
+        if ok:
+            self._mark_successful_switch(code, new_team_id)
+            self._close_pending_requests(code.id, email, new_mother_id)
+            return SwitchResult(True, "切换成功", mother_id=new_mother_id, team_id=new_team_id)
+
+        needs_queue = NO_SLOT_MESSAGE in (msg or "")
+        if not needs_queue or not allow_queue:
+            return SwitchResult(False, msg or "切换失败", queued=needs_queue)
+
+        request = self._enqueue_switch_request(code, email, prev_mother_id, msg or NO_SLOT_MESSAGE)
+        return SwitchResult(False, "暂无可用座位，已加入排队", queued=True, request=request)
+
     def _load_code(self, email: str, code_plain: Optional[str]) -> Optional[models.RedeemCode]:
         query = self.users_session.query(models.RedeemCode)
         if code_plain:
@@ -162,15 +234,32 @@ class SwitchService:
         return seat, prev_mother_id
 
     def _detach_previous_membership(
-        self, email: str, seat: Optional[models.SeatAllocation]
+        self, email: str, previous: Optional[_PreviousSeat]
     ) -> Tuple[bool, Optional[str]]:
-        if not seat or not seat.team_id:
+        if not previous or not previous.team_id:
             return True, None
-        mother = self.mother_repo.get(seat.mother_id) if seat.mother_id else None
-        if mother and mother.status == models.MotherStatus.active:
-            return self.invite_service.remove_member(email, seat.team_id)
+        if self._mother_active(previous.mother_id):
+            return self.invite_service.remove_member(email, previous.team_id)
+        return self._release_local_seat(previous.seat_id)
 
+    async def _detach_previous_membership_async(
+        self, email: str, previous: Optional[_PreviousSeat]
+    ) -> Tuple[bool, Optional[str]]:
+        if not previous or not previous.team_id:
+            return True, None
+        if await asyncio.to_thread(self._mother_active, previous.mother_id):
+            return await self.invite_service.remove_member_async(email, previous.team_id)
+        return await asyncio.to_thread(self._release_local_seat, previous.seat_id)
+
+    def _mother_active(self, mother_id: Optional[int]) -> bool:
+        mother = self.mother_repo.get(mother_id) if mother_id else None
+        return bool(mother and mother.status == models.MotherStatus.active)
+
+    def _release_local_seat(self, seat_id: int) -> Tuple[bool, Optional[str]]:
         # 母号已失效，直接释放本地席位
+        seat = self.pool_session.get(models.SeatAllocation, seat_id)
+        if seat is None:
+            return True, None
         seat.status = models.SeatStatus.free
         seat.held_until = None
         seat.team_id = None
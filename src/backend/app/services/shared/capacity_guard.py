@@ -9,7 +9,7 @@ from sqlalchemy.orm import Session
 
 from app import models
 from app.config import settings
-from app.repositories import UsersRepository
+from app.services.shared.stats_counters import DOMAIN_USERS, CounterSnapshot, read_counters
 
 
 @dataclass(frozen=True)
@@ -47,12 +47,13 @@ class CapacityGuard:
         self.users_session = users_session
         self.pool_session = pool_session
         self.warn_threshold = warn_threshold or max(0, settings.capacity_warn_threshold)
-        self._users_repo = UsersRepository(users_session)
 
-    def snapshot(self) -> CapacitySnapshot:
+    def snapshot(self, *, users_counters: Optional[CounterSnapshot] = None) -> CapacitySnapshot:
         now = datetime.utcnow()
         total_slots, alive_mothers = self._compute_total_slots(now)
-        reserved_codes = self._users_repo.count_active_redeem_codes()
+        # 已发放且未停用的兑换码数读计数器表，避免每次全表 COUNT
+        counters = users_counters or read_counters(self.users_session, DOMAIN_USERS)
+        reserved_codes = counters.get("codes.active")
         available_slots = max(total_slots - reserved_codes, 0)
         warn = available_slots <= self.warn_threshold
         return CapacitySnapshot(
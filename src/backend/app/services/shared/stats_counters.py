@@ -0,0 +1,373 @@
+"""
+统计计数器
+
+总览、配额、容量与监控接口原先每次请求都要对兑换码、邀请、母号、座位等表执行十几条
+COUNT。这里在各域维护一张 stats_counters 表（key + dim -> value），读取时一条 SELECT：
+
+- 增量：监听 ORM flush，被跟踪模型的新增/删除/相关字段变化在同一事务内以 ±n 写入计数器，
+  与业务数据一起提交或回滚
+- 批量语句：ORM 无法感知的批量 UPDATE/DELETE/INSERT 需带 execution_options(stats_tracked=True)
+  并用 record_transition 登记变化；未登记的批量语句会把所在域标记为 dirty
+- 对账：reconcile 用每个模型一条 GROUP BY 重建计数器并清除 dirty（由后台任务定期执行）
+- 读取：从未对账、dirty 或表尚未迁移时，read_counters 退回到同样的 GROUP BY 现算，不写库
+- 分片：每个键拆成 STATS_COUNTER_SHARDS 行，事务随机选一个分片写入，读取时按键求和，
+  避免全局计数（如 codes、invites）的单行在 PostgreSQL 上让并发事务排队等锁
+
+绕过 ORM 会话的写入（原生 SQL、其他进程）同样只能靠定期对账纠正。
+"""
+from __future__ import annotations
+
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Mapping, Optional
+
+from sqlalchemy import delete, event, func, inspect, select, update
+from sqlalchemy.orm import Mapper, Session
+
+from app import models
+from app.config import settings
+
+DOMAIN_USERS = "users"
+DOMAIN_POOL = "pool"
+
+# 批量语句已自行登记计数变化时设置的执行选项
+STATS_TRACKED = "stats_tracked"
+
+_META_KEY = "_meta"
+_MISSING = object()
+# 表不存在的结论缓存时长（迁移后无需重启即可生效）
+_TABLE_RECHECK_SECONDS = 60.0
+# 会话内缓存所选分片的 session.info 键
+_SHARD_INFO_KEY = "stats_counter_shard"
+
+CounterKey = tuple[str, str]
+
+
+def _norm(value: Any) -> str:
+    if value is None:
+        return ""
+    return str(getattr(value, "value", value))
+
+
+def _status_keys(name: str) -> Callable[[Mapping[str, Any]], list[CounterKey]]:
+    def _keys(values: Mapping[str, Any]) -> list[CounterKey]:
+        return [(name, ""), (f"{name}.status", _norm(values["status"]))]
+
+    return _keys
+
+
+def _code_keys(values: Mapping[str, Any]) -> list[CounterKey]:
+    status = _norm(values["status"])
+    keys = [("codes", ""), ("codes.status", status)]
+    if values["active"]:
+        keys.append(("codes.active", ""))
+    batch_id = values["batch_id"]
+    if batch_id:
+        keys.append(("codes.batch", batch_id))
+        if status == models.CodeStatus.used.value:
+            keys.append(("codes.batch_used", batch_id))
+    return keys
+
+
+def _team_keys(values: Mapping[str, Any]) -> list[CounterKey]:
+    return [("teams", ""), ("teams.enabled", "1" if values["is_enabled"] else "0")]
+
+
+@dataclass(frozen=True)
+class _Spec:
+    model: type
+    domain: str
+    attrs: tuple[str, ...]
+    keys: Callable[[Mapping[str, Any]], list[CounterKey]]
+    names: tuple[str, ...]
+
+
+_specs_cache: Optional[dict[type, _Spec]] = None
+
+
+def _specs() -> dict[type, _Spec]:
+    # 延迟构建：本模块可能在 app.models 尚未加载完成时被导入
+    global _specs_cache
+    if _specs_cache is None:
+        specs = [
+            _Spec(models.RedeemCode, DOMAIN_USERS, ("status", "active", "batch_id"), _code_keys,
+                  ("codes", "codes.status", "codes.active", "codes.batch", "codes.batch_used")),
+            _Spec(models.InviteRequest, DOMAIN_USERS, ("status",), _status_keys("invites"),
+                  ("invites", "invites.status")),
+            _Spec(models.BatchJob, DOMAIN_USERS, ("status",), _status_keys("jobs"), ("jobs", "jobs.status")),
+            _Spec(models.MotherAccount, DOMAIN_POOL, ("status",), _status_keys("mothers"),
+                  ("mothers", "mothers.status")),
+            _Spec(models.MotherTeam, DOMAIN_POOL, ("is_enabled",), _team_keys, ("teams", "teams.enabled")),
+            _Spec(models.SeatAllocation, DOMAIN_POOL, ("status",), _status_keys("seats"), ("seats", "seats.status")),
+            _Spec(models.ChildAccount, DOMAIN_POOL, ("status",), _status_keys("children"),
+                  ("children", "children.status")),
+        ]
+        _specs_cache = {s.model: s for s in specs}
+    return _specs_cache
+
+
+def _counter_model(domain: str):
+    return models.StatsCounterUsers if domain == DOMAIN_USERS else models.StatsCounter
+
+
+# ---- 表存在性 ----
+
+_table_checks: dict[object, tuple[bool, float]] = {}
+_table_lock = threading.Lock()
+
+
+def _connection(session: Session, domain: str):
+    return session.connection(bind_arguments={"mapper": inspect(_counter_model(domain))})
+
+
+def _has_table(conn, domain: str) -> bool:
+    key = (conn.engine, domain)
+    cached = _table_checks.get(key)
+    now = time.monotonic()
+    if cached is not None and (cached[0] or now - cached[1] < _TABLE_RECHECK_SECONDS):
+        return cached[0]
+    try:
+        present = inspect(conn).has_table(_counter_model(domain).__tablename__)
+    except Exception:
+        present = False
+    with _table_lock:
+        _table_checks[key] = (present, now)
+    return present
+
+
+# ---- 写入 ----
+
+def _shard(session: Session) -> int:
+    # 同一会话固定一个分片：一个事务对每个键只锁一行，并发事务分散到不同行
+    shard = session.info.get(_SHARD_INFO_KEY)
+    if shard is None:
+        shard = random.randrange(max(1, int(settings.stats_counter_shards)))
+        session.info[_SHARD_INFO_KEY] = shard
+    return shard
+
+
+def _apply(session: Session, domain: str, deltas: Mapping[CounterKey, int]) -> None:
+    items = sorted((k, d) for k, d in deltas.items() if d)
+    if not items:
+        return
+    conn = _connection(session, domain)
+    if not _has_table(conn, domain):
+        return
+    table = _counter_model(domain).__table__
+    now = datetime.utcnow()
+    shard = _shard(session)
+    rows = [{"key": k, "dim": dim, "shard": shard, "value": d, "updated_at": now} for (k, dim), d in items]
+    dialect = conn.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.key, table.c.dim, table.c.shard],
+            set_={"value": table.c.value + stmt.excluded.value, "updated_at": stmt.excluded.updated_at},
+        )
+        conn.execute(stmt, rows)
+        return
+    # 其他方言：先加后插（首次出现的键可能并发插入冲突，由对账纠正）
+    for row in rows:
+        res = conn.execute(
+            update(table)
+            .where(table.c.key == row["key"], table.c.dim == row["dim"], table.c.shard == shard)
+            .values(value=table.c.value + row["value"], updated_at=now)
+        )
+        if not res.rowcount:
+            conn.execute(table.insert().values(**row))
+
+
+def _add(into: dict[CounterKey, int], spec: _Spec, values: Mapping[str, Any], sign: int) -> None:
+    for key in spec.keys(values):
+        into[key] = into.get(key, 0) + sign
+
+
+def record_transition(
+    session: Session,
+    model: type,
+    old: Optional[Mapping[str, Any]],
+    new: Optional[Mapping[str, Any]],
+    count: int = 1,
+) -> None:
+    """登记批量语句造成的计数变化：count 行从 old 变为 new（None 表示插入/删除）。
+
+    未给出的跟踪字段视为前后不变。调用方的语句需带 execution_options(stats_tracked=True)。
+    """
+    spec = _specs().get(model)
+    if spec is None or not count:
+        return
+    base = {a: None for a in spec.attrs}
+    deltas: dict[CounterKey, int] = {}
+    if old is not None:
+        _add(deltas, spec, {**base, **old}, -count)
+    if new is not None:
+        _add(deltas, spec, {**base, **new}, count)
+    _apply(session, spec.domain, deltas)
+
+
+def _mark_dirty(session: Session, domain: str) -> None:
+    _apply(session, domain, {(_META_KEY, f"{domain}.dirty"): 1})
+
+
+def _values(state, spec: _Spec, *, previous: bool):
+    out = {}
+    for attr in spec.attrs:
+        hist = state.attrs[attr].history
+        if previous:
+            if hist.deleted:
+                value = hist.deleted[0]
+            elif hist.unchanged:
+                value = hist.unchanged[0]
+            else:
+                value = state.dict.get(attr, _MISSING)
+        else:
+            value = hist.added[0] if hist.added else state.dict.get(attr, _MISSING)
+        if value is _MISSING:
+            return None
+        out[attr] = value
+    return out
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session: Session, flush_context) -> None:
+    specs = _specs()
+    deltas: dict[str, dict[CounterKey, int]] = {}
+    dirty: set[str] = set()
+
+    def _collect(obj, old: bool, new: bool) -> None:
+        spec = specs.get(type(obj))
+        if spec is None:
+            return
+        state = inspect(obj)
+        if old and new and not any(state.attrs[a].history.has_changes() for a in spec.attrs):
+            return
+        into = deltas.setdefault(spec.domain, {})
+        for previous, sign, wanted in ((True, -1, old), (False, 1, new)):
+            if not wanted:
+                continue
+            values = _values(state, spec, previous=previous)
+            if values is None:
+                dirty.add(spec.domain)
+                return
+            _add(into, spec, values, sign)
+
+    for obj in session.new:
+        _collect(obj, old=False, new=True)
+    for obj in session.deleted:
+        _collect(obj, old=True, new=False)
+    for obj in session.dirty:
+        _collect(obj, old=True, new=True)
+
+    for domain, changes in deltas.items():
+        if domain not in dirty:
+            _apply(session, domain, changes)
+    for domain in dirty:
+        _mark_dirty(session, domain)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk(orm_execute_state) -> None:
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    if orm_execute_state.execution_options.get(STATS_TRACKED):
+        return
+    mapper = orm_execute_state.bind_mapper
+    spec = _specs().get(mapper.class_) if mapper is not None else None
+    if spec is not None:
+        _mark_dirty(orm_execute_state.session, spec.domain)
+
+
+_history_installed = False
+
+
+@event.listens_for(Mapper, "after_configured")
+def _install_active_history() -> None:
+    """让跟踪字段在赋值时总能拿到旧值（已过期的对象被修改时先加载旧值），否则只能标记 dirty"""
+    global _history_installed
+    if _history_installed:
+        return
+    _history_installed = True
+    for spec in _specs().values():
+        for attr in spec.attrs:
+            event.listen(getattr(spec.model, attr), "set", _keep_old_value, active_history=True)
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+# ---- 对账与读取 ----
+
+@dataclass
+class CounterSnapshot:
+    domain: str
+    values: dict[CounterKey, int] = field(default_factory=dict)
+    # counters：读自计数器表；aggregate：现算
+    source: str = "counters"
+
+    def get(self, key: str, dim: str = "") -> int:
+        return int(self.values.get((key, dim), 0))
+
+    def by_dim(self, key: str) -> dict[str, int]:
+        return {d: int(v) for (k, d), v in self.values.items() if k == key and v}
+
+
+def compute_counters(session: Session, domain: str) -> dict[CounterKey, int]:
+    """按模型各一条 GROUP BY 计算本域全部计数"""
+    counts: dict[CounterKey, int] = {}
+    for spec in _specs().values():
+        if spec.domain != domain:
+            continue
+        cols = [getattr(spec.model, a) for a in spec.attrs]
+        for row in session.execute(select(*cols, func.count()).group_by(*cols)).all():
+            _add(counts, spec, dict(zip(spec.attrs, row[:-1])), int(row[-1]))
+    return counts
+
+
+def _names(domain: str) -> list[str]:
+    return [n for s in _specs().values() if s.domain == domain for n in s.names]
+
+
+def reconcile(session: Session, domain: str) -> int:
+    """重建本域计数器（不提交），返回写入的键数；各键的全部分片合并写入分片 0"""
+    counts = compute_counters(session, domain)
+    conn = _connection(session, domain)
+    if not _has_table(conn, domain):
+        return 0
+    table = _counter_model(domain).__table__
+    names = _names(domain)
+    now = datetime.utcnow()
+    conn.execute(delete(table).where(table.c.key.in_(names)))
+    conn.execute(
+        delete(table).where(table.c.key == _META_KEY, table.c.dim.in_([f"{domain}.dirty", f"{domain}.reconciled_at"]))
+    )
+    rows = [{"key": k, "dim": d, "shard": 0, "value": v, "updated_at": now} for (k, d), v in counts.items() if v]
+    rows.append(
+        {"key": _META_KEY, "dim": f"{domain}.reconciled_at", "shard": 0, "value": int(time.time()), "updated_at": now}
+    )
+    conn.execute(table.insert(), rows)
+    return len(rows) - 1
+
+
+def read_counters(session: Session, domain: str) -> CounterSnapshot:
+    """读取本域计数；计数器不可信（从未对账 / dirty / 表不存在）时现算"""
+    conn = _connection(session, domain)
+    if _has_table(conn, domain):
+        table = _counter_model(domain).__table__
+        rows = conn.execute(
+            select(table.c.key, table.c.dim, func.sum(table.c.value))
+            .where(table.c.key.in_([*_names(domain), _META_KEY]))
+            .group_by(table.c.key, table.c.dim)
+        )
+        values = {(k, d): int(v) for k, d, v in rows}
+        reconciled = values.get((_META_KEY, f"{domain}.reconciled_at"))
+        if reconciled and not values.get((_META_KEY, f"{domain}.dirty")):
+            return CounterSnapshot(domain, values)
+    return CounterSnapshot(domain, compute_counters(session, domain), source="aggregate")
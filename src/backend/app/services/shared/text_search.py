@@ -0,0 +1,214 @@
+"""
+管理端子串搜索
+
+兑换码、用户（邀请）与母号列表的搜索原先是 lower(col) LIKE '%term%'，无法使用索引。
+这里按方言走可索引的路径：
+
+- PostgreSQL：pg_trgm GIN 索引（每表一个多列 GIN，建在 lower(col) 上），
+  LIKE '%term%' 直接命中；索引由 alembic 迁移创建
+- SQLite：FTS5 trigram 影子表（external content，rowid = 源表 id），由触发器与源表保持同步；
+  建表（create_all / 迁移）时一并创建，MATCH 查询后按 rowid 回表
+- 快路径：'=term' 精确匹配、'term*' 前缀匹配，只走 lower(col) 上的 B-tree 索引，不做 trigram 扫描
+- 关键词不足 3 个字符（trigram 无法命中）或影子表不存在时回退到 LIKE
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from sqlalchemy import event, literal_column, or_, select, table, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import bindparam, func
+
+from app.database import BasePool, BaseUsers
+
+MODE_SUBSTRING = "substring"
+MODE_PREFIX = "prefix"
+MODE_EXACT = "exact"
+
+_MIN_TRIGRAM = 3
+_FTS_RECHECK_SECONDS = 60.0
+# SQLite BINARY 排序下大于任意合法 UTF-8 字符，用作前缀范围上界
+_PREFIX_UPPER = "\U0010ffff"
+
+
+@dataclass(frozen=True)
+class SearchTarget:
+    table: str
+    # 子串搜索列（进入 trigram 索引 / FTS 影子表）
+    columns: tuple[str, ...]
+    # 精确 / 前缀快路径列（lower(col) 上有 B-tree 索引）
+    key_columns: tuple[str, ...]
+
+    @property
+    def fts_table(self) -> str:
+        return f"{self.table}_fts"
+
+
+SEARCH_TARGETS: dict[str, SearchTarget] = {
+    "redeem_codes": SearchTarget(
+        "redeem_codes",
+        ("code_hash", "batch_id", "used_by_email", "used_by_team_id"),
+        ("code_hash", "batch_id", "used_by_email", "used_by_team_id"),
+    ),
+    "invite_requests": SearchTarget(
+        "invite_requests",
+        ("email", "team_id", "error_msg"),
+        ("email", "team_id"),
+    ),
+    "mother_accounts": SearchTarget("mother_accounts", ("name",), ("name",)),
+}
+
+
+def parse_term(raw: Optional[str]) -> tuple[str, str]:
+    """'=abc' -> 精确，'abc*' -> 前缀，其余为子串；统一转小写"""
+    term = (raw or "").strip()
+    if term.startswith("=") and len(term) > 1:
+        return MODE_EXACT, term[1:].strip().lower()
+    if term.endswith("*") and len(term) > 1:
+        return MODE_PREFIX, term[:-1].strip().lower()
+    return MODE_SUBSTRING, term.lower()
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# ---- SQLite FTS5 影子表 ----
+
+def sqlite_search_ddl(target: SearchTarget) -> list[str]:
+    """影子表、同步触发器与 lower() 索引（均为 IF NOT EXISTS，可重复执行）"""
+    fts, src = target.fts_table, target.table
+    cols = ", ".join(target.columns)
+    new_vals = ", ".join(f"new.{c}" for c in target.columns)
+    old_vals = ", ".join(f"old.{c}" for c in target.columns)
+    delete_old = f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals});"
+    insert_new = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals});"
+    stmts = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{cols}, content='{src}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {src} BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {src} BEGIN {delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {src} "
+        f"BEGIN {delete_old} {insert_new} END",
+    ]
+    stmts += [
+        f"CREATE INDEX IF NOT EXISTS ix_search_{src}_{c} ON {src} (lower({c}))" for c in target.key_columns
+    ]
+    return stmts
+
+
+def sqlite_trigram_supported() -> bool:
+    """FTS5 trigram 分词需要 SQLite >= 3.34 且编译了 FTS5"""
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        return False
+    try:
+        conn = sqlite3.connect(":memory:")
+        try:
+            conn.execute("CREATE VIRTUAL TABLE t USING fts5(a, tokenize='trigram')")
+        finally:
+            conn.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+_TRIGRAM_OK: Optional[bool] = None
+
+
+def _after_create(metadata, connection, **kw) -> None:
+    """create_all 之后为 SQLite 补建影子表与触发器（生产库由迁移创建）"""
+    global _TRIGRAM_OK
+    if connection.dialect.name != "sqlite":
+        return
+    if _TRIGRAM_OK is None:
+        _TRIGRAM_OK = sqlite_trigram_supported()
+    if not _TRIGRAM_OK:
+        return
+    created = {t.name for t in (kw.get("tables") or metadata.sorted_tables)}
+    for name, target in SEARCH_TARGETS.items():
+        if name in created:
+            for stmt in sqlite_search_ddl(target):
+                connection.exec_driver_sql(stmt)
+
+
+event.listen(BaseUsers.metadata, "after_create", _after_create)
+event.listen(BasePool.metadata, "after_create", _after_create)
+
+_fts_checks: dict[tuple[Any, str], tuple[bool, float]] = {}
+_fts_lock = threading.Lock()
+
+
+def _fts_ready(session: Session, model: Any, target: SearchTarget) -> bool:
+    bind = session.get_bind(model)
+    key = (bind, target.fts_table)
+    cached = _fts_checks.get(key)
+    now = time.monotonic()
+    if cached is not None and (cached[0] or now - cached[1] < _FTS_RECHECK_SECONDS):
+        return cached[0]
+    try:
+        present = (
+            session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": target.fts_table},
+                bind_arguments={"mapper": model},
+            ).first()
+            is not None
+        )
+    except Exception:
+        present = False
+    with _fts_lock:
+        _fts_checks[key] = (present, now)
+    return present
+
+
+# ---- 查询条件 ----
+
+def search_clause(session: Session, model: Any, raw: Optional[str]):
+    """返回 model 的搜索条件；关键词为空时返回 None"""
+    target = SEARCH_TARGETS[model.__tablename__]
+    mode, term = parse_term(raw)
+    if not term:
+        return None
+    dialect = session.get_bind(model).dialect.name
+
+    if mode == MODE_EXACT:
+        return or_(*(func.lower(getattr(model, c)) == term for c in target.key_columns))
+    if mode == MODE_PREFIX:
+        if dialect == "sqlite":
+            return or_(
+                *(
+                    (func.lower(getattr(model, c)) >= term) & (func.lower(getattr(model, c)) < term + _PREFIX_UPPER)
+                    for c in target.key_columns
+                )
+            )
+        pattern = f"{_escape_like(term)}%"
+        return or_(*(func.lower(getattr(model, c)).like(pattern, escape="\\") for c in target.key_columns))
+
+    if dialect == "sqlite" and len(term) >= _MIN_TRIGRAM and _fts_ready(session, model, target):
+        phrase = '"' + term.replace('"', '""') + '"'
+        fts = target.fts_table
+        matched = (
+            select(literal_column("rowid"))
+            .select_from(table(fts))
+            .where(literal_column(fts).op("MATCH")(bindparam("search_q", phrase, unique=True)))
+        )
+        return model.id.in_(matched)
+    pattern = f"%{_escape_like(term)}%"
+    return or_(*(func.lower(getattr(model, c)).like(pattern, escape="\\") for c in target.columns))
+
+
+__all__ = [
+    "MODE_EXACT",
+    "MODE_PREFIX",
+    "MODE_SUBSTRING",
+    "SEARCH_TARGETS",
+    "SearchTarget",
+    "parse_term",
+    "search_clause",
+    "sqlite_search_ddl",
+    "sqlite_trigram_supported",
+]
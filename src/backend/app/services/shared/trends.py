@@ -0,0 +1,59 @@
+"""
+趋势指标
+
+统计/监控接口共用的趋势口径：每个指标对应一个域内的时间列，按小时或天分桶，
+每个指标一条 GROUP BY 查询（见 app.utils.time_buckets）。有小时汇总的指标
+（邀请、兑换）历史区间读 stats_hourly_rollups，仅未汇总的近期小时读原始表。
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlalchemy.orm import Session
+
+from app import models
+from app.services.services.stats_rollup import rollup_series
+from app.utils.time_buckets import BUCKET_DAY, count_by_bucket, format_bucket, trailing_window
+
+# 指标 -> (是否 Users 域, 时间列, 对应的小时汇总指标)
+TREND_METRICS: dict[str, tuple[bool, Any, Optional[str]]] = {
+    "invites": (True, models.InviteRequest.created_at, "invites"),
+    "codes": (True, models.RedeemCode.used_at, "redemptions"),
+    "jobs": (True, models.BatchJob.created_at, None),
+    "mothers": (False, models.MotherAccount.created_at, None),
+    "children": (False, models.ChildAccount.created_at, None),
+}
+
+
+def metric_trend(
+    users_db: Session,
+    pool_db: Session,
+    metric: str,
+    periods: int,
+    bucket: str = BUCKET_DAY,
+    now: Optional[datetime] = None,
+) -> list[dict[str, Any]]:
+    """最近 periods 个桶（含当前桶）的计数序列：[{"date", "count"}]，空桶为 0"""
+    if metric not in TREND_METRICS:
+        raise ValueError(f"不支持的统计指标: {metric}")
+    in_users, column, rollup = TREND_METRICS[metric]
+    start, end = trailing_window(periods, bucket, now)
+    if rollup is not None:
+        series = rollup_series(users_db, rollup, start=start, end=end, bucket=bucket)
+    else:
+        series = count_by_bucket(users_db if in_users else pool_db, column, start=start, end=end, bucket=bucket)
+    return [{"date": format_bucket(ts, bucket), "count": count} for ts, count in series]
+
+
+def recent_activity_by_day(users_db: Session, days: int = 7, now: Optional[datetime] = None) -> list[dict[str, Any]]:
+    """最近 days 天的邀请/兑换数（今天在前）：[{"date": "MM-DD", "invites", "redemptions"}]"""
+    start, end = trailing_window(days, BUCKET_DAY, now)
+    invites = rollup_series(users_db, "invites", start=start, end=end, bucket=BUCKET_DAY)
+    redemptions = rollup_series(
+        users_db, "redemptions", start=start, end=end, bucket=BUCKET_DAY, statuses=[models.CodeStatus.used.value]
+    )
+    return [
+        {"date": day.strftime("%m-%d"), "invites": inv, "redemptions": red}
+        for (day, inv), (_, red) in reversed(list(zip(invites, redemptions)))
+    ]
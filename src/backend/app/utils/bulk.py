@@ -0,0 +1,156 @@
+"""
+分块批量更新
+
+维护任务处理积压数据时不把全部行加载成 ORM 对象，而是按主键分块执行
+UPDATE ... WHERE id IN (本块)：
+
+- 支持 UPDATE ... RETURNING 的方言（PostgreSQL / SQLite 3.35+）一条语句完成取块与更新，
+  PostgreSQL 的取块子查询带 FOR UPDATE SKIP LOCKED，避免与在线请求互相等待
+- 其他方言先查出本块主键（SELECT ... FOR UPDATE 锁住候选行）再更新，更新时重复 WHERE 条件防止
+  覆盖并发修改；rowcount 与候选数不一致时重新查出实际被更新的行，on_chunk 与计数只基于这些行
+- 每块单独提交；块大小与整轮耗时都有上限，超时的剩余部分留给下一轮
+- 在调度器的锁租约下运行时，每块开始前检查租约，锁已丢失（可能已被其他实例接管）则停止
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Sequence
+
+from sqlalchemy import and_, select, update
+from sqlalchemy.orm import Session
+
+from app.utils.locks import lease_lost
+
+
+@dataclass
+class BulkPassResult:
+    """一轮分块处理的统计"""
+
+    rows: int = 0
+    chunks: int = 0
+    elapsed_ms: float = 0.0
+    # 因耗时上限提前结束，仍可能有剩余
+    truncated: bool = False
+    # 锁租约丢失而提前结束
+    lost: bool = False
+    # 仅 keep_returned=True 时收集（整轮的 returning 行），默认只交给 on_chunk，保持内存有界
+    returned: list[tuple] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "chunks": self.chunks,
+            "elapsed_ms": round(self.elapsed_ms, 1),
+            "truncated": self.truncated,
+            "lost": self.lost,
+        }
+
+
+def supports_update_returning(session: Session, model) -> bool:
+    try:
+        return bool(session.get_bind(model).dialect.update_returning)
+    except Exception:
+        return False
+
+
+def chunked_update(
+    session: Session,
+    model,
+    where: Sequence[Any],
+    values: dict,
+    *,
+    returning: Sequence[Any] = (),
+    chunk_size: int = 1000,
+    max_seconds: Optional[float] = None,
+    execution_options: Optional[dict] = None,
+    on_chunk: Optional[Callable[[list[tuple]], None]] = None,
+    commit: Optional[Callable[[], None]] = None,
+    keep_returned: bool = False,
+) -> BulkPassResult:
+    """按主键分块执行 UPDATE model SET values WHERE where，直到没有匹配行或超时。
+
+    where 更新后必须不再匹配（否则会反复处理同一批行）。每块实际更新的 (id, *returning) 行
+    交给 on_chunk，在提交前调用（可用于在同一事务内记录附带变更）；keep_returned 时另外累积到
+    result.returned。
+    """
+    pk = model.id
+    chunk_size = max(1, int(chunk_size))
+    result = BulkPassResult()
+    started = time.monotonic()
+    use_returning = supports_update_returning(session, model)
+    is_pg = session.get_bind(model).dialect.name == "postgresql"
+    commit = commit or session.commit
+    options = dict(execution_options or {})
+    options.setdefault("synchronize_session", False)
+
+    while True:
+        if lease_lost():
+            result.lost = True
+            break
+        if use_returning:
+            ids_q = select(pk).where(*where).order_by(pk).limit(chunk_size)
+            if is_pg:
+                ids_q = ids_q.with_for_update(skip_locked=True)
+            stmt = (
+                update(model)
+                .where(pk.in_(ids_q.scalar_subquery()))
+                .values(**values)
+                .returning(pk, *returning)
+                .execution_options(**options)
+            )
+            rows = [tuple(r) for r in session.execute(stmt).all()]
+            fetched = len(rows)
+        else:
+            rows = [
+                tuple(r)
+                for r in session.execute(
+                    select(pk, *returning).where(*where).order_by(pk).limit(chunk_size).with_for_update()
+                ).all()
+            ]
+            fetched = len(rows)
+            ids = [r[0] for r in rows]
+            # 重复 WHERE 条件：查出后被并发修改的行不会被覆盖
+            updated = session.execute(
+                update(model)
+                .where(pk.in_(ids), *where)
+                .values(**values)
+                .execution_options(**options)
+            ).rowcount
+            if updated is not None and 0 <= updated < len(rows):
+                # 部分候选行已被并发修改：只保留确实变为目标值的行
+                rows = [
+                    tuple(r)
+                    for r in session.execute(
+                        select(pk, *returning).where(pk.in_(ids), _matches(model, values)).order_by(pk)
+                    ).all()
+                ]
+
+        if not fetched:
+            break
+        if on_chunk is not None and rows:
+            on_chunk(rows)
+        commit()
+
+        result.rows += len(rows)
+        result.chunks += 1
+        if keep_returned:
+            result.returned.extend(rows)
+        if fetched < chunk_size:
+            break
+        if max_seconds is not None and time.monotonic() - started >= max_seconds:
+            result.truncated = True
+            break
+
+    result.elapsed_ms = (time.monotonic() - started) * 1000
+    return result
+
+
+def _matches(model, values: dict):
+    """行的列已等于 values（UPDATE 之后的状态）"""
+    return and_(
+        *(
+            getattr(model, name).is_(None) if value is None else getattr(model, name) == value
+            for name, value in values.items()
+        )
+    )
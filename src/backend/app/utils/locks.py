@@ -1,66 +1,251 @@
+"""Distributed locks on Redis.
+
+- Locks share the process-wide pooled sync Redis client instead of opening a
+  connection per attempt.
+- Each successful acquisition gets a fencing token: a per-lock counter that is
+  incremented atomically with the SET NX, so a stale holder can be told apart
+  from the current one. The counter key expires after a long idle window that is
+  refreshed on every acquire and renewal, so it only resets once no lease can
+  still be alive.
+- The Lua scripts are registered once per client rather than on every call.
+- While work is in progress a daemon thread renews the lease (PEXPIRE every
+  ttl/3, only if the token still matches). If the lease is lost the holder is
+  flagged via ``LockLease.lost`` and a warning is logged.
+- Work running under ``holding(lease)`` can poll ``lease_lost()`` at safe
+  points (e.g. chunk boundaries) and stop once another holder may have taken over.
+- Acquire latency/outcome and hold time are exported as metrics, labelled by the
+  lock name with numeric segments dropped (e.g. ``pool_sync:1:2`` -> ``pool_sync``).
+"""
 from __future__ import annotations
 
-import os
+import logging
+import threading
+import time
 import uuid
-from typing import Optional, Tuple
+import weakref
+from contextlib import contextmanager
+from typing import Iterator, NamedTuple, Optional, Tuple
 
 try:
     from redis import Redis  # type: ignore
+    from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
 except Exception:  # pragma: no cover
     Redis = None  # type: ignore
+    RedisConnectionError = RedisTimeoutError = OSError  # type: ignore
+
+try:
+    from app.metrics_prom import lock_acquire_seconds, lock_held_seconds, lock_lease_lost_total
+except Exception:  # pragma: no cover - metrics optional
+    lock_acquire_seconds = lock_held_seconds = lock_lease_lost_total = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+NO_REDIS = "no-redis"
+
+# Idle window after which an unused fence counter is dropped; far longer than any lease TTL.
+_FENCE_TTL_MS = 7 * 24 * 3600 * 1000
+
+# KEYS: lock, fence counter; ARGV: token, ttl_ms, fence_ttl_ms -> fencing token, or 0 if held by someone else
+_ACQUIRE_LUA = """
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    local fence = redis.call('incr', KEYS[2])
+    redis.call('pexpire', KEYS[2], ARGV[3])
+    return fence
+end
+return 0
+"""
+
+# KEYS: lock, fence counter; ARGV: token, ttl_ms, fence_ttl_ms
+_RENEW_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('pexpire', KEYS[2], ARGV[3])
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class _Scripts(NamedTuple):
+    acquire: object
+    renew: object
+    release: object
 
-from app.config import settings
+
+_scripts_by_client: "weakref.WeakKeyDictionary[Redis, _Scripts]" = weakref.WeakKeyDictionary()
+_scripts_lock = threading.Lock()
+
+
+def _scripts(client: "Redis") -> _Scripts:
+    """Lock scripts registered on ``client``, created on first use."""
+    scripts = _scripts_by_client.get(client)
+    if scripts is None:
+        with _scripts_lock:
+            scripts = _scripts_by_client.get(client)
+            if scripts is None:
+                scripts = _Scripts(
+                    client.register_script(_ACQUIRE_LUA),
+                    client.register_script(_RENEW_LUA),
+                    client.register_script(_RELEASE_LUA),
+                )
+                _scripts_by_client[client] = scripts
+    return scripts
+
+
+def _fence_key(name: str) -> str:
+    return f"{name}:fence"
+
+
+def _fence_ttl_ms(ttl_seconds: int) -> int:
+    return max(_FENCE_TTL_MS, ttl_seconds * 1000 * 10)
 
 
 def _get_redis_sync_client() -> Optional["Redis"]:
-    """Create a sync Redis client if possible; return None on failure or if library missing."""
+    """Shared pooled sync Redis client; None when Redis is unavailable or the library is missing."""
     if Redis is None:
         return None
+    from app.services.services.rate_limiter_service import get_sync_redis_client
+
+    return get_sync_redis_client()
+
+
+def _metric_label(name: str) -> str:
+    return ":".join(part for part in name.split(":") if not part.isdigit())
+
+
+def _observe(metric, value: float, **labels) -> None:
     try:
-        client = Redis.from_url(settings.redis_url, password=settings.redis_password, decode_responses=True)
-        client.ping()
-        return client
+        if metric is not None:
+            metric.labels(**labels).observe(value)
     except Exception:
-        return None
+        pass
+
+
+class LockLease:
+    """A held lock: token, fencing token and optional background renewal."""
+
+    def __init__(self, client: "Redis", name: str, token: str, fence: int, ttl_seconds: int):
+        self.client = client
+        self.name = name
+        self.token = token
+        self.fence = fence
+        self.ttl_seconds = ttl_seconds
+        self.acquired_at = time.monotonic()
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def renew(self) -> bool:
+        """Extend the TTL if we still hold the lock; marks the lease lost otherwise."""
+        try:
+            ok = bool(_scripts(self.client).renew(
+                keys=[self.name, _fence_key(self.name)],
+                args=[self.token, self.ttl_seconds * 1000, _fence_ttl_ms(self.ttl_seconds)],
+            ))
+        except Exception:
+            # transient error: keep trying until the TTL runs out
+            logger.debug("lock renew failed for %s", self.name, exc_info=True)
+            return not self.lost.is_set()
+        if not ok and not self.lost.is_set():
+            self.lost.set()
+            logger.warning("lock %s lost (fence=%s) before work finished", self.name, self.fence)
+            try:
+                if lock_lease_lost_total is not None:
+                    lock_lease_lost_total.labels(lock=_metric_label(self.name)).inc()
+            except Exception:
+                pass
+        return ok
+
+    def start_renewal(self) -> None:
+        if self._thread is not None:
+            return
+        interval = max(0.5, self.ttl_seconds / 3.0)
+
+        def _run() -> None:
+            while not self._stop.wait(interval):
+                if not self.renew():
+                    return
+
+        self._thread = threading.Thread(target=_run, name=f"lock-renew:{self.name}", daemon=True)
+        self._thread.start()
+
+    def release(self) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=1.0)
+        _observe(lock_held_seconds, time.monotonic() - self.acquired_at, lock=_metric_label(self.name))
+        try:
+            _scripts(self.client).release(keys=[self.name], args=[self.token])
+        except Exception:
+            logger.debug("release_lock failed", exc_info=True)
 
 
-def try_acquire_lock(name: str, ttl_seconds: int) -> Tuple[Optional["Redis"], Optional[str]]:
+def try_acquire_lock(name: str, ttl_seconds: int, *, renew: bool = True) -> Tuple[Optional[LockLease], Optional[str]]:
     """Try to acquire a distributed lock via Redis.
 
-    Returns (client, token) if acquired; otherwise (None, None).
+    Returns (lease, token) if acquired; otherwise (None, None).
     If Redis unavailable, returns (None, "no-redis") to indicate fallback/no lock.
+    With ``renew`` the lease is extended in the background until release_lock.
     """
     client = _get_redis_sync_client()
     if not client:
-        return None, "no-redis"
+        return None, NO_REDIS
+    ttl = max(1, int(ttl_seconds))
     token = uuid.uuid4().hex
+    started = time.monotonic()
     try:
-        ok = client.set(name, token, nx=True, ex=max(1, ttl_seconds))
-        if ok:
-            return client, token
-        return None, None
+        fence = int(_scripts(client).acquire(
+            keys=[name, _fence_key(name)], args=[token, ttl * 1000, _fence_ttl_ms(ttl)]
+        ))
+    except (RedisConnectionError, RedisTimeoutError):
+        _observe(lock_acquire_seconds, time.monotonic() - started, lock=_metric_label(name), result="error")
+        return None, NO_REDIS
     except Exception:
+        _observe(lock_acquire_seconds, time.monotonic() - started, lock=_metric_label(name), result="error")
+        return None, None
+    result = "acquired" if fence else "miss"
+    _observe(lock_acquire_seconds, time.monotonic() - started, lock=_metric_label(name), result=result)
+    if not fence:
         return None, None
+    lease = LockLease(client, name, token, fence, ttl)
+    if renew:
+        lease.start_renewal()
+    return lease, token
 
 
-def release_lock(client: Optional["Redis"], name: str, token: Optional[str]) -> None:
-    if not client or not token:
+def release_lock(lease: Optional[LockLease], name: str, token: Optional[str]) -> None:
+    """Stop renewal and delete the lock if the token still matches."""
+    if not lease or not token:
         return
-    # release only if token matches
+    lease.release()
+
+
+_held = threading.local()
+
+
+@contextmanager
+def holding(lease: Optional[LockLease]) -> Iterator[Optional[LockLease]]:
+    """Make ``lease`` the current thread's lease for the duration of the block."""
+    previous = getattr(_held, "lease", None)
+    _held.lease = lease
     try:
-        client.eval(
-            """
-            if redis.call('get', KEYS[1]) == ARGV[1] then
-                return redis.call('del', KEYS[1])
-            else
-                return 0
-            end
-            """,
-            1,
-            name,
-            token,
-        )
-    except Exception:
-        import logging
-        logging.getLogger(__name__).debug("release_lock failed", exc_info=True)
+        yield lease
+    finally:
+        _held.lease = previous
+
+
+def current_lease() -> Optional[LockLease]:
+    return getattr(_held, "lease", None)
+
 
+def lease_lost() -> bool:
+    """True if the current thread's lease was lost; always False without one."""
+    lease = current_lease()
+    return lease is not None and lease.lost.is_set()
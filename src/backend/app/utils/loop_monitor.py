@@ -0,0 +1,177 @@
+"""
+事件循环阻塞监控
+
+async 路由里直接执行同步 IO / CPU 工作会卡住整个 worker 的事件循环。检测不依赖事件循环的
+具体实现（asyncio 与 uvloop 均可），也不修改任何 asyncio 内部类：
+
+- 心跳：后台任务按固定间隔 sleep，实际唤醒延迟即调度滞后，记入 event_loop_lag_ms
+- 看门狗线程：心跳超时未到时，读取事件循环线程当前的调用栈（sys._current_frames），
+  取最内层的协程作为阻塞者，并从栈帧中名为 scope 的 ASGI 请求 scope 得到路由模板
+  （路由匹配后 Starlette 会原地写入 scope["route"]）。心跳恢复时若滞后超过阈值，
+  按看门狗记下的路由与协程上报
+"""
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import sys
+import threading
+import time
+from typing import Optional
+
+try:
+    from app.metrics_prom import event_loop_blocked_ms, event_loop_blocked_total, event_loop_lag_ms
+except Exception:
+    event_loop_blocked_ms = event_loop_blocked_total = event_loop_lag_ms = None
+
+logger = logging.getLogger(__name__)
+
+# 栈中持有 ASGI 请求 scope 的局部变量名（Starlette 中间件与路由均如此命名）
+_SCOPE_LOCAL = "scope"
+UNKNOWN = "unknown"
+
+
+def route_label(scope: Optional[dict]) -> str:
+    """请求 scope -> 低基数路由标签（路由模板，未匹配时为 unmatched，非请求上下文为 background）"""
+    if not scope:
+        return "background"
+    method = scope.get("method", "")
+    path = getattr(scope.get("route"), "path", None)
+    if not path:
+        endpoint = scope.get("endpoint")
+        path = getattr(endpoint, "__name__", None)
+    return f"{method} {path}".strip() if path else "unmatched"
+
+
+def _frame_scope(frame) -> Optional[dict]:
+    if _SCOPE_LOCAL not in frame.f_code.co_varnames:
+        return None
+    try:
+        scope = frame.f_locals.get(_SCOPE_LOCAL)
+    except Exception:
+        return None
+    if isinstance(scope, dict) and scope.get("type") == "http":
+        return scope
+    return None
+
+
+def describe_stack(frame) -> tuple[str, str]:
+    """从栈顶向下：最内层协程为阻塞者，最内层的 HTTP scope 给出路由"""
+    callback: Optional[str] = None
+    scope: Optional[dict] = None
+    top = frame
+    while frame is not None and (callback is None or scope is None):
+        code = frame.f_code
+        if callback is None and code.co_flags & inspect.CO_COROUTINE:
+            callback = getattr(code, "co_qualname", code.co_name)
+        if scope is None:
+            scope = _frame_scope(frame)
+        frame = frame.f_back
+    if callback is None and top is not None:
+        callback = getattr(top.f_code, "co_qualname", top.f_code.co_name)
+    return route_label(scope), callback or UNKNOWN
+
+
+def report_blocked(duration_ms: float, route: str, callback: str) -> None:
+    logger.warning("event loop blocked for %.0fms by %s (route=%s)", duration_ms, callback, route)
+    if event_loop_blocked_total is None:
+        return
+    try:
+        event_loop_blocked_total.labels(route=route).inc()
+        event_loop_blocked_ms.labels(route=route).observe(duration_ms)
+    except Exception:
+        logger.debug("loop monitor metrics failed", exc_info=True)
+
+
+class LoopLagMonitor:
+    """心跳测量调度滞后；看门狗线程在滞后期间定位阻塞的协程与路由"""
+
+    def __init__(self, *, interval_seconds: float = 0.5, threshold_ms: float = 100.0):
+        self.interval = max(0.01, float(interval_seconds))
+        self.threshold_ms = float(threshold_ms)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread: Optional[int] = None
+        # (心跳序号, 开始等待时刻) 整体替换，看门狗读取时不会拿到错配的两项
+        self._beat: tuple[int, float] = (0, 0.0)
+        # 看门狗记下的 (心跳序号, 路由, 协程)
+        self._suspect: Optional[tuple[int, str, str]] = None
+        self.max_lag_ms = 0.0
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = (0, time.monotonic())
+        self._stop.clear()
+        self._task = loop.create_task(self._run(), name="loop-lag-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        watchdog, self._watchdog = self._watchdog, None
+        self._stop.set()
+        if watchdog is not None:
+            await asyncio.to_thread(watchdog.join, 1.0)
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        seq = 0
+        while True:
+            seq += 1
+            self._beat = (seq, time.monotonic())
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - expected) * 1000.0)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if event_loop_lag_ms is not None:
+                try:
+                    event_loop_lag_ms.observe(lag_ms)
+                except Exception:
+                    pass
+            if lag_ms >= self.threshold_ms:
+                suspect, self._suspect = self._suspect, None
+                if suspect is not None and suspect[0] == seq:
+                    report_blocked(lag_ms, suspect[1], suspect[2])
+                else:
+                    report_blocked(lag_ms, UNKNOWN, UNKNOWN)
+
+    def _watch(self) -> None:
+        # 超时达到阈值一半即采样，此时超过阈值的阻塞必然仍在执行
+        half = self.threshold_ms / 2000.0
+        tick = max(0.005, min(self.interval, half) / 2)
+        while not self._stop.wait(tick):
+            seq, beat_at = self._beat
+            overdue = time.monotonic() - beat_at - self.interval
+            if overdue < half or (self._suspect is not None and self._suspect[0] == seq):
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            try:
+                route, callback = describe_stack(frame)
+            except Exception:
+                logger.debug("loop monitor stack inspection failed", exc_info=True)
+                continue
+            finally:
+                del frame
+            self._suspect = (seq, route, callback)
+
+
+__all__ = [
+    "LoopLagMonitor",
+    "describe_stack",
+    "report_blocked",
+    "route_label",
+]
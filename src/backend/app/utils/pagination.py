@@ -6,10 +6,25 @@
   "items": [...],
   "pagination": { "page", "page_size", "total", "total_pages" }
 }
+
+游标（keyset）分页：按 (created_at, id) 倒序，下一页从上一页最后一行之后继续，
+不需要 COUNT 与 OFFSET，深翻页的代价与第一页相同：
+{
+  "items": [...],
+  "pagination": { "page_size", "next_cursor", "has_more", "total", "total_estimated" }
+}
+total 仅在请求时给出，PostgreSQL 上取自查询计划的估算行数，其他方言为 None。
 """
 from __future__ import annotations
 
+import base64
+import json
 from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query, Session
 
 
 DEFAULT_MAX_PAGE_SIZE = 200
@@ -59,5 +74,84 @@ def compute_pagination(
     return PageMeta(page=current_page, page_size=page_size, total=total, total_pages=total_pages), offset
 
 
-__all__ = ["compute_pagination", "PageMeta", "DEFAULT_MAX_PAGE_SIZE"]
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps({"t": created_at.isoformat(), "i": int(row_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple[datetime, int]:
+    """解析游标；格式错误抛 ValueError"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(data["t"]), int(data["i"])
+    except Exception as exc:
+        raise ValueError("invalid cursor") from exc
+
+
+def keyset_page(
+    query: Query,
+    *,
+    created_col: Any,
+    id_col: Any,
+    cursor: Optional[str],
+    page_size: int,
+    max_page_size: int = DEFAULT_MAX_PAGE_SIZE,
+) -> tuple[list, dict]:
+    """按 (created_col, id_col) 倒序取一页。cursor 为空时取第一页。
+
+    Returns: (rows, pagination)；游标非法时抛 ValueError
+    """
+    page_size = _clamp(int(page_size or 1), 1, max_page_size)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(created_col, id_col) < tuple_(created_at, row_id))
+    rows = query.order_by(created_col.desc(), id_col.desc()).limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, created_col.key), getattr(last, id_col.key))
+    return rows, {
+        "page_size": page_size,
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+        "total": None,
+        "total_estimated": False,
+    }
+
+
+def estimate_count(session: Session, query: Query) -> Optional[int]:
+    """用查询计划估算行数（仅 PostgreSQL），不执行 COUNT；其他方言返回 None"""
+    try:
+        bind = session.get_bind()
+        if bind.dialect.name != "postgresql":
+            return None
+        compiled = query.statement.compile(dialect=bind.dialect)
+        conn = session.connection()
+        plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except Exception:
+        return None
+
+
+def with_estimated_total(session: Session, query: Query, pagination: dict) -> dict:
+    pagination["total"] = estimate_count(session, query)
+    pagination["total_estimated"] = pagination["total"] is not None
+    return pagination
+
+
+__all__ = [
+    "compute_pagination",
+    "PageMeta",
+    "DEFAULT_MAX_PAGE_SIZE",
+    "encode_cursor",
+    "decode_cursor",
+    "keyset_page",
+    "estimate_count",
+    "with_estimated_total",
+]
 
@@ -2,14 +2,15 @@
 Pool 重试机制
 
 提供指数退避重试功能，支持错误分类和智能重试。
+底层复用 app.utils.retry_policy 的统一重试引擎：与 Provider 内部重试共享请求级预算，
+嵌套调用时只由最外层重试。
 """
-import time
 from typing import Callable, TypeVar, Optional, Any
 from dataclasses import dataclass
 from enum import Enum
 
 from ..config import pool_config
-from ..provider import ProviderError
+from .retry_policy import RetryPolicy, call_with_retry, provider_retry_policy
 
 
 T = TypeVar('T')
@@ -46,20 +47,10 @@ def classify_error(error: Exception) -> ErrorCategory:
     Returns:
         ErrorCategory
     """
-    if isinstance(error, ProviderError):
-        # ProviderError 的 status 属性是 int
-        status = error.status if hasattr(error, 'status') else 0
-
-        # 429 Too Many Requests, 5xx Server Error - 可重试
-        if status == 429 or (500 <= status < 600):
-            return ErrorCategory.RETRYABLE
-
-        # 403 Forbidden, 404 Not Found - 不可重试
-        if status in (403, 404):
-            return ErrorCategory.NON_RETRYABLE
-
-    # 其他错误默认可重试
-    return ErrorCategory.RETRYABLE
+    # 429 / 5xx 与网络错误可重试；403、404 等其他状态码及熔断、截止时间错误不可重试
+    if provider_retry_policy.is_retryable(error):
+        return ErrorCategory.RETRYABLE
+    return ErrorCategory.NON_RETRYABLE
 
 
 def retry_with_backoff(
@@ -67,6 +58,7 @@ def retry_with_backoff(
     max_attempts: Optional[int] = None,
     backoff_ms: Optional[list[int]] = None,
     on_retry: Optional[Callable[[int, Exception], None]] = None,
+    endpoint: str = "pool",
 ) -> RetryResult:
     """
     带指数退避的重试
@@ -76,58 +68,38 @@ def retry_with_backoff(
         max_attempts: 最大尝试次数（默认从 pool_config 读取）
         backoff_ms: 退避序列（毫秒），默认从 pool_config 读取
         on_retry: 重试回调函数 (attempt, error) -> None
+        endpoint: 指标标签
         
     Returns:
         RetryResult
     """
-    max_attempts = max_attempts or pool_config.retry_attempts
+    max_attempts = max(1, max_attempts or pool_config.retry_attempts)
     backoff_ms = backoff_ms or pool_config.retry_backoff_ms
-    
-    last_error: Exception | None = None
-    last_category = ErrorCategory.UNKNOWN
-    
-    for attempt in range(1, max_attempts + 1):
-        try:
-            result = fn()
-            return RetryResult(
-                success=True,
-                data=result,
-                attempts=attempt,
-            )
-        except Exception as e:
-            last_error = e
-            last_category = classify_error(e)
-            
-            # 如果是不可重试的错误，直接返回
-            if last_category == ErrorCategory.NON_RETRYABLE:
-                return RetryResult(
-                    success=False,
-                    error=e,
-                    attempts=attempt,
-                    category=last_category,
-                )
-            
-            # 如果还有重试机会，等待后重试
-            if attempt < max_attempts:
-                # 计算退避时间
-                backoff_index = min(attempt - 1, len(backoff_ms) - 1)
-                wait_ms = backoff_ms[backoff_index]
-                
-                # 调用重试回调
-                if on_retry:
-                    on_retry(attempt, e)
-                
-                # 等待
-                time.sleep(wait_ms / 1000.0)
-    
-    # 所有尝试都失败
-    return RetryResult(
-        success=False,
-        error=last_error,
-        attempts=max_attempts,
-        category=last_category,
+    policy = RetryPolicy(
+        max_attempts=max_attempts,
+        backoff_ms=tuple(backoff_ms) if backoff_ms else None,
+        jitter=False,
+        max_retry_after_ms=provider_retry_policy.max_retry_after_ms,
     )
 
+    attempts = 0
+
+    def _attempt() -> T:
+        nonlocal attempts
+        attempts += 1
+        return fn()
+
+    try:
+        result = call_with_retry(_attempt, policy=policy, endpoint=endpoint, on_retry=on_retry)
+    except Exception as e:
+        return RetryResult(
+            success=False,
+            error=e,
+            attempts=attempts,
+            category=classify_error(e),
+        )
+    return RetryResult(success=True, data=result, attempts=attempts)
+
 
 def retry_async_with_backoff(
     fn: Callable[[], T],
@@ -0,0 +1,340 @@
+"""
+统一重试引擎
+
+Provider 调用、Pool 包装器与邀请流程共用的一套重试策略：
+- 指数退避 + full jitter，尊重上游 Retry-After
+- 每个 HTTP 请求一个重试预算（RetryBudget）：最大重试次数 + 截止时间（deadline），
+  通过 contextvars 传递到线程池 / 协程中的所有下游调用
+- 嵌套调用只由最外层负责重试，内层只执行一次，避免 3×3 的重试放大
+- 上报每次重试的等待时间，以及请求总耗时中花在重试与等待上的比例
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, ContextManager, Iterator, Optional, TypeVar
+
+from app.config import settings
+from app.metrics import provider_metrics
+
+T = TypeVar("T")
+
+# 可重试的上游状态码（429 与 5xx 网关类错误）
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# 本地产生、重试无意义的错误码（熔断打开 / 截止时间已到）
+NON_RETRYABLE_CODES = frozenset({"circuit_open", "deadline_exceeded"})
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求截止时间已到，不再发起新的尝试"""
+
+    status = 504
+
+    def __init__(self, endpoint: str):
+        super().__init__(f"Request deadline exceeded before calling {endpoint}")
+        self.endpoint = endpoint
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """单次调用的重试策略"""
+    max_attempts: int = 3
+    base_delay_ms: int = 500
+    max_delay_ms: int = 8000
+    multiplier: float = 2.0
+    # 显式退避序列（毫秒），设置后优先于指数退避
+    backoff_ms: Optional[tuple[int, ...]] = None
+    jitter: bool = True
+    max_retry_after_ms: int = 30000
+    retry_statuses: frozenset = RETRY_STATUSES
+
+    @classmethod
+    def from_settings(cls, settings) -> "RetryPolicy":
+        return cls(
+            max_attempts=max(1, settings.provider_retry_attempts),
+            base_delay_ms=settings.provider_retry_base_delay_ms,
+            max_delay_ms=settings.provider_retry_max_delay_ms,
+            jitter=settings.provider_retry_jitter,
+            max_retry_after_ms=settings.provider_retry_after_max_ms,
+        )
+
+    def is_retryable(self, error: BaseException) -> bool:
+        if isinstance(error, DeadlineExceeded):
+            return False
+        if getattr(error, "code", None) in NON_RETRYABLE_CODES:
+            return False
+        status = getattr(error, "status", None)
+        if isinstance(status, int):
+            return status in self.retry_statuses
+        # 网络错误等无状态码异常视为可重试
+        return True
+
+    def delay_ms(self, retry_index: int, retry_after_ms: Optional[float] = None) -> float:
+        """
+        计算第 retry_index 次重试（从 0 开始）前的等待时间
+
+        上游给出 Retry-After 时以其为下限（不超过 max_retry_after_ms）。
+        """
+        if self.backoff_ms:
+            ceiling = float(self.backoff_ms[min(retry_index, len(self.backoff_ms) - 1)])
+        else:
+            ceiling = min(float(self.max_delay_ms), self.base_delay_ms * (self.multiplier ** retry_index))
+        delay = random.uniform(0, ceiling) if self.jitter else ceiling
+        if retry_after_ms is not None:
+            delay = max(delay, min(float(retry_after_ms), float(self.max_retry_after_ms)))
+        return delay
+
+
+class RetryBudget:
+    """
+    单个 HTTP 请求的重试预算
+
+    在同一请求内的所有 Provider 调用共享：重试次数用尽或截止时间将至时不再重试。
+    """
+
+    def __init__(self, max_retries: Optional[int] = None, deadline_seconds: Optional[float] = None):
+        self._lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + deadline_seconds if deadline_seconds else None
+        self.max_retries = max_retries
+        self.retries_used = 0
+        self.wait_ms = 0.0
+        self.retry_attempt_ms = 0.0
+
+    def remaining_seconds(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def expired(self) -> bool:
+        remaining = self.remaining_seconds()
+        return remaining is not None and remaining <= 0
+
+    def try_consume(self, delay_ms: float = 0.0) -> bool:
+        """预占一次重试；预算用尽或等待后会越过截止时间时返回 False"""
+        with self._lock:
+            if self.max_retries is not None and self.retries_used >= self.max_retries:
+                return False
+            remaining = self.remaining_seconds()
+            if remaining is not None and remaining <= delay_ms / 1000.0:
+                return False
+            self.retries_used += 1
+            return True
+
+    def record_wait(self, wait_ms: float) -> None:
+        with self._lock:
+            self.wait_ms += wait_ms
+
+    def record_retry_attempt(self, elapsed_ms: float) -> None:
+        with self._lock:
+            self.retry_attempt_ms += elapsed_ms
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started_at) * 1000
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "retries_used": self.retries_used,
+                "wait_ms": round(self.wait_ms, 1),
+                "retry_attempt_ms": round(self.retry_attempt_ms, 1),
+                "elapsed_ms": round(self.elapsed_ms(), 1),
+            }
+
+
+_budget_var: contextvars.ContextVar[Optional[RetryBudget]] = contextvars.ContextVar(
+    "retry_budget", default=None
+)
+_retry_active_var: contextvars.ContextVar[bool] = contextvars.ContextVar("retry_active", default=False)
+
+
+def current_budget() -> Optional[RetryBudget]:
+    return _budget_var.get()
+
+
+@contextmanager
+def retry_budget(
+    max_retries: Optional[int] = None,
+    deadline_seconds: Optional[float] = None,
+) -> Iterator[RetryBudget]:
+    """在当前上下文（请求/任务）内开启重试预算"""
+    budget = RetryBudget(max_retries=max_retries, deadline_seconds=deadline_seconds)
+    token = _budget_var.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget_var.reset(token)
+
+
+def item_retry_budget() -> ContextManager[RetryBudget]:
+    """
+    批量操作中为单个条目开启独立预算（次数与截止时间同请求级配置）
+
+    请求级预算通过 contextvars 进入线程池，逐条调用 Provider 的批量路由 / 任务若共用它，
+    整批只有几次重试且会在截止时间后整体失败。
+    """
+    deadline = settings.request_deadline_seconds if settings.request_deadline_seconds > 0 else None
+    return retry_budget(max_retries=max(0, settings.request_retry_budget), deadline_seconds=deadline)
+
+
+def consume_retry(delay_ms: float = 0.0) -> bool:
+    """业务层的“换一个母号再试”等重试也从同一预算中扣减；无预算时总是允许"""
+    budget = _budget_var.get()
+    if budget is None:
+        return True
+    return budget.try_consume(delay_ms)
+
+
+def _retry_after_ms(error: BaseException) -> Optional[float]:
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value) * 1000.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头（秒数或 HTTP 日期），返回秒"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    from datetime import datetime, timezone
+
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def _plan_retry(
+    policy: RetryPolicy,
+    error: BaseException,
+    attempt: int,
+    max_attempts: int,
+) -> Optional[float]:
+    """返回下一次重试前的等待毫秒数；不应重试时返回 None"""
+    if attempt >= max_attempts or not policy.is_retryable(error):
+        return None
+    delay = policy.delay_ms(attempt - 1, _retry_after_ms(error))
+    budget = _budget_var.get()
+    if budget is not None and not budget.try_consume(delay):
+        return None
+    return delay
+
+
+def _record_wait(endpoint: str, wait_ms: float) -> None:
+    budget = _budget_var.get()
+    if budget is not None:
+        budget.record_wait(wait_ms)
+    provider_metrics.record_retry(endpoint, wait_ms)
+
+
+def _record_attempt(attempt: int, started: float) -> None:
+    # 仅统计重试（第 2 次及以后）的尝试耗时
+    if attempt <= 1:
+        return
+    budget = _budget_var.get()
+    if budget is not None:
+        budget.record_retry_attempt((time.monotonic() - started) * 1000)
+
+
+def _check_deadline(endpoint: str) -> None:
+    budget = _budget_var.get()
+    if budget is not None and budget.expired():
+        raise DeadlineExceeded(endpoint)
+
+
+def call_with_retry(
+    fn: Callable[[], T],
+    *,
+    policy: RetryPolicy,
+    endpoint: str = "-",
+    on_retry: Optional[Callable[[int, BaseException], None]] = None,
+) -> T:
+    """
+    按策略执行 fn，失败时重试；最终失败时抛出最后一次异常
+
+    若外层已处于重试循环中（嵌套调用），只执行一次，由外层统一决定是否重试。
+    """
+    _check_deadline(endpoint)
+    if _retry_active_var.get():
+        return fn()
+
+    token = _retry_active_var.set(True)
+    try:
+        attempt = 0
+        while True:
+            attempt += 1
+            t0 = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                _record_attempt(attempt, t0)
+                delay = _plan_retry(policy, e, attempt, policy.max_attempts)
+                if delay is None:
+                    raise
+                if on_retry:
+                    on_retry(attempt, e)
+                _record_wait(endpoint, delay)
+                time.sleep(delay / 1000.0)
+                _check_deadline(endpoint)
+                continue
+            _record_attempt(attempt, t0)
+            return result
+    finally:
+        _retry_active_var.reset(token)
+
+
+async def acall_with_retry(
+    fn: Callable[[], Awaitable[T]],
+    *,
+    policy: RetryPolicy,
+    endpoint: str = "-",
+    on_retry: Optional[Callable[[int, BaseException], None]] = None,
+) -> T:
+    """call_with_retry 的异步版本，退避使用 asyncio.sleep"""
+    _check_deadline(endpoint)
+    if _retry_active_var.get():
+        return await fn()
+
+    token = _retry_active_var.set(True)
+    try:
+        attempt = 0
+        while True:
+            attempt += 1
+            t0 = time.monotonic()
+            try:
+                result = await fn()
+            except Exception as e:
+                _record_attempt(attempt, t0)
+                delay = _plan_retry(policy, e, attempt, policy.max_attempts)
+                if delay is None:
+                    raise
+                if on_retry:
+                    on_retry(attempt, e)
+                _record_wait(endpoint, delay)
+                await asyncio.sleep(delay / 1000.0)
+                _check_deadline(endpoint)
+                continue
+            _record_attempt(attempt, t0)
+            return result
+    finally:
+        _retry_active_var.reset(token)
+
+
+provider_retry_policy = RetryPolicy.from_settings(settings)
@@ -0,0 +1,103 @@
+"""按时间分桶计数
+
+趋势/活动接口原先逐天（或用 OR 串起的每日条件）查询计数。这里每个指标只发一条
+SELECT bucket, COUNT(*) ... WHERE ts >= start AND ts < end GROUP BY bucket，
+空桶在 Python 中补 0：
+
+- SQLite：strftime 截断为文本，读回后解析
+- PostgreSQL 等：date_trunc
+- 支持小时 / 天两种粒度，时间均为 UTC naive
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+from typing import Any, Iterable, Optional, Union
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+BUCKET_HOUR = "hour"
+BUCKET_DAY = "day"
+BUCKETS = (BUCKET_HOUR, BUCKET_DAY)
+
+_STEP = {BUCKET_HOUR: timedelta(hours=1), BUCKET_DAY: timedelta(days=1)}
+_SQLITE_FORMAT = {BUCKET_HOUR: "%Y-%m-%d %H:00:00", BUCKET_DAY: "%Y-%m-%d 00:00:00"}
+
+
+def _check(bucket: str) -> None:
+    if bucket not in _STEP:
+        raise ValueError(f"不支持的时间粒度: {bucket}")
+
+
+def truncate(ts: datetime, bucket: str) -> datetime:
+    """截断到所在桶的起点"""
+    _check(bucket)
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0) if bucket == BUCKET_DAY else ts
+
+
+def bucket_starts(start: datetime, end: datetime, bucket: str) -> list[datetime]:
+    """[start, end) 覆盖的全部桶起点"""
+    _check(bucket)
+    step = _STEP[bucket]
+    cur = truncate(start, bucket)
+    out = []
+    while cur < end:
+        out.append(cur)
+        cur += step
+    return out
+
+
+def trailing_window(periods: int, bucket: str, now: Optional[datetime] = None) -> tuple[datetime, datetime]:
+    """包含当前桶在内的最近 periods 个桶：[start, end)"""
+    _check(bucket)
+    end = truncate(now or datetime.utcnow(), bucket) + _STEP[bucket]
+    return end - _STEP[bucket] * max(1, periods), end
+
+
+def bucket_expr(column, bucket: str, dialect_name: str):
+    _check(bucket)
+    if dialect_name == "sqlite":
+        return func.strftime(_SQLITE_FORMAT[bucket], column)
+    return func.date_trunc(bucket, column)
+
+
+def parse_bucket(value: Union[str, datetime, date]) -> datetime:
+    """把分桶表达式的结果（SQLite 为文本）转换为 datetime"""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.fromisoformat(str(value))
+
+
+def count_by_bucket(
+    session: Session,
+    column,
+    *,
+    start: datetime,
+    end: datetime,
+    bucket: str = BUCKET_DAY,
+    filters: Iterable[Any] = (),
+    measure: Optional[Any] = None,
+) -> list[tuple[datetime, int]]:
+    """一条 GROUP BY 统计 [start, end) 内 column（ORM 时间列）落在各桶的行数，
+    返回补齐空桶后的 [(桶起点, 数量)]；给出 measure 时改为对该列求和（用于读取预汇总表）"""
+    _check(bucket)
+    dialect = session.get_bind(column.class_).dialect.name
+    expr = bucket_expr(column, bucket, dialect)
+    agg = func.count() if measure is None else func.coalesce(func.sum(measure), 0)
+    stmt = (
+        select(expr, agg)
+        .where(column >= start, column < end, *filters)
+        .group_by(expr)
+    )
+    counts: dict[datetime, int] = {}
+    for key, count in session.execute(stmt):
+        if key is not None:
+            counts[parse_bucket(key)] = int(count or 0)
+    return [(b, counts.get(b, 0)) for b in bucket_starts(start, end, bucket)]
+
+
+def format_bucket(ts: datetime, bucket: str) -> str:
+    return ts.date().isoformat() if bucket == BUCKET_DAY else ts.isoformat()
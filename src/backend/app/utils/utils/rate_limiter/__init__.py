@@ -39,8 +39,15 @@ from .strategies import (
     EmailKeyStrategy,
     CompositeKeyStrategy,
     UserKeyStrategy,
+    JSONBodyKeyStrategy,
+)
+from .fastapi_integration import (
+    RateLimitRule,
+    build_full_key,
+    rate_limit,
+    rate_limit_many,
+    rate_limit_middleware_factory,
 )
-from .fastapi_integration import rate_limit, rate_limit_middleware_factory, build_full_key
 
 __version__ = "1.0.0"
 __all__ = [
@@ -60,8 +67,11 @@ __all__ = [
     "EmailKeyStrategy",
     "CompositeKeyStrategy",
     "UserKeyStrategy",
+    "JSONBodyKeyStrategy",
     # FastAPI integration
+    "RateLimitRule",
     "rate_limit",
+    "rate_limit_many",
     "rate_limit_middleware_factory",
     "build_full_key",
 ]
\ No newline at end of file
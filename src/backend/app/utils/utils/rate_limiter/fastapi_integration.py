@@ -3,6 +3,7 @@ FastAPI集成模块
 """
 from __future__ import annotations
 
+from dataclasses import dataclass
 from typing import Optional, Callable
 
 from fastapi import Depends, HTTPException, Request
@@ -17,6 +18,53 @@ def build_full_key(strategy: KeyStrategy, request: Request) -> str:
     return f"{strategy.name}:{strategy.build_key(request)}"
 
 
+async def _abuild_full_key(strategy: KeyStrategy, request: Request) -> Optional[str]:
+    """支持异步策略（abuild_key）；返回 None 表示跳过该规则"""
+    abuild = getattr(strategy, "abuild_key", None)
+    if abuild is None:
+        return build_full_key(strategy, request)
+    value = await abuild(request)
+    return None if value is None else f"{strategy.name}:{value}"
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """rate_limit_many 的一条规则"""
+    strategy: KeyStrategy
+    config_id: Optional[str] = None
+    config: Optional[RateLimitConfig] = None
+    tokens: int = 1
+
+
+async def _resolve_config(
+    limiter: RateLimiter, config: Optional[RateLimitConfig], config_id: Optional[str]
+) -> Optional[RateLimitConfig]:
+    # Redis 限流器的 get_config 命中进程内缓存，不产生网络往返
+    if config or not config_id:
+        return config
+    return await limiter.get_config(config_id)
+
+
+def _apply_result(request: Request, res: RateLimitResult, header_prefix: str) -> None:
+    """设置限流响应头；被拒绝时抛出 429"""
+    # 通过request.state设置响应头；FastAPI也允许在路由中添加
+    response: Optional[Response] = request.scope.get("fastapi_astack_response")  # 自定义钩子（如果设置）
+    if response is not None:
+        response.headers[f"{header_prefix}-Limit"] = str(res.limit)
+        response.headers[f"{header_prefix}-Remaining"] = str(res.remaining)
+        response.headers[f"{header_prefix}-Reset"] = str(res.reset_at_ms)
+
+    if not res.allowed:
+        headers = {
+            f"{header_prefix}-Limit": str(res.limit),
+            f"{header_prefix}-Remaining": str(res.remaining),
+            f"{header_prefix}-Reset": str(res.reset_at_ms),
+        }
+        if res.retry_after_ms >= 0:
+            headers["Retry-After"] = str((res.retry_after_ms + 999) // 1000)
+        raise HTTPException(status_code=429, detail="请求过于频繁，请稍后重试", headers=headers)
+
+
 def rate_limit(
     limiter: RateLimiter,
     strategy: KeyStrategy,
@@ -45,11 +93,7 @@ def rate_limit(
     """
     async def dependency(request: Request) -> object:
         key = build_full_key(strategy, request)
-        effective_config = config
-        if not effective_config and config_id:
-            fetched = await limiter.get_config(config_id)
-            if fetched:
-                effective_config = fetched
+        effective_config = await _resolve_config(limiter, config, config_id)
 
         res: RateLimitResult = await limiter.allow(
             key,
@@ -57,29 +101,69 @@ def rate_limit(
             config=effective_config,
             strategy=strategy.name,
         )
+        _apply_result(request, res, header_prefix)
+        return object()
 
-        # 通过request.state设置响应头；FastAPI也允许在路由中添加
-        response: Optional[Response] = request.scope.get("fastapi_astack_response")  # 自定义钩子（如果设置）
-        if response is not None:
-            response.headers[f"{header_prefix}-Limit"] = str(res.limit)
-            response.headers[f"{header_prefix}-Remaining"] = str(res.remaining)
-            response.headers[f"{header_prefix}-Reset"] = str(res.reset_at_ms)
-
-        if not res.allowed:
-            headers = {
-                f"{header_prefix}-Limit": str(res.limit),
-                f"{header_prefix}-Remaining": str(res.remaining),
-                f"{header_prefix}-Reset": str(res.reset_at_ms),
-            }
-            if res.retry_after_ms >= 0:
-                headers["Retry-After"] = str((res.retry_after_ms + 999) // 1000)
-            raise HTTPException(status_code=429, detail="请求过于频繁，请稍后重试", headers=headers)
+    return dependency
+
+
+def rate_limit_many(
+    limiter: RateLimiter,
+    *rules: RateLimitRule,
+    header_prefix: str = "X-RateLimit",
+) -> Callable[[Request], object]:
+    """
+    在一次检查中同时应用多条限流规则（Redis 上为一次 EVALSHA），全部满足才扣减。
 
+    响应头取剩余额度最少的桶；被拒绝时取重试等待最长的被拒绝桶。
+    限流器未实现 allow_many 时退回逐条 allow：先全部 peek，都满足再逐条扣减（非原子）。
+    """
+    async def dependency(request: Request) -> object:
+        checks = []
+        for rule in rules:
+            key = await _abuild_full_key(rule.strategy, request)
+            if key is None:
+                continue
+            cfg = await _resolve_config(limiter, rule.config, rule.config_id)
+            checks.append((key, rule.tokens, cfg, rule.strategy.name))
+        if not checks:
+            return object()
+
+        results = await _allow_many(limiter, checks)
+        if all(r.allowed for r in results):
+            res = min(results, key=lambda r: r.remaining)
+        else:
+            # 未满足的桶 retry_after_ms 非 0（-1 表示不会恢复）
+            res = max(
+                (r for r in results if r.retry_after_ms != 0),
+                key=lambda r: r.retry_after_ms if r.retry_after_ms >= 0 else float("inf"),
+                default=results[0],
+            )
+        _apply_result(request, res, header_prefix)
         return object()
 
     return dependency
 
 
+async def _allow_many(limiter: RateLimiter, checks: list) -> list[RateLimitResult]:
+    allow_many = getattr(limiter, "allow_many", None)
+    if allow_many is not None:
+        return await allow_many(checks)
+    # peek 不判定是否放行，按剩余额度判断
+    peeks = [
+        await limiter.allow(key, tokens, config=cfg, strategy=strategy, as_peek=True)
+        for key, tokens, cfg, strategy in checks
+    ]
+    short = [peek.remaining < check[1] for peek, check in zip(peeks, checks)]
+    if any(short):
+        # 额度不足的桶再正常检查一次（会被拒绝，得到 retry_after），其余桶不扣减
+        return [
+            await limiter.allow(key, tokens, config=cfg, strategy=strategy) if lacking else peek
+            for (key, tokens, cfg, strategy), peek, lacking in zip(checks, peeks, short)
+        ]
+    return [await limiter.allow(key, tokens, config=cfg, strategy=strategy) for key, tokens, cfg, strategy in checks]
+
+
 def rate_limit_middleware_factory(limiter: RateLimiter, strategy: KeyStrategy):
     """
     创建限流中间件的工厂函数
@@ -4,7 +4,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Optional, Protocol, Any, Mapping, Coroutine, runtime_checkable
+from typing import Optional, Protocol, Any, Mapping, Coroutine, Sequence, Tuple, List, runtime_checkable
 
 
 @dataclass(frozen=True)
@@ -54,6 +54,11 @@ class RateLimiter(Protocol):
         as_peek: bool = False,
     ) -> RateLimitResult: ...
 
+    async def allow_many(
+        self,
+        checks: Sequence[Tuple[str, int, Optional["RateLimitConfig"], Optional[str]]],
+    ) -> List[RateLimitResult]: ...
+
     async def get_status(
         self,
         key: str,
@@ -1,42 +1,131 @@
 """
 内存限流器实现 - 用作Redis不可用时的降级方案
+
+桶表为定长 LRU（OrderedDict）：超过 max_keys 时淘汰最久未访问的桶；
+空闲超过 idle_seconds 且令牌已回满的桶与新建桶等价，插入新键时顺带从 LRU 头部清理。
+allowed/denied 计数随桶存放，一起淘汰。锁按 hash(key) 分片，数量固定。
 """
 from __future__ import annotations
 
 import asyncio
 import time
-from collections import defaultdict
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 
 from .config import RateLimitConfig
 from .interfaces import RateLimiter, RateLimitResult, RateLimitStatus, RateLimitStats
 
+try:
+    from app.metrics_prom import rate_limiter_memory_evictions_total, rate_limiter_memory_keys
+except Exception:
+    rate_limiter_memory_evictions_total = rate_limiter_memory_keys = None
+
+# 每次插入最多检查的 LRU 头部桶数（摊还空闲清理）
+_IDLE_SWEEP_BATCH = 8
+
 
-@dataclass
+@dataclass(slots=True)
 class _Bucket:
     """令牌桶内部状态"""
     tokens: float
     last_refill: float  # 单调时间秒
     capacity: int
     refill_rate: float
+    allowed: int = 0
+    denied: int = 0
+
+    def refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.last_refill)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+        self.last_refill = now
+
+    def idle_full(self, now: float, idle_seconds: float) -> bool:
+        """空闲足够久且令牌已回满（淘汰后重建不会多给令牌）"""
+        idle = now - self.last_refill
+        return idle >= idle_seconds and self.tokens + idle * self.refill_rate >= self.capacity
 
 
 class MemoryTokenBucketLimiter(RateLimiter):
     """
     内存令牌桶限流器，适合在Redis不可用时作为降级方案。
-    通过每个键的异步锁实现线程安全。使用单调时钟。
+    通过分片异步锁实现并发安全，桶数量有上限。使用单调时钟。
+
+    注意：按容量淘汰的桶若未回满，重建后会重新获得满额令牌；max_keys 应明显大于活跃键数。
     """
 
-    def __init__(self, default_config: RateLimitConfig) -> None:
+    def __init__(
+        self,
+        default_config: RateLimitConfig,
+        *,
+        max_keys: int = 100_000,
+        idle_seconds: float = 600.0,
+        lock_shards: int = 64,
+    ) -> None:
         default_config.validate()
+        if max_keys <= 0 or lock_shards <= 0:
+            raise ValueError("max_keys and lock_shards must be positive")
         self._default = default_config
-        self._buckets: Dict[str, _Bucket] = {}
-        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._max_keys = int(max_keys)
+        self._idle_seconds = max(0.0, float(idle_seconds))
+        self._buckets: "OrderedDict[str, _Bucket]" = OrderedDict()
+        self._locks: List[asyncio.Lock] = [asyncio.Lock() for _ in range(int(lock_shards))]
         self._configs: Dict[str, RateLimitConfig] = {}
-        # 简单统计
-        self._allowed: Dict[str, int] = defaultdict(int)
-        self._denied: Dict[str, int] = defaultdict(int)
+        self.evictions: Dict[str, int] = {"capacity": 0, "idle": 0}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _lock_for(self, key: str) -> asyncio.Lock:
+        return self._locks[hash(key) % len(self._locks)]
+
+    def _evicted(self, reason: str, count: int) -> None:
+        self.evictions[reason] += count
+        if rate_limiter_memory_evictions_total is not None:
+            try:
+                rate_limiter_memory_evictions_total.labels(reason=reason).inc(count)
+            except Exception:
+                pass
+
+    def _bucket(self, key: str, cfg: RateLimitConfig, now: float) -> _Bucket:
+        """取出（或新建）桶并标记为最近使用，同时补充令牌"""
+        buckets = self._buckets
+        bucket = buckets.get(key)
+        if bucket is not None:
+            buckets.move_to_end(key)
+            bucket.refill(now)
+            return bucket
+
+        # 插入前摊还清理 LRU 头部的空闲桶
+        idle = 0
+        for _ in range(min(_IDLE_SWEEP_BATCH, len(buckets))):
+            oldest = next(iter(buckets.values()))
+            if not oldest.idle_full(now, self._idle_seconds):
+                break
+            buckets.popitem(last=False)
+            idle += 1
+        if idle:
+            self._evicted("idle", idle)
+        overflow = 0
+        while len(buckets) >= self._max_keys:
+            buckets.popitem(last=False)
+            overflow += 1
+        if overflow:
+            self._evicted("capacity", overflow)
+
+        bucket = _Bucket(
+            tokens=float(cfg.capacity),
+            last_refill=now,
+            capacity=cfg.capacity,
+            refill_rate=cfg.refill_rate,
+        )
+        buckets[key] = bucket
+        if rate_limiter_memory_keys is not None:
+            try:
+                rate_limiter_memory_keys.set(len(buckets))
+            except Exception:
+                pass
+        return bucket
 
     async def allow(
         self,
@@ -49,24 +138,10 @@ class MemoryTokenBucketLimiter(RateLimiter):
     ) -> RateLimitResult:
         cfg = config or self._default
         cfg.validate()
-        lock = self._locks[key]
         now = time.monotonic()
 
-        async with lock:
-            bucket = self._buckets.get(key)
-            if bucket is None:
-                bucket = _Bucket(
-                    tokens=float(cfg.capacity),
-                    last_refill=now,
-                    capacity=cfg.capacity,
-                    refill_rate=cfg.refill_rate,
-                )
-                self._buckets[key] = bucket
-
-            # 补充令牌
-            elapsed = max(0.0, now - bucket.last_refill)
-            bucket.tokens = min(bucket.capacity, bucket.tokens + elapsed * bucket.refill_rate)
-            bucket.last_refill = now
+        async with self._lock_for(key):
+            bucket = self._bucket(key, cfg, now)
 
             allowed = bucket.tokens >= tokens
             remaining_after = bucket.tokens
@@ -76,13 +151,13 @@ class MemoryTokenBucketLimiter(RateLimiter):
             if not as_peek:
                 if allowed:
                     bucket.tokens -= tokens
-                    self._allowed[key] += 1
+                    bucket.allowed += 1
                 else:
                     # 计算获取至少1个令牌的重试时间
                     deficit = tokens - bucket.tokens
                     retry_after_s = max(0.0, deficit / bucket.refill_rate)
                     retry_after_ms = int(round(retry_after_s * 1000))
-                    self._denied[key] += 1
+                    bucket.denied += 1
 
                 remaining_after = int(bucket.tokens)
             else:
@@ -98,20 +173,71 @@ class MemoryTokenBucketLimiter(RateLimiter):
             strategy=strategy,
         )
 
+    async def allow_many(
+        self,
+        checks: Sequence[Tuple[str, int, Optional[RateLimitConfig], Optional[str]]],
+    ) -> List[RateLimitResult]:
+        """检查多个桶，全部满足才扣减（与 Redis 实现语义一致）"""
+        resolved = []
+        for key, tokens, config, strategy in checks:
+            cfg = config or self._default
+            cfg.validate()
+            resolved.append((key, tokens, cfg, strategy))
+        if not resolved:
+            return []
+
+        now = time.monotonic()
+        # 按分片序号固定顺序加锁，避免并发的多桶检查互相等待
+        shards = sorted({hash(k) % len(self._locks) for k, *_ in resolved})
+        locks = [self._locks[i] for i in shards]
+        for lock in locks:
+            await lock.acquire()
+        try:
+            buckets = [self._bucket(key, cfg, now) for key, _, cfg, _ in resolved]
+
+            allowed = all(b.tokens >= t for b, (_, t, _, _) in zip(buckets, resolved))
+            results = []
+            for bucket, (key, tokens, cfg, strategy) in zip(buckets, resolved):
+                retry_after_ms = 0
+                if allowed:
+                    bucket.tokens -= tokens
+                    bucket.allowed += 1
+                elif bucket.tokens < tokens:
+                    retry_after_ms = int(round(max(0.0, (tokens - bucket.tokens) / bucket.refill_rate) * 1000))
+                    bucket.denied += 1
+                reset_at_ms = int(
+                    (time.time() + max(0.0, (bucket.capacity - bucket.tokens) / bucket.refill_rate)) * 1000
+                )
+                results.append(
+                    RateLimitResult(
+                        allowed=allowed,
+                        remaining=int(bucket.tokens),
+                        retry_after_ms=retry_after_ms,
+                        reset_at_ms=reset_at_ms,
+                        limit=cfg.capacity,
+                        key=key,
+                        strategy=strategy,
+                    )
+                )
+            return results
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
     async def get_status(self, key: str, *, config: Optional[RateLimitConfig] = None) -> RateLimitStatus:
         res = await self.allow(key, tokens=0, config=config, as_peek=True)
         return RateLimitStatus(remaining=res.remaining, reset_at_ms=res.reset_at_ms, limit=res.limit, key=key)
 
     async def get_stats(self, key: str) -> RateLimitStats:
-        # 内存回退不跟踪时间戳；为最后时间返回None
+        # 内存回退不跟踪时间戳；为最后时间返回None。计数随桶淘汰清零
         bucket = self._buckets.get(key)
         remaining = bucket.tokens if bucket else 0
         capacity = bucket.capacity if bucket else (self._default.capacity if self._default else 0)
 
         return RateLimitStats(
             key=key,
-            allowed=self._allowed.get(key, 0),
-            denied=self._denied.get(key, 0),
+            allowed=bucket.allowed if bucket else 0,
+            denied=bucket.denied if bucket else 0,
             last_allowed_ms=None,
             last_denied_ms=None,
             remaining=int(remaining),
@@ -1,19 +1,27 @@
 """
 Redis分布式限流器实现
+
+每次检查只有一次网络往返：
+- 限流配置缓存在进程内；set_config / delete_config 同时递增配置版本号，
+  令牌桶脚本每次返回当前版本号，发现变化后下一次 get_config 再重新加载（惰性刷新）
+- allow_many 在一次 EVALSHA 中检查多个桶（如兑换接口的 IP 与邮箱），全部满足才扣减
 """
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
-from typing import Optional, Tuple, List, Any, Dict, cast
+import time
+from typing import Optional, Sequence, Tuple, List, Any, Dict, cast
 
 try:
     from redis.asyncio import Redis  # type: ignore
-    from redis.exceptions import RedisError
+    from redis.exceptions import NoScriptError, RedisError
     REDIS_AVAILABLE = True
 except ImportError:
     Redis = None
     RedisError = Exception
+    NoScriptError = Exception
     REDIS_AVAILABLE = False
 
 from .config import RateLimitConfig
@@ -22,18 +30,16 @@ from .memory import MemoryTokenBucketLimiter
 
 logger = logging.getLogger(__name__)
 
-# Redis Lua脚本：令牌桶算法
+# Redis Lua脚本：令牌桶算法（一次检查一个或多个桶，全部满足才扣减）
 LUA_TOKEN_BUCKET = r"""
 -- KEYS:
---  1 -> bucket_key (hash)
---  2 -> stats_key  (hash)
---  3 -> denied_zset (sorted set)
+--  1 -> config_version_key (string; 配置版本号)
+--  2 -> denied_zset (sorted set)
+--  3.. -> 每个桶两项：bucket_key (hash), stats_key (hash)
 -- ARGV:
---  1 -> capacity (int)
---  2 -> refill_rate_per_sec (float as string)
---  3 -> requested_tokens (int)
---  4 -> expire_seconds (int; 0 for no expiry)
---  5 -> as_peek (0 or 1)
+--  1 -> as_peek (0 or 1)
+--  2.. -> 每个桶四项：capacity (int), refill_rate_per_sec (float as string),
+--         requested_tokens (int), expire_seconds (int; 0 for no expiry)
 --
 -- Hash fields in bucket:
 --  tokens (float), last_refill_ms (int), capacity (int), refill_rate (float)
@@ -42,119 +48,149 @@ LUA_TOKEN_BUCKET = r"""
 --  allowed (int), denied (int), last_allowed_ms (int), last_denied_ms (int),
 --  remaining (int), capacity (int)
 --
-local bucket_key = KEYS[1]
-local stats_key = KEYS[2]
-local denied_zset_key = KEYS[3]
-
-local capacity = tonumber(ARGV[1])
-local refill_rate = tonumber(ARGV[2])
-local requested = tonumber(ARGV[3])
-local expire_seconds = tonumber(ARGV[4])
-local as_peek = tonumber(ARGV[5])
-
-if capacity <= 0 then
-  return {0, 0, 0, 0, 0}
-end
-if refill_rate <= 0 then
-  -- treat as no-refill: only capacity tokens ever
-  refill_rate = 0
-end
+-- Returns: {config_version, 然后每个桶五项: allowed, remaining, retry_after_ms, reset_ms, capacity}
+--
+local version_key = KEYS[1]
+local denied_zset_key = KEYS[2]
+local as_peek = tonumber(ARGV[1])
+local n = (#KEYS - 2) / 2
 
 -- use Redis TIME for server time
 local t = redis.call('TIME')
 local now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local version = tonumber(redis.call('GET', version_key) or '0') or 0
+
+-- pass 1: refill every bucket and decide
+local state = {}
+local all_ok = 1
+for i = 1, n do
+  local a = 2 + (i - 1) * 4
+  local capacity = tonumber(ARGV[a])
+  local refill_rate = tonumber(ARGV[a + 1])
+  local requested = tonumber(ARGV[a + 2])
+  local expire_seconds = tonumber(ARGV[a + 3])
+  if refill_rate <= 0 then
+    -- treat as no-refill: only capacity tokens ever
+    refill_rate = 0
+  end
+
+  local bucket_key = KEYS[3 + (i - 1) * 2]
+  local data = redis.call('HMGET', bucket_key, 'tokens', 'last_refill_ms', 'capacity', 'refill_rate')
+  local tokens = tonumber(data[1])
+  local last_refill_ms = tonumber(data[2])
 
-local data = redis.call('HMGET', bucket_key, 'tokens', 'last_refill_ms', 'capacity', 'refill_rate')
-local tokens = tonumber(data[1])
-local last_refill_ms = tonumber(data[2])
-
-if tokens == nil or last_refill_ms == nil then
-  tokens = capacity
-  last_refill_ms = now_ms
-else
-  -- normalize capacity/refill_rate from existing if present
-  local existing_cap = tonumber(data[3])
-  local existing_rate = tonumber(data[4])
-  if existing_cap ~= nil then
-    capacity = existing_cap
+  if tokens == nil or last_refill_ms == nil then
+    tokens = capacity
+    last_refill_ms = now_ms
+  else
+    -- normalize capacity/refill_rate from existing if present
+    local existing_cap = tonumber(data[3])
+    local existing_rate = tonumber(data[4])
+    if existing_cap ~= nil then
+      capacity = existing_cap
+    end
+    if existing_rate ~= nil then
+      refill_rate = existing_rate
+    end
   end
-  if existing_rate ~= nil then
-    refill_rate = existing_rate
+
+  -- refill computation
+  if refill_rate > 0 then
+    local elapsed_ms = math.max(0, now_ms - last_refill_ms)
+    local add = (elapsed_ms * refill_rate) / 1000.0
+    tokens = math.min(capacity, tokens + add)
   end
-end
 
--- refill computation
-if refill_rate > 0 then
-  local elapsed_ms = math.max(0, now_ms - last_refill_ms)
-  local add = (elapsed_ms * refill_rate) / 1000.0
-  tokens = math.min(capacity, tokens + add)
+  local ok = 0
+  if capacity > 0 and requested > 0 and tokens >= requested then
+    ok = 1
+  else
+    all_ok = 0
+  end
+  state[i] = {tokens, capacity, refill_rate, requested, expire_seconds, ok}
 end
 
-local allowed = 0
-local retry_after_ms = 0
-
-if requested > 0 and tokens >= requested and as_peek == 0 then
-  allowed = 1
-  tokens = tokens - requested
-end
+-- pass 2: consume (only if every bucket allows), persist and report
+local out = {version}
+for i = 1, n do
+  local s = state[i]
+  local tokens, capacity, refill_rate, requested, expire_seconds, ok = s[1], s[2], s[3], s[4], s[5], s[6]
+  local bucket_key = KEYS[3 + (i - 1) * 2]
+  local stats_key = KEYS[4 + (i - 1) * 2]
+
+  local allowed = 0
+  local retry_after_ms = 0
+  if as_peek == 0 and all_ok == 1 then
+    allowed = 1
+    tokens = tokens - requested
+  end
 
--- Save bucket state
-redis.call('HMSET', bucket_key,
-  'tokens', tostring(tokens),
-  'last_refill_ms', tostring(now_ms),
-  'capacity', tostring(capacity),
-  'refill_rate', tostring(refill_rate)
-)
-if expire_seconds and expire_seconds > 0 then
-  redis.call('EXPIRE', bucket_key, expire_seconds)
-end
+  -- Save bucket state
+  redis.call('HSET', bucket_key,
+    'tokens', tostring(tokens),
+    'last_refill_ms', tostring(now_ms),
+    'capacity', tostring(capacity),
+    'refill_rate', tostring(refill_rate)
+  )
+  if expire_seconds and expire_seconds > 0 then
+    redis.call('EXPIRE', bucket_key, expire_seconds)
+  end
 
--- Stats handling
-local remaining_int = math.floor(tokens + 0.000001)
-if as_peek == 0 then
-  if allowed == 1 then
-    redis.call('HINCRBY', stats_key, 'allowed', 1)
-    redis.call('HSET', stats_key, 'last_allowed_ms', tostring(now_ms))
-  else
-    redis.call('HINCRBY', stats_key, 'denied', 1)
-    redis.call('HSET', stats_key, 'last_denied_ms', tostring(now_ms))
-    if denied_zset_key and denied_zset_key ~= '' then
-      redis.call('ZINCRBY', denied_zset_key, 1, stats_key)
-    end
-    -- compute retry-after: time to accumulate deficit tokens
-    if refill_rate > 0 then
-      local deficit = requested - tokens
-      if deficit > 0 then
-        retry_after_ms = math.floor((deficit / refill_rate) * 1000.0 + 0.5)
+  -- Stats handling
+  local remaining_int = math.floor(tokens + 0.000001)
+  if as_peek == 0 then
+    if allowed == 1 then
+      redis.call('HINCRBY', stats_key, 'allowed', 1)
+      redis.call('HSET', stats_key, 'last_allowed_ms', tostring(now_ms))
+    else
+      -- 只有不满足的桶记为拒绝；其余桶本次未扣减
+      if ok == 0 then
+        redis.call('HINCRBY', stats_key, 'denied', 1)
+        redis.call('HSET', stats_key, 'last_denied_ms', tostring(now_ms))
+        if denied_zset_key and denied_zset_key ~= '' then
+          redis.call('ZINCRBY', denied_zset_key, 1, stats_key)
+        end
+      end
+      -- compute retry-after: time to accumulate deficit tokens
+      if refill_rate > 0 then
+        local deficit = requested - tokens
+        if deficit > 0 then
+          retry_after_ms = math.floor((deficit / refill_rate) * 1000.0 + 0.5)
+        else
+          retry_after_ms = 0
+        end
       else
-        retry_after_ms = 0
+        retry_after_ms = -1
       end
-    else
-      retry_after_ms = -1
     end
   end
-end
 
-redis.call('HSET', stats_key, 'remaining', tostring(remaining_int))
-redis.call('HSET', stats_key, 'capacity', tostring(capacity))
-if expire_seconds and expire_seconds > 0 then
-  redis.call('EXPIRE', stats_key, expire_seconds)
-end
+  redis.call('HSET', stats_key, 'remaining', tostring(remaining_int), 'capacity', tostring(capacity))
+  if expire_seconds and expire_seconds > 0 then
+    redis.call('EXPIRE', stats_key, expire_seconds)
+  end
 
--- reset time: when bucket would be full if no consumption
-local reset_ms
-if refill_rate > 0 then
-  local to_full = capacity - tokens
-  if to_full <= 0 then
-    reset_ms = now_ms
+  -- reset time: when bucket would be full if no consumption
+  local reset_ms
+  if refill_rate > 0 then
+    local to_full = capacity - tokens
+    if to_full <= 0 then
+      reset_ms = now_ms
+    else
+      reset_ms = now_ms + math.floor((to_full / refill_rate) * 1000.0 + 0.5)
+    end
   else
-    reset_ms = now_ms + math.floor((to_full / refill_rate) * 1000.0 + 0.5)
+    reset_ms = now_ms
   end
-else
-  reset_ms = now_ms
+
+  table.insert(out, allowed)
+  table.insert(out, remaining_int)
+  table.insert(out, retry_after_ms)
+  table.insert(out, reset_ms)
+  table.insert(out, capacity)
 end
 
-return {allowed, remaining_int, retry_after_ms, reset_ms, capacity}
+return out
 """
 
 
@@ -172,6 +208,7 @@ class RedisTokenBucketLimiter(RateLimiter):
         namespace: str = "rate:limiter",
         fallback: Optional[MemoryTokenBucketLimiter] = None,
         config_key: str = "config",  # 在namespace下用于动态配置存储的字段名
+        config_cache_seconds: float = 60.0,  # 本地配置缓存的最长使用时间（版本号未变时）
     ) -> None:
         if not REDIS_AVAILABLE:
             raise ImportError("redis is required. Install with: pip install redis>=4.5")
@@ -183,7 +220,13 @@ class RedisTokenBucketLimiter(RateLimiter):
         self._fallback = fallback or MemoryTokenBucketLimiter(default_config)
         self._script_sha: Optional[str] = None
         self._config_hash_key = f"{self._ns}:{config_key}"
+        self._config_version_key = f"{self._ns}:{config_key}:version"
         self._denied_zset = f"{self._ns}:denied_rank"
+        self._config_cache_seconds = config_cache_seconds
+        self._config_cache: Optional[Dict[str, RateLimitConfig]] = None
+        self._config_version: Optional[int] = None
+        self._config_loaded_at = 0.0
+        self._config_lock = asyncio.Lock()
 
     async def _ensure_script(self) -> None:
         """确保Lua脚本已加载到Redis"""
@@ -202,38 +245,57 @@ class RedisTokenBucketLimiter(RateLimiter):
         stats = f"{self._ns}:stats:{key}"
         return bucket, stats, self._denied_zset
 
-    async def _eval_token_bucket(
-        self, key: str, cfg: RateLimitConfig, requested_tokens: int, as_peek: bool
-    ) -> Optional[List[int]]:
-        """执行令牌桶Lua脚本"""
+    async def _eval_token_buckets(
+        self, checks: Sequence[Tuple[str, RateLimitConfig, int]], as_peek: bool
+    ) -> Optional[List[List[int]]]:
+        """执行令牌桶Lua脚本；checks 为 (key, config, requested_tokens)"""
         await self._ensure_script()
-        bucket_key, stats_key, denied_zset_key = self._keys_for(key)
-
-        argv = [
-            str(cfg.capacity),
-            str(cfg.refill_rate),
-            str(int(requested_tokens)),
-            str(int(cfg.expire_seconds or 0)),
-            "1" if as_peek else "0",
-        ]
+        keys: List[str] = [self._config_version_key, self._denied_zset]
+        argv: List[str] = ["1" if as_peek else "0"]
+        for key, cfg, requested_tokens in checks:
+            bucket_key, stats_key, _ = self._keys_for(key)
+            keys += [bucket_key, stats_key]
+            argv += [
+                str(cfg.capacity),
+                str(cfg.refill_rate),
+                str(int(requested_tokens)),
+                str(int(cfg.expire_seconds or 0)),
+            ]
 
         try:
-            if self._script_sha:
-                res = await self._redis.evalsha(self._script_sha, 3, bucket_key, stats_key, denied_zset_key, *argv)
-            else:
-                res = await self._redis.eval(LUA_TOKEN_BUCKET, 3, bucket_key, stats_key, denied_zset_key, *argv)
+            try:
+                if not self._script_sha:
+                    raise NoScriptError("script not loaded")
+                res = await self._redis.evalsha(self._script_sha, len(keys), *keys, *argv)
+            except NoScriptError:
+                # Redis 重启或执行过 SCRIPT FLUSH：直接 EVAL，并在下次重新加载
+                self._script_sha = None
+                res = await self._redis.eval(LUA_TOKEN_BUCKET, len(keys), *keys, *argv)
         except RedisError as e:
             logger.warning("Redis error during rate limit check: %s", e)
             return None
 
-        # res = [allowed, remaining, retry_after_ms, reset_ms, capacity]
+        # res = [config_version, (allowed, remaining, retry_after_ms, reset_ms, capacity) * n]
         try:
-            out = [int(res[0]), int(res[1]), int(res[2]), int(res[3]), int(res[4])]
-            return out
+            self._note_config_version(int(res[0]))
+            values = [int(v) for v in res[1:]]
+            return [values[i:i + 5] for i in range(0, len(values), 5)]
         except Exception as e:
             logger.error("Failed to parse Redis response: %s", e)
             return None
 
+    def _to_result(self, key: str, row: List[int], strategy: Optional[str], as_peek: bool) -> RateLimitResult:
+        allowed, remaining, retry_after_ms, reset_ms, capacity = row
+        return RateLimitResult(
+            allowed=bool(allowed) if not as_peek else True,
+            remaining=remaining,
+            retry_after_ms=retry_after_ms if not as_peek else 0,
+            reset_at_ms=reset_ms,
+            limit=capacity,
+            key=key,
+            strategy=strategy,
+        )
+
     async def allow(
         self,
         key: str,
@@ -246,22 +308,34 @@ class RedisTokenBucketLimiter(RateLimiter):
         cfg = config or self._default
         cfg.validate()
 
-        result = await self._eval_token_bucket(key, cfg, tokens, as_peek)
-        if result is None:
+        rows = await self._eval_token_buckets([(key, cfg, tokens)], as_peek)
+        if rows is None:
             # 在任何Redis问题时回退
             logger.debug("Falling back to memory limiter for key: %s", key)
             return await self._fallback.allow(key, tokens, config=cfg, strategy=strategy, as_peek=as_peek)
+        return self._to_result(key, rows[0], strategy, as_peek)
 
-        allowed, remaining, retry_after_ms, reset_ms, capacity = result
-        return RateLimitResult(
-            allowed=bool(allowed) if not as_peek else True,
-            remaining=remaining,
-            retry_after_ms=retry_after_ms if not as_peek else 0,
-            reset_at_ms=reset_ms,
-            limit=capacity,
-            key=key,
-            strategy=strategy,
-        )
+    async def allow_many(
+        self,
+        checks: Sequence[Tuple[str, int, Optional[RateLimitConfig], Optional[str]]],
+    ) -> List[RateLimitResult]:
+        """
+        一次往返检查多个桶；checks 为 (key, tokens, config, strategy)。
+        全部满足才扣减，否则都不扣减，结果中的 allowed 一致。
+        """
+        resolved = []
+        for key, tokens, config, strategy in checks:
+            cfg = config or self._default
+            cfg.validate()
+            resolved.append((key, tokens, cfg, strategy))
+        if not resolved:
+            return []
+
+        rows = await self._eval_token_buckets([(k, c, t) for k, t, c, _ in resolved], False)
+        if rows is None:
+            logger.debug("Falling back to memory limiter for keys: %s", [k for k, *_ in resolved])
+            return await self._fallback.allow_many(checks)
+        return [self._to_result(k, row, strategy, False) for (k, _, _, strategy), row in zip(resolved, rows)]
 
     async def get_status(self, key: str, *, config: Optional[RateLimitConfig] = None) -> RateLimitStatus:
         res = await self.allow(key, tokens=0, config=config, as_peek=True)
@@ -302,8 +376,61 @@ class RedisTokenBucketLimiter(RateLimiter):
             # 回退：没有持久化的统计数据，但提供回退所知道的
             return await self._fallback.get_stats(key)
 
+    # ---- 动态配置（进程内缓存 + 版本号） ----
+
+    def _note_config_version(self, version: int) -> None:
+        """脚本返回的版本号与本地缓存不一致时，标记缓存失效"""
+        if self._config_version is not None and version != self._config_version:
+            self._config_cache = None
+
+    @staticmethod
+    def _parse_config(raw: Any) -> RateLimitConfig:
+        if isinstance(raw, bytes):
+            raw = raw.decode()
+        data = json.loads(raw)
+        return RateLimitConfig(
+            capacity=int(data["capacity"]),
+            refill_rate=float(data["refill_rate"]),
+            expire_seconds=int(data.get("expire_seconds", 0)),
+            name=data.get("name"),
+        )
+
+    async def _load_configs(self) -> Dict[str, RateLimitConfig]:
+        """一次往返读取全部配置与版本号"""
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.hgetall(self._config_hash_key)
+        pipe.get(self._config_version_key)
+        raw_map, version = await pipe.execute()
+
+        configs: Dict[str, RateLimitConfig] = {}
+        for config_id, raw in (raw_map or {}).items():
+            if isinstance(config_id, bytes):
+                config_id = config_id.decode()
+            try:
+                configs[config_id] = self._parse_config(raw)
+            except Exception as e:
+                logger.warning("Invalid rate limit config %s: %s", config_id, e)
+        self._config_cache = configs
+        self._config_version = int(version or 0)
+        self._config_loaded_at = time.monotonic()
+        return configs
+
+    def _config_cache_fresh(self) -> bool:
+        return (
+            self._config_cache is not None
+            and time.monotonic() - self._config_loaded_at < self._config_cache_seconds
+        )
+
+    async def _bump_config_version(self, op: str, *args: Any) -> None:
+        pipe = self._redis.pipeline(transaction=True)
+        getattr(pipe, op)(self._config_hash_key, *args)
+        pipe.incr(self._config_version_key)
+        await pipe.execute()
+        # 本进程立即失效；其他进程在下一次检查时通过版本号发现变化
+        self._config_cache = None
+
     async def set_config(self, config_id: str, config: RateLimitConfig) -> None:
-        """在Redis哈希中存储序列化配置"""
+        """在Redis哈希中存储序列化配置，并递增配置版本号"""
         payload = json.dumps(
             {
                 "capacity": config.capacity,
@@ -314,36 +441,28 @@ class RedisTokenBucketLimiter(RateLimiter):
             separators=(",", ":"),
         )
         try:
-            await self._redis.hset(self._config_hash_key, config_id, payload)
+            await self._bump_config_version("hset", config_id, payload)
             logger.debug("Stored rate limit config: %s", config_id)
         except RedisError as e:
             logger.warning("Failed to store rate limit config: %s", e)
             # 尽力而为：忽略失败
 
     async def get_config(self, config_id: str) -> Optional[RateLimitConfig]:
-        """从Redis获取配置"""
-        try:
-            raw = await self._redis.hget(self._config_hash_key, config_id)
-            if not raw:
-                return None
-            if isinstance(raw, bytes):
-                raw = raw.decode()
-            data = json.loads(raw)
-            cfg = RateLimitConfig(
-                capacity=int(data["capacity"]),
-                refill_rate=float(data["refill_rate"]),
-                expire_seconds=int(data.get("expire_seconds", 0)),
-                name=data.get("name"),
-            )
-            return cfg
-        except (RedisError, Exception) as e:
-            logger.warning("Failed to get rate limit config: %s", e)
-            return None
+        """获取配置：优先使用进程内缓存，过期或版本变化时从Redis重新加载"""
+        if not self._config_cache_fresh():
+            async with self._config_lock:
+                if not self._config_cache_fresh():
+                    try:
+                        await self._load_configs()
+                    except (RedisError, Exception) as e:
+                        logger.warning("Failed to get rate limit config: %s", e)
+                        # 加载失败时继续使用旧缓存（若有）
+        return (self._config_cache or {}).get(config_id)
 
     async def delete_config(self, config_id: str) -> None:
         """删除配置"""
         try:
-            await self._redis.hdel(self._config_hash_key, config_id)
+            await self._bump_config_version("hdel", config_id)
             logger.debug("Deleted rate limit config: %s", config_id)
         except RedisError as e:
             logger.warning("Failed to delete rate limit config: %s", e)
@@ -53,6 +53,32 @@ class EmailKeyStrategy:
         return request.query_params.get(self.form_field, "unknown")
 
 
+class JSONBodyKeyStrategy:
+    """
+    基于JSON请求体字段的键生成策略（如兑换接口的 email）
+
+    依赖中读取的请求体由 Starlette 缓存，不会重复读取；字段缺失时 abuild_key 返回 None，
+    rate_limit_many 会跳过该规则。
+    """
+
+    def __init__(self, field: str = "email", name: Optional[str] = None) -> None:
+        self.field = field
+        self.name = name or field
+
+    def build_key(self, request: Request) -> str:
+        return request.query_params.get(self.field, "unknown")
+
+    async def abuild_key(self, request: Request) -> Optional[str]:
+        try:
+            body = await request.json()
+        except Exception:
+            return None
+        value = body.get(self.field) if isinstance(body, dict) else None
+        if not isinstance(value, str) or not value.strip():
+            return None
+        return value.strip().lower()
+
+
 class CompositeKeyStrategy:
     """
     组合多个策略生成一个键。最终键嵌入每个段，如: "ip:1.2.3.4|path:/login"
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+内存回退限流器压测：大量不同键下的内存占用
+
+向 MemoryTokenBucketLimiter 写入 N 个互不相同的键（模拟随机 IP / 邮箱攻击），
+每隔一段打印桶数、淘汰数与 tracemalloc 统计的当前内存；桶数达到上限后内存应保持平稳。
+
+Usage:
+  python scripts/bench_memory_limiter.py --keys 1000000 --max-keys 100000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from app.utils.utils.rate_limiter import MemoryTokenBucketLimiter, RateLimitConfig
+
+
+async def run(keys: int, max_keys: int, report_every: int) -> None:
+    limiter = MemoryTokenBucketLimiter(
+        RateLimitConfig(capacity=60, refill_rate=1.0, name="bench"), max_keys=max_keys
+    )
+    tracemalloc.start()
+    started = time.perf_counter()
+    print(f"{'keys':>10} {'buckets':>10} {'evicted':>10} {'current_mb':>11} {'peak_mb':>9}")
+    for i in range(1, keys + 1):
+        await limiter.allow(f"ip:{i}")
+        if i % report_every == 0:
+            current, peak = tracemalloc.get_traced_memory()
+            print(
+                f"{i:>10} {len(limiter):>10} {limiter.evictions['capacity']:>10} "
+                f"{current / 2**20:>11.1f} {peak / 2**20:>9.1f}"
+            )
+    elapsed = time.perf_counter() - started
+    tracemalloc.stop()
+    print(f"{keys} keys in {elapsed:.1f}s ({keys / elapsed:,.0f} ops/s, tracemalloc enabled)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=1_000_000)
+    parser.add_argument("--max-keys", type=int, default=100_000)
+    parser.add_argument("--report-every", type=int, default=100_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.keys, args.max_keys, args.report_every))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+管理员会话校验缓存测试
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.config import settings
+from app.security import sign_session
+from app.services.services import admin_session_cache as cache
+
+
+class _Redis:
+    """测试用最小 Redis：只实现缓存用到的命令"""
+
+    def __init__(self):
+        self.data = {}
+
+    def mget(self, *keys):
+        return [self.data.get(k) for k in keys]
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key) or 0) + 1)
+        return int(self.data[key])
+
+
+@pytest.fixture
+def db(test_engine, monkeypatch):
+    monkeypatch.setattr(settings, "admin_session_cache_ttl_seconds", 30.0)
+    monkeypatch.setattr(cache, "_local", {})
+    monkeypatch.setattr(cache, "_local_epoch", 0)
+    session = sessionmaker(bind=test_engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _login(db, sid):
+    db.add(models.AdminSession(session_id=sid, expires_at=datetime.utcnow() + timedelta(hours=1)))
+    db.commit()
+    return sign_session(sid)
+
+
+def _revoke_in_db(db, sid):
+    db.query(models.AdminSession).filter_by(session_id=sid).update({"revoked": True})
+    db.commit()
+
+
+@pytest.mark.parametrize("backend", ["memory", "redis"])
+def test_cache_hit_logout_and_logout_all(db, monkeypatch, backend):
+    fake = _Redis() if backend == "redis" else None
+    monkeypatch.setattr(cache, "_redis", lambda: fake)
+    token = _login(db, f"sess-{backend}-1")
+    other = _login(db, f"sess-{backend}-2")
+
+    assert cache.resolve_admin_session(db, token) == f"sess-{backend}-1"
+    assert cache.resolve_admin_session(db, other) == f"sess-{backend}-2"
+
+    # 命中缓存时不再查库（库中撤销对缓存不可见，直到显式失效）
+    _revoke_in_db(db, f"sess-{backend}-1")
+    assert cache.resolve_admin_session(db, token) == f"sess-{backend}-1"
+    cache.invalidate_admin_session(token)
+    assert cache.resolve_admin_session(db, token) is None
+
+    _revoke_in_db(db, f"sess-{backend}-2")
+    cache.invalidate_all_admin_sessions()
+    assert cache.resolve_admin_session(db, other) is None
+
+
+def test_shared_redis_revocation_and_no_refill(db, monkeypatch):
+    fake = _Redis()
+    monkeypatch.setattr(cache, "_redis", lambda: fake)
+    token = _login(db, "sess-shared")
+    assert cache.resolve_admin_session(db, token) == "sess-shared"
+
+    # 另一个 worker 登出：墓碑写入共享存储，本进程立即可见
+    cache.invalidate_admin_session(token)
+    monkeypatch.setattr(cache, "_local", {})
+    assert cache.resolve_admin_session(db, token) is None
+    # 回填使用 NX，不会覆盖墓碑
+    cache._store(cache._token_hash(token), "sess-shared", 0, 30)
+    assert cache.resolve_admin_session(db, token) is None
+
+
+def test_invalid_token_and_disabled_cache(db, monkeypatch):
+    monkeypatch.setattr(cache, "_redis", lambda: None)
+    assert cache.resolve_admin_session(db, "garbage") is None
+    monkeypatch.setattr(settings, "admin_session_cache_ttl_seconds", 0.0)
+    token = _login(db, "sess-nocache")
+    assert cache.resolve_admin_session(db, token) == "sess-nocache"
+    _revoke_in_db(db, "sess-nocache")
+    assert cache.resolve_admin_session(db, token) is None
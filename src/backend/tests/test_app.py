@@ -3,7 +3,7 @@
 """
 import asyncio
 from typing import Optional
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import sessionmaker
@@ -29,13 +29,14 @@ def test_redeem_success(test_client: TestClient, db_session, sample_redeem_codes
 
     with patch("app.services.services.redeem.InviteService") as mock_invite_service:
         service = MagicMock()
-        service.invite_email.return_value = (
+        # /api/redeem 走异步邀请路径
+        service.invite_email_async = AsyncMock(return_value=(
             True,
             "邀请成功",
             1,
             sample_mothers[0].id,
             sample_mothers[0].teams[0].team_id,
-        )
+        ))
         mock_invite_service.return_value = service
 
         response = test_client.post(
@@ -120,6 +121,24 @@ def test_public_redeem_rate_limit(test_client: TestClient):
                 strategy=strategy,
             )
 
+        async def allow_many(self, checks):
+            # 一次请求的多条规则整体只计一次
+            allowed = self.remaining >= 1
+            if allowed:
+                self.remaining -= 1
+            return [
+                RateLimitResult(
+                    allowed=allowed,
+                    remaining=self.remaining,
+                    retry_after_ms=0 if allowed else 1000,
+                    reset_at_ms=0,
+                    limit=1,
+                    key=key,
+                    strategy=strategy,
+                )
+                for key, _, _, strategy in checks
+            ]
+
         async def get_config(self, config_id: str):
             return None
 
@@ -0,0 +1,120 @@
+"""
+纯 ASGI 中间件测试（安全头、输入校验、统一响应格式）
+"""
+from fastapi import APIRouter, FastAPI, Response
+from fastapi.testclient import TestClient
+
+from app.middleware import InputValidationMiddleware, SecurityHeadersMiddleware
+from app.middleware.response import UnifiedJSONResponse, setup_middleware
+
+
+def _security_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    def ping(response: Response):
+        response.headers["X-Frame-Options"] = "SAMEORIGIN"
+        return {"ok": True}
+
+    @app.post("/api/echo")
+    def echo():
+        return {"ok": True}
+
+    app.add_middleware(InputValidationMiddleware)
+    app.add_middleware(SecurityHeadersMiddleware)
+    return app
+
+
+def test_security_headers_use_per_request_nonce():
+    client = TestClient(_security_app())
+    first = client.get("/ping", headers={"X-Domain": "users"})
+    second = client.get("/ping")
+
+    nonce = first.headers["x-csp-nonce"]
+    assert f"script-src 'self' 'nonce-{nonce}'" in first.headers["content-security-policy"]
+    assert f"style-src 'self' 'nonce-{nonce}'" in first.headers["content-security-policy"]
+    assert second.headers["x-csp-nonce"] != nonce
+    # 覆盖路由设置的同名头部，且不重复
+    assert first.headers.get_list("x-frame-options") == ["DENY"]
+    assert first.headers["x-domain-ack"] == "users"
+    assert "x-domain-ack" not in second.headers
+
+
+def test_input_validation_rejects_before_routing():
+    client = TestClient(_security_app())
+    assert client.get("/ping", headers={"X-Test": "<script>"}).status_code == 400
+    bad = client.post("/api/echo", content="x", headers={"content-type": "text/plain"})
+    assert bad.status_code == 415
+    assert bad.json() == {"detail": "Unsupported Media Type"}
+    # 拒绝响应同样带安全头
+    assert "content-security-policy" in bad.headers
+    assert client.post("/api/echo", json={}).status_code == 200
+
+
+def test_unified_envelope_applied_at_render():
+    app = FastAPI()
+    setup_middleware(app)
+    router = APIRouter()
+
+    @router.get("/plain")
+    def plain():
+        return {"value": 1}
+
+    @router.get("/standard")
+    def standard():
+        return {"success": True, "message": "ok", "data": [1], "meta": {"page": 1}}
+
+    app.include_router(router)
+    client = TestClient(app)
+
+    resp = client.get("/plain")
+    body = resp.json()
+    assert body["success"] is True and body["data"] == {"value": 1}
+    assert body["meta"]["request_id"] == resp.headers["x-request-id"]
+    assert "processing_time_ms" in body["meta"]
+    assert resp.headers["x-content-type-options"] == "nosniff"
+
+    body = client.get("/standard").json()
+    assert body["data"] == [1] and body["meta"]["page"] == 1 and "request_id" in body["meta"]
+
+
+def test_envelope_skipped_without_middleware():
+    assert UnifiedJSONResponse({"a": 1}).body == b'{"a":1}'
+
+
+def test_envelope_covers_explicit_json_and_exception_handlers():
+    """显式 JSONResponse、异常处理器输出及早于 setup_middleware 注册的路由同样被包装"""
+    from fastapi import HTTPException
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI()
+
+    @app.get("/early")
+    def early():
+        return {"value": 0}
+
+    setup_middleware(app)
+
+    @app.get("/explicit")
+    def explicit():
+        return JSONResponse({"value": 2}, status_code=201)
+
+    @app.get("/missing")
+    def missing():
+        raise HTTPException(status_code=404, detail="nope")
+
+    client = TestClient(app)
+
+    resp = client.get("/explicit")
+    body = resp.json()
+    assert resp.status_code == 201 and body["data"] == {"value": 2}
+    assert body["meta"]["request_id"] == resp.headers["x-request-id"]
+    assert int(resp.headers["content-length"]) == len(resp.content)
+
+    resp = client.get("/missing")
+    body = resp.json()
+    assert resp.status_code == 404
+    assert body["message"] == "操作失败" and body["data"] == {"detail": "nope"}
+    assert "request_id" in body["meta"]
+
+    assert client.get("/early").json()["data"] == {"value": 0}
@@ -0,0 +1,178 @@
+"""
+Provider 熔断器测试
+"""
+import threading
+
+import pytest
+
+from app import circuit_breaker as cb_mod
+from app.circuit_breaker import (
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    BreakerBackend,
+    BreakerConfig,
+    CircuitBreaker,
+    MemoryBreakerBackend,
+)
+
+
+def _backend(**overrides) -> MemoryBreakerBackend:
+    return MemoryBreakerBackend(BreakerConfig(**overrides))
+
+
+class TestMemoryBreakerBackend:
+    """测试状态机与 LRU 上限"""
+
+    def test_opens_after_threshold_and_probes_once(self):
+        b = _backend(fail_threshold=2, reset_seconds=10, half_open_max_probes=1)
+        now = 1000.0
+        b.on_failure("send_invite", "t1", now)
+        assert b.allow("send_invite", "t1", now) is True
+        b.on_failure("send_invite", "t1", now)
+        assert b.get("send_invite", "t1").state == STATE_OPEN
+        assert b.allow("send_invite", "t1", now + 5) is False
+
+        # 冷却结束：只放行一个探测
+        assert b.allow("send_invite", "t1", now + 11) is True
+        assert b.get("send_invite", "t1").state == STATE_HALF_OPEN
+        assert b.allow("send_invite", "t1", now + 11) is False
+
+        b.on_success("send_invite", "t1")
+        assert b.get("send_invite", "t1") is None
+        assert b.allow("send_invite", "t1", now + 12) is True
+
+    def test_failed_probe_reopens(self):
+        b = _backend(fail_threshold=1, reset_seconds=10)
+        b.on_failure("list_members", "t1", 0.0)
+        assert b.allow("list_members", "t1", 11.0) is True
+        b.on_failure("list_members", "t1", 11.0)
+        st = b.get("list_members", "t1")
+        assert st.state == STATE_OPEN
+        assert st.opened_at == 11.0
+        assert b.allow("list_members", "t1", 15.0) is False
+
+    def test_lost_probe_lease_expires(self):
+        b = _backend(fail_threshold=1, reset_seconds=10, probe_timeout_seconds=5)
+        b.on_failure("x", "t1", 0.0)
+        assert b.allow("x", "t1", 10.0) is True
+        assert b.allow("x", "t1", 12.0) is False
+        assert b.allow("x", "t1", 15.0) is True
+
+    def test_lru_bound(self):
+        b = _backend(fail_threshold=5, max_entries=3)
+        for i in range(10):
+            b.on_failure("x", f"team-{i}", 0.0)
+        teams = [st.team_id for st in b.items()]
+        assert len(teams) == 3
+        assert teams == ["team-9", "team-8", "team-7"]
+
+    def test_reset_filters(self):
+        b = _backend(fail_threshold=1)
+        b.on_failure("a", "t1", 0.0)
+        b.on_failure("b", "t1", 0.0)
+        b.on_failure("a", "t2", 0.0)
+        assert b.reset(endpoint="a") == 2
+        assert [st.endpoint for st in b.items()] == ["b"]
+
+    def test_items_filter_by_endpoint_or_team(self):
+        b = _backend(fail_threshold=5)
+        b.on_failure("a", "t1", 0.0)
+        b.on_failure("b", "t1", 0.0)
+        b.on_failure("a", "t2", 0.0)
+        assert sorted(st.team_id for st in b.items(endpoint="a")) == ["t1", "t2"]
+        assert sorted(st.endpoint for st in b.items(team_id="t1")) == ["a", "b"]
+
+    def test_state_filter_applies_before_limit(self):
+        b = _backend(fail_threshold=2)
+        b.on_failure("a", "open-team", 0.0)
+        b.on_failure("a", "open-team", 0.0)
+        # 更新的 closed 条目排在前面，不能占掉 limit
+        for i in range(5):
+            b.on_failure("a", f"team-{i}", 0.0)
+        assert [st.team_id for st in b.items(limit=2, state=STATE_OPEN)] == ["open-team"]
+        breaker = CircuitBreaker(backend=b, config=b.config)
+        assert [st["team_id"] for st in breaker.snapshot(limit=1, state=STATE_OPEN)["items"]] == ["open-team"]
+
+
+class _BrokenBackend(BreakerBackend):
+    name = "broken"
+
+    def _down(self, *args):
+        raise ConnectionError("redis down")
+
+    allow = on_success = on_failure = get = items = reset = _down
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        BreakerBackend()
+
+
+def test_breaker_falls_back_to_memory_when_backend_fails():
+    breaker = CircuitBreaker(backend=_BrokenBackend(), config=BreakerConfig(fail_threshold=1))
+    breaker.record_failure("send_invite", "t1")
+    assert breaker.allow("send_invite", "t1") is False
+    snapshot = breaker.snapshot()
+    assert snapshot["backend"] == "broken"
+    assert snapshot["items"][0]["state"] == STATE_OPEN
+
+
+class _RemoteBackend(BreakerBackend):
+    """模拟 Redis 后端：委托给进程内后端，并记录调用所在线程"""
+
+    name = "redis"
+
+    def __init__(self, config):
+        self.config = config
+        self.memory = MemoryBreakerBackend(config)
+        self.threads = set()
+
+    def allow(self, endpoint, team_id, now):
+        self.threads.add(threading.get_ident())
+        return self.memory.allow(endpoint, team_id, now)
+
+    def on_success(self, endpoint, team_id):
+        self.memory.on_success(endpoint, team_id)
+
+    def on_failure(self, endpoint, team_id, now):
+        self.memory.on_failure(endpoint, team_id, now)
+
+    def get(self, endpoint, team_id):
+        return self.memory.get(endpoint, team_id)
+
+    def items(self, limit=200, endpoint=None, team_id=None, state=None):
+        return self.memory.items(limit, endpoint, team_id, state)
+
+    def reset(self, endpoint=None, team_id=None):
+        return self.memory.reset(endpoint, team_id)
+
+
+def test_auto_backend_reprobes_redis(monkeypatch):
+    config = BreakerConfig()
+    remote = _RemoteBackend(config)
+    available = [False]
+    clock = [100.0]
+    monkeypatch.setattr(cb_mod.settings, "circuit_breaker_backend", "auto")
+    monkeypatch.setattr(cb_mod.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(
+        cb_mod, "_build_backend", lambda cfg: remote if available[0] else MemoryBreakerBackend(cfg)
+    )
+
+    breaker = CircuitBreaker(config=config)
+    assert breaker.backend.name == "memory"
+    available[0] = True
+    assert breaker.backend.name == "memory"
+    clock[0] += cb_mod._REPROBE_SECONDS
+    assert breaker.backend is remote
+    clock[0] += cb_mod._REPROBE_SECONDS
+    assert breaker.backend is remote
+
+
+@pytest.mark.asyncio
+async def test_async_calls_run_remote_backend_off_loop():
+    remote = _RemoteBackend(BreakerConfig(fail_threshold=1))
+    breaker = CircuitBreaker(backend=remote, config=remote.config)
+    assert await breaker.aallow("send_invite", "t1") is True
+    assert threading.get_ident() not in remote.threads
+    await breaker.arecord_failure("send_invite", "t1")
+    assert await breaker.aallow("send_invite", "t1") is False
@@ -0,0 +1,74 @@
+"""
+兑换码流式导出测试
+"""
+import json
+import os
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.config import settings
+from app.services.services import code_export
+from app.services.services.jobs import JobRunner
+
+BATCH = "export-test"
+
+
+@pytest.fixture
+def users(test_engine):
+    session = sessionmaker(bind=test_engine)()
+    session.query(models.RedeemCode).filter(models.RedeemCode.batch_id == BATCH).delete()
+    for i in range(5):
+        status = models.CodeStatus.used if i == 0 else models.CodeStatus.unused
+        session.add(models.RedeemCode(code_hash=f"export-{i}", batch_id=BATCH, status=status))
+    session.commit()
+    used = session.query(models.RedeemCode).filter_by(code_hash="export-0").one()
+    session.add(
+        models.InviteRequest(
+            team_id="export-team", email="exp@example.com", code_id=used.id, status=models.InviteStatus.sent
+        )
+    )
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _ours(lines):
+    return [r for r in lines if r["batch_id"] == BATCH]
+
+
+def test_stream_is_chunked_and_joins_invites(users):
+    chunks = list(code_export.iter_export_bytes(users, "ndjson", chunk_size=2))
+    assert len(chunks) >= 3
+    rows = _ours(json.loads(line) for chunk in chunks for line in chunk.decode().splitlines())
+    assert sorted(r["code"] for r in rows) == [f"export-{i}" for i in range(5)]
+    used = next(r for r in rows if r["code"] == "export-0")
+    assert used["is_used"] and used["used_by"] == "exp@example.com"
+
+    csv_text = b"".join(code_export.iter_export_bytes(users, "csv", status="used", chunk_size=2)).decode()
+    assert csv_text.splitlines()[0] == ",".join(code_export.CSV_COLUMNS)
+    assert "export-0" in csv_text and "export-1" not in csv_text
+
+    with pytest.raises(ValueError):
+        code_export.validate_export_args("xlsx", "all")
+
+
+def test_export_job_writes_file(users, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "code_export_dir", str(tmp_path))
+    job = code_export.enqueue_export_job(users, "txt", "unused")
+
+    assert JobRunner(users).process_one_job()
+    users.refresh(job)
+    assert job.status == models.BatchJobStatus.succeeded
+    meta = json.loads(job.metadata_json)
+    path = code_export.export_file_path(meta["file"])
+    assert path and os.path.dirname(path) == str(tmp_path)
+    with open(path, encoding="utf-8") as fh:
+        codes = fh.read().splitlines()
+    assert {f"export-{i}" for i in range(1, 5)} <= set(codes)
+    assert "export-0" not in codes
+    assert not [p for p in os.listdir(tmp_path) if p.endswith(".part")]
+    assert code_export.export_file_path("../" + meta["file"]) == path
@@ -0,0 +1,65 @@
+"""
+批量生成兑换码测试
+"""
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.config import settings
+from app.services.services import redeem
+from app.services.shared.stats_counters import compute_counters, read_counters, reconcile
+
+
+@pytest.fixture
+def users(test_engine):
+    session = sessionmaker(bind=test_engine)()
+    session.query(models.RedeemCode).filter(models.RedeemCode.batch_id.like("gen-%")).delete()
+    if not session.query(models.CodeSku).filter_by(slug="gen-sku").first():
+        session.add(models.CodeSku(name="Gen", slug="gen-sku", default_refresh_limit=2))
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def test_generate_in_chunks_with_group(users, monkeypatch):
+    monkeypatch.setattr(settings, "code_generate_chunk_size", 400)
+    batch, codes = redeem.generate_codes(
+        users, 1000, "GEN", None, "gen-bulk", sku_slug="gen-sku", mother_group_id=9
+    )
+    assert batch == "gen-bulk" and len(set(codes)) == 1000
+    assert all(c.startswith("GEN") for c in codes)
+    rows = users.query(models.RedeemCode).filter_by(batch_id="gen-bulk").all()
+    assert len(rows) == 1000
+    assert {r.mother_group_id for r in rows} == {9}
+    assert {r.refresh_limit for r in rows} == {2}
+    assert {r.status for r in rows} == {models.CodeStatus.unused}
+    assert {r.code_hash for r in rows} == {redeem.hash_code(c) for c in codes}
+
+
+def test_only_colliding_rows_are_retried(users, monkeypatch):
+    _, existing = redeem.generate_codes(users, 1, None, None, "gen-seed", sku_slug="gen-sku")
+    reconcile(users, "users")
+    users.commit()
+
+    calls = []
+    real = redeem._new_codes
+
+    def fake(count, prefix):
+        calls.append(count)
+        fresh = real(count, prefix)
+        return existing + fresh[1:] if len(calls) == 1 else fresh
+
+    monkeypatch.setattr(redeem, "_new_codes", fake)
+    _, codes = redeem.generate_codes(users, 5, None, None, "gen-retry", sku_slug="gen-sku")
+
+    assert calls == [5, 1]
+    assert len(codes) == 5 and existing[0] not in codes
+    assert users.query(models.RedeemCode).filter_by(batch_id="gen-retry").count() == 5
+    # 计数器随批量写入同步增加
+    snapshot = read_counters(users, "users")
+    assert snapshot.source == "counters"
+    assert snapshot.get("codes.batch", "gen-retry") == 5
+    expected = compute_counters(users, "users")
+    assert {k: v for k, v in snapshot.values.items() if k[0] != "_meta"} == expected
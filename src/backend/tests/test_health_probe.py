@@ -0,0 +1,120 @@
+"""
+母号健康探测测试
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.provider import ProviderError
+from app.security import encrypt_token
+from app.services.services.health_probe import HostRateLimiter, MotherHealthProber
+from app.services.services.maintenance import create_maintenance_service
+
+
+@pytest.fixture
+def sessions(test_engine):
+    Session = sessionmaker(bind=test_engine)
+    users, pool = Session(), Session()
+    pool.query(models.SeatAllocation).delete(synchronize_session=False)
+    pool.query(models.MotherTeam).delete(synchronize_session=False)
+    pool.query(models.MotherAccount).delete(synchronize_session=False)
+    pool.commit()
+    try:
+        yield users, pool
+    finally:
+        users.close()
+        pool.close()
+
+
+def _mother(pool, name, *, checked_hours_ago=None, team=True):
+    checked = None if checked_hours_ago is None else datetime.utcnow() - timedelta(hours=checked_hours_ago)
+    mother = models.MotherAccount(
+        name=name,
+        access_token_enc=encrypt_token(f"token-{name}"),
+        status=models.MotherStatus.active,
+        last_health_check_at=checked,
+    )
+    pool.add(mother)
+    pool.flush()
+    if team:
+        pool.add(models.MotherTeam(mother_id=mother.id, team_id=f"team-{name}", is_enabled=True, is_default=True))
+    pool.commit()
+    return mother
+
+
+class TestHostRateLimiter:
+    """测试主机令牌桶"""
+
+    def test_waits_when_bucket_empty(self, monkeypatch):
+        now = [0.0]
+        sleeps = []
+
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        monkeypatch.setattr("app.services.services.health_probe.time.sleep", fake_sleep)
+        limiter = HostRateLimiter(2, burst=2, clock=lambda: now[0])
+        for _ in range(3):
+            limiter.acquire("h")
+        limiter.acquire("other")
+        assert sleeps == [pytest.approx(0.5)]
+
+
+class TestMotherHealthProber:
+    """测试选择、并发探测与落库"""
+
+    def test_select_prefers_unchecked_then_error_prone(self, sessions):
+        _, pool = sessions
+        older = _mother(pool, "older", checked_hours_ago=10)
+        flaky = _mother(pool, "flaky", checked_hours_ago=6)
+        never = _mother(pool, "never")
+        _mother(pool, "fresh", checked_hours_ago=0)
+
+        prober = MotherHealthProber(workers=2, rate_per_host=0)
+        for _ in range(5):
+            prober._observe(flaky.id, True)
+
+        picked = prober.select(pool, 3, datetime.utcnow())
+        assert [m.id for m in picked] == [never.id, flaky.id, older.id]
+
+    def test_sweep_probes_concurrently_and_persists(self, sessions, monkeypatch):
+        users, pool = sessions
+        alive = _mother(pool, "alive")
+        dead = _mother(pool, "dead")
+        flaky = _mother(pool, "flaky")
+        _mother(pool, "lonely", team=False)
+
+        def fake_list_members(token, team_id, offset=0, limit=25, query=""):
+            if team_id == "team-dead":
+                raise ProviderError(401, "unauthorized", "token revoked")
+            if team_id == "team-flaky":
+                raise ProviderError(502, "bad_gateway", "upstream")
+            return {"items": []}
+
+        monkeypatch.setattr("app.services.services.health_probe.provider.list_members", fake_list_members)
+        prober = MotherHealthProber(workers=4, rate_per_host=0)
+        monkeypatch.setattr("app.services.services.maintenance.mother_health_prober", prober)
+
+        service = create_maintenance_service(users, pool)
+        assert service.check_mother_health(limit=10) == 4
+
+        pool.expire_all()
+        rows = {m.name: m for m in pool.query(models.MotherAccount)}
+        assert rows["dead"].status == models.MotherStatus.invalid
+        assert rows["alive"].last_seen_alive_at is not None
+        assert rows["lonely"].last_seen_alive_at is not None
+        assert rows["flaky"].status == models.MotherStatus.active
+        assert rows["flaky"].last_seen_alive_at is None
+        assert all(m.last_health_check_at is not None for m in rows.values())
+        assert prober.error_rate(flaky.id) > 0
+        assert prober.error_rate(alive.id) == 0
+        assert dead.id not in prober._error_rate
+
+        last = prober.snapshot()["last_sweep"]
+        assert last["results"] == {"no_team": 1, "alive": 1, "invalid": 1, "error": 1}
+        assert last["backlog"] == 0
+        # 本轮已全部探测，下一轮没有到期母号
+        assert service.check_mother_health(limit=10) == 0
@@ -0,0 +1,173 @@
+"""
+邀请合并发送测试
+"""
+import asyncio
+import threading
+
+import pytest
+
+from app.invite_coalescer import AsyncInviteCoalescer, InviteCoalescer, split_invite_response
+from app.provider import ProviderError
+
+
+def _echo(emails):
+    return {"invites": [{"id": f"inv-{e}", "email_address": e} for e in reversed(emails)]}
+
+
+class TestSplitInviteResponse:
+    """测试批量响应拆分"""
+
+    def test_match_by_email(self):
+        parts = split_invite_response(_echo(["a@x.com", "B@x.com"]), ["A@x.com", "b@x.com"])
+        assert [p["invites"][0]["id"] for p in parts] == ["inv-a@x.com", "inv-B@x.com"]
+
+    def test_positional_fallback_and_missing(self):
+        parts = split_invite_response({"invites": [{"id": "1"}, {"id": "2"}]}, ["a@x.com", "b@x.com"])
+        assert [p["invites"][0]["id"] for p in parts] == ["1", "2"]
+        parts = split_invite_response({"invites": [{"id": "1", "email": "a@x.com"}]}, ["a@x.com", "b@x.com"])
+        assert parts[1]["invites"] == []
+
+
+class TestInviteCoalescer:
+    """测试线程版合并"""
+
+    def test_concurrent_callers_share_one_request(self):
+        calls = []
+
+        def send(token, team_id, emails, role="standard-user", resend=True):
+            calls.append((team_id, list(emails)))
+            return _echo(emails)
+
+        coalescer = InviteCoalescer(send, window_ms=200, max_batch=4)
+        results = {}
+
+        def worker(email):
+            results[email] = coalescer.submit("tok", "team-1", email, "standard-user", True)
+
+        threads = [threading.Thread(target=worker, args=(f"u{i}@x.com",)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+
+        assert len(calls) == 1
+        assert sorted(calls[0][1]) == [f"u{i}@x.com" for i in range(4)]
+        for email, resp in results.items():
+            assert resp["invites"][0]["id"] == f"inv-{email}"
+
+    def test_rejected_batch_falls_back_to_single_sends(self):
+        calls = []
+
+        def send(token, team_id, emails, role="standard-user", resend=True):
+            calls.append(list(emails))
+            if "bad" in emails:
+                raise ProviderError(400, "invite_failed", "invalid email")
+            return _echo(emails)
+
+        coalescer = InviteCoalescer(send, window_ms=200, max_batch=2)
+        results = {}
+
+        def worker(email):
+            try:
+                results[email] = coalescer.submit("tok", "team-1", email, "standard-user", True)
+            except ProviderError as e:
+                results[email] = e
+
+        threads = [threading.Thread(target=worker, args=(e,)) for e in ("ok@x.com", "bad")]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+
+        assert len(calls) == 3
+        assert results["ok@x.com"]["invites"][0]["id"] == "inv-ok@x.com"
+        assert isinstance(results["bad"], ProviderError)
+
+    def test_disabled_sends_directly(self):
+        calls = []
+
+        def send(token, team_id, emails, role="standard-user", resend=True):
+            calls.append(list(emails))
+            return _echo(emails)
+
+        coalescer = InviteCoalescer(send, window_ms=0, max_batch=50)
+        assert coalescer.submit("tok", "team-1", "a@x.com", "standard-user", True)["invites"][0]["id"] == "inv-a@x.com"
+        assert calls == [["a@x.com"]]
+
+
+class TestAsyncInviteCoalescer:
+    """测试 asyncio 版合并"""
+
+    @pytest.mark.asyncio
+    async def test_groups_by_team_and_propagates_errors(self):
+        calls = []
+
+        async def send(token, team_id, emails, role="standard-user", resend=True):
+            calls.append((team_id, list(emails)))
+            if team_id == "team-down":
+                raise ProviderError(503, "invite_failed", "unavailable")
+            return _echo(emails)
+
+        coalescer = AsyncInviteCoalescer(send, window_ms=20, max_batch=10)
+        ok = [coalescer.submit("tok", "team-1", f"u{i}@x.com", "standard-user", True) for i in range(3)]
+        down = [coalescer.submit("tok", "team-down", f"d{i}@x.com", "standard-user", True) for i in range(2)]
+        results = await asyncio.gather(*ok, *down, return_exceptions=True)
+
+        assert sorted(c[0] for c in calls) == ["team-1", "team-down"]
+        assert [r["invites"][0]["id"] for r in results[:3]] == [f"inv-u{i}@x.com" for i in range(3)]
+        assert all(isinstance(r, ProviderError) and r.status == 503 for r in results[3:])
+
+    @pytest.mark.asyncio
+    async def test_full_batch_flushes_before_window(self):
+        calls = []
+
+        async def send(token, team_id, emails, role="standard-user", resend=True):
+            calls.append(list(emails))
+            return _echo(emails)
+
+        coalescer = AsyncInviteCoalescer(send, window_ms=10_000, max_batch=2)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(coalescer.submit("tok", "t", f"u{i}@x.com", "standard-user", True) for i in range(2))),
+            timeout=2,
+        )
+        assert calls == [["u0@x.com", "u1@x.com"]]
+        assert len(results) == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_leader_does_not_strand_batch(self):
+        calls = []
+        in_flight = asyncio.Event()
+        release = asyncio.Event()
+
+        async def send(token, team_id, emails, role="standard-user", resend=True):
+            calls.append(list(emails))
+            in_flight.set()
+            await release.wait()
+            return _echo(emails)
+
+        coalescer = AsyncInviteCoalescer(send, window_ms=20, max_batch=10)
+
+        # 窗口期内取消 leader：跟随者仍收到结果，被取消的邮箱不再发送
+        leader = asyncio.create_task(coalescer.submit("tok", "t", "lead@x.com", "standard-user", True))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(coalescer.submit("tok", "t", "f1@x.com", "standard-user", True))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.wait_for(in_flight.wait(), 2)
+        release.set()
+        assert (await asyncio.wait_for(follower, 2))["invites"][0]["id"] == "inv-f1@x.com"
+        assert calls == [["f1@x.com"]]
+        assert coalescer._open == {}
+
+        # 发送过程中取消 leader：同批跟随者与之后的调用方都不受影响
+        in_flight.clear()
+        release.clear()
+        leader = asyncio.create_task(coalescer.submit("tok", "t", "lead2@x.com", "standard-user", True))
+        follower = asyncio.create_task(coalescer.submit("tok", "t", "f2@x.com", "standard-user", True))
+        await asyncio.wait_for(in_flight.wait(), 2)
+        leader.cancel()
+        release.set()
+        assert (await asyncio.wait_for(follower, 2))["invites"][0]["id"] == "inv-f2@x.com"
+        later = await asyncio.wait_for(coalescer.submit("tok", "t", "f3@x.com", "standard-user", True), 2)
+        assert later["invites"][0]["id"] == "inv-f3@x.com"
+        assert coalescer._open == {}
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import threading
 from datetime import datetime
 from types import MethodType
 
+import pytest
+from sqlalchemy import event
 from sqlalchemy.orm import sessionmaker
 
 from app import models
@@ -126,3 +129,91 @@ def test_invite_service_respects_session_boundaries(monkeypatch, test_engine):
         pool_session.query = MethodType(original_pool_query, pool_session)
         users_session.close()
         pool_session.close()
+
+
+@pytest.mark.asyncio
+async def test_invite_email_async_uses_async_provider(monkeypatch, test_engine):
+    """invite_email_async 应通过 provider_async 发送邀请，并与同步路径落库一致。"""
+
+    Session = sessionmaker(bind=test_engine)
+    users_session = Session()
+    pool_session = Session()
+
+    pool_session.query(models.SeatAllocation).delete(synchronize_session=False)
+    pool_session.query(models.MotherTeam).delete(synchronize_session=False)
+    pool_session.query(models.MotherAccount).delete(synchronize_session=False)
+    users_session.query(models.InviteRequest).delete(synchronize_session=False)
+    users_session.query(models.RedeemCode).delete(synchronize_session=False)
+    users_session.commit()
+    pool_session.commit()
+
+    mother = models.MotherAccount(
+        name="mother-async@example.com",
+        access_token_enc=encrypt_token("dummy-token"),
+        status=models.MotherStatus.active,
+        seat_limit=1,
+    )
+    pool_session.add(mother)
+    pool_session.flush()
+    pool_session.add(
+        models.MotherTeam(
+            mother_id=mother.id,
+            team_id="team-async",
+            team_name="Team Async",
+            is_enabled=True,
+            is_default=True,
+        )
+    )
+    seat = models.SeatAllocation(mother_id=mother.id, slot_index=1, status=models.SeatStatus.free)
+    pool_session.add(seat)
+    pool_session.commit()
+
+    code = models.RedeemCode(
+        code_hash="hash-async",
+        batch_id="batch-async",
+        status=models.CodeStatus.unused,
+        created_at=datetime.utcnow(),
+    )
+    users_session.add(code)
+    users_session.commit()
+
+    calls = []
+
+    async def fake_send_invite(token, team_id, email, role="standard-user", resend=True):
+        calls.append((team_id, email))
+        return {"invites": [{"id": "invite-async"}]}
+
+    def sync_send_invite(*args, **kwargs):
+        raise AssertionError("async path must not call the blocking provider")
+
+    monkeypatch.setattr("app.services.services.invites.provider_async.send_invite", fake_send_invite)
+    monkeypatch.setattr("app.services.services.invites.provider.send_invite", sync_send_invite)
+
+    # 记录执行 SQL 的线程：数据库访问都应在 to_thread 中，事件循环线程上不应有懒加载
+    loop_thread = threading.get_ident()
+    on_loop = []
+
+    def _record(conn, cursor, statement, *args):
+        if threading.get_ident() == loop_thread:
+            on_loop.append(statement)
+
+    service = InviteService(UsersRepository(users_session), MotherRepository(pool_session))
+    event.listen(test_engine, "before_cursor_execute", _record)
+    try:
+        try:
+            ok, _, invite_id, mother_id, team_id = await service.invite_email_async("async@example.com", code)
+        finally:
+            event.remove(test_engine, "before_cursor_execute", _record)
+
+        assert on_loop == []
+
+        assert ok is True
+        assert calls == [("team-async", "async@example.com")]
+        assert mother_id == mother.id
+        assert team_id == "team-async"
+        assert pool_session.get(models.SeatAllocation, seat.id).status == models.SeatStatus.used
+        assert users_session.get(models.RedeemCode, code.id).status == models.CodeStatus.used
+        assert users_session.get(models.InviteRequest, invite_id).invite_id == "invite-async"
+    finally:
+        users_session.close()
+        pool_session.close()
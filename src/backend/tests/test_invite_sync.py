@@ -0,0 +1,74 @@
+"""
+邀请接受状态对账测试
+"""
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.config import settings
+from app.security import encrypt_token
+from app.services.services.maintenance import _collect_member_ids, create_maintenance_service
+
+
+def test_collect_member_ids_prefers_membership_id():
+    payload = {"data": {"memberships": [{"id": "mem-1", "user": {"id": "user-1", "email": "A@x.com"}}]}}
+    index: dict[str, str] = {}
+    _collect_member_ids(payload, index)
+    assert index == {"a@x.com": "mem-1"}
+
+
+def test_sync_reads_every_page_and_updates_in_bulk(test_engine, monkeypatch):
+    monkeypatch.setattr(settings, "invite_sync_page_size", 2)
+    Session = sessionmaker(bind=test_engine)
+    users, pool = Session(), Session()
+    pool.query(models.SeatAllocation).delete(synchronize_session=False)
+    pool.query(models.MotherTeam).delete(synchronize_session=False)
+    pool.query(models.MotherAccount).delete(synchronize_session=False)
+    users.query(models.InviteRequest).delete(synchronize_session=False)
+    pool.commit()
+    users.commit()
+    try:
+        mother = models.MotherAccount(
+            name="sync-mother", access_token_enc=encrypt_token("tok"), status=models.MotherStatus.active
+        )
+        pool.add(mother)
+        pool.flush()
+        pool.add(models.MotherTeam(mother_id=mother.id, team_id="team-sync", is_enabled=True, is_default=True))
+        emails = [f"m{i}@example.com" for i in range(4)] + ["ghost@example.com"]
+        for i, email in enumerate(emails):
+            pool.add(
+                models.SeatAllocation(
+                    mother_id=mother.id,
+                    slot_index=i + 1,
+                    status=models.SeatStatus.used,
+                    team_id="team-sync",
+                    email=email,
+                )
+            )
+            users.add(models.InviteRequest(team_id="team-sync", email=email, status=models.InviteStatus.sent))
+        pool.commit()
+        users.commit()
+
+        members = [{"id": f"mem-{i}", "email": f"M{i}@example.com"} for i in range(4)]
+        calls = []
+
+        def fake_list_members(token, team_id, offset=0, limit=25, query=""):
+            calls.append((offset, limit))
+            return {"items": members[offset:offset + limit], "total": len(members)}
+
+        monkeypatch.setattr("app.services.services.maintenance.provider.list_members", fake_list_members)
+        service = create_maintenance_service(users, pool)
+        assert service.sync_invite_acceptance(days=365, limit_groups=10) == 4
+        assert calls == [(0, 2), (2, 2)]
+
+        users.expire_all()
+        pool.expire_all()
+        invites = {i.email: i for i in users.query(models.InviteRequest)}
+        assert invites["m3@example.com"].status == models.InviteStatus.accepted
+        assert invites["m3@example.com"].member_id == "mem-3"
+        assert invites["ghost@example.com"].status == models.InviteStatus.sent
+        seats = {s.email: s.member_id for s in pool.query(models.SeatAllocation)}
+        assert seats["m0@example.com"] == "mem-0"
+        assert seats["ghost@example.com"] is None
+    finally:
+        users.close()
+        pool.close()
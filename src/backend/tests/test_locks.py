@@ -0,0 +1,75 @@
+"""
+分布式锁测试（栅栏令牌、租期续期与释放）
+"""
+import time
+
+from app.utils import locks
+
+
+class _FakeRedis:
+    """按脚本源码模拟锁脚本；记录每个键的过期毫秒数与脚本注册次数"""
+
+    def __init__(self):
+        self.values, self.ttls = {}, {}
+        self.registered = 0
+
+    def register_script(self, source):
+        self.registered += 1
+
+        def run(keys, args):
+            if source == locks._ACQUIRE_LUA:
+                if keys[0] in self.values:
+                    return 0
+                self.values[keys[0]], self.ttls[keys[0]] = args[0], args[1]
+                self.values[keys[1]] = int(self.values.get(keys[1], 0)) + 1
+                self.ttls[keys[1]] = args[2]
+                return self.values[keys[1]]
+            if self.values.get(keys[0]) != args[0]:
+                return 0
+            if source == locks._RENEW_LUA:
+                self.ttls[keys[0]], self.ttls[keys[1]] = args[1], args[2]
+            else:
+                del self.values[keys[0]]
+            return 1
+
+        return run
+
+
+def test_fencing_token_and_release(monkeypatch):
+    redis = _FakeRedis()
+    monkeypatch.setattr(locks, "_get_redis_sync_client", lambda: redis)
+
+    lease, token = locks.try_acquire_lock("job:7", 10, renew=False)
+    assert lease.fence == 1 and redis.ttls["job:7"] == 10000
+    assert locks.try_acquire_lock("job:7", 10, renew=False) == (None, None)
+
+    locks.release_lock(lease, "job:7", token)
+    assert "job:7" not in redis.values
+    second, _ = locks.try_acquire_lock("job:7", 10, renew=False)
+    assert second.fence == 2
+    # 旧持有者释放不会删掉新锁
+    lease.release()
+    assert redis.values["job:7"] == second.token
+    # 栅栏计数器带过期时间；脚本每个客户端只注册一次
+    assert redis.ttls["job:7:fence"] == locks._FENCE_TTL_MS
+    assert redis.registered == 3
+
+
+def test_renewal_extends_and_detects_loss(monkeypatch):
+    redis = _FakeRedis()
+    monkeypatch.setattr(locks, "_get_redis_sync_client", lambda: redis)
+
+    lease, token = locks.try_acquire_lock("task", 1)
+    redis.ttls["task"] = 0
+    time.sleep(0.7)
+    assert redis.ttls["task"] == 1000 and not lease.lost.is_set()
+
+    redis.values["task"] = "someone-else"
+    assert lease.lost.wait(1.5)
+    locks.release_lock(lease, "task", token)
+    assert redis.values["task"] == "someone-else"
+
+
+def test_no_redis(monkeypatch):
+    monkeypatch.setattr(locks, "_get_redis_sync_client", lambda: None)
+    assert locks.try_acquire_lock("x", 5) == (None, locks.NO_REDIS)
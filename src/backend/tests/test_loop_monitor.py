@@ -0,0 +1,64 @@
+"""
+事件循环阻塞监控测试
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils import loop_monitor
+from app.utils.loop_monitor import LoopLagMonitor, route_label
+
+
+def test_route_label():
+    assert route_label(None) == "background"
+    assert route_label({"method": "GET", "route": SimpleNamespace(path="/admin/users")}) == "GET /admin/users"
+    assert route_label({"method": "POST"}) == "unmatched"
+
+
+@pytest.mark.asyncio
+async def test_blocking_coroutine_reported_with_route(monkeypatch):
+    reports = []
+    monkeypatch.setattr(loop_monitor, "report_blocked", lambda ms, route, cb: reports.append((ms, route, cb)))
+    original_run = asyncio.events.Handle._run
+
+    async def slow_handler():
+        # 与 Starlette 一致：路由匹配后 scope["route"] 可从栈帧的 scope 局部变量读到
+        scope = {"type": "http", "method": "GET", "route": SimpleNamespace(path="/admin/users")}
+        time.sleep(0.08)
+        return scope
+
+    monitor = LoopLagMonitor(interval_seconds=0.01, threshold_ms=50)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.02)
+        await asyncio.create_task(slow_handler())
+        await asyncio.sleep(0.03)
+    finally:
+        await monitor.stop()
+
+    assert any(route == "GET /admin/users" and "slow_handler" in cb and ms >= 50 for ms, route, cb in reports)
+    assert monitor.max_lag_ms >= 30
+    # 不依赖 asyncio 内部实现（uvloop 下同样可用），也不修改全局的 Handle._run
+    assert asyncio.events.Handle._run is original_run
+
+
+@pytest.mark.asyncio
+async def test_blocking_outside_request_reported_as_background(monkeypatch):
+    reports = []
+    monkeypatch.setattr(loop_monitor, "report_blocked", lambda ms, route, cb: reports.append((ms, route, cb)))
+
+    async def slow_job():
+        time.sleep(0.08)
+
+    monitor = LoopLagMonitor(interval_seconds=0.01, threshold_ms=50)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.02)
+        await slow_job()
+        await asyncio.sleep(0.03)
+    finally:
+        await monitor.stop()
+
+    assert any(route == "background" and "slow_job" in cb for _, route, cb in reports)
@@ -0,0 +1,172 @@
+"""
+维护任务分块批量更新测试
+"""
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.config import settings
+from app.services.services.maintenance import create_maintenance_service
+from app.services.services.seat_index import index_for
+from app.utils import bulk
+from app.utils.bulk import chunked_update
+from app.utils.locks import holding
+
+
+@pytest.fixture
+def sessions(test_engine, monkeypatch):
+    monkeypatch.setattr(settings, "maintenance_bulk_chunk_size", 20)
+    Session = sessionmaker(bind=test_engine)
+    users, pool = Session(), Session()
+    pool.query(models.SeatAllocation).delete(synchronize_session=False)
+    pool.query(models.MotherTeam).delete(synchronize_session=False)
+    pool.query(models.MotherAccount).delete(synchronize_session=False)
+    pool.commit()
+    try:
+        yield users, pool
+    finally:
+        users.close()
+        pool.close()
+
+
+def _mother(pool, name, *, seats=0, held=0, expired=False):
+    now = datetime.utcnow()
+    mother = models.MotherAccount(
+        name=name,
+        status=models.MotherStatus.active,
+        seat_limit=seats + held,
+        token_expires_at=now - timedelta(days=1) if expired else now + timedelta(days=30),
+    )
+    pool.add(mother)
+    pool.flush()
+    pool.add(models.MotherTeam(mother_id=mother.id, team_id=f"team-{name}", is_enabled=True, is_default=True))
+    for i in range(seats + held):
+        is_held = i < held
+        pool.add(
+            models.SeatAllocation(
+                mother_id=mother.id,
+                slot_index=i + 1,
+                status=models.SeatStatus.held if is_held else models.SeatStatus.used,
+                held_until=now - timedelta(minutes=5) if is_held else None,
+                team_id=f"team-{name}",
+                email=f"{name}-{i}@example.com",
+            )
+        )
+    pool.commit()
+    return mother
+
+
+class TestCleanupStaleHeld:
+    """测试过期占位释放"""
+
+    def test_frees_in_chunks_and_updates_index(self, sessions):
+        users, pool = sessions
+        mother = _mother(pool, "held", held=45, seats=2)
+        index = index_for(pool)
+        index.reconcile(pool)
+        assert index.free_seats(mother.id) == 0
+
+        service = create_maintenance_service(users, pool)
+        assert service.cleanup_stale_held() == 45
+        assert index.free_seats(mother.id) == 45
+
+        pool.expire_all()
+        seats = pool.query(models.SeatAllocation).all()
+        assert sum(1 for s in seats if s.status == models.SeatStatus.free and s.email is None) == 45
+        assert sum(1 for s in seats if s.status == models.SeatStatus.used) == 2
+        assert service.cleanup_stale_held() == 0
+
+    def test_without_returning(self, sessions, monkeypatch):
+        _, pool = sessions
+        _mother(pool, "plain", held=25)
+        monkeypatch.setattr(bulk, "supports_update_returning", lambda session, model: False)
+        result = chunked_update(
+            pool,
+            models.SeatAllocation,
+            where=(models.SeatAllocation.status == models.SeatStatus.held,),
+            values={"status": models.SeatStatus.free},
+            returning=(models.SeatAllocation.mother_id,),
+            chunk_size=10,
+            keep_returned=True,
+        )
+        assert (result.rows, result.chunks) == (25, 3)
+        assert len(result.returned) == 25
+
+    def test_without_returning_skips_concurrently_changed_rows(self, sessions, monkeypatch):
+        _, pool = sessions
+        mother = _mother(pool, "race", held=5)
+        monkeypatch.setattr(bulk, "supports_update_returning", lambda session, model: False)
+        Seat = models.SeatAllocation
+        victim = pool.query(Seat.id).filter(Seat.mother_id == mother.id).order_by(Seat.id).first()[0]
+        real_execute = pool.execute
+        raced = []
+
+        def execute(stmt, *args, **kwargs):
+            # 在取出候选行之后、UPDATE 之前，模拟另一事务把其中一行改为已使用
+            if getattr(stmt, "is_update", False) and not raced:
+                raced.append(1)
+                real_execute(update(Seat).where(Seat.id == victim).values(status=models.SeatStatus.used))
+            return real_execute(stmt, *args, **kwargs)
+
+        monkeypatch.setattr(pool, "execute", execute)
+        chunks = []
+        result = chunked_update(
+            pool,
+            Seat,
+            where=(Seat.status == models.SeatStatus.held,),
+            values={"status": models.SeatStatus.free},
+            chunk_size=10,
+            on_chunk=chunks.append,
+        )
+        assert result.rows == 4 and result.returned == []
+        assert victim not in [r[0] for r in chunks[0]] and len(chunks[0]) == 4
+
+
+    def test_stops_when_lease_lost(self, sessions):
+        _, pool = sessions
+        _mother(pool, "lease", held=25)
+        lease = SimpleNamespace(lost=threading.Event(), fence=1)
+
+        with holding(lease):
+            result = chunked_update(
+                pool,
+                models.SeatAllocation,
+                where=(models.SeatAllocation.status == models.SeatStatus.held,),
+                values={"status": models.SeatStatus.free},
+                chunk_size=10,
+                # 第一块提交前锁被他人接管：本块已完成，后续块不再处理
+                on_chunk=lambda rows: lease.lost.set(),
+            )
+        assert (result.rows, result.chunks, result.lost) == (10, 1, True)
+        pool.expire_all()
+        assert pool.query(models.SeatAllocation).filter_by(status=models.SeatStatus.held).count() == 15
+
+
+class TestCleanupExpiredMotherTeams:
+    """测试过期母号清理"""
+
+    def test_invalidates_expired_mothers_once(self, sessions):
+        users, pool = sessions
+        for i in range(3):
+            _mother(pool, f"old{i}", seats=3, expired=True)
+        alive = _mother(pool, "alive", seats=2)
+
+        service = create_maintenance_service(users, pool)
+        assert service.cleanup_expired_mother_teams() == 3
+
+        pool.expire_all()
+        mothers = {m.name: m for m in pool.query(models.MotherAccount)}
+        assert all(mothers[f"old{i}"].status == models.MotherStatus.invalid for i in range(3))
+        assert mothers["alive"].status == models.MotherStatus.active
+        teams = pool.query(models.MotherTeam).all()
+        assert [t.mother_id for t in teams] == [alive.id]
+        seats = pool.query(models.SeatAllocation).filter(models.SeatAllocation.mother_id != alive.id).all()
+        assert seats and all(s.status == models.SeatStatus.free and s.email is None for s in seats)
+
+        # 已处理的母号不会在下一轮重复处理
+        assert service.cleanup_expired_mother_teams() == 0
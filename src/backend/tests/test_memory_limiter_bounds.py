@@ -0,0 +1,52 @@
+"""
+内存回退限流器容量上限与淘汰测试
+"""
+import pytest
+
+from app.utils.utils.rate_limiter import MemoryTokenBucketLimiter, RateLimitConfig
+from app.utils.utils.rate_limiter import memory
+
+CFG = RateLimitConfig(capacity=2, refill_rate=1.0, name="t")
+
+
+@pytest.mark.asyncio
+async def test_capacity_evicts_least_recently_used():
+    limiter = MemoryTokenBucketLimiter(CFG, max_keys=3, idle_seconds=3600, lock_shards=2)
+    for key in ("a", "b", "c"):
+        await limiter.allow(key)
+    # 访问 a 使其成为最近使用，随后插入 d 应淘汰 b
+    await limiter.allow("a")
+    await limiter.allow("d")
+
+    assert len(limiter) == 3
+    assert set(limiter._buckets) == {"c", "a", "d"}
+    assert limiter.evictions == {"capacity": 1, "idle": 0}
+    assert (await limiter.get_stats("a")).allowed == 2
+    assert (await limiter.get_stats("b")).allowed == 0
+
+
+@pytest.mark.asyncio
+async def test_idle_eviction_waits_for_full_refill(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(memory.time, "monotonic", lambda: now[0])
+    slow = RateLimitConfig(capacity=10, refill_rate=0.1, name="slow")
+    limiter = MemoryTokenBucketLimiter(CFG, max_keys=100, idle_seconds=5)
+
+    await limiter.allow("fast", 2)
+    await limiter.allow("slow", 10, config=slow)
+    now[0] += 6
+    await limiter.allow("new")
+    # fast 已回满被清理；slow 仍欠令牌（需 100s 回满），保留以免重置后多给令牌
+    assert "fast" not in limiter._buckets and "slow" in limiter._buckets
+    assert limiter.evictions["idle"] == 1
+    assert not (await limiter.allow("slow", 10, config=slow)).allowed
+
+
+@pytest.mark.asyncio
+async def test_allow_many_with_sharded_locks_stays_bounded():
+    limiter = MemoryTokenBucketLimiter(CFG, max_keys=50, lock_shards=4)
+    for i in range(200):
+        results = await limiter.allow_many([(f"ip:{i}", 1, None, "ip"), (f"email:{i}", 1, None, "email")])
+        assert all(r.allowed for r in results)
+    assert len(limiter) == 50
+    assert limiter.evictions["capacity"] == 350
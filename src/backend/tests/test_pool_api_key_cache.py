@@ -0,0 +1,115 @@
+"""
+Pool API Key 校验缓存与 last_used_at 批量写回测试
+"""
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from app.middleware.pool_api_auth import PoolAPIAuthMiddleware
+from app.models_pool_api import APIKey
+from app.services import pool_api_key_service as svc
+from app.services.pool_api_key_service import APIKeyService
+
+
+@pytest.fixture
+def factory(test_engine):
+    svc.invalidate_key_cache()
+    svc._pending_usage.clear()
+    yield sessionmaker(bind=test_engine)
+    svc.invalidate_key_cache()
+    svc._pending_usage.clear()
+
+
+def _no_db():
+    raise AssertionError("缓存命中时不应访问数据库")
+
+
+def test_cache_hit_and_batched_usage(factory):
+    db = factory()
+    api_key, plain = APIKeyService.create_api_key(db, name="cache")
+    other, other_plain = APIKeyService.create_api_key(db, name="other")
+
+    first = APIKeyService.authenticate(plain, session_factory=factory)
+    assert first.id == api_key.id and first.name == "cache"
+    assert APIKeyService.authenticate(plain, session_factory=_no_db) == first
+    assert APIKeyService.authenticate(other_plain, session_factory=factory).id == other.id
+    assert APIKeyService.authenticate("pool_unknown", session_factory=factory) is None
+
+    # 使用时间只在写回时落库，两把 key 一条 UPDATE
+    db.expire_all()
+    assert db.get(APIKey, api_key.id).last_used_at is None
+    assert svc.flush_key_usage(factory) == 2
+    assert svc.flush_key_usage(factory) == 0
+    db.expire_all()
+    assert db.get(APIKey, api_key.id).last_used_at is not None
+    assert db.get(APIKey, other.id).last_used_at is not None
+    db.close()
+
+
+def test_disable_invalidates_cache(factory):
+    db = factory()
+    api_key, plain = APIKeyService.create_api_key(db, name="revoke")
+    assert APIKeyService.authenticate(plain, session_factory=factory) is not None
+
+    assert APIKeyService.disable_api_key(db, api_key.id)
+    assert APIKeyService.get_cached_key(plain) is None
+    assert APIKeyService.authenticate(plain, session_factory=factory) is None
+    db.close()
+
+
+def test_middleware_uses_cache(factory):
+    db = factory()
+    api_key, plain = APIKeyService.create_api_key(db, name="mw")
+    db.close()
+    APIKeyService.authenticate(plain, session_factory=factory)
+
+    app = FastAPI()
+
+    @app.get("/pool/whoami")
+    def whoami(request: Request):
+        return {"id": request.state.api_key_id, "request_id": request.state.request_id}
+
+    app.add_middleware(PoolAPIAuthMiddleware, pool_api_prefix="/pool")
+    client = TestClient(app)
+
+    resp = client.get("/pool/whoami", headers={"X-API-Key": plain})
+    assert resp.status_code == 200 and resp.json()["id"] == api_key.id
+    missing = client.get("/pool/whoami")
+    assert missing.status_code == 401 and missing.json()["error"] == "MISSING_API_KEY"
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key) or 0) + 1
+        return self.data[key]
+
+
+def test_revocation_on_other_worker_clears_cache(factory, monkeypatch):
+    """其他进程禁用 key 后，同步撤销 epoch 即清空本进程缓存"""
+    redis = _FakeRedis()
+    monkeypatch.setattr(svc, "_redis", lambda: redis)
+    monkeypatch.setattr(svc, "_seen_epoch", None)
+    assert svc.sync_key_revocations() is False
+
+    db = factory()
+    api_key, plain = APIKeyService.create_api_key(db, name="remote")
+    assert APIKeyService.authenticate(plain, session_factory=factory) is not None
+
+    # 模拟另一个 worker：改库并发布撤销，本进程缓存此时仍然命中
+    db.get(APIKey, api_key.id).is_active = False
+    db.commit()
+    svc.publish_key_revocation()
+    assert APIKeyService.get_cached_key(plain) is not None
+
+    assert svc.sync_key_revocations() is True
+    assert APIKeyService.get_cached_key(plain) is None
+    assert APIKeyService.authenticate(plain, session_factory=factory) is None
+    assert svc.sync_key_revocations() is False
+    db.close()
@@ -0,0 +1,82 @@
+"""
+Provider HTTP 连接池测试
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.metrics import ProviderMetrics
+from app.provider_client import ProviderClientConfig, ProviderHttpClient
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    fresh = ProviderMetrics()
+    monkeypatch.setattr("app.provider_client.provider_metrics", fresh)
+    return fresh
+
+
+class TestProviderHttpClient:
+    """测试连接复用与指标"""
+
+    def test_keepalive_reuses_connection(self, local_server, metrics):
+        client = ProviderHttpClient(ProviderClientConfig(http2=False))
+        try:
+            for _ in range(3):
+                r = client.get(f"{local_server}/ping")
+                assert r.status_code == 200
+                assert r.json() == {"ok": True}
+        finally:
+            client.close()
+
+        [stats] = metrics.pool_snapshot()
+        assert stats["host"] == local_server
+        assert stats["misses"] == 1
+        assert stats["hits"] == 2
+        assert stats["inflight"] == 0
+
+    def test_host_override_applies(self):
+        client = ProviderHttpClient(ProviderClientConfig(read_timeout=30.0))
+        client.configure_host("chatgpt.com", read_timeout=5.0, max_connections=10)
+
+        cfg = client.config_for("https://chatgpt.com", None)
+        assert cfg.read_timeout == 5.0
+        assert cfg.max_connections == 10
+        assert client.config_for("https://example.com", None).read_timeout == 30.0
+
+    def test_host_override_beats_proxy_override(self):
+        client = ProviderHttpClient(ProviderClientConfig())
+        client.configure_proxy("http://proxy:8080", connect_timeout=1.0, read_timeout=9.0)
+        client.configure_host("chatgpt.com", read_timeout=3.0)
+
+        cfg = client.config_for("https://chatgpt.com", "http://proxy:8080")
+        assert cfg.connect_timeout == 1.0
+        assert cfg.read_timeout == 3.0
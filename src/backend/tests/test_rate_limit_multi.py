@@ -0,0 +1,174 @@
+"""
+多桶限流与限流配置本地缓存测试
+"""
+import json
+
+import pytest
+
+from fastapi import Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.utils.utils.rate_limiter import (
+    IPKeyStrategy,
+    JSONBodyKeyStrategy,
+    MemoryTokenBucketLimiter,
+    RateLimitConfig,
+    RateLimitRule,
+    RedisTokenBucketLimiter,
+    rate_limit_many,
+)
+
+IP_CFG = RateLimitConfig(capacity=5, refill_rate=0.001, name="ip")
+EMAIL_CFG = RateLimitConfig(capacity=2, refill_rate=0.001, name="email")
+
+
+@pytest.mark.asyncio
+async def test_memory_allow_many_is_all_or_nothing():
+    limiter = MemoryTokenBucketLimiter(IP_CFG)
+    checks = [("ip:1.1.1.1", 1, IP_CFG, "ip"), ("email:a@x.com", 1, EMAIL_CFG, "email")]
+
+    assert all(r.allowed for r in await limiter.allow_many(checks))
+    assert all(r.allowed for r in await limiter.allow_many(checks))
+    denied = await limiter.allow_many(checks)
+    assert not any(r.allowed for r in denied)
+    assert denied[0].retry_after_ms == 0 and denied[1].retry_after_ms > 0
+    # 被拒绝的请求不扣减 IP 桶
+    assert (await limiter.get_status("ip:1.1.1.1")).remaining == 3
+
+
+class _AllowOnlyLimiter:
+    """只实现 allow 的限流器（如旧的自定义实现）"""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def allow(self, key, tokens=1, *, config=None, strategy=None, as_peek=False):
+        return await self.inner.allow(key, tokens, config=config, strategy=strategy, as_peek=as_peek)
+
+
+def test_rate_limit_many_falls_back_to_allow():
+    limiter = MemoryTokenBucketLimiter(IP_CFG)
+    dep = rate_limit_many(
+        _AllowOnlyLimiter(limiter),
+        RateLimitRule(IPKeyStrategy(), config=IP_CFG),
+        RateLimitRule(JSONBodyKeyStrategy("email"), config=EMAIL_CFG),
+    )
+
+    async def limited(request: Request):
+        await dep(request)
+
+    app = FastAPI()
+
+    @app.post("/redeem", dependencies=[Depends(limited)])
+    async def redeem(payload: dict):
+        return {"ok": True}
+
+    client = TestClient(app)
+    assert client.post("/redeem", json={"email": "a@x.com"}).status_code == 200
+    assert client.post("/redeem", json={"email": "a@x.com"}).status_code == 200
+    assert client.post("/redeem", json={"email": "a@x.com"}).status_code == 429
+    # 先 peek 再扣减：被拒绝的请求不消耗 IP 额度，5 次容量还剩 3 次
+    for _ in range(3):
+        assert client.post("/redeem", json={}).status_code == 200
+    assert client.post("/redeem", json={}).status_code == 429
+
+
+def test_rate_limit_many_dependency():
+    limiter = MemoryTokenBucketLimiter(IP_CFG)
+    dep = rate_limit_many(
+        limiter,
+        RateLimitRule(IPKeyStrategy(), config=IP_CFG),
+        RateLimitRule(JSONBodyKeyStrategy("email"), config=EMAIL_CFG),
+    )
+
+    async def limited(request: Request):
+        await dep(request)
+
+    app = FastAPI()
+
+    @app.post("/redeem", dependencies=[Depends(limited)])
+    async def redeem(payload: dict):
+        return {"ok": True}
+
+    client = TestClient(app)
+    assert client.post("/redeem", json={"email": "A@x.com"}).status_code == 200
+    assert client.post("/redeem", json={"email": "a@x.com"}).status_code == 200
+    blocked = client.post("/redeem", json={"email": "a@x.com"})
+    assert blocked.status_code == 429 and int(blocked.headers["retry-after"]) > 0
+    # 其他邮箱仍可用；缺少邮箱时只按 IP 限流
+    assert client.post("/redeem", json={"email": "b@x.com"}).status_code == 200
+    # 被拒绝的那次不消耗 IP 额度：5 次容量还剩 2 次
+    assert client.post("/redeem", json={}).status_code == 200
+    assert client.post("/redeem", json={}).status_code == 200
+    assert client.post("/redeem", json={}).status_code == 429
+
+
+class _Pipeline:
+    def __init__(self, redis):
+        self.redis, self.ops = redis, []
+
+    def __getattr__(self, name):
+        return lambda *args: self.ops.append((name, args))
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        return [getattr(self.redis, f"_{name}")(*args) for name, args in self.ops]
+
+
+class _FakeRedis:
+    """只记录往返次数；脚本执行结果由测试指定"""
+
+    def __init__(self):
+        self.hashes, self.strings, self.round_trips = {}, {}, 0
+        self.script_reply = None
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+    def _hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def _hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def _get(self, key):
+        return self.strings.get(key)
+
+    def _incr(self, key):
+        self.strings[key] = str(int(self.strings.get(key) or 0) + 1)
+
+    async def script_load(self, script):
+        self.round_trips += 1
+        return "sha"
+
+    async def evalsha(self, sha, numkeys, *args):
+        self.round_trips += 1
+        self.last_call = (numkeys, args)
+        return self.script_reply
+
+
+@pytest.mark.asyncio
+async def test_redis_config_cached_until_version_changes():
+    redis = _FakeRedis()
+    limiter = RedisTokenBucketLimiter(redis, IP_CFG, namespace="t")
+    await limiter.set_config("redeem:by_ip", IP_CFG)
+    await limiter.set_config("redeem:by_email", EMAIL_CFG)
+    assert redis.strings["t:config:version"] == "2"
+
+    assert (await limiter.get_config("redeem:by_email")).capacity == 2
+    trips = redis.round_trips
+    assert (await limiter.get_config("redeem:by_ip")).capacity == 5
+    assert redis.round_trips == trips
+
+    # 一次 EVALSHA 检查两个桶
+    redis.script_reply = [2, 1, 4, 0, 0, 5, 1, 1, 0, 0, 2]
+    results = await limiter.allow_many([("ip:x", 1, IP_CFG, "ip"), ("email:y", 1, EMAIL_CFG, "email")])
+    assert [r.remaining for r in results] == [4, 1] and all(r.allowed for r in results)
+    assert redis.last_call[0] == 6
+
+    # 其他进程修改配置：版本号变化后惰性重新加载
+    redis.hashes["t:config"]["redeem:by_email"] = json.dumps({"capacity": 9, "refill_rate": 1.0})
+    redis.strings["t:config:version"] = "3"
+    redis.script_reply = [3, 1, 3, 0, 0, 5]
+    await limiter.allow("ip:x", config=IP_CFG)
+    assert (await limiter.get_config("redeem:by_email")).capacity == 9
@@ -0,0 +1,191 @@
+"""
+批量兑换测试
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.provider import ProviderError
+from app.security import encrypt_token
+from app.services.services.redeem import hash_code
+from app.services.services.redeem_batch import BatchRedeemItem, redeem_codes_batch_async
+
+
+def _reset(users, pool):
+    pool.query(models.SeatAllocation).delete(synchronize_session=False)
+    pool.query(models.MotherTeam).delete(synchronize_session=False)
+    pool.query(models.MotherAccount).delete(synchronize_session=False)
+    users.query(models.CodeRefreshHistory).delete(synchronize_session=False)
+    users.query(models.InviteRequest).delete(synchronize_session=False)
+    users.query(models.RedeemCode).delete(synchronize_session=False)
+    users.commit()
+    pool.commit()
+
+
+def _seed_mother(pool, name, seats):
+    mother = models.MotherAccount(
+        name=name,
+        access_token_enc=encrypt_token(f"token-{name}"),
+        status=models.MotherStatus.active,
+        seat_limit=seats,
+        created_at=datetime.utcnow(),
+    )
+    pool.add(mother)
+    pool.flush()
+    pool.add(models.MotherTeam(mother_id=mother.id, team_id=f"team-{name}", is_enabled=True, is_default=True))
+    for i in range(seats):
+        pool.add(models.SeatAllocation(mother_id=mother.id, slot_index=i + 1, status=models.SeatStatus.free))
+    pool.commit()
+    return mother
+
+
+def _seed_code(users, code):
+    row = models.RedeemCode(code_hash=hash_code(code), batch_id="bulk", status=models.CodeStatus.unused)
+    users.add(row)
+    users.commit()
+    return row
+
+
+@pytest.mark.asyncio
+async def test_batch_redeem_groups_invites_per_team(monkeypatch, test_engine):
+    Session = sessionmaker(bind=test_engine)
+    users, pool = Session(), Session()
+    _reset(users, pool)
+    _seed_mother(pool, "a", 2)
+    _seed_mother(pool, "b", 2)
+    for code in ("BULKCODE01", "BULKCODE02", "BULKCODE03", "BULKCODE04"):
+        _seed_code(users, code)
+
+    calls = []
+
+    async def fake_send_invites(token, team_id, emails, role="standard-user", resend=True):
+        calls.append((team_id, list(emails)))
+        if team_id == "team-b":
+            raise ProviderError(500, "invite_failed", "boom")
+        return {"invites": [{"id": f"inv-{e}", "email_address": e} for e in emails]}
+
+    monkeypatch.setattr("app.services.services.redeem_batch.provider_async.send_invites", fake_send_invites)
+
+    items = [
+        BatchRedeemItem("BULKCODE01", "u1@example.com"),
+        BatchRedeemItem("BULKCODE02", "u2@example.com"),
+        BatchRedeemItem("BULKCODE01", "dup@example.com"),
+        BatchRedeemItem("MISSING001", "x@example.com"),
+        BatchRedeemItem("BULKCODE03", "u3@example.com"),
+    ]
+    try:
+        outcomes = await redeem_codes_batch_async(users, pool, items)
+
+        # 每个团队只调用一次，邮箱合并发送
+        assert sorted(calls) == [
+            ("team-a", ["u1@example.com", "u2@example.com"]),
+            ("team-b", ["u3@example.com"]),
+        ]
+        assert [o.success for o in outcomes] == [True, True, False, False, False]
+        assert outcomes[2].message == "兑换码在本批次中重复"
+        assert outcomes[3].message == "兑换码无效"
+
+        users.expire_all()
+        pool.expire_all()
+        codes = {r.code_hash: r for r in users.query(models.RedeemCode)}
+        assert codes[hash_code("BULKCODE01")].status == models.CodeStatus.used
+        assert codes[hash_code("BULKCODE01")].bound_email == "u1@example.com"
+        # 发送失败：兑换码回滚，座位释放
+        assert codes[hash_code("BULKCODE03")].status == models.CodeStatus.unused
+        assert codes[hash_code("BULKCODE04")].status == models.CodeStatus.unused
+
+        seats = pool.query(models.SeatAllocation).all()
+        assert sorted(s.email for s in seats if s.status == models.SeatStatus.used) == [
+            "u1@example.com",
+            "u2@example.com",
+        ]
+        assert sum(1 for s in seats if s.status == models.SeatStatus.free) == 2
+        statuses = sorted(i.status.value for i in users.query(models.InviteRequest))
+        assert statuses == ["failed", "sent", "sent"]
+    finally:
+        users.close()
+        pool.close()
+
+
+@pytest.mark.asyncio
+async def test_batch_redeem_reports_no_seat(monkeypatch, test_engine):
+    Session = sessionmaker(bind=test_engine)
+    users, pool = Session(), Session()
+    _reset(users, pool)
+    _seed_mother(pool, "solo", 1)
+    _seed_code(users, "SEATCODE01")
+    _seed_code(users, "SEATCODE02")
+
+    async def fake_send_invites(token, team_id, emails, role="standard-user", resend=True):
+        return {"invites": [{"id": "inv-1"}]}
+
+    monkeypatch.setattr("app.services.services.redeem_batch.provider_async.send_invites", fake_send_invites)
+    try:
+        outcomes = await redeem_codes_batch_async(
+            users,
+            pool,
+            [BatchRedeemItem("SEATCODE01", "a@example.com"), BatchRedeemItem("SEATCODE02", "b@example.com")],
+        )
+        assert outcomes[0].success is True
+        assert outcomes[1].success is False
+        assert "暂无可用座位" in outcomes[1].message
+        users.expire_all()
+        row = users.query(models.RedeemCode).filter_by(code_hash=hash_code("SEATCODE02")).one()
+        assert row.status == models.CodeStatus.unused
+    finally:
+        users.close()
+        pool.close()
+
+
+@pytest.mark.asyncio
+async def test_batch_redeem_keeps_seat_reclaimed_during_send(monkeypatch, test_engine):
+    """发送期间座位被回收并分给他人时，落库不得把它标记为 used；每个团队使用独立的重试预算"""
+    from app.utils.retry_policy import current_budget, retry_budget
+
+    Session = sessionmaker(bind=test_engine)
+    users, pool = Session(), Session()
+    _reset(users, pool)
+    _seed_mother(pool, "a", 1)
+    _seed_mother(pool, "b", 1)
+    for code in ("HOLDCODE01", "HOLDCODE02"):
+        _seed_code(users, code)
+
+    budgets = {}
+    started = datetime.utcnow()
+
+    async def fake_send_invites(token, team_id, emails, role="standard-user", resend=True):
+        budgets[team_id] = current_budget()
+        other = Session()
+        try:
+            seat = other.query(models.SeatAllocation).filter_by(team_id=team_id).one()
+            assert (seat.held_until - started).total_seconds() > 30
+            if team_id == "team-a":
+                # 模拟 cleanup_stale_held 回收后被另一请求抢占
+                seat.status = models.SeatStatus.held
+                seat.invite_request_id = None
+                seat.email = "other@example.com"
+                other.commit()
+        finally:
+            other.close()
+        return {"invites": [{"id": f"inv-{e}", "email_address": e} for e in emails]}
+
+    monkeypatch.setattr("app.services.services.redeem_batch.provider_async.send_invites", fake_send_invites)
+
+    items = [BatchRedeemItem("HOLDCODE01", "h1@example.com"), BatchRedeemItem("HOLDCODE02", "h2@example.com")]
+    try:
+        with retry_budget(max_retries=4) as request_budget:
+            outcomes = await redeem_codes_batch_async(users, pool, items)
+
+        assert all(o.success for o in outcomes)
+        assert len({id(b) for b in budgets.values()}) == 2 and request_budget not in budgets.values()
+
+        pool.expire_all()
+        seats = {s.team_id: s for s in pool.query(models.SeatAllocation)}
+        assert seats["team-a"].status == models.SeatStatus.held
+        assert seats["team-a"].email == "other@example.com"
+        assert seats["team-b"].status == models.SeatStatus.used
+    finally:
+        users.close()
+        pool.close()
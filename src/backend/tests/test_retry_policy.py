@@ -0,0 +1,115 @@
+"""
+统一重试引擎测试
+"""
+import pytest
+
+from app.config import settings
+from app.provider import ProviderError
+from app.utils.pool_retry import retry_with_backoff
+from app.utils.retry_policy import (
+    DeadlineExceeded,
+    RetryPolicy,
+    acall_with_retry,
+    call_with_retry,
+    current_budget,
+    item_retry_budget,
+    parse_retry_after,
+    retry_budget,
+)
+
+FAST = RetryPolicy(max_attempts=3, base_delay_ms=1, max_delay_ms=1, jitter=False)
+
+
+def _always_503(calls: list):
+    def fn():
+        calls.append(1)
+        raise ProviderError(503, "unavailable", "busy")
+    return fn
+
+
+class TestRetryPolicy:
+    """测试重试次数、预算与嵌套"""
+
+    def test_nested_calls_do_not_multiply(self):
+        calls = []
+        inner = _always_503(calls)
+
+        def outer():
+            return call_with_retry(inner, policy=FAST, endpoint="inner")
+
+        with pytest.raises(ProviderError):
+            call_with_retry(outer, policy=FAST, endpoint="outer")
+        # 外层 3 次，内层只执行一次，而不是 3×3
+        assert len(calls) == 3
+
+    def test_budget_limits_retries_across_calls(self):
+        calls = []
+        with retry_budget(max_retries=2) as budget:
+            for _ in range(2):
+                with pytest.raises(ProviderError):
+                    call_with_retry(_always_503(calls), policy=FAST)
+        assert len(calls) == 4  # 1+2 次，然后预算用尽只执行 1 次
+        assert budget.retries_used == 2
+        assert budget.snapshot()["wait_ms"] == 2.0
+
+    def test_non_retryable_status_not_retried(self):
+        calls = []
+
+        def fn():
+            calls.append(1)
+            raise ProviderError(403, "forbidden", "no")
+
+        with pytest.raises(ProviderError):
+            call_with_retry(fn, policy=FAST)
+        assert len(calls) == 1
+
+    def test_expired_deadline_stops_before_calling(self):
+        with retry_budget(deadline_seconds=0.001) as budget:
+            budget.deadline = budget.started_at - 1
+            with pytest.raises(DeadlineExceeded):
+                call_with_retry(lambda: "never", policy=FAST, endpoint="x")
+
+    def test_retry_after_is_lower_bound(self):
+        policy = RetryPolicy(base_delay_ms=100, max_delay_ms=100, jitter=False, max_retry_after_ms=5000)
+        assert policy.delay_ms(0, retry_after_ms=2000) == 2000
+        assert policy.delay_ms(0, retry_after_ms=60000) == 5000
+        assert policy.delay_ms(0) == 100
+
+    def test_parse_retry_after(self):
+        assert parse_retry_after("3") == 3.0
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+        assert parse_retry_after("garbage") is None
+        assert parse_retry_after(None) is None
+
+    def test_pool_retry_shares_budget(self):
+        calls = []
+        with retry_budget(max_retries=1):
+            result = retry_with_backoff(_always_503(calls), max_attempts=3, backoff_ms=[1])
+        assert result.success is False
+        assert result.attempts == 2
+
+    def test_item_budget_is_independent_of_request(self, monkeypatch):
+        monkeypatch.setattr(settings, "request_retry_budget", 2)
+        calls = []
+        with retry_budget(max_retries=0) as request_budget:
+            for _ in range(3):
+                # 批量条目各自有完整预算，不消耗请求级预算
+                with item_retry_budget():
+                    assert current_budget() is not request_budget
+                    with pytest.raises(ProviderError):
+                        call_with_retry(_always_503(calls), policy=FAST, endpoint="item")
+            assert current_budget() is request_budget
+        assert len(calls) == 9
+
+    @pytest.mark.asyncio
+    async def test_async_retry(self):
+        calls = []
+
+        async def flaky():
+            calls.append(1)
+            if len(calls) < 2:
+                raise ProviderError(502, "bad_gateway", "x")
+            return "ok"
+
+        assert await acall_with_retry(flaky, policy=FAST) == "ok"
+        assert len(calls) == 2
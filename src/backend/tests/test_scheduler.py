@@ -0,0 +1,145 @@
+"""
+后台任务调度测试
+"""
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app import scheduler as scheduler_mod
+from app.config import settings
+from app.scheduler import (
+    RESULT_ERROR,
+    RESULT_LOCKED,
+    RESULT_LOST,
+    RESULT_OK,
+    RESULT_OVERLAP,
+    RESULT_TIMEOUT,
+    ScheduledTask,
+    TaskScheduler,
+    owns_task,
+)
+from app.utils.locks import current_lease, lease_lost
+
+
+@pytest.fixture(autouse=True)
+def _no_redis(monkeypatch):
+    monkeypatch.setattr(scheduler_mod, "try_acquire_lock", lambda name, ttl: (None, "no-redis"))
+
+
+class TestTaskScheduler:
+    """测试单次执行、超时与防重叠"""
+
+    @pytest.mark.asyncio
+    async def test_run_once_results(self):
+        def boom():
+            raise RuntimeError("boom")
+
+        ok = ScheduledTask("ok_task", lambda: 3, 60)
+        bad = ScheduledTask("bad_task", boom, 60)
+        sched = TaskScheduler([ok, bad])
+
+        assert await sched.run_once(ok) == RESULT_OK
+        assert await sched.run_once(bad) == RESULT_ERROR
+        snap = {s["name"]: s for s in sched.snapshot()}
+        assert snap["ok_task"]["last_value"] == 3
+        assert snap["bad_task"]["last_result"] == RESULT_ERROR
+
+    @pytest.mark.asyncio
+    async def test_timeout_then_overlap_until_thread_returns(self):
+        release = threading.Event()
+        task = ScheduledTask("slow_task", lambda: release.wait(5) and 1, 60, timeout_seconds=0.05)
+        sched = TaskScheduler([task])
+
+        assert await sched.run_once(task) == RESULT_TIMEOUT
+        # 线程仍在运行：跳过
+        assert await sched.run_once(task) == RESULT_OVERLAP
+        release.set()
+        await asyncio.sleep(0.05)
+        assert await sched.run_once(task) == RESULT_OK
+
+    @pytest.mark.asyncio
+    async def test_lock_miss_is_reported(self, monkeypatch):
+        monkeypatch.setattr(scheduler_mod, "try_acquire_lock", lambda name, ttl: (None, None))
+        calls = []
+        task = ScheduledTask("locked_task", lambda: calls.append(1), 60)
+        assert await TaskScheduler([task]).run_once(task) == RESULT_LOCKED
+        assert calls == []
+
+    @pytest.mark.asyncio
+    async def test_lease_lost_mid_run_stops_task(self, monkeypatch):
+        lease = SimpleNamespace(lost=threading.Event(), fence=7)
+        released = []
+        monkeypatch.setattr(scheduler_mod, "try_acquire_lock", lambda name, ttl: (lease, "token"))
+        monkeypatch.setattr(scheduler_mod, "release_lock", lambda l, name, token: released.append(l))
+        chunks = []
+
+        def long_pass():
+            assert current_lease() is lease
+            for i in range(5):
+                if lease_lost():
+                    break
+                chunks.append(i)
+                if i == 1:
+                    # 续期发现锁已被他人接管
+                    lease.lost.set()
+            return len(chunks)
+
+        task = ScheduledTask("lease_task", long_pass, 60)
+        sched = TaskScheduler([task])
+        assert await sched.run_once(task) == RESULT_LOST
+        assert chunks == [0, 1] and released == [lease]
+        assert current_lease() is None
+        assert sched.snapshot()[0]["last_value"] is None
+
+    @pytest.mark.asyncio
+    async def test_loops_run_independently(self):
+        fast_runs = []
+        blocker = threading.Event()
+        fast = ScheduledTask("fast_task", lambda: fast_runs.append(1), 0.1, jitter_seconds=0)
+        slow = ScheduledTask("stuck_task", lambda: blocker.wait(5), 0.1, jitter_seconds=0)
+        sched = TaskScheduler([fast, slow])
+        sched.start()
+        try:
+            await asyncio.sleep(0.45)
+        finally:
+            blocker.set()
+            await sched.stop()
+        assert len(fast_runs) >= 3
+
+    @pytest.mark.asyncio
+    async def test_tasks_use_own_thread_pool(self):
+        release = threading.Event()
+        names = []
+
+        def hung():
+            names.append(threading.current_thread().name)
+            release.wait(5)
+
+        task = ScheduledTask("hung_task", hung, 60, timeout_seconds=0.05)
+        sched = TaskScheduler([task])
+        try:
+            assert await sched.run_once(task) == RESULT_TIMEOUT
+            # 超时任务仍占着线程，但不影响默认线程池
+            assert await asyncio.wait_for(asyncio.to_thread(lambda: 1), 1) == 1
+            assert names and names[0].startswith("scheduler")
+        finally:
+            release.set()
+            await sched.stop()
+
+
+class TestSchedulerConfig:
+    """测试分片与覆盖配置"""
+
+    def test_shards_partition_tasks(self):
+        names = [f"task_{i}" for i in range(20)]
+        owned = [[n for n in names if owns_task(n, 3, i)] for i in range(3)]
+        assert sorted(sum(owned, [])) == sorted(names)
+        assert all(owns_task(n, 1, 0) for n in names)
+
+    def test_overrides(self, monkeypatch):
+        monkeypatch.setattr(settings, "scheduler_task_overrides_raw", "a=5:2, b=:9, bad=x, c=7")
+        assert settings.scheduler_task_overrides == {"a": (5.0, 2.0), "b": (None, 9.0), "c": (7.0, None)}
+        task = ScheduledTask("a", lambda: None, 60)
+        assert (task.interval_seconds, task.timeout_seconds) == (5.0, 2.0)
@@ -0,0 +1,124 @@
+"""
+座位可用性索引测试
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.security import encrypt_token
+from app.services.services.seat_index import SeatAvailabilityIndex, index_for
+
+
+@pytest.fixture
+def pool_session(test_engine):
+    session = sessionmaker(bind=test_engine)()
+    session.query(models.SeatAllocation).delete(synchronize_session=False)
+    session.query(models.MotherTeam).delete(synchronize_session=False)
+    session.query(models.MotherAccount).delete(synchronize_session=False)
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _mother(session, name, *, free=1, used=0, group_id=None, team=True, age_days=0):
+    mother = models.MotherAccount(
+        name=name,
+        access_token_enc=encrypt_token("t"),
+        status=models.MotherStatus.active,
+        seat_limit=free + used,
+        group_id=group_id,
+        created_at=datetime.utcnow() - timedelta(days=age_days),
+    )
+    session.add(mother)
+    session.flush()
+    if team:
+        session.add(models.MotherTeam(mother_id=mother.id, team_id=f"team-{name}", is_enabled=True, is_default=True))
+    for i in range(free + used):
+        status = models.SeatStatus.free if i < free else models.SeatStatus.used
+        session.add(models.SeatAllocation(mother_id=mother.id, slot_index=i + 1, status=status))
+    session.commit()
+    return mother
+
+
+class TestSeatAvailabilityIndex:
+    """测试对账、排序与增量更新"""
+
+    def test_reconcile_orders_and_filters(self, pool_session):
+        old = _mother(pool_session, "old", age_days=3)
+        new = _mother(pool_session, "new", age_days=1)
+        _mother(pool_session, "full", free=0, used=2, age_days=2)
+        _mother(pool_session, "no-team", team=False, age_days=2)
+
+        index = SeatAvailabilityIndex()
+        index.reconcile(pool_session)
+
+        assert index.candidates() == [old.id, new.id]
+        assert index.candidates(newest_first=True) == [new.id, old.id]
+        assert index.candidates(exclude={old.id}) == [new.id]
+
+    def test_group_bucket(self, pool_session):
+        pool_session.add(models.MotherGroup(id=901, name="g-901"))
+        pool_session.commit()
+        grouped = _mother(pool_session, "grouped", group_id=901)
+        other = _mother(pool_session, "other")
+
+        index = SeatAvailabilityIndex()
+        index.reconcile(pool_session)
+
+        assert index.candidates(901) == [grouped.id]
+        assert set(index.candidates()) == {grouped.id, other.id}
+
+    def test_commit_applies_seat_claim_and_release(self, pool_session):
+        mother = _mother(pool_session, "m1", free=1)
+        index = index_for(pool_session)
+        index.reconcile(pool_session)
+        assert index.candidates() == [mother.id]
+
+        seat = pool_session.query(models.SeatAllocation).filter_by(mother_id=mother.id).one()
+        seat.status = models.SeatStatus.held
+        pool_session.flush()
+        # 未提交前不生效
+        assert index.candidates() == [mother.id]
+        pool_session.commit()
+        assert index.candidates() == []
+
+        seat.status = models.SeatStatus.free
+        pool_session.commit()
+        assert index.candidates() == [mother.id]
+
+    def test_rollback_discards_pending(self, pool_session):
+        mother = _mother(pool_session, "m2", free=1)
+        index = index_for(pool_session)
+        index.reconcile(pool_session)
+
+        seat = pool_session.query(models.SeatAllocation).filter_by(mother_id=mother.id).one()
+        seat.status = models.SeatStatus.used
+        pool_session.flush()
+        pool_session.rollback()
+        assert index.free_seats(mother.id) == 1
+
+    def test_bulk_update_forces_reconcile(self, pool_session):
+        mother = _mother(pool_session, "m3", free=2)
+        index = index_for(pool_session)
+        index.reconcile(pool_session)
+
+        pool_session.execute(
+            update(models.SeatAllocation)
+            .where(models.SeatAllocation.mother_id == mother.id)
+            .values(status=models.SeatStatus.used)
+        )
+        pool_session.commit()
+        index.ensure_fresh(pool_session)
+        assert index.candidates() == []
+
+    def test_new_mother_is_picked_up(self, pool_session):
+        index = index_for(pool_session)
+        index.reconcile(pool_session)
+        mother = _mother(pool_session, "late")
+        index.ensure_fresh(pool_session)
+        assert index.candidates() == [mother.id]
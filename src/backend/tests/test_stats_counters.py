@@ -0,0 +1,131 @@
+"""
+统计计数器测试
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.services.services.maintenance import create_maintenance_service
+from app.services.services.quota_service import QuotaService
+from app.services.shared import stats_counters
+from app.services.shared.stats_counters import DOMAIN_POOL, DOMAIN_USERS, compute_counters, read_counters
+
+
+def _live(snapshot):
+    return {k: v for k, v in snapshot.values.items() if v and k[0] != "_meta"}
+
+
+@pytest.fixture
+def sessions(test_engine):
+    Session = sessionmaker(bind=test_engine)
+    users, pool = Session(), Session()
+    try:
+        stats_counters.reconcile(users, DOMAIN_USERS)
+        stats_counters.reconcile(pool, DOMAIN_POOL)
+        users.commit()
+        pool.commit()
+        yield users, pool
+    finally:
+        users.close()
+        pool.close()
+
+
+def test_flush_keeps_counters_in_sync(sessions):
+    users, _ = sessions
+    codes = [models.RedeemCode(code_hash=f"sc-{i}", batch_id="sc-batch") for i in range(3)]
+    users.add_all(codes)
+    users.add(models.InviteRequest(team_id="t", email="sc@example.com"))
+    users.commit()
+
+    codes[0].status = models.CodeStatus.used
+    codes[1].active = False
+    users.delete(codes[2])
+    users.commit()
+
+    snap = read_counters(users, DOMAIN_USERS)
+    assert snap.source == "counters"
+    assert _live(snap) == {k: v for k, v in compute_counters(users, DOMAIN_USERS).items() if v}
+    assert snap.get("codes.batch", "sc-batch") == 2
+    assert snap.get("codes.batch_used", "sc-batch") == 1
+
+
+def test_rollback_discards_deltas(sessions):
+    users, _ = sessions
+    before = read_counters(users, DOMAIN_USERS).get("codes")
+    users.add(models.RedeemCode(code_hash="sc-rollback"))
+    users.flush()
+    users.rollback()
+    assert read_counters(users, DOMAIN_USERS).get("codes") == before
+
+
+def test_sessions_write_to_separate_shards(sessions, test_engine):
+    """不同会话的增量落在各自分片，读取时按键求和，对账后合并回分片 0"""
+    users, _ = sessions
+    before = read_counters(users, DOMAIN_USERS).get("codes")
+    Session = sessionmaker(bind=test_engine)
+    for i, shard in enumerate((1, 2)):
+        other = Session()
+        other.info[stats_counters._SHARD_INFO_KEY] = shard
+        other.add(models.RedeemCode(code_hash=f"sc-shard-{i}", batch_id="sc-shard"))
+        other.commit()
+        other.close()
+
+    rows = users.query(models.StatsCounterUsers).filter_by(key="codes", dim="").all()
+    assert {r.shard: r.value for r in rows if r.shard} == {1: 1, 2: 1}
+    assert read_counters(users, DOMAIN_USERS).get("codes") == before + 2
+
+    stats_counters.reconcile(users, DOMAIN_USERS)
+    users.commit()
+    rows = users.query(models.StatsCounterUsers).filter_by(key="codes", dim="").all()
+    assert [(r.shard, r.value) for r in rows] == [(0, before + 2)]
+
+
+def test_untracked_bulk_update_marks_dirty_until_reconciled(sessions):
+    users, _ = sessions
+    users.add(models.RedeemCode(code_hash="sc-bulk"))
+    users.commit()
+    users.execute(
+        update(models.RedeemCode)
+        .where(models.RedeemCode.code_hash == "sc-bulk")
+        .values(status=models.CodeStatus.used)
+    )
+    users.commit()
+
+    snap = read_counters(users, DOMAIN_USERS)
+    assert snap.source == "aggregate"
+    assert _live(snap) == {k: v for k, v in compute_counters(users, DOMAIN_USERS).items() if v}
+
+    stats_counters.reconcile(users, DOMAIN_USERS)
+    users.commit()
+    assert read_counters(users, DOMAIN_USERS).source == "counters"
+
+
+def test_tracked_bulk_paths_record_transitions(sessions):
+    users, pool = sessions
+    now = datetime.utcnow()
+    mother = models.MotherAccount(name="sc-mother", status=models.MotherStatus.active)
+    pool.add(mother)
+    pool.flush()
+    for i in range(3):
+        pool.add(
+            models.SeatAllocation(
+                mother_id=mother.id,
+                slot_index=i + 1,
+                status=models.SeatStatus.held,
+                held_until=now - timedelta(minutes=1),
+            )
+        )
+    pool.commit()
+
+    create_maintenance_service(users, pool).cleanup_stale_held()
+
+    snap = read_counters(pool, DOMAIN_POOL)
+    assert snap.source == "counters"
+    assert _live(snap) == {k: v for k, v in compute_counters(pool, DOMAIN_POOL).items() if v}
+    assert snap.get("seats.status", "held") == 0
+
+    quota = QuotaService.get_quota_snapshot(users, pool)
+    assert quota.used_seats == QuotaService.count_used_seats(pool)
@@ -0,0 +1,82 @@
+"""
+小时汇总测试
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.services.services.stats_rollup import StatsRollupService, get_watermark, rollup_series
+from app.utils.time_buckets import BUCKET_DAY, BUCKET_HOUR, count_by_bucket, trailing_window, truncate
+
+
+@pytest.fixture
+def users(test_engine):
+    session = sessionmaker(bind=test_engine)()
+    session.query(models.StatsHourlyRollup).delete()
+    session.query(models.StatsCounterUsers).filter(models.StatsCounterUsers.key == "_rollup").delete()
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _raw(session, column, start, end, bucket, *filters):
+    return count_by_bucket(session, column, start=start, end=end, bucket=bucket, filters=filters)
+
+
+def test_rollup_matches_raw_and_absorbs_late_rows(users):
+    now = datetime.utcnow()
+    users.add(models.InviteRequest(team_id="ru", email="a@example.com", created_at=now - timedelta(hours=3)))
+    users.add(models.InviteRequest(team_id="ru", email="b@example.com", created_at=now - timedelta(hours=30)))
+    users.add(
+        models.RedeemCode(
+            code_hash="rollup-code",
+            status=models.CodeStatus.used,
+            used_at=now - timedelta(hours=2),
+            mother_group_id=77,
+        )
+    )
+    users.commit()
+
+    service = StatsRollupService(users)
+    assert service.run(now) > 0
+    assert get_watermark(users) == truncate(now, BUCKET_HOUR)
+    assert users.query(models.StatsHourlyRollup).filter_by(metric="redemptions", mother_group_id=77).count() == 1
+
+    start, end = trailing_window(3, BUCKET_DAY, now)
+    assert rollup_series(users, "invites", start=start, end=end, bucket=BUCKET_DAY) == _raw(
+        users, models.InviteRequest.created_at, start, end, BUCKET_DAY
+    )
+
+    # 重复运行不会重复计数
+    total = users.query(func.sum(models.StatsHourlyRollup.count)).scalar()
+    service.run(now)
+    assert users.query(func.sum(models.StatsHourlyRollup.count)).scalar() == total
+
+    # 已汇总小时的迟到数据在回看窗口内被吸收
+    users.add(models.InviteRequest(team_id="ru", email="late@example.com", created_at=now - timedelta(hours=5)))
+    users.commit()
+    service.run(now)
+    start, end = trailing_window(12, BUCKET_HOUR, now)
+    assert rollup_series(users, "invites", start=start, end=end, bucket=BUCKET_HOUR) == _raw(
+        users, models.InviteRequest.created_at, start, end, BUCKET_HOUR
+    )
+    used = rollup_series(users, "redemptions", start=start, end=end, bucket=BUCKET_HOUR, statuses=["used"])
+    assert used == _raw(
+        users, models.RedeemCode.used_at, start, end, BUCKET_HOUR, models.RedeemCode.status == models.CodeStatus.used
+    )
+
+
+def test_current_hour_is_read_from_raw_tables(users):
+    now = datetime.utcnow()
+    StatsRollupService(users).run(now)
+    users.add(models.InviteRequest(team_id="ru", email="fresh@example.com", created_at=now))
+    users.commit()
+    start, end = trailing_window(1, BUCKET_HOUR, now)
+    assert rollup_series(users, "invites", start=start, end=end, bucket=BUCKET_HOUR) == _raw(
+        users, models.InviteRequest.created_at, start, end, BUCKET_HOUR
+    )
@@ -0,0 +1,67 @@
+"""
+管理端搜索测试（SQLite FTS5 影子表与快路径）
+"""
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.services.shared.text_search import (
+    MODE_EXACT,
+    MODE_PREFIX,
+    MODE_SUBSTRING,
+    parse_term,
+    search_clause,
+    sqlite_trigram_supported,
+)
+
+
+@pytest.fixture
+def users(test_engine):
+    session = sessionmaker(bind=test_engine)()
+    session.query(models.RedeemCode).filter(models.RedeemCode.batch_id.like("SRCH-%")).delete()
+    session.add_all(
+        [
+            models.RedeemCode(code_hash="srch-alpha-001", batch_id="SRCH-Spring"),
+            models.RedeemCode(code_hash="srch-beta-002", batch_id="SRCH-Summer"),
+        ]
+    )
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _codes(session, term):
+    rows = session.query(models.RedeemCode).filter(search_clause(session, models.RedeemCode, term)).all()
+    return sorted(r.code_hash for r in rows if (r.batch_id or "").startswith("SRCH-"))
+
+
+def test_parse_term_modes():
+    assert parse_term(" =ABC ") == (MODE_EXACT, "abc")
+    assert parse_term("Ab*") == (MODE_PREFIX, "ab")
+    assert parse_term("a%b") == (MODE_SUBSTRING, "a%b")
+    assert parse_term("  ") == (MODE_SUBSTRING, "")
+
+
+@pytest.mark.skipif(not sqlite_trigram_supported(), reason="SQLite 不支持 FTS5 trigram")
+def test_substring_uses_fts_and_follows_updates(users):
+    assert users.execute(text("SELECT count(*) FROM sqlite_master WHERE name = 'redeem_codes_fts'")).scalar() == 1
+    assert _codes(users, "PRING") == ["srch-alpha-001"]
+    assert _codes(users, "srch-") == ["srch-alpha-001", "srch-beta-002"]
+
+    code = users.query(models.RedeemCode).filter_by(code_hash="srch-alpha-001").one()
+    code.batch_id = "SRCH-Autumn"
+    users.commit()
+    assert _codes(users, "pring") == []
+    assert _codes(users, "autum") == ["srch-alpha-001"]
+
+
+def test_fast_paths_and_short_terms(users):
+    assert _codes(users, "=SRCH-BETA-002") == ["srch-beta-002"]
+    assert _codes(users, "=srch-beta") == []
+    assert _codes(users, "srch-b*") == ["srch-beta-002"]
+    # 不足 3 个字符回退到 LIKE
+    assert _codes(users, "00") == ["srch-alpha-001", "srch-beta-002"]
+    assert search_clause(users, models.RedeemCode, "  ") is None
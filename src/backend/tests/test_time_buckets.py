@@ -0,0 +1,79 @@
+"""
+时间分桶计数测试
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.services.shared.trends import recent_activity_by_day
+from app.utils.time_buckets import (
+    BUCKET_DAY,
+    BUCKET_HOUR,
+    count_by_bucket,
+    trailing_window,
+    truncate,
+)
+
+NOW = datetime(2030, 3, 10, 15, 42)
+
+
+@pytest.fixture
+def users(test_engine):
+    session = sessionmaker(bind=test_engine)()
+    team = "tb-team"
+    session.query(models.InviteRequest).filter(models.InviteRequest.team_id == team).delete()
+    for offset in (timedelta(minutes=5), timedelta(minutes=30), timedelta(hours=2), timedelta(days=2)):
+        session.add(models.InviteRequest(team_id=team, email="tb@example.com", created_at=NOW - offset))
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def test_trailing_window_includes_current_bucket():
+    assert truncate(NOW, BUCKET_DAY) == datetime(2030, 3, 10)
+    start, end = trailing_window(3, BUCKET_DAY, NOW)
+    assert (start, end) == (datetime(2030, 3, 8), datetime(2030, 3, 11))
+    start, end = trailing_window(2, BUCKET_HOUR, NOW)
+    assert (start, end) == (datetime(2030, 3, 10, 14), datetime(2030, 3, 10, 16))
+    with pytest.raises(ValueError):
+        truncate(NOW, "week")
+
+
+def test_daily_buckets_fill_gaps(users):
+    start, end = trailing_window(4, BUCKET_DAY, NOW)
+    series = count_by_bucket(
+        users,
+        models.InviteRequest.created_at,
+        start=start,
+        end=end,
+        filters=(models.InviteRequest.team_id == "tb-team",),
+    )
+    assert series == [
+        (datetime(2030, 3, 7), 0),
+        (datetime(2030, 3, 8), 1),
+        (datetime(2030, 3, 9), 0),
+        (datetime(2030, 3, 10), 3),
+    ]
+
+
+def test_hourly_buckets(users):
+    start, end = trailing_window(3, BUCKET_HOUR, NOW)
+    series = count_by_bucket(
+        users,
+        models.InviteRequest.created_at,
+        start=start,
+        end=end,
+        bucket=BUCKET_HOUR,
+        filters=(models.InviteRequest.team_id == "tb-team",),
+    )
+    assert [c for _, c in series] == [1, 0, 2]
+
+
+def test_recent_activity_is_newest_first(users):
+    activity = recent_activity_by_day(users, days=3, now=NOW)
+    assert [a["date"] for a in activity] == ["03-10", "03-09", "03-08"]
+    assert activity[0]["invites"] >= 3